@@ -0,0 +1,54 @@
+"""Compara dois resultados de ``benchmarks.run``.
+
+Uso::
+
+    python -m benchmarks.compare base.json novo.json [--threshold 1.10]
+
+Sai com código 1 se algum benchmark ficar mais lento que ``threshold`` vezes
+a mediana de referência.
+"""
+import argparse
+import json
+import sys
+from typing import Any, Dict, List, Tuple
+
+
+def load(path: str) -> Dict[str, Any]:
+    with open(path) as f:
+        return json.load(f)
+
+
+def compare(base: Dict[str, Any], new: Dict[str, Any]) -> List[Tuple[str, float, float, float]]:
+    """Devolve ``(nome, mediana_base, mediana_nova, razão)`` para benchmarks em comum."""
+    rows = []
+    for name, stats in new["benchmarks"].items():
+        if name not in base["benchmarks"]:
+            continue
+        base_median = base["benchmarks"][name]["median_s"]
+        new_median = stats["median_s"]
+        ratio = new_median / base_median if base_median else float("inf")
+        rows.append((name, base_median, new_median, ratio))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compara resultados de benchmarks")
+    parser.add_argument("base")
+    parser.add_argument("new")
+    parser.add_argument("--threshold", type=float, default=1.10)
+    args = parser.parse_args(argv)
+
+    base, new = load(args.base), load(args.new)
+    print(f"base={base.get('commit')} new={new.get('commit')}")
+    regressions = 0
+    for name, base_median, new_median, ratio in compare(base, new):
+        flag = ""
+        if ratio > args.threshold:
+            flag = "  <-- regression"
+            regressions += 1
+        print(f"{name:<24} {base_median * 1000:9.2f} ms -> {new_median * 1000:9.2f} ms  x{ratio:5.2f}{flag}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
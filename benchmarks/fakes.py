@@ -0,0 +1,294 @@
+"""Dublês em memória dos clientes do Google Cloud usados nos benchmarks."""
+import random
+import threading
+import time
+from collections import deque
+from datetime import datetime, UTC
+from typing import Any, Deque, Dict, List, Optional
+
+
+class FakeBigQueryClient:
+    """Cliente BigQuery que contabiliza as linhas recebidas.
+
+    Opcionalmente simula a latência de ``insert_rows_json`` (fixa mais um
+    custo por linha), uma taxa de erro e uma quota de requisições simultâneas
+    (``quota_in_flight``), devolvendo erros de linha como o cliente real.
+    Linhas com ``row_ids`` já gravados são descartadas, como o BigQuery faz
+    com ``insertId`` repetido, e contadas em ``rows_deduplicated``; isso só é
+    correto para reenvios. Um ``row_id`` repetido dentro da mesma requisição
+    indica ids que não são únicos por transação (o BigQuery perderia a linha
+    sem avisar) e é contado em ``insert_id_collisions``.
+    """
+
+    def __init__(self, project: str = "bench-project", latency: float = 0.0,
+                 latency_per_row: float = 0.0, error_rate: float = 0.0, seed: int = 0,
+                 quota_in_flight: int = 0, **kwargs):
+        self.project = project
+        self.quota_in_flight = quota_in_flight
+        self.in_flight = 0
+        self.max_in_flight_seen = 0
+        self.quota_errors = 0
+        self.latency = latency
+        self.latency_per_row = latency_per_row
+        self.error_rate = error_rate
+        self.rows_inserted = 0
+        self.rows_deduplicated = 0
+        self.insert_id_collisions = 0
+        self.calls = 0
+        self.failed_calls = 0
+        self._random = random.Random(seed)
+        self._insert_ids = set()
+        self._lock = threading.Lock()
+
+    def insert_rows_json(self, table: str, rows: List[Dict[str, Any]], row_ids: Optional[List[Any]] = None):
+        with self._lock:
+            self.in_flight += 1
+            self.max_in_flight_seen = max(self.max_in_flight_seen, self.in_flight)
+            over_quota = self.quota_in_flight and self.in_flight > self.quota_in_flight
+        try:
+            delay = self.latency + self.latency_per_row * len(rows)
+            if delay:
+                time.sleep(delay)
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+        with self._lock:
+            self.calls += 1
+            if over_quota:
+                self.quota_errors += 1
+                return [{"index": 0, "errors": [{"reason": "rateLimitExceeded", "message": "simulated"}]}]
+            if self.error_rate and self._random.random() < self.error_rate:
+                self.failed_calls += 1
+                return [{"index": 0, "errors": [{"reason": "backendError", "message": "simulated"}]}]
+            if row_ids is None:
+                self.rows_inserted += len(rows)
+                return []
+            self.insert_id_collisions += len(row_ids) - len(set(row_ids))
+            for row_id in row_ids:
+                if row_id is not None and row_id in self._insert_ids:
+                    self.rows_deduplicated += 1
+                    continue
+                self._insert_ids.add(row_id)
+                self.rows_inserted += 1
+        return []
+
+
+class FakeIngestionIndexClient:
+    """Cliente BigQuery para a tabela do índice incremental (``BigQueryIngestionIndexBackend``).
+
+    Guarda as linhas inseridas (descartando reenvios de ``row_ids`` já
+    gravados, e contando em ``insert_id_collisions`` ids repetidos dentro de
+    uma requisição) e responde à consulta do índice com a entrada mais
+    recente de cada chave da conta e do período passados como parâmetros.
+    """
+
+    def __init__(self, project: str = "bench-project"):
+        self.project = project
+        self.rows: List[Dict[str, Any]] = []
+        self.queries = 0
+        self.insert_id_collisions = 0
+        self._insert_ids = set()
+        self._lock = threading.Lock()
+
+    def insert_rows_json(self, table: str, rows: List[Dict[str, Any]], row_ids: Optional[List[Any]] = None):
+        with self._lock:
+            if row_ids:
+                self.insert_id_collisions += len(row_ids) - len(set(row_ids))
+            for row, row_id in zip(rows, row_ids or [None] * len(rows)):
+                if row_id is not None and row_id in self._insert_ids:
+                    continue
+                self._insert_ids.add(row_id)
+                self.rows.append(dict(row))
+        return []
+
+    def query(self, sql: str, job_config=None):
+        params = {param.name: param.value for param in job_config.query_parameters}
+        with self._lock:
+            self.queries += 1
+            latest: Dict[str, Dict[str, Any]] = {}
+            for row in self.rows:
+                if row["account"] == params["account"] and row["period"] == params["period"]:
+                    if row["row_key"] not in latest or row["recorded_at"] >= latest[row["row_key"]]["recorded_at"]:
+                        latest[row["row_key"]] = row
+        return FakeFuture(list(latest.values()))
+
+
+class FakeFuture:
+    def __init__(self, result: Any = None):
+        self._result = result
+
+    def result(self, timeout=None):
+        return self._result
+
+
+class FakePublisher:
+    """Publisher do Pub/Sub que guarda apenas o tamanho das mensagens."""
+
+    def __init__(self, *args, **kwargs):
+        self.messages = 0
+        self.bytes_published = 0
+
+    def topic_path(self, project_id, topic_id):
+        return f"projects/{project_id}/topics/{topic_id}"
+
+    def publish(self, topic, data: bytes, ordering_key: str = "", **attrs):
+        self.messages += 1
+        self.bytes_published += len(data)
+        return FakeFuture(str(self.messages))
+
+    def resume_publish(self, topic, ordering_key: str):
+        pass
+
+
+class FakeSubscriber:
+    """Subscriber do Pub/Sub sem conexão (só monta o caminho da subscription)."""
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def subscription_path(self, project_id, subscription_id):
+        return f"projects/{project_id}/subscriptions/{subscription_id}"
+
+
+class FakePubSubMessage:
+    """Mensagem entregue por ``FakePubSub`` (mesma interface usada pelo writer)."""
+
+    def __init__(self, broker: "FakePubSub", message_id: str, data: bytes,
+                 attributes: Dict[str, str], publish_time: datetime, delivery_attempt: int,
+                 ordering_key: str = ""):
+        self._broker = broker
+        self.message_id = message_id
+        self.data = data
+        self.attributes = attributes
+        self.ordering_key = ordering_key
+        self.publish_time = publish_time
+        self.delivery_attempt = delivery_attempt
+
+    def ack(self):
+        self._broker._ack(self.message_id, self.delivery_attempt)
+
+    def nack(self):
+        self._broker._nack(self.message_id, self.delivery_attempt)
+
+
+class FakePubSub:
+    """Tópico e subscription em memória com semântica de fila do Pub/Sub.
+
+    As mensagens ficam na fila até serem confirmadas: ``nack`` as devolve
+    imediatamente e leases que passam do ``ack_deadline`` são reentregues.
+    Depois de ``max_delivery_attempts`` entregas sem ack, a mensagem vai para
+    ``dead_letters``. Serve como publisher (``topic_path``/``publish``) e como
+    subscriber (``pull``).
+    """
+
+    def __init__(self, ack_deadline: float = 10.0, max_delivery_attempts: Optional[int] = None):
+        self.ack_deadline = ack_deadline
+        self.max_delivery_attempts = max_delivery_attempts
+        self.stats = {"published": 0, "delivered": 0, "acked": 0, "nacked": 0,
+                      "redelivered": 0, "expired": 0, "dead_lettered": 0}
+        self.dead_letters: List[Dict[str, Any]] = []
+        self._messages: Dict[str, Dict[str, Any]] = {}
+        self._ready: Deque[str] = deque()
+        self._leases: Dict[str, float] = {}
+        self._cond = threading.Condition()
+
+    def topic_path(self, project_id, topic_id):
+        return f"projects/{project_id}/topics/{topic_id}"
+
+    def publish(self, topic, data: bytes, ordering_key: str = "", **attrs):
+        with self._cond:
+            self.stats["published"] += 1
+            message_id = str(self.stats["published"])
+            self._messages[message_id] = {"data": data, "attributes": attrs, "ordering_key": ordering_key,
+                                          "publish_time": datetime.now(UTC), "attempts": 0}
+            self._ready.append(message_id)
+            self._cond.notify()
+        return FakeFuture(message_id)
+
+    def _expire_leases(self, now: float) -> None:
+        for message_id, deadline in list(self._leases.items()):
+            if deadline <= now:
+                del self._leases[message_id]
+                self.stats["expired"] += 1
+                self._requeue(message_id)
+
+    def _requeue(self, message_id: str) -> None:
+        entry = self._messages[message_id]
+        if self.max_delivery_attempts and entry["attempts"] >= self.max_delivery_attempts:
+            del self._messages[message_id]
+            self.stats["dead_lettered"] += 1
+            self.dead_letters.append({"message_id": message_id, **entry})
+        else:
+            self._ready.append(message_id)
+        self._cond.notify_all()
+
+    def pull(self, timeout: Optional[float] = None) -> Optional[FakePubSubMessage]:
+        """Entrega a próxima mensagem disponível, esperando até ``timeout`` segundos."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                self._expire_leases(now)
+                if self._ready:
+                    message_id = self._ready.popleft()
+                    entry = self._messages[message_id]
+                    entry["attempts"] += 1
+                    if entry["attempts"] > 1:
+                        self.stats["redelivered"] += 1
+                    self.stats["delivered"] += 1
+                    self._leases[message_id] = now + self.ack_deadline
+                    return FakePubSubMessage(self, message_id, entry["data"], dict(entry["attributes"]),
+                                             entry["publish_time"], entry["attempts"], entry["ordering_key"])
+                waits = [lease - now for lease in self._leases.values()]
+                if deadline is not None:
+                    if now >= deadline:
+                        return None
+                    waits.append(deadline - now)
+                self._cond.wait(min(waits) if waits else None)
+
+    def _ack(self, message_id: str, attempt: int) -> None:
+        with self._cond:
+            entry = self._messages.get(message_id)
+            if entry is None or entry["attempts"] != attempt or message_id not in self._leases:
+                return
+            del self._leases[message_id]
+            del self._messages[message_id]
+            self.stats["acked"] += 1
+            self._cond.notify_all()
+
+    def _nack(self, message_id: str, attempt: int) -> None:
+        with self._cond:
+            entry = self._messages.get(message_id)
+            if entry is None or entry["attempts"] != attempt or message_id not in self._leases:
+                return
+            del self._leases[message_id]
+            self.stats["nacked"] += 1
+            self._requeue(message_id)
+
+    def pending(self) -> int:
+        """Mensagens ainda não confirmadas (na fila ou em lease)."""
+        with self._cond:
+            return len(self._messages)
+
+
+class FakeTelemetry:
+    """Substitui ``get_telemetry`` para não configurar o exportador do Cloud Trace."""
+
+
+class FakeSpanExporter:
+    """Exportador de spans que descarta tudo (no lugar do Cloud Trace)."""
+
+    def __init__(self, *args, **kwargs):
+        self.exported = 0
+
+    def export(self, spans):
+        from opentelemetry.sdk.trace.export import SpanExportResult
+
+        self.exported += len(spans)
+        return SpanExportResult.SUCCESS
+
+    def shutdown(self):
+        pass
+
+    def force_flush(self, timeout_millis: int = 30000):
+        return True
@@ -0,0 +1,315 @@
+"""Teste de carga ponta a ponta do pipeline, em processo.
+
+Reproduz N uploads concorrentes passando por ``storage_trigger_function``,
+``parse_excel`` (chamado no lugar do ``requests.post`` do trigger) e pelo
+writer, que consome de um Pub/Sub em memória com fila, ack/nack e
+reentrega (``benchmarks.fakes.FakePubSub``) e grava em um BigQuery falso com
+latência e taxa de erro configuráveis. Uso::
+
+    python -m benchmarks.load_test --uploads 50 --concurrency 8 --writers 4 --sink-latency 0.05
+
+O relatório traz vazão, latências p50/p99 por etapa e o pico de memória
+rastreada (``tracemalloc``) enquanto cada etapa estava ativa. Como as etapas
+rodam ao mesmo tempo, o pico de uma etapa inclui a memória das outras que
+estavam em andamento no mesmo instante.
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import resource
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager
+from datetime import datetime, UTC
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+from unittest.mock import patch
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from benchmarks.fakes import FakeBigQueryClient, FakePubSub, FakeSpanExporter, FakeTelemetry  # noqa: E402
+from benchmarks.run import RESULTS_DIR, git_commit, quiet_loggers  # noqa: E402
+from benchmarks.statement_generator import generate_statement  # noqa: E402
+
+ACCOUNT = "itau-card"
+STAGES = ("trigger", "reader", "queue", "writer", "end_to_end")
+FUNCTION_URL = "http://load-test/reader"
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Percentil por posição (nearest-rank); 0 para listas vazias."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, math.ceil(q / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+class StageRecorder:
+    """Latências por etapa e pico de memória rastreada enquanto cada etapa está ativa."""
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Counter = Counter()
+        self.peak_bytes: Dict[str, int] = defaultdict(int)
+        self._active: Counter = Counter()
+        self._lock = threading.Lock()
+
+    def record(self, stage: str, duration: float) -> None:
+        with self._lock:
+            self.latencies[stage].append(duration)
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        with self._lock:
+            self._active[name] += 1
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            with self._lock:
+                self.errors[name] += 1
+            raise
+        finally:
+            self.record(name, time.perf_counter() - start)
+            self.sample()
+            with self._lock:
+                self._active[name] -= 1
+
+    def sample(self) -> None:
+        if not tracemalloc.is_tracing():
+            return
+        current, _ = tracemalloc.get_traced_memory()
+        with self._lock:
+            for name, count in self._active.items():
+                if count and current > self.peak_bytes[name]:
+                    self.peak_bytes[name] = current
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        report = {}
+        for name in STAGES:
+            values = self.latencies.get(name, [])
+            report[name] = {
+                "count": len(values),
+                "errors": self.errors.get(name, 0),
+                "p50_s": percentile(values, 50),
+                "p99_s": percentile(values, 99),
+                "max_s": max(values) if values else 0.0,
+                "peak_traced_mib": self.peak_bytes.get(name, 0) / (1024 * 1024),
+            }
+        return report
+
+
+class _Request:
+    def __init__(self, payload, headers: Optional[Dict[str, str]] = None):
+        self._payload = payload
+        self.headers = headers or {}
+
+    def get_json(self, silent=False):
+        return self._payload
+
+
+class _Response:
+    def __init__(self, body: str, status_code: int):
+        self.text = body
+        self.status_code = status_code
+
+    def raise_for_status(self):
+        import requests
+
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"{self.status_code}: {self.text}")
+
+
+class _CloudEvent:
+    def __init__(self, data):
+        self.data = data
+
+
+def _memory_sampler(recorder: StageRecorder, stop: threading.Event, interval: float) -> None:
+    while not stop.wait(interval):
+        recorder.sample()
+
+
+def run_load_test(uploads: int = 20, concurrency: int = 4, writers: int = 2, rows: int = 500,
+                  blocks: int = 3, sink_latency: float = 0.0, sink_latency_per_row: float = 0.0,
+                  sink_error_rate: float = 0.0, ack_deadline: float = 10.0,
+                  max_delivery_attempts: Optional[int] = 5, seed: int = 42,
+                  trace_memory: bool = True, sample_interval: float = 0.005) -> Dict[str, Any]:
+    """Executa o teste de carga e devolve o relatório."""
+    from credit_card_readers.azul_visa_reader import parse_excel
+    from finance_data_writer.writer import process_message
+    from function_file_arrival.trigger import storage_trigger_function
+    from utils.factories import clear_instances
+
+    quiet_loggers("credit_card_readers.azul_visa_reader", "finance_data_writer.writer",
+                  "function_file_arrival.trigger")
+
+    broker = FakePubSub(ack_deadline=ack_deadline, max_delivery_attempts=max_delivery_attempts)
+    sink = FakeBigQueryClient(latency=sink_latency, latency_per_row=sink_latency_per_row,
+                              error_rate=sink_error_rate, seed=seed)
+    telemetry = FakeTelemetry()
+    recorder = StageRecorder()
+    topic_path = broker.topic_path("bench-project", "bench-topic")
+    upload_started: Dict[str, float] = {}
+    results: Counter = Counter()
+
+    with tempfile.TemporaryDirectory() as tmp, ExitStack() as stack:
+        # Os arquivos ficam em <tmp>/<conta>/..., como se tivessem sido baixados do bucket
+        root = Path(tmp)
+        (root / ACCOUNT).mkdir()
+        names = []
+        for i in range(uploads):
+            name = f"{ACCOUNT}/statement-{i:05d}.xlsx"
+            generate_statement(str(root / name), rows, blocks, seed + i)
+            names.append(name)
+
+        def post(url, json=None, headers=None, **kwargs):
+            payload = dict(json, file_path=str(root / json["file_path"]))
+            with recorder.stage("reader"):
+                result = parse_excel(_Request(payload, headers), publisher=broker, topic_path=topic_path,
+                                     telemetry=telemetry)
+            body, status = result if isinstance(result, tuple) else (result, 200)
+            return _Response(body, status)
+
+        stack.enter_context(patch.dict(os.environ, {
+            "K_SERVICE": "load-test",
+            f"TRANSACTIONS_FUNCTION_ITAU_CARD_{ACCOUNT.upper()}": FUNCTION_URL,
+            "BIGQUERY_DATASET": "bench_dataset",
+            "BIGQUERY_TABLE": "bench_table",
+            "UPLOAD_MANIFEST_BACKEND": "memory",
+            "INGESTION_INDEX_BACKEND": "memory",
+            "PARSE_CACHE_DIR": str(root / "parse_cache"),
+        }))
+        stack.enter_context(patch("function_file_arrival.trigger.requests.post", post))
+        stack.enter_context(patch("finance_data_writer.writer.get_bigquery_client", return_value=sink))
+        stack.enter_context(patch("opentelemetry.exporter.cloud_trace.CloudTraceSpanExporter", FakeSpanExporter))
+        clear_instances()
+        stack.callback(clear_instances)
+
+        def upload(index: int) -> None:
+            name = names[index]
+            event = _CloudEvent({"bucket": "load-test", "name": name, "generation": str(index + 1)})
+            upload_started[str(root / name)] = time.perf_counter()
+            with recorder.stage("trigger"):
+                result = storage_trigger_function(event, telemetry=telemetry)
+            results[result] += 1
+
+        ingest_done = threading.Event()
+
+        def consume() -> None:
+            while True:
+                message = broker.pull(timeout=0.05)
+                if message is None:
+                    if ingest_done.is_set() and broker.pending() == 0:
+                        return
+                    continue
+                queued = (datetime.now(UTC) - message.publish_time).total_seconds()
+                recorder.record("queue", queued)
+                with recorder.stage("writer"):
+                    ok = process_message(message, telemetry=telemetry)
+                if ok:
+                    file_path = json.loads(message.data)["file_path"]
+                    started = upload_started.get(file_path)
+                    if started is not None:
+                        recorder.record("end_to_end", time.perf_counter() - started)
+
+        stop_sampler = threading.Event()
+        if trace_memory:
+            tracemalloc.start()
+            sampler = threading.Thread(target=_memory_sampler, args=(recorder, stop_sampler, sample_interval),
+                                       daemon=True)
+            sampler.start()
+
+        start = time.perf_counter()
+        writer_threads = [threading.Thread(target=consume, daemon=True) for _ in range(writers)]
+        for thread in writer_threads:
+            thread.start()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            list(pool.map(upload, range(uploads)))
+        ingest_done.set()
+        ingest_s = time.perf_counter() - start
+        for thread in writer_threads:
+            thread.join()
+        wall_s = time.perf_counter() - start
+
+        stop_sampler.set()
+        if trace_memory:
+            _, traced_peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+    return {
+        "params": {
+            "uploads": uploads, "concurrency": concurrency, "writers": writers, "rows": rows,
+            "blocks": blocks, "sink_latency": sink_latency, "sink_latency_per_row": sink_latency_per_row,
+            "sink_error_rate": sink_error_rate, "ack_deadline": ack_deadline,
+            "max_delivery_attempts": max_delivery_attempts, "seed": seed,
+        },
+        "wall_s": wall_s,
+        "ingest_s": ingest_s,
+        "uploads_per_s": uploads / wall_s if wall_s else 0.0,
+        "rows_written": sink.rows_inserted,
+        "rows_per_s": sink.rows_inserted / wall_s if wall_s else 0.0,
+        "trigger_results": dict(results),
+        "pubsub": dict(broker.stats),
+        "sink": {"calls": sink.calls, "failed_calls": sink.failed_calls},
+        "stages": recorder.summary(),
+        "traced_peak_mib": traced_peak / (1024 * 1024) if trace_memory else None,
+        "max_rss_mib": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Teste de carga ponta a ponta do pipeline")
+    parser.add_argument("--uploads", type=int, default=50, help="Uploads simulados")
+    parser.add_argument("--concurrency", type=int, default=8, help="Uploads processados ao mesmo tempo")
+    parser.add_argument("--writers", type=int, default=4, help="Consumidores do writer")
+    parser.add_argument("--rows", type=int, default=500, help="Lançamentos por extrato")
+    parser.add_argument("--blocks", type=int, default=3, help="Blocos por extrato")
+    parser.add_argument("--sink-latency", type=float, default=0.05, help="Latência fixa do BigQuery (s)")
+    parser.add_argument("--sink-latency-per-row", type=float, default=0.0, help="Latência por linha (s)")
+    parser.add_argument("--sink-error-rate", type=float, default=0.0, help="Fração de inserts com erro")
+    parser.add_argument("--ack-deadline", type=float, default=10.0)
+    parser.add_argument("--max-delivery-attempts", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--no-memory", action="store_true", help="Não rastrear memória (menos overhead)")
+    parser.add_argument("--output", help="Arquivo JSON de saída (padrão: benchmarks/results/load-<commit>.json)")
+    args = parser.parse_args(argv)
+
+    commit = git_commit()
+    report = {
+        "commit": commit,
+        "timestamp": datetime.now(UTC).isoformat(),
+        "python": platform.python_version(),
+        **run_load_test(
+            uploads=args.uploads, concurrency=args.concurrency, writers=args.writers, rows=args.rows,
+            blocks=args.blocks, sink_latency=args.sink_latency, sink_latency_per_row=args.sink_latency_per_row,
+            sink_error_rate=args.sink_error_rate, ack_deadline=args.ack_deadline,
+            max_delivery_attempts=args.max_delivery_attempts, seed=args.seed,
+            trace_memory=not args.no_memory,
+        ),
+    }
+
+    output = Path(args.output) if args.output else RESULTS_DIR / f"load-{commit}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2))
+
+    print(f"uploads/s={report['uploads_per_s']:.2f}  rows/s={report['rows_per_s']:.0f}  "
+          f"wall={report['wall_s']:.2f} s  pubsub={report['pubsub']}")
+    for name, stats in report["stages"].items():
+        print(f"{name:<11} n={stats['count']:<6} p50={stats['p50_s'] * 1000:9.2f} ms  "
+              f"p99={stats['p99_s'] * 1000:9.2f} ms  peak={stats['peak_traced_mib']:7.1f} MiB")
+    print(f"Results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+"""Benchmarks reprodutíveis do pipeline de leitura e escrita.
+
+Uso::
+
+    python -m benchmarks.run --rows 5000 --repeat 5
+    python -m benchmarks.compare benchmarks/results/<antigo>.json benchmarks/results/<novo>.json
+
+Os extratos são gerados por ``benchmarks.statement_generator`` com seed fixo e
+o BigQuery é substituído por ``benchmarks.fakes.FakeBigQueryClient``. Os
+resultados são gravados em JSON junto com o commit atual.
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, UTC
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+from unittest.mock import patch
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+os.environ.setdefault("BIGQUERY_DATASET", "bench_dataset")
+os.environ.setdefault("BIGQUERY_TABLE", "bench_table")
+
+from benchmarks.fakes import FakeBigQueryClient, FakeTelemetry  # noqa: E402
+from benchmarks.statement_generator import (  # noqa: E402
+    generate_descriptions,
+    generate_merchant_rules,
+    generate_statement,
+)
+
+RESULTS_DIR = PROJECT_ROOT / "benchmarks" / "results"
+ACCOUNT = "itau-card"
+HASH_COLUMNS = ["data", "valor", "descricao"]
+
+
+def quiet_loggers(*names: str) -> None:
+    """Evita que os logs JSON das funções dominem o tempo medido."""
+    for name in names:
+        logging.getLogger(name).setLevel(logging.WARNING)
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=PROJECT_ROOT, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def measure(fn: Callable[[], Any], repeat: int, warmup: int = 1) -> Dict[str, float]:
+    """Executa ``fn`` ``repeat`` vezes e devolve estatísticas de tempo em segundos."""
+    for _ in range(warmup):
+        fn()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return {
+        "repeat": repeat,
+        "min_s": min(timings),
+        "median_s": statistics.median(timings),
+        "mean_s": statistics.fmean(timings),
+        "stdev_s": statistics.stdev(timings) if len(timings) > 1 else 0.0,
+    }
+
+
+def _with_throughput(stats: Dict[str, float], rows: int) -> Dict[str, float]:
+    stats["rows"] = rows
+    stats["rows_per_s"] = rows / stats["median_s"] if stats["median_s"] else 0.0
+    return stats
+
+
+def run_categorize_benchmarks(merchants: int, descriptions: int, repeat: int, seed: int) -> Dict[str, Any]:
+    """Mede a categorização de descrições contra ``merchants`` regras sintéticas.
+
+    ``categorize[uncached]`` desliga o cache por descrição e mede só o
+    autômato; ``categorize[cached]`` reflete extratos reais, em que os mesmos
+    estabelecimentos se repetem. ``categorizer_compile`` é o custo pago uma vez
+    por processo.
+    """
+    from credit_card_readers.categorizer import Categorizer
+
+    rules = generate_merchant_rules(merchants, seed=seed)
+    texts = generate_descriptions(descriptions, rules, seed=seed)
+    results: Dict[str, Any] = {
+        "categorizer_compile": measure(lambda: Categorizer(rules), max(1, repeat // 2), warmup=0),
+    }
+    results["categorizer_compile"]["rules"] = merchants
+
+    for name, cache_size in (("uncached", 0), ("cached", 65536)):
+        categorizer = Categorizer(rules, cache_size=cache_size)
+
+        def categorize_all():
+            categorize = categorizer.categorize
+            for text in texts:
+                categorize(text)
+
+        stats = _with_throughput(measure(categorize_all, repeat), len(texts))
+        stats["rules"] = merchants
+        stats["descriptions_per_minute"] = stats["rows_per_s"] * 60
+        results[f"categorize[{name}]"] = stats
+    return results
+
+
+def run_benchmarks(rows: int, blocks: int, repeat: int, formats: List[str], seed: int,
+                   merchants: int = 5000, descriptions: int = 100_000) -> Dict[str, Any]:
+    from credit_card_readers.azul_visa_reader import compute_row_hash, convert_data
+    from finance_data_writer.writer import write_to_bigquery
+
+    quiet_loggers("credit_card_readers.azul_visa_reader", "finance_data_writer.writer")
+
+    results: Dict[str, Any] = {}
+    parsed: List[List[Dict[str, Any]]] = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for fmt in formats:
+            path = generate_statement(os.path.join(tmp, f"statement.{fmt}"), rows, blocks, seed)
+            # convert_data grava o .xlsx convertido ao lado do .xls
+            parsed = convert_data(path, ACCOUNT)
+            results[f"convert_data[{fmt}]"] = _with_throughput(
+                measure(lambda: convert_data(path, ACCOUNT), repeat), rows)
+
+    # Comparação entre formatos: quantas vezes mais rápido que o .xlsx
+    baseline = results.get("convert_data[xlsx]")
+    if baseline and baseline["rows_per_s"]:
+        for fmt in formats:
+            stats = results[f"convert_data[{fmt}]"]
+            stats["speedup_vs_xlsx"] = stats["rows_per_s"] / baseline["rows_per_s"]
+
+    flat_rows = [row for block in parsed for row in block]
+
+    def hash_all():
+        for row in flat_rows:
+            compute_row_hash(row, HASH_COLUMNS, ACCOUNT)
+
+    results["compute_row_hash"] = _with_throughput(measure(hash_all, repeat), len(flat_rows))
+
+    message = {"rows": parsed, "file_path": "statement.xlsx", "trace_id": None}
+    payload = json.dumps(message).encode("utf-8")
+    results["serialize[encode]"] = _with_throughput(
+        measure(lambda: json.dumps(message).encode("utf-8"), repeat), len(flat_rows))
+    results["serialize[encode]"]["payload_bytes"] = len(payload)
+    results["serialize[decode]"] = _with_throughput(
+        measure(lambda: json.loads(payload.decode("utf-8")), repeat), len(flat_rows))
+
+    results.update(run_categorize_benchmarks(merchants, descriptions, repeat, seed))
+
+    client = FakeBigQueryClient()
+    telemetry = FakeTelemetry()
+    with patch("finance_data_writer.writer.get_bigquery_client", return_value=client):
+        results["write_to_bigquery"] = _with_throughput(
+            measure(lambda: write_to_bigquery(flat_rows, telemetry=telemetry), repeat), len(flat_rows))
+
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks do pipeline de extratos")
+    parser.add_argument("--rows", type=int, default=5000, help="Lançamentos por extrato")
+    parser.add_argument("--blocks", type=int, default=3, help="Blocos por extrato")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--merchants", type=int, default=5000, help="Regras do benchmark de categorização")
+    parser.add_argument("--descriptions", type=int, default=100_000, help="Descrições categorizadas por repetição")
+    parser.add_argument("--formats", nargs="+", default=["xlsx", "xls", "csv", "ofx"],
+                        choices=["xlsx", "xls", "csv", "ofx"])
+    parser.add_argument("--output", help="Arquivo JSON de saída (padrão: benchmarks/results/<commit>.json)")
+    args = parser.parse_args(argv)
+
+    commit = git_commit()
+    report = {
+        "commit": commit,
+        "timestamp": datetime.now(UTC).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "params": {
+            "rows": args.rows,
+            "blocks": args.blocks,
+            "repeat": args.repeat,
+            "seed": args.seed,
+            "formats": args.formats,
+            "merchants": args.merchants,
+            "descriptions": args.descriptions,
+        },
+        "benchmarks": run_benchmarks(args.rows, args.blocks, args.repeat, args.formats, args.seed,
+                                     args.merchants, args.descriptions),
+    }
+
+    output = Path(args.output) if args.output else RESULTS_DIR / f"{commit}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2))
+
+    for name, stats in report["benchmarks"].items():
+        print(f"{name:<24} median={stats['median_s'] * 1000:9.2f} ms  rows/s={stats.get('rows_per_s', 0):12.0f}")
+    print(f"Results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
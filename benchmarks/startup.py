@@ -0,0 +1,239 @@
+"""Benchmark de cold start das funções.
+
+Para cada entry point, um processo Python novo é iniciado com
+``-X importtime``; ele importa o módulo da função, executa uma primeira e uma
+segunda requisição contra dublês e reporta tempo de import, RSS após o import
+e RSS/latência da primeira requisição. Cada entry point também é medido com
+o warm-up da instância (``WARMUP.run()`` antes da primeira requisição, como
+faz ``WARMUP_ON_START``), para comparar a primeira requisição com o regime
+estável com e sem warm-up. Uso::
+
+    python -m benchmarks.startup --repeat 3
+
+Este módulo importa apenas a biblioteca padrão no topo para não contaminar
+as medições do processo filho.
+"""
+import argparse
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from contextlib import ExitStack
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+RESULTS_DIR = PROJECT_ROOT / "benchmarks" / "results"
+RESULT_MARKER = "STARTUP_RESULT "
+
+ENTRY_POINTS = {
+    "trigger": "function_file_arrival.trigger",
+    "reader": "credit_card_readers.azul_visa_reader",
+    "writer": "finance_data_writer.writer",
+}
+
+
+def rss_kb() -> int:
+    """RSS atual do processo em KiB (pico, fora do Linux)."""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") // 1024
+    except (OSError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+class _Response:
+    status_code = 200
+
+    def raise_for_status(self):
+        pass
+
+
+class _Request:
+    headers: Dict[str, str] = {}
+
+    def __init__(self, payload):
+        self._payload = payload
+
+    def get_json(self, silent=False):
+        return self._payload
+
+
+class _CloudEvent:
+    def __init__(self, data):
+        self.data = data
+
+
+class _Message:
+    def __init__(self, payload: bytes):
+        from datetime import datetime, UTC
+
+        self.data = payload
+        self.message_id = "startup-1"
+        self.publish_time = datetime.now(UTC)
+        self.attributes: Dict[str, str] = {}
+
+    def ack(self):
+        pass
+
+    def nack(self):
+        pass
+
+
+def _request_for(entry: str, module, statement: str):
+    """Monta a chamada das requisições de cada entry point."""
+    if entry == "trigger":
+        event = _CloudEvent({"bucket": "bench-bucket", "name": "itau-card/statement.xlsx"})
+        return lambda: module.storage_trigger_function(event)
+    if entry == "reader":
+        # Hash novo a cada chamada: o manifesto e o cache de parsing pulariam as
+        # repetições do mesmo arquivo e o regime estável não leria a planilha
+        return lambda: module.parse_excel(
+            _Request({"file_path": statement, "content_hash": f"startup-{uuid.uuid4().hex}"}))
+    payload = json.dumps({"rows": [[{"data": "2024-01-01", "valor": 1000, "descricao": "X",
+                                     "account": "itau-card", "id": "1"}]],
+                          "file_path": statement}).encode("utf-8")
+    return lambda: module.process_message(_Message(payload))
+
+
+def probe(entry: str, statement: str, warmup: bool = False) -> Dict[str, Any]:
+    """Executado no processo filho: mede import e primeiras requisições."""
+    os.environ.setdefault("K_SERVICE", "startup-bench")
+    os.environ.setdefault("GOOGLE_CLOUD_PROJECT", "bench-project")
+    os.environ.setdefault("PUBSUB_TOPIC", "bench-topic")
+    os.environ.setdefault("BIGQUERY_DATASET", "bench_dataset")
+    os.environ.setdefault("BIGQUERY_TABLE", "bench_table")
+    os.environ.setdefault("TRANSACTIONS_FUNCTION_ITAU_CARD_ITAU-CARD", "http://localhost/bench")
+
+    rss_start = rss_kb()
+    start = time.perf_counter()
+    # __import__ (e não importlib.import_module) para aparecer no -X importtime
+    module = __import__(ENTRY_POINTS[entry], fromlist=["_"])
+    import_s = time.perf_counter() - start
+    rss_import = rss_kb()
+
+    from unittest.mock import patch
+
+    from benchmarks.fakes import FakeBigQueryClient, FakePublisher, FakeSpanExporter, FakeSubscriber
+
+    call = _request_for(entry, module, statement)
+    patches = {
+        "trigger": [patch("requests.post", return_value=_Response())],
+        "reader": [patch("google.cloud.pubsub_v1.PublisherClient", FakePublisher)],
+        "writer": [patch("google.cloud.bigquery.Client", FakeBigQueryClient),
+                   patch("google.cloud.pubsub_v1.SubscriberClient", FakeSubscriber)],
+    }[entry]
+    patches.append(patch("opentelemetry.exporter.cloud_trace.CloudTraceSpanExporter", FakeSpanExporter))
+
+    # Os patches importam os módulos adiados dentro da janela da primeira requisição,
+    # como aconteceria em produção ao construir os clientes reais.
+    warmup_s = 0.0
+    with ExitStack() as stack:
+        for p in patches:
+            stack.enter_context(p)
+        if warmup:
+            start = time.perf_counter()
+            module.WARMUP.run()
+            warmup_s = time.perf_counter() - start
+        start = time.perf_counter()
+        call()
+        first_request_s = time.perf_counter() - start
+        rss_first = rss_kb()
+        steady = []
+        for _ in range(3):
+            start = time.perf_counter()
+            call()
+            steady.append(time.perf_counter() - start)
+
+    return {
+        "import_s": import_s,
+        "warmup_s": warmup_s,
+        "first_request_s": first_request_s,
+        "steady_request_s": statistics.median(steady),
+        "rss_start_kb": rss_start,
+        "rss_after_import_kb": rss_import,
+        "rss_after_first_request_kb": rss_first,
+    }
+
+
+def parse_importtime(stderr: str, module: str) -> Tuple[float, List[Dict[str, Any]]]:
+    """Extrai o tempo cumulativo do módulo e os imports com maior tempo próprio."""
+    total_us = 0
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = [part.strip() for part in line[len("import time:"):].split("|")]
+        self_us, cumulative_us = int(self_us), int(cumulative_us)
+        if name == module:
+            total_us = cumulative_us
+        modules.append({"module": name, "self_ms": self_us / 1000, "cumulative_ms": cumulative_us / 1000})
+    modules.sort(key=lambda m: m["self_ms"], reverse=True)
+    return total_us / 1_000_000, modules[:10]
+
+
+def run_entry(entry: str, statement: str, warmup: bool = False) -> Dict[str, Any]:
+    command = [sys.executable, "-X", "importtime", "-m", "benchmarks.startup", "--probe", entry,
+               "--statement", statement]
+    if warmup:
+        command.append("--warmup")
+    result = subprocess.run(command, cwd=PROJECT_ROOT, capture_output=True, text=True, check=True)
+    line = next(line for line in result.stdout.splitlines() if line.startswith(RESULT_MARKER))
+    metrics = json.loads(line[len(RESULT_MARKER):])
+    metrics["importtime_s"], metrics["top_imports"] = parse_importtime(result.stderr, ENTRY_POINTS[entry])
+    return metrics
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark de cold start das funções")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--entries", nargs="+", default=list(ENTRY_POINTS), choices=list(ENTRY_POINTS))
+    parser.add_argument("--output", help="Arquivo JSON de saída (padrão: benchmarks/results/startup-<commit>.json)")
+    parser.add_argument("--probe", choices=list(ENTRY_POINTS), help=argparse.SUPPRESS)
+    parser.add_argument("--statement", help=argparse.SUPPRESS)
+    parser.add_argument("--warmup", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.probe:
+        print(RESULT_MARKER + json.dumps(probe(args.probe, args.statement, args.warmup)))
+        return
+
+    sys.path.insert(0, str(PROJECT_ROOT))
+    from benchmarks.run import git_commit
+    from benchmarks.statement_generator import generate_statement
+
+    commit = git_commit()
+    report: Dict[str, Any] = {"commit": commit, "python": sys.version.split()[0], "entries": {}}
+    with tempfile.TemporaryDirectory() as tmp:
+        statement = generate_statement(os.path.join(tmp, "statement.xlsx"), 200)
+        for entry in args.entries:
+            for warmup in (False, True):
+                runs = [run_entry(entry, statement, warmup) for _ in range(args.repeat)]
+                summary = {
+                    key: statistics.median(run[key] for run in runs)
+                    for key in runs[0] if key != "top_imports"
+                }
+                summary["top_imports"] = runs[-1]["top_imports"]
+                name = f"{entry}[warmup]" if warmup else entry
+                report["entries"][name] = summary
+                print(f"{name:<16} import={summary['importtime_s'] * 1000:8.1f} ms  "
+                      f"warmup={summary['warmup_s'] * 1000:8.1f} ms  "
+                      f"first_request={summary['first_request_s'] * 1000:8.1f} ms  "
+                      f"steady={summary['steady_request_s'] * 1000:7.1f} ms  "
+                      f"rss_import={summary['rss_after_import_kb'] / 1024:6.1f} MiB  "
+                      f"rss_first={summary['rss_after_first_request_kb'] / 1024:6.1f} MiB")
+
+    output = Path(args.output) if args.output else RESULTS_DIR / f"startup-{commit}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2))
+    print(f"Results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
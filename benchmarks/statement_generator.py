@@ -0,0 +1,224 @@
+"""Gerador de extratos sintéticos do Itaú para benchmarks e testes.
+
+Os arquivos seguem o layout consumido por ``convert_data``: blocos de
+lançamentos precedidos por uma linha de cabeçalho (``data``, ``valor``,
+``descricao``) e separados por linhas em branco, com datas ``dd/mm/yy`` ou
+``dd/mm/yyyy`` e valores no formato ``R$ 1.234,56``.
+"""
+import argparse
+import csv
+import html
+import random
+from datetime import date, datetime, timedelta
+from typing import List, Optional, Sequence, Tuple
+
+HEADER = ("data", "valor", "descricao")
+
+MERCHANTS = [
+    "IFOOD *REST",
+    "UBER TRIP",
+    "UBER *EATS",
+    "PADARIA CENTRAL",
+    "POSTO IPIRANGA",
+    "AMAZON MARKETPLACE",
+    "MERCADOLIVRE*LOJA",
+    "NETFLIX.COM",
+    "SPOTIFY",
+    "DROGASIL",
+    "PAG*ZEDELIVERY",
+    "CARREFOUR",
+    "LOJAS AMERICANAS",
+    "RAIA DROGASIL",
+    "SHELL BOX",
+]
+
+
+def format_valor_br(valor: float) -> str:
+    """Formata valor no padrão brasileiro (``R$ 1.234,56``)."""
+    inteiro, centavos = f"{abs(valor):.2f}".split(".")
+    grupos = []
+    while len(inteiro) > 3:
+        grupos.insert(0, inteiro[-3:])
+        inteiro = inteiro[:-3]
+    grupos.insert(0, inteiro)
+    sinal = "-" if valor < 0 else ""
+    return f"R$ {sinal}{'.'.join(grupos)},{centavos}"
+
+
+def format_data_br(dia: date, short_year: bool) -> str:
+    """Formata data como ``dd/mm/yy`` ou ``dd/mm/yyyy``."""
+    return dia.strftime("%d/%m/%y" if short_year else "%d/%m/%Y")
+
+
+def _descricao(rng: random.Random) -> str:
+    merchant = rng.choice(MERCHANTS)
+    sorteio = rng.random()
+    if sorteio < 0.15:
+        total = rng.randint(2, 12)
+        return f"{merchant} {rng.randint(1, total):02d}/{total:02d}"
+    if sorteio < 0.5:
+        return f"{merchant} {rng.randint(100, 9999)}"
+    return merchant
+
+
+def generate_rows(n_rows: int, n_blocks: int = 3, seed: int = 42,
+                  start: Optional[date] = None) -> List[Sequence]:
+    """Gera as linhas de um extrato com ``n_rows`` lançamentos em ``n_blocks`` blocos.
+
+    Cada bloco começa com a linha de cabeçalho e termina com uma linha em
+    branco. O resultado é determinístico para um mesmo ``seed``.
+    """
+    rng = random.Random(seed)
+    start = start or date(2024, 1, 1)
+    n_blocks = max(1, min(n_blocks, n_rows or 1))
+
+    rows: List[Sequence] = []
+    for block in range(n_blocks):
+        block_size = n_rows // n_blocks + (1 if block < n_rows % n_blocks else 0)
+        if block:
+            rows.append((None, None, None))
+        rows.append(HEADER)
+        for _ in range(block_size):
+            dia = start + timedelta(days=rng.randint(0, 364))
+            valor = round(rng.uniform(1, 5000), 2)
+            if rng.random() < 0.05:
+                valor = -valor  # estornos
+            rows.append((
+                format_data_br(dia, short_year=rng.random() < 0.5),
+                format_valor_br(valor),
+                _descricao(rng),
+            ))
+    return rows
+
+
+def generate_merchant_rules(n_merchants: int, n_categories: int = 40, seed: int = 42) -> List[Tuple[str, str]]:
+    """Gera regras ``(padrão, categoria)`` com ``n_merchants`` estabelecimentos sintéticos.
+
+    Os padrões têm de um a três tokens, como nomes reais de estabelecimentos.
+    """
+    rng = random.Random(seed)
+    syllables = ["BA", "CO", "DI", "FA", "GU", "LO", "MA", "NE", "PI", "RO", "SA", "TU", "VE", "ZO"]
+    rules = []
+    seen = set()
+    while len(rules) < n_merchants:
+        pattern = " ".join("".join(rng.choice(syllables) for _ in range(rng.randint(2, 4)))
+                           for _ in range(rng.randint(1, 3)))
+        if pattern not in seen:
+            seen.add(pattern)
+            rules.append((pattern, f"categoria_{rng.randrange(n_categories):02d}"))
+    return rules
+
+
+def generate_descriptions(n: int, rules: Sequence[Tuple[str, str]], miss_rate: float = 0.2,
+                          seed: int = 42) -> List[str]:
+    """Gera descrições no estilo de extrato (``PAG*<LOJA> 1234``) a partir das regras."""
+    rng = random.Random(seed)
+    descriptions = []
+    for _ in range(n):
+        merchant = "LOJA DESCONHECIDA" if rng.random() < miss_rate else rng.choice(rules)[0]
+        prefix = rng.choice(("", "", "PAG*", "MP*", "EC *"))
+        suffix = rng.choice(("", f" {rng.randint(100, 9999)}", f" {rng.randint(1, 12):02d}/12", " SAO PAULO BR"))
+        descriptions.append(f"{prefix}{merchant}{suffix}")
+    return descriptions
+
+
+def write_xlsx(path: str, rows: Sequence[Sequence]) -> str:
+    """Grava as linhas em um arquivo .xlsx."""
+    from openpyxl import Workbook
+
+    wb = Workbook()
+    ws = wb.active
+    for row in rows:
+        ws.append(list(row))
+    wb.save(path)
+    return path
+
+
+def write_xls(path: str, rows: Sequence[Sequence]) -> str:
+    """Grava as linhas em um arquivo .xls (requer ``xlwt``)."""
+    try:
+        import xlwt
+    except ImportError as e:
+        raise ImportError("xlwt is required to generate .xls statements") from e
+
+    wb = xlwt.Workbook()
+    ws = wb.add_sheet("Lançamentos")
+    for row_index, row in enumerate(rows):
+        for col_index, value in enumerate(row):
+            if value is not None:
+                ws.write(row_index, col_index, value)
+    wb.save(path)
+    return path
+
+
+def write_csv(path: str, rows: Sequence[Sequence]) -> str:
+    """Grava as linhas em um .csv separado por ``;`` (como os exports brasileiros)."""
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f, delimiter=";")
+        for row in rows:
+            writer.writerow(["" if value is None else value for value in row])
+    return path
+
+
+def _parse_valor_br(valor: str) -> float:
+    return float(valor.replace("R$", "").strip().replace(".", "").replace(",", "."))
+
+
+def write_ofx(path: str, rows: Sequence[Sequence]) -> str:
+    """Grava as linhas como extrato de cartão OFX 1.x (SGML), um extrato por bloco.
+
+    Compras são gravadas com valor negativo, como nos OFX de cartão.
+    """
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("OFXHEADER:100\nDATA:OFXSGML\nVERSION:102\nENCODING:UTF-8\nCHARSET:NONE\n\n"
+                "<OFX>\n<CREDITCARDMSGSRSV1>\n")
+        in_block = False
+        for index, row in enumerate(rows):
+            if tuple(row) == HEADER:
+                f.write("<CCSTMTTRNRS>\n<CCSTMTRS>\n<CURDEF>BRL\n<BANKTRANLIST>\n")
+                in_block = True
+                continue
+            if not any(row):
+                if in_block:
+                    f.write("</BANKTRANLIST>\n</CCSTMTRS>\n</CCSTMTTRNRS>\n")
+                    in_block = False
+                continue
+            data, valor, descricao = row
+            dia = datetime.strptime(data, "%d/%m/%y" if len(data) == 8 else "%d/%m/%Y")
+            f.write(f"<STMTTRN>\n<TRNTYPE>DEBIT\n<DTPOSTED>{dia:%Y%m%d}120000[-3:BRT]\n"
+                    f"<TRNAMT>{-_parse_valor_br(valor):.2f}\n<FITID>{index}\n<MEMO>{html.escape(descricao, quote=False)}\n</STMTTRN>\n")
+        if in_block:
+            f.write("</BANKTRANLIST>\n</CCSTMTRS>\n</CCSTMTTRNRS>\n")
+        f.write("</CREDITCARDMSGSRSV1>\n</OFX>\n")
+    return path
+
+
+WRITERS = {
+    "xlsx": write_xlsx,
+    "xls": write_xls,
+    "csv": write_csv,
+    "ofx": write_ofx,
+}
+
+
+def generate_statement(path: str, n_rows: int, n_blocks: int = 3, seed: int = 42) -> str:
+    """Gera um extrato sintético no formato indicado pela extensão de ``path``."""
+    extension = path.rsplit(".", 1)[-1].lower()
+    if extension not in WRITERS:
+        raise ValueError(f"Unsupported statement format: {extension}")
+    return WRITERS[extension](path, generate_rows(n_rows, n_blocks, seed))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Gera extratos sintéticos do Itaú")
+    parser.add_argument("output", help="Arquivo de saída (.xlsx, .xls, .csv ou .ofx)")
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--blocks", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args(argv)
+    generate_statement(args.output, args.rows, args.blocks, args.seed)
+    print(args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,222 @@
+"""Arquivo Parquet dos extratos já lidos, particionado por conta e mês.
+
+Ler o Excel é de longe a etapa mais cara do leitor. Para que uma mudança na
+normalização ou no schema não exija ler de novo todo o histórico, cada
+extrato lido é gravado em ``STATEMENT_ARCHIVE_DIR`` como um dataset Parquet
+comprimido (zstd) no formato Hive::
+
+    <dir>/account=<conta>/month=<YYYY-MM>/<arquivo>.parquet
+
+Cada arquivo guarda as linhas de um extrato em uma partição: as colunas já
+normalizadas (``id``, ``data``, ``valor`` em centavos, ``descricao``) e a proveniência de
+cada linha, ou seja, o extrato, a planilha, o número da linha, o layout e as
+células brutas passadas ao processador de linha. O nome do arquivo vem do
+conteúdo do extrato, então arquivar o mesmo extrato de novo substitui a
+versão anterior em vez de duplicá-la.
+
+``StatementArchive.statements`` lê um extrato por vez, só com as colunas
+pedidas e só das partições filtradas; ``credit_card_readers.replay`` usa
+essas linhas para republicar sem openpyxl.
+"""
+import hashlib
+import json
+import os
+import threading
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+from urllib.parse import quote
+
+from utils.factories import get_or_create
+from utils.ingestion_index import row_period
+from utils.lazy_import import lazy_import
+from utils.money import is_cents
+
+# pyarrow só é necessário para arquivar e reprocessar
+pa = lazy_import("pyarrow")
+pq = lazy_import("pyarrow.parquet")
+ds = lazy_import("pyarrow.dataset")
+
+# (planilha, linha na planilha, layout, células brutas), na mesma ordem das linhas lidas
+Provenance = Tuple[Optional[str], int, str, Tuple[Any, ...]]
+
+PARTITION_COLUMNS = ("account", "month")
+PROVENANCE_COLUMNS = ("file_path", "block", "position", "source_sheet", "source_row", "layout", "raw_cells")
+NORMALIZED_COLUMNS = ("file_path", "block", "position", "id", "data", "valor", "descricao")
+
+
+def _schema():
+    return pa.schema([
+        ("file_path", pa.string()),
+        ("content_hash", pa.string()),
+        ("archived_at", pa.timestamp("ms", tz="UTC")),
+        ("block", pa.int32()),
+        ("position", pa.int32()),
+        ("source_sheet", pa.string()),
+        ("source_row", pa.int32()),
+        ("layout", pa.string()),
+        ("raw_cells", pa.list_(pa.string())),
+        ("id", pa.string()),
+        ("data", pa.string()),
+        ("valor", pa.int64()),
+        ("descricao", pa.string()),
+    ])
+
+
+def encode_cell(value: Any) -> str:
+    """Célula bruta em JSON; datas do openpyxl e valores exatos do OFX mantêm o tipo."""
+    if isinstance(value, Decimal):
+        return json.dumps({"decimal": str(value)})
+    if isinstance(value, datetime):
+        return json.dumps({"datetime": value.isoformat()})
+    if isinstance(value, date):
+        return json.dumps({"date": value.isoformat()})
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return json.dumps(value)
+    return json.dumps(str(value))
+
+
+def decode_cell(text: str) -> Any:
+    value = json.loads(text)
+    if isinstance(value, dict):
+        if "datetime" in value:
+            return datetime.fromisoformat(value["datetime"])
+        if "date" in value:
+            return date.fromisoformat(value["date"])
+        if "decimal" in value:
+            return Decimal(value["decimal"])
+    return value
+
+
+def _as_cents(value: Any) -> Optional[int]:
+    return value if is_cents(value) else None
+
+
+def _as_text(value: Any) -> Optional[str]:
+    if value is None:
+        return None
+    return value.isoformat() if isinstance(value, (date, datetime)) else str(value)
+
+
+def statement_key(file_path: str, content_hash: Optional[str] = None) -> str:
+    """Nome do arquivo Parquet de um extrato (o mesmo a cada reprocessamento)."""
+    return hashlib.md5((content_hash or file_path).encode()).hexdigest()  # nosec B324 - not used for security
+
+
+class StatementArchive:
+    """Dataset Parquet de extratos lidos, particionado por conta e mês."""
+
+    def __init__(self, root: str, compression: str = "zstd"):
+        self.root = root
+        self.compression = compression
+        os.makedirs(root, exist_ok=True)
+
+    def _partition_dir(self, account: str, month: str) -> str:
+        return os.path.join(self.root, f"account={quote(account, safe='')}", f"month={quote(month, safe='')}")
+
+    def write(self, blocks: List[List[Dict[str, Any]]], provenance: Sequence[Provenance],
+              file_path: str, content_hash: Optional[str] = None) -> Dict[str, Any]:
+        """Grava um extrato lido; ``provenance`` tem uma entrada por linha, na ordem dos blocos.
+
+        Returns:
+            Linhas, partições e bytes gravados.
+        """
+        rows = [(block_index, position, row)
+                for block_index, block in enumerate(blocks)
+                for position, row in enumerate(block)]
+        if len(rows) != len(provenance):
+            raise ValueError(f"Provenance has {len(provenance)} entries for {len(rows)} rows")
+
+        partitions: Dict[Tuple[str, str], List[int]] = {}
+        for index, (_, _, row) in enumerate(rows):
+            key = (str(row.get("account") or ""), row_period(row))
+            partitions.setdefault(key, []).append(index)
+
+        archived_at = datetime.now().astimezone()
+        name = f"{statement_key(file_path, content_hash)}.parquet"
+        written_bytes = 0
+        for (account, month), indexes in partitions.items():
+            columns: Dict[str, List[Any]] = {column: [] for column in _schema().names}
+            for index in indexes:
+                block_index, position, row = rows[index]
+                sheet, source_row, layout, raw_cells = provenance[index]
+                columns["block"].append(block_index)
+                columns["position"].append(position)
+                columns["source_sheet"].append(sheet)
+                columns["source_row"].append(source_row)
+                columns["layout"].append(layout)
+                columns["raw_cells"].append([encode_cell(cell) for cell in raw_cells])
+                columns["id"].append(_as_text(row.get("id")))
+                columns["data"].append(_as_text(row.get("data")))
+                columns["valor"].append(_as_cents(row.get("valor")))
+                columns["descricao"].append(_as_text(row.get("descricao")))
+            columns["file_path"] = [file_path] * len(indexes)
+            columns["content_hash"] = [content_hash] * len(indexes)
+            columns["archived_at"] = [archived_at] * len(indexes)
+
+            directory = self._partition_dir(account, month)
+            os.makedirs(directory, exist_ok=True)
+            path = os.path.join(directory, name)
+            # Grava ao lado (arquivo oculto, ignorado pelo dataset) e renomeia:
+            # leitores nunca veem um arquivo pela metade
+            tmp_path = os.path.join(directory, f".{name}.{os.getpid()}.{threading.get_ident()}.tmp")
+            pq.write_table(pa.table(columns, schema=_schema()), tmp_path, compression=self.compression)
+            os.replace(tmp_path, path)
+            written_bytes += os.path.getsize(path)
+
+        return {"rows": len(rows), "partitions": len(partitions), "bytes": written_bytes}
+
+    def dataset(self):
+        partitioning = ds.partitioning(pa.schema([("account", pa.string()), ("month", pa.string())]),
+                                       flavor="hive")
+        return ds.dataset(self.root, format="parquet", partitioning=partitioning)
+
+    def statements(self, account: Optional[str] = None, month: Optional[str] = None,
+                   columns: Sequence[str] = PROVENANCE_COLUMNS) -> Iterator[Tuple[str, str, str, List[Dict[str, Any]]]]:
+        """Percorre os extratos arquivados, um arquivo (extrato × partição) por vez.
+
+        Só as partições que batem com ``account``/``month`` são abertas e só
+        ``columns`` são lidas do disco.
+
+        Yields:
+            ``(account, month, file_path, linhas)``, com as linhas na ordem original.
+        """
+        if not os.path.isdir(self.root):
+            return
+        expression = None
+        for name, value in (("account", account), ("month", month)):
+            if value is not None:
+                condition = ds.field(name) == value
+                expression = condition if expression is None else expression & condition
+        read_columns = [column for column in columns if column not in PARTITION_COLUMNS]
+        for column in ("file_path", "block", "position"):
+            if column not in read_columns:
+                read_columns.append(column)
+
+        fragments = sorted(self.dataset().get_fragments(filter=expression), key=lambda fragment: fragment.path)
+        for fragment in fragments:
+            keys = ds.get_partition_keys(fragment.partition_expression)
+            rows = fragment.to_table(columns=read_columns).to_pylist()
+            if not rows:
+                continue
+            rows.sort(key=lambda row: (row["block"], row["position"]))
+            yield keys["account"], keys["month"], rows[0]["file_path"], rows
+
+    def stats(self) -> Dict[str, Any]:
+        files = 0
+        size = 0
+        for directory, _, names in os.walk(self.root):
+            for name in names:
+                if name.endswith(".parquet"):
+                    files += 1
+                    size += os.path.getsize(os.path.join(directory, name))
+        return {"files": files, "bytes": size}
+
+
+def get_statement_archive() -> Optional[StatementArchive]:
+    """Arquivo em ``STATEMENT_ARCHIVE_DIR`` (``None`` quando não configurado)."""
+    root = os.getenv("STATEMENT_ARCHIVE_DIR")
+    if not root:
+        return None
+    return get_or_create(f"statement_archive:{root}", lambda: StatementArchive(root))
+
@@ -3,20 +3,64 @@ import re
 import json
 import hashlib
 import logging
-import pandas as pd
 from datetime import datetime
 from openpyxl import load_workbook
-from typing import List, Dict, Any, Tuple
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Dict, Any, Optional, Tuple
 import time
 
 import functions_framework
 from flask import Request
-from utils.telemetry import create_span, get_current_trace_id
-from utils.factories import get_logger, get_telemetry, get_pubsub_publisher, get_topic_path
+from credit_card_readers.archive import Provenance, StatementArchive, get_statement_archive
+from credit_card_readers.categorizer import get_categorizer
+from credit_card_readers.installments import annotate_installments, get_installment_index
+from credit_card_readers.registry import (
+    ColumnMapping,
+    Layout,
+    SNIFF_ROWS,
+    detect_layout,
+    get_layout,
+    looks_like_header,
+    match_header,
+    register_layout,
+    sniff_layout,
+)
+from credit_card_readers.text_readers import get_row_reader, head_rows
+from utils.lazy_import import lazy_import
+from utils.telemetry import create_span, extract_context, get_current_trace_id, inject_context
+from utils.hotpath import HotPathStats, collect, counted, counted_iter
+from utils.factories import (
+    get_ingestion_index,
+    get_logger,
+    get_parse_cache,
+    get_pubsub_publisher,
+    get_rate_limiter,
+    get_telemetry,
+    get_topic_path,
+    get_upload_manifest,
+    message_ordering_enabled,
+)
+from utils.manifest import file_content_key
+from utils.money import cents_text, legacy_amount_text, to_cents
+from utils.parse_cache import parse_cache_key
+from utils.profiling import profile_invocation, request_wants_profile
+from utils.warmup import Warmup, warmup_on_start
+
+# pandas só é necessário para converter .xls; não pagamos o import em todo cold start
+pd = lazy_import("pandas")
 
 # Setup logger
 logger = get_logger(__name__)
 
+def _date_fallback(result, data_str) -> bool:
+    """A conversão de data falhou quando o texto volta sem alteração."""
+    return isinstance(data_str, str) and result == data_str
+
+def _value_fallback(result, valor_str) -> bool:
+    """A conversão de valor falhou quando um valor presente vira ``None``."""
+    return result is None and valor_str is not None
+
+@counted(failure=_date_fallback)
 def converter_data_br(data_str: str) -> str:
     """Converte data do formato brasileiro para ISO."""
     try:
@@ -34,24 +78,23 @@ def converter_data_br(data_str: str) -> str:
     except Exception:
         return data_str
 
-def converter_valor_br(valor_str: str) -> float:
-    """Converte valor do formato brasileiro para float."""
-    try:
-        if not isinstance(valor_str, str):
-            return valor_str
-        
-        # Remove R$ e espaços
-        valor_str = valor_str.replace('R$', '').strip()
-        
-        # Converte para float
-        return float(valor_str.replace('.', '').replace(',', '.'))
-    except Exception:
-        return None
+@counted(failure=_value_fallback)
+def converter_valor_br(valor_str: Any) -> Optional[int]:
+    """Converte valor do formato brasileiro (ou célula numérica em reais) para centavos."""
+    return to_cents(valor_str)
+
+@counted()
+def compute_row_hash(row: Dict[str, Any], columns: List[str], account: str,
+                     amount_text: Optional[str] = None) -> str:
+    """Computa hash MD5 para uma linha de dados.
 
-def compute_row_hash(row: Dict[str, Any], columns: List[str], account: str) -> str:
-    """Computa hash MD5 para uma linha de dados."""
+    ``amount_text`` é o texto do valor usado no hash (``legacy_amount_text``
+    da célula original, o mesmo de antes dos centavos, para os ids não
+    mudarem); sem ele, os centavos de ``valor`` viram texto em reais.
+    """
     # Cria string com valores concatenados
-    values = [str(row.get(col, '')) for col in columns]
+    values = [(cents_text(row.get(col, '')) if amount_text is None else amount_text)
+              if col == 'valor' else str(row.get(col, '')) for col in columns]
     values.append(account)
     data = ''.join(values)
     
@@ -64,14 +107,16 @@ def convert_xls_to_xlsx(file_path: str) -> str:
         try:
             logger.info("Converting XLS to XLSX", extra={"file_path": file_path})
             
-            # Lê o arquivo .xls
-            df = pd.read_excel(file_path, engine='xlrd')
+            # Lê todas as planilhas do arquivo .xls, sem interpretar cabeçalho
+            sheets = pd.read_excel(file_path, engine='xlrd', sheet_name=None, header=None)
             
             # Cria novo caminho para arquivo .xlsx
             xlsx_path = file_path.replace('.xls', '.xlsx')
             
-            # Salva como .xlsx
-            df.to_excel(xlsx_path, index=False)
+            # Salva como .xlsx preservando nomes e ordem das planilhas
+            with pd.ExcelWriter(xlsx_path) as writer:
+                for sheet_name, df in sheets.items():
+                    df.to_excel(writer, sheet_name=sheet_name, index=False, header=False)
             
             logger.info("XLS to XLSX conversion completed",
                           extra={"original_file": file_path,
@@ -92,84 +137,258 @@ def process_row(row, current_columns, account):
             valor_celula = row[col_index] if col_index < len(row) else None
             row_dict[col_name] = valor_celula
     
+    amount_text = None
     if 'data' in row_dict:
         row_dict['data'] = converter_data_br(row_dict['data'])
     if 'valor' in row_dict:
+        amount_text = legacy_amount_text(row_dict['valor'])
         row_dict['valor'] = converter_valor_br(row_dict['valor'])
     
     row_dict['account'] = account
-    row_dict['id'] = compute_row_hash(row_dict, current_columns, account)
+    row_dict['id'] = compute_row_hash(row_dict, current_columns, account, amount_text)
     return row_dict
 
 def process_header(row):
     """Processa o cabeçalho da planilha."""
     return [str(x).strip().lower() if x else None for x in row]
 
-def convert_data(file_path: str, account: str) -> List[List[Dict[str, Any]]]:
-    """Converte dados do Excel para lista de dicionários."""
-    with create_span("convert_data", {"file_path": file_path, "account": account}) as span:
+@counted()
+def process_itau_row(values: Tuple[Any, ...], account: str) -> Dict[str, Any]:
+    """Processa uma linha do layout Itaú já reduzida a (data, valor, descricao)."""
+    data, valor, descricao = values
+    
+    # Cria dicionário com dados
+    row_data = {
+        'data': converter_data_br(data),
+        'valor': converter_valor_br(valor),
+        'descricao': descricao,
+        'account': account
+    }
+    
+    # Adiciona hash
+    row_data['id'] = compute_row_hash(
+        row_data,
+        ['data', 'valor', 'descricao'],
+        account,
+        legacy_amount_text(valor)
+    )
+    return row_data
+
+# Layout padrão dos extratos Itaú; sem cabeçalho assume data, valor, descricao
+ITAU_LAYOUT = register_layout(Layout(
+    name="itau",
+    aliases={
+        'data': ('data',),
+        'valor': ('valor', 'valor (r$)', 'valor em r$'),
+        'descricao': ('descricao', 'descrição', 'lançamento', 'lancamento', 'estabelecimento'),
+    },
+    row_processor=process_itau_row,
+    default_mapping=ColumnMapping((0, 1, 2)),
+))
+
+def _parse_rows(rows, account: str, layout: Optional[Layout] = None,
+                mapping: Optional[ColumnMapping] = None, provenance: Optional[List[Provenance]] = None,
+                sheet: Optional[str] = None) -> List[List[Dict[str, Any]]]:
+    """Agrupa as linhas de uma planilha em blocos de lançamentos.
+    
+    Cada linha de cabeçalho recompila o mapeamento de colunas (uma vez por
+    bloco) e seleciona o processador de linha do layout correspondente.
+    Com ``provenance``, cada lançamento também registra ali a planilha, o
+    número da linha, o layout e as células brutas que o originaram.
+    """
+    layout = layout or ITAU_LAYOUT
+    mapping = mapping or layout.default_mapping
+    process = layout.row_processor
+    
+    # Lista para armazenar blocos de dados
+    data_blocks = []
+    current_block = []
+    
+    # Processa linhas
+    for row_number, row in enumerate(rows, start=1):
+        # Verifica se é uma linha de cabeçalho
+        if looks_like_header(row):
+            match = match_header(row, preferred=layout)
+            if match:
+                layout, mapping = match
+                process = layout.row_processor
+            else:
+                # Cabeçalho que nenhum layout reconhece: encerra o bloco sem
+                # tratar a linha como lançamento
+                logger.warning("Unmatched header row",
+                               extra={"sheet": sheet, "row_number": row_number, "header": list(row)})
+            # Se já temos um bloco, adiciona à lista
+            if current_block:
+                data_blocks.append(current_block)
+                current_block = []
+            continue
+        
+        # Verifica se é uma linha vazia
+        if not any(row):
+            if current_block:
+                data_blocks.append(current_block)
+                current_block = []
+            continue
+        
+        # Processa linha de dados
+        values = mapping.extract(row)
+        current_block.append(process(values, account))
+        if provenance is not None:
+            provenance.append((sheet, row_number, layout.name, values))
+    
+    # Adiciona último bloco se houver
+    if current_block:
+        data_blocks.append(current_block)
+    
+    return data_blocks
+
+def convert_data(file_path: str, account: str, layout: Optional[Layout] = None,
+                 mapping: Optional[ColumnMapping] = None,
+                 provenance: Optional[List[Provenance]] = None,
+                 parser: Optional[str] = None) -> List[List[Dict[str, Any]]]:
+    """Converte dados do extrato (Excel, CSV ou OFX) para lista de dicionários.
+    
+    ``parser`` é o tipo roteado pelo trigger; sem ele o tipo vem da extensão.
+    """
+    with create_span("convert_data", {"file_path": file_path, "account": account}) as span, \
+            collect() as hotpath:
         try:
             logger.info("Starting data conversion", extra={"file_path": file_path, "account": account})
             
+            # CSV/OFX: leitura em streaming, mesmas regras de bloco e normalização
+            row_reader = get_row_reader(file_path, parser)
+            if row_reader is not None:
+                rows = counted_iter("read_rows", row_reader(file_path))
+                data_blocks = _parse_rows(rows, account, layout, mapping, provenance)
+            else:
+                # Converte .xls para .xlsx se necessário
+                if file_path.endswith('.xls'):
+                    file_path = convert_xls_to_xlsx(file_path)
+                
+                # Carrega workbook em modo streaming (read-only)
+                wb = load_workbook(file_path, read_only=True, data_only=True)
+                try:
+                    rows = counted_iter("read_rows", wb.active.iter_rows(values_only=True))
+                    data_blocks = _parse_rows(rows, account, layout, mapping, provenance, wb.active.title)
+                finally:
+                    wb.close()
+            
+            logger.info("Data conversion completed",
+                          extra={"file_path": file_path,
+                                 "blocks_count": len(data_blocks),
+                                 "total_rows": sum(len(block) for block in data_blocks)})
+            
+            return data_blocks
+        except Exception as e:
+            error_msg = f"Error processing file: {str(e)}"
+            logger.error(error_msg, extra={"file_path": file_path})
+            span.set_attribute("error", error_msg)
+            raise
+        finally:
+            record_hotpath(span, hotpath, file_path)
+
+def record_hotpath(span, hotpath: HotPathStats, file_path: str):
+    """Anexa os contadores das funções por linha ao span e às métricas, uma vez por arquivo."""
+    summary = hotpath.summary()
+    if not summary:
+        return
+    for name, value in hotpath.span_attributes().items():
+        span.set_attribute(name, value)
+    logger.info("SLI: hotpath", extra={"file_path": file_path, "functions": summary})
+
+def _parse_sheet(file_path: str, sheet_name: str, account: str, with_provenance: bool = False,
+                 layout_name: Optional[str] = None, mapping_indexes: Optional[Tuple[int, ...]] = None):
+    """Lê uma única planilha (executado nos processos do pool).
+    
+    O layout chega pelo nome e o mapeamento pelos índices das colunas, para
+    não serializar o processador de linha entre processos. Devolve também os
+    contadores das funções por linha, que não atravessam a fronteira do
+    processo pelo thread-local, e a proveniência das linhas quando
+    ``with_provenance``.
+    """
+    start_time = time.monotonic()
+    provenance = [] if with_provenance else None
+    layout = get_layout(layout_name) if layout_name else None
+    mapping = ColumnMapping(mapping_indexes) if mapping_indexes else None
+    with collect() as hotpath:
+        wb = load_workbook(file_path, read_only=True, data_only=True)
+        try:
+            rows = counted_iter("read_rows", wb[sheet_name].iter_rows(values_only=True))
+            blocks = _parse_rows(rows, account, layout, mapping, provenance, sheet_name)
+        finally:
+            wb.close()
+    return sheet_name, blocks, time.monotonic() - start_time, hotpath.counters, provenance
+
+def convert_sheets(file_path: str, account: str, sheets: Optional[List[str]] = None,
+                   sheet_accounts: Optional[Dict[str, str]] = None,
+                   max_workers: Optional[int] = None,
+                   provenance: Optional[List[Provenance]] = None,
+                   layout: Optional[Layout] = None,
+                   mapping: Optional[ColumnMapping] = None) -> List[List[Dict[str, Any]]]:
+    """Converte várias planilhas (uma por cartão/titular) em paralelo.
+    
+    Sem ``sheets`` todas as planilhas são lidas. ``sheet_accounts`` mapeia o
+    nome da planilha para a conta; planilhas sem mapeamento usam ``account``.
+    ``layout``/``mapping`` são os detectados (ou roteados) para o arquivo,
+    como em ``convert_data``. Os blocos são devolvidos na ordem das
+    planilhas no arquivo.
+    """
+    sheet_accounts = sheet_accounts or {}
+    with create_span("convert_sheets", {"file_path": file_path, "account": account}) as span:
+        try:
+            logger.info("Starting multi-sheet conversion",
+                        extra={"file_path": file_path, "sheets": sheets})
+            
             # Converte .xls para .xlsx se necessário
             if file_path.endswith('.xls'):
                 file_path = convert_xls_to_xlsx(file_path)
             
-            # Carrega workbook
-            wb = load_workbook(file_path, data_only=True)
-            sheet = wb.active
+            # Apenas os nomes das planilhas; o conteúdo é lido nos workers
+            wb = load_workbook(file_path, read_only=True)
+            available = wb.sheetnames
+            wb.close()
             
-            # Lista para armazenar blocos de dados
-            data_blocks = []
-            current_block = []
+            if sheets is None:
+                selected = available
+            else:
+                missing = [name for name in sheets if name not in available]
+                if missing:
+                    raise ValueError(f"Sheets not found: {missing}")
+                selected = [name for name in available if name in sheets]
             
-            # Processa linhas
-            for row in sheet.iter_rows(values_only=True):
-                # Verifica se é uma linha de cabeçalho
-                if row[0] == 'data':
-                    # Se já temos um bloco, adiciona à lista
-                    if current_block:
-                        data_blocks.append(current_block)
-                        current_block = []
-                    continue
-                
-                # Verifica se é uma linha vazia
-                if not any(row):
-                    if current_block:
-                        data_blocks.append(current_block)
-                        current_block = []
-                    continue
-                
-                # Processa linha de dados
-                data = converter_data_br(row[0])
-                valor = converter_valor_br(row[1])
-                descricao = row[2]
-                
-                # Cria dicionário com dados
-                row_data = {
-                    'data': data,
-                    'valor': valor,
-                    'descricao': descricao,
-                    'account': account
-                }
-                
-                # Adiciona hash
-                row_data['id'] = compute_row_hash(
-                    row_data,
-                    ['data', 'valor', 'descricao'],
-                    account
-                )
-                
-                current_block.append(row_data)
+            # A leitura do openpyxl é Python puro e presa ao GIL: o paralelismo
+            # precisa de processos. O layout vai pelo nome (registrado no import)
+            jobs = [(file_path, name, sheet_accounts.get(name, account), provenance is not None,
+                     layout.name if layout else None, mapping.indexes if mapping else None)
+                    for name in selected]
+            # Mais processos que CPUs só somam o custo de criar os workers
+            cpus = os.cpu_count() or 1
+            workers = min(len(jobs), max_workers or cpus, cpus)
+            if workers > 1:
+                with ProcessPoolExecutor(max_workers=workers) as executor:
+                    results = list(executor.map(_parse_sheet, *zip(*jobs)))
+            else:
+                results = [_parse_sheet(*job) for job in jobs]
             
-            # Adiciona último bloco se houver
-            if current_block:
-                data_blocks.append(current_block)
+            data_blocks = []
+            hotpath = HotPathStats()
+            span.set_attribute("sheets_count", len(results))
+            span.set_attribute("workers", workers)
+            for sheet_name, blocks, duration, counters, sheet_provenance in results:
+                data_blocks.extend(blocks)
+                hotpath.merge(counters)
+                if provenance is not None:
+                    provenance.extend(sheet_provenance)
+                span.set_attribute(f"sheet.{sheet_name}.duration_ms", round(duration * 1000, 3))
+                span.set_attribute(f"sheet.{sheet_name}.rows", sum(len(block) for block in blocks))
             
-            logger.info("Data conversion completed",
-                          extra={"file_path": file_path,
-                                 "blocks_count": len(data_blocks),
-                                 "total_rows": sum(len(block) for block in data_blocks)})
+            logger.info("Multi-sheet conversion completed",
+                        extra={"file_path": file_path,
+                               "sheets": [result[0] for result in results],
+                               "sheet_durations": {result[0]: result[2] for result in results},
+                               "blocks_count": len(data_blocks),
+                               "total_rows": sum(len(block) for block in data_blocks)})
+            record_hotpath(span, hotpath, file_path)
             
             return data_blocks
         except Exception as e:
@@ -178,14 +397,145 @@ def convert_data(file_path: str, account: str) -> List[List[Dict[str, Any]]]:
             span.set_attribute("error", error_msg)
             raise
 
+def read_statement(file_path: str, sheets=None, sheet_accounts=None, span=None,
+                   provenance: Optional[List[Provenance]] = None, parser: Optional[str] = None,
+                   layout_name: Optional[str] = None) -> List[List[Dict[str, Any]]]:
+    """Lê o extrato: converte .xls, detecta o layout e extrai os blocos.
+    
+    ``parser`` e ``layout_name`` vêm da rota do trigger: o tipo de parser
+    escolhe entre planilha e leitor de texto sem olhar a extensão, e o layout
+    dispensa a detecção pelas primeiras linhas (cabeçalhos de outro layout
+    ainda são reconhecidos bloco a bloco). CSV e OFX não têm planilhas:
+    ``sheets``/``sheet_accounts`` são ignorados.
+    """
+    # Converter XLS para XLSX se necessário
+    if file_path.endswith(".xls"):
+        start_time = time.monotonic()
+        file_path = convert_xls_to_xlsx(file_path)
+        conversion_duration = time.monotonic() - start_time
+        logger.info("SLI: xls_conversion_duration",
+                  extra={"duration": conversion_duration, "file_path": file_path})
+    
+    # Layout da rota ou detectado lendo apenas as primeiras linhas
+    text_format = get_row_reader(file_path, parser) is not None
+    if layout_name:
+        detected = (get_layout(layout_name), None)
+    elif text_format:
+        detected = sniff_layout(head_rows(file_path, SNIFF_ROWS, parser))
+    else:
+        detected = detect_layout(file_path)
+    layout, mapping = detected if detected else (None, None)
+    if span is not None:
+        span.set_attribute("layout", layout.name if layout else "default")
+    logger.info("Statement layout detected",
+                extra={"file_path": file_path,
+                       "layout": layout.name if layout else None,
+                       "source": "route" if layout_name else "detected"})
+    
+    # Converter dados (todas/algumas planilhas quando solicitado)
+    if (sheets or sheet_accounts) and not text_format:
+        if sheets == "*":
+            sheets = None
+        elif isinstance(sheets, str):
+            sheets = [sheets]
+        return convert_sheets(file_path, 'ITAU_CARD', sheets=sheets, sheet_accounts=sheet_accounts,
+                              provenance=provenance, layout=layout, mapping=mapping)
+    return convert_data(file_path, 'ITAU_CARD', layout, mapping, provenance, parser)
+
+def record_installments(blocks: List[List[Dict[str, Any]]], file_path: Optional[str] = None):
+    """Atualiza o índice de compras parceladas com as parcelas publicadas."""
+    try:
+        recorded = get_installment_index().record(row for block in blocks for row in block)
+        logger.info("SLI: installments_recorded",
+                   extra={"file_path": file_path, "rows_count": recorded})
+    except Exception as e:
+        # A mensagem já foi publicada: o índice é atualizado no próximo extrato
+        logger.error(f"Error updating installment index: {str(e)}",
+                    extra={"file_path": file_path})
+
+def record_archive(archive: StatementArchive, blocks: List[List[Dict[str, Any]]],
+                   provenance: List[Provenance], file_path: str, content_hash: Optional[str] = None):
+    """Grava o extrato lido no arquivo Parquet usado pelo reprocessamento."""
+    try:
+        start_time = time.monotonic()
+        result = archive.write(blocks, provenance, file_path, content_hash)
+        logger.info("SLI: statement_archived",
+                   extra={"file_path": file_path,
+                         "duration": time.monotonic() - start_time,
+                         **result})
+    except Exception as e:
+        # O arquivo serve só ao reprocessamento: a publicação segue sem ele
+        logger.error(f"Error archiving statement: {str(e)}",
+                    extra={"file_path": file_path})
+
+def _warm_parser():
+    """Exercita o caminho de leitura (openpyxl read-only) com uma planilha mínima."""
+    from io import BytesIO
+    from openpyxl import Workbook
+
+    buffer = BytesIO()
+    wb = Workbook()
+    wb.active.append(["data", "valor", "descricao"])
+    wb.active.append(["01/01/2024", "R$ 1,00", "WARMUP"])
+    wb.save(buffer)
+    buffer.seek(0)
+    wb = load_workbook(buffer, read_only=True, data_only=True)
+    try:
+        _parse_rows(wb.active.iter_rows(values_only=True), "warmup")
+    finally:
+        wb.close()
+
+def ordering_key_for(file_path: str, request_json: Dict[str, Any]) -> str:
+    """Conta do extrato usada como ordering_key (a pasta do arquivo quando o trigger não a envia)."""
+    if not message_ordering_enabled():
+        return ""
+    account = request_json.get("account")
+    if not account and "/" in file_path:
+        account = file_path.split("/", 1)[0]
+    return account or ""
+
+def publish_message(publisher, topic_path: str, data: bytes, ordering_key: str = "", **attributes):
+    """Publica e espera a confirmação, mantendo a ordem das mensagens da mesma conta.
+    
+    Depois de uma falha o publisher pausa a ordering_key para não publicar
+    fora de ordem; ela é retomada aqui, já que a nova tentativa do upload
+    republica a mesma mensagem.
+    """
+    if ordering_key:
+        attributes["ordering_key"] = ordering_key
+    get_rate_limiter().acquire("pubsub.publish", topic_path)
+    try:
+        return publisher.publish(topic_path, data, **attributes).result()
+    except Exception:
+        if ordering_key:
+            publisher.resume_publish(topic_path, ordering_key)
+        raise
+
+# Inicialização pesada feita antes da primeira requisição (WARMUP_ON_START ou /_ah/warmup)
+WARMUP = Warmup("azul_visa_reader", [
+    ("telemetry", lambda: get_telemetry("azul_visa_reader")),
+    ("pubsub_publisher", lambda: get_topic_path(get_pubsub_publisher())),
+    ("parser", _warm_parser),
+    ("pandas", lambda: pd.read_excel),
+    ("categorizer", lambda: get_categorizer()),
+    ("upload_manifest", lambda: get_upload_manifest()),
+    ("parse_cache", lambda: get_parse_cache()),
+    ("installment_index", lambda: get_installment_index()),
+])
+if warmup_on_start():
+    WARMUP.start()
+
 @functions_framework.http
+@WARMUP.entry_point
+@profile_invocation("parse_excel", request_wants_profile)
 def parse_excel(request: Request, publisher=None, topic_path=None, telemetry=None):
     """HTTP Cloud Function para processar arquivo Excel."""
     publisher = publisher or get_pubsub_publisher()
     topic_path = topic_path or get_topic_path(publisher)
     telemetry = telemetry or get_telemetry("azul_visa_reader")
     
-    with create_span("parse_excel") as span:
+    # Continua o trace do trigger (traceparent W3C nos headers HTTP)
+    with create_span("parse_excel", context=extract_context(getattr(request, "headers", None))) as span:
         try:
             # Verificar se é uma requisição local
             if not os.getenv("K_SERVICE"):
@@ -206,34 +556,84 @@ def parse_excel(request: Request, publisher=None, topic_path=None, telemetry=Non
                 span.set_attribute("error", error_msg)
                 return (error_msg, 400)
             
+            # Pular arquivos cujo conteúdo já foi publicado
+            manifest = get_upload_manifest()
+            content_hash = request_json.get("content_hash") or file_content_key(file_path)
+            if content_hash and manifest.is_done(content_hash):
+                skips = manifest.record_skip("reader")
+                logger.info("SLI: duplicate_upload_skipped",
+                           extra={"stage": "reader",
+                                 "file_path": file_path,
+                                 "content_hash": content_hash,
+                                 "skips_total": skips})
+                span.set_attribute("duplicate", True)
+                return ("Already processed", 200)
+            
             # Registrar início do processamento
             logger.info("Starting file processing", extra={"file_path": file_path})
             
-            # Converter XLS para XLSX se necessário
-            if file_path.endswith(".xls"):
-                start_time = time.monotonic()
-                file_path = convert_xls_to_xlsx(file_path)
-                conversion_duration = time.monotonic() - start_time
-                logger.info("SLI: xls_conversion_duration",
-                          extra={"duration": conversion_duration, "file_path": file_path})
-            
-            # Ler dados do Excel
+            # Reaproveitar o resultado de uma tentativa anterior (ex.: falha no publish)
+            sheets = request_json.get("sheets")
+            sheet_accounts = request_json.get("sheet_accounts")
+            parser = request_json.get("parser")
+            layout_name = request_json.get("layout")
+            parse_cache = get_parse_cache()
+            cache_key = parse_cache_key(file_path, content_hash, request_json.get("generation"),
+                                        sheets=sheets, sheet_accounts=sheet_accounts,
+                                        parser=parser, layout=layout_name) if parse_cache else None
             start_time = time.monotonic()
-            wb = load_workbook(file_path)
-            ws = wb.active
+            converted_rows = parse_cache.get(cache_key) if cache_key else None
+            if cache_key:
+                logger.info("SLI: parse_cache_hit" if converted_rows is not None else "SLI: parse_cache_miss",
+                           extra={"file_path": file_path, **parse_cache.stats()})
+                span.set_attribute("parse_cache.hit", converted_rows is not None)
+            
+            if converted_rows is None:
+                # A proveniência só é coletada quando o arquivo Parquet está configurado
+                archive = get_statement_archive()
+                provenance = [] if archive is not None else None
+                converted_rows = read_statement(file_path, sheets, sheet_accounts, span, provenance,
+                                                parser, layout_name)
+                if archive is not None:
+                    record_archive(archive, converted_rows, provenance, file_path, content_hash)
+                if cache_key:
+                    try:
+                        parse_cache.put(cache_key, converted_rows)
+                    except OSError as e:
+                        logger.warning(f"Could not cache parsed statement: {str(e)}",
+                                       extra={"file_path": file_path})
+            
+            # Categorizar lançamentos pela descrição
+            categorize_start = time.monotonic()
+            categorized = get_categorizer().categorize_blocks(converted_rows)
+            total_rows = sum(len(block) for block in converted_rows)
+            logger.info("SLI: categorization",
+                       extra={"file_path": file_path,
+                             "duration": time.monotonic() - categorize_start,
+                             "rows_count": total_rows,
+                             "categorized_rows": categorized})
+            span.set_attribute("categorized_rows", categorized)
             
-            # Processar linhas
-            rows = []
-            for row in ws.iter_rows(min_row=2, values_only=True):
-                if row[0]:  # Verificar se a linha não está vazia
-                    rows.append({
-                        "data": row[0],
-                        "descricao": row[1],
-                        "valor": row[2]
-                    })
+            # Identificar parcelas (xx/yy) e ligar cada uma à compra original
+            installment_rows = annotate_installments(converted_rows)
+            span.set_attribute("installment_rows", installment_rows)
             
-            # Converter dados
-            converted_rows = convert_data(file_path, 'ITAU_CARD')
+            # Modo incremental: publica apenas linhas novas ou alteradas
+            index_entries = None
+            incremental = request_json.get("incremental")
+            if incremental is None:
+                incremental = os.getenv("INCREMENTAL_INGESTION", "").lower() in ("1", "true", "yes")
+            if incremental:
+                converted_rows, diff_stats, index_entries = get_ingestion_index().diff_blocks(converted_rows)
+                logger.info("SLI: incremental_diff",
+                           extra={"file_path": file_path, **diff_stats})
+                for name, value in diff_stats.items():
+                    span.set_attribute(f"incremental.{name}", value)
+                if not converted_rows:
+                    if content_hash:
+                        manifest.mark_done(content_hash, file_path=file_path)
+                    logger.info("No new rows to publish", extra={"file_path": file_path})
+                    return ("OK", 200)
             
             # Publicar mensagem no Pub/Sub
             message = {
@@ -241,12 +641,22 @@ def parse_excel(request: Request, publisher=None, topic_path=None, telemetry=Non
                 "file_path": file_path,
                 "trace_id": get_current_trace_id()
             }
+            if index_entries is not None:
+                # O writer registra estas entradas no índice após escrever
+                message["index_entries"] = index_entries
+            
+            # O contexto do span de publish vai nos atributos para o writer continuar o trace
+            ordering_key = ordering_key_for(file_path, request_json)
+            with create_span("pubsub_publish", {"topic": topic_path, "ordering_key": ordering_key}):
+                publish_message(publisher, topic_path, json.dumps(message).encode("utf-8"),
+                                ordering_key, **inject_context())
             
-            future = publisher.publish(
-                topic_path,
-                json.dumps(message).encode("utf-8")
-            )
-            future.result()
+            if content_hash:
+                manifest.mark_done(content_hash, file_path=file_path)
+            if cache_key:
+                parse_cache.delete(cache_key)
+            if installment_rows:
+                record_installments(converted_rows, file_path)
             
             # Registrar métricas
             processing_duration = time.monotonic() - start_time
@@ -268,16 +678,3 @@ def parse_excel(request: Request, publisher=None, topic_path=None, telemetry=Non
                         extra={"file_path": file_path if 'file_path' in locals() else None})
             span.set_attribute("error", error_msg)
             return (error_msg, 500)
-
-def main(logger=None, telemetry=None):
-    logger = logger or get_logger(__name__)
-    telemetry = telemetry or get_telemetry("writer")
-    # ... resto do código ...
-
-from unittest.mock import MagicMock
-
-def test_main():
-    fake_logger = MagicMock()
-    fake_telemetry = MagicMock()
-    main(logger=fake_logger, telemetry=fake_telemetry)
-    # ... asserts ...
@@ -0,0 +1,129 @@
+"""Categorização de lançamentos pela descrição (``descricao``).
+
+As regras associam nomes de estabelecimentos (``"IFOOD"``, ``"UBER"``,
+``"POSTO SHELL"``...) a categorias. Descrições e padrões são normalizados
+para tokens (maiúsculas, sem acentos, pontuação vira espaço), e todos os
+padrões são compilados em um único autômato Aho-Corasick sobre tokens: cada
+descrição é percorrida uma vez, independentemente do número de regras.
+Quando vários padrões casam, vence o mais longo (em tokens) e, no empate, o
+que aparece primeiro nas regras.
+
+As regras são lidas de ``CATEGORY_RULES_PATH`` (ou do ``category_rules.json``
+ao lado deste módulo) e compiladas uma única vez por processo.
+"""
+import json
+import os
+import re
+import unicodedata
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from utils.factories import discard_instance, get_or_create
+
+DEFAULT_RULES_PATH = os.path.join(os.path.dirname(__file__), "category_rules.json")
+
+_NON_ALNUM = re.compile(r"[^A-Z0-9]+")
+
+
+def tokenize(text: Any) -> Tuple[str, ...]:
+    """Normaliza um texto para tokens: maiúsculas, sem acentos, só letras e dígitos."""
+    if not isinstance(text, str):
+        return ()
+    text = text.upper()
+    if not text.isascii():
+        text = "".join(ch for ch in unicodedata.normalize("NFKD", text) if not unicodedata.combining(ch))
+    return tuple(_NON_ALNUM.sub(" ", text).split())
+
+
+class Categorizer:
+    """Autômato Aho-Corasick sobre tokens que mapeia descrições para categorias."""
+
+    def __init__(self, rules: Sequence[Tuple[str, str]], cache_size: int = 65536):
+        # Nó 0 é a raiz; cada nó guarda transições, link de falha e melhor saída
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        # Saída: (tokens do padrão, -ordem da regra, categoria) — maior vence
+        self._output: List[Optional[Tuple[int, int, str]]] = [None]
+        self.patterns = 0
+        for order, (pattern, category) in enumerate(rules):
+            self._add(tokenize(pattern), category, order)
+        self._build()
+        self.categorize = lru_cache(maxsize=cache_size)(self._categorize)
+
+    def _add(self, tokens: Tuple[str, ...], category: str, order: int) -> None:
+        if not tokens:
+            return
+        node = 0
+        for token in tokens:
+            next_node = self._goto[node].get(token)
+            if next_node is None:
+                next_node = len(self._goto)
+                self._goto[node][token] = next_node
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append(None)
+            node = next_node
+        candidate = (len(tokens), -order, category)
+        if self._output[node] is None or candidate > self._output[node]:
+            self._output[node] = candidate
+        self.patterns += 1
+
+    def _build(self) -> None:
+        """Calcula os links de falha (BFS) e propaga a melhor saída por eles."""
+        queue = list(self._goto[0].values())
+        for node in queue:
+            for token, child in self._goto[node].items():
+                fail = self._fail[node]
+                while fail and token not in self._goto[fail]:
+                    fail = self._fail[fail]
+                target = self._goto[fail].get(token, 0)
+                self._fail[child] = target if target != child else 0
+                inherited = self._output[self._fail[child]]
+                if inherited is not None and (self._output[child] is None or inherited > self._output[child]):
+                    self._output[child] = inherited
+                queue.append(child)
+
+    def _categorize(self, descricao: Any) -> Optional[str]:
+        goto, fail, output = self._goto, self._fail, self._output
+        node = 0
+        best = None
+        for token in tokenize(descricao):
+            while node and token not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(token, 0)
+            match = output[node]
+            if match is not None and (best is None or match > best):
+                best = match
+        return best[2] if best else None
+
+    def categorize_blocks(self, blocks: List[List[Dict[str, Any]]]) -> int:
+        """Adiciona ``category`` a cada linha; devolve quantas linhas foram categorizadas."""
+        categorize = self.categorize
+        matched = 0
+        for block in blocks:
+            for row in block:
+                category = categorize(row.get("descricao"))
+                row["category"] = category
+                if category is not None:
+                    matched += 1
+        return matched
+
+
+def load_rules(path: str) -> List[Tuple[str, str]]:
+    """Lê regras no formato ``{"categorias": {"<categoria>": ["<padrão>", ...]}}``."""
+    with open(path, encoding="utf-8") as f:
+        document = json.load(f)
+    return [(pattern, category)
+            for category, patterns in document["categorias"].items()
+            for pattern in patterns]
+
+
+def get_categorizer() -> Categorizer:
+    """Categorizador compilado uma vez por processo a partir de ``CATEGORY_RULES_PATH``."""
+    return get_or_create("categorizer", lambda: Categorizer(
+        load_rules(os.getenv("CATEGORY_RULES_PATH", DEFAULT_RULES_PATH))))
+
+
+def reset_categorizer() -> None:
+    """Descarta o categorizador compilado (ex.: após trocar as regras)."""
+    discard_instance("categorizer")
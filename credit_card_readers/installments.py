@@ -0,0 +1,194 @@
+"""Compras parceladas: marcadores ``xx/yy`` nas descrições e índice de compromissos futuros.
+
+O Itaú descreve parcelas como ``"LOJA X 03/10"`` ou ``"LOJA X PARC 03/10"``.
+``parse_installment`` separa o estabelecimento, o número da parcela e o total
+de parcelas; ``annotate_installments`` grava esses campos e um
+``purchase_id`` em cada linha parcelada.
+
+O ``purchase_id`` liga as parcelas de uma mesma compra entre extratos. Ele é
+derivado da conta, do estabelecimento normalizado, do total de parcelas, do
+valor da parcela e do mês de origem (mês do lançamento menos as parcelas já
+pagas), que é o mesmo para todas as parcelas da compra.
+
+``InstallmentIndex`` guarda uma linha por compra com a maior parcela já vista,
+então projetar as parcelas restantes de uma compra é uma consulta pela chave
+primária, sem varrer lançamentos. Valores de parcela ficam em centavos.
+"""
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from credit_card_readers.categorizer import tokenize
+from utils.factories import get_or_create
+from utils.ingestion_index import UNKNOWN_PERIOD, row_period
+from utils.money import cents_text, to_cents
+
+DEFAULT_INDEX_PATH = "/tmp/installments.sqlite3"
+
+# PRAGMA user_version a partir do qual installment_value está em centavos
+CENTS_SCHEMA_VERSION = 1
+
+_INSTALLMENT = re.compile(
+    r"^(?P<merchant>.*?)[\s*-]*(?:PARC(?:ELA)?\.?\s*)?(?<!\d)(?P<number>\d{1,2})\s*/\s*(?P<total>\d{1,2})\s*$",
+    re.IGNORECASE,
+)
+
+
+def parse_installment(descricao: Any) -> Optional[Tuple[str, int, int]]:
+    """Extrai ``(estabelecimento, parcela, total)`` de uma descrição parcelada."""
+    if not isinstance(descricao, str) or "/" not in descricao:
+        return None
+    match = _INSTALLMENT.match(descricao.strip())
+    if not match:
+        return None
+    number, total = int(match.group("number")), int(match.group("total"))
+    merchant = match.group("merchant").strip()
+    if not merchant or total < 2 or not 1 <= number <= total:
+        return None
+    return merchant, number, total
+
+
+def add_months(period: str, months: int) -> str:
+    """Soma meses a um período ``YYYY-MM``."""
+    year, month = int(period[:4]), int(period[5:7])
+    index = year * 12 + (month - 1) + months
+    return f"{index // 12:04d}-{index % 12 + 1:02d}"
+
+
+def purchase_id(account: str, merchant: str, total: int, valor: Any, origin_month: str) -> str:
+    # cents_text mantém os ids gerados quando o valor era um float em reais
+    material = f"{account}|{' '.join(tokenize(merchant))}|{total}|{cents_text(valor)}|{origin_month}"
+    return hashlib.md5(material.encode()).hexdigest()  # nosec B324 - not used for security
+
+
+def annotate_installments(blocks: List[List[Dict[str, Any]]]) -> int:
+    """Adiciona ``installment_number``, ``installment_total`` e ``purchase_id`` às linhas.
+
+    Linhas sem marcador recebem ``None`` nos três campos. Devolve quantas
+    linhas são parcelas.
+    """
+    found = 0
+    for block in blocks:
+        for row in block:
+            parsed = parse_installment(row.get("descricao"))
+            period = row_period(row)
+            if parsed is None or period == UNKNOWN_PERIOD:
+                row["installment_number"] = row["installment_total"] = row["purchase_id"] = None
+                continue
+            merchant, number, total = parsed
+            origin_month = add_months(period, -(number - 1))
+            row["installment_number"] = number
+            row["installment_total"] = total
+            row["purchase_id"] = purchase_id(row.get("account"), merchant, total, row.get("valor"), origin_month)
+            found += 1
+    return found
+
+
+class InstallmentIndex:
+    """Uma linha por compra parcelada, com a maior parcela já vista."""
+
+    def __init__(self, path: str = DEFAULT_INDEX_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        existing = self._conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'installment_purchases'").fetchone()
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS installment_purchases (
+                purchase_id TEXT PRIMARY KEY, account TEXT NOT NULL, merchant TEXT NOT NULL,
+                installment_total INTEGER NOT NULL, installment_value INTEGER,
+                origin_month TEXT NOT NULL, last_number INTEGER NOT NULL, updated_at REAL NOT NULL);
+            CREATE INDEX IF NOT EXISTS installment_purchases_open
+                ON installment_purchases (account, last_number, installment_total);
+        """)
+        if self._conn.execute("PRAGMA user_version").fetchone()[0] < CENTS_SCHEMA_VERSION:
+            if existing:
+                # Índices anteriores aos centavos guardam o valor da parcela em reais
+                self._conn.execute("UPDATE installment_purchases SET installment_value = ROUND(installment_value * 100)")
+            self._conn.execute(f"PRAGMA user_version = {CENTS_SCHEMA_VERSION}")
+        self._conn.commit()
+
+    def record(self, rows: Iterable[Dict[str, Any]]) -> int:
+        """Registra as parcelas anotadas; devolve quantas linhas foram consideradas."""
+        entries = []
+        for row in rows:
+            if not row.get("purchase_id"):
+                continue
+            merchant, number, total = parse_installment(row.get("descricao"))
+            origin_month = add_months(row_period(row), -(number - 1))
+            valor = row.get("valor")
+            # Blocos antigos do cache de parsing ainda trazem o valor em reais (float)
+            if isinstance(valor, float):
+                valor = to_cents(valor)
+            entries.append((row["purchase_id"], row.get("account") or "", merchant, total,
+                            valor, origin_month, number, time.time()))
+        if entries:
+            with self._lock, self._conn:
+                self._conn.executemany(
+                    "INSERT INTO installment_purchases (purchase_id, account, merchant, installment_total,"
+                    " installment_value, origin_month, last_number, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
+                    " ON CONFLICT(purchase_id) DO UPDATE SET"
+                    " last_number = MAX(last_number, excluded.last_number), updated_at = excluded.updated_at",
+                    entries,
+                )
+        return len(entries)
+
+    @staticmethod
+    def _projection(purchase: Tuple) -> Dict[str, Any]:
+        purchase_key, account, merchant, total, value, origin_month, last_number = purchase
+        # Colunas REAL de índices migrados devolvem float
+        value = int(value) if value is not None else None
+        remaining = total - last_number
+        return {
+            "purchase_id": purchase_key,
+            "account": account,
+            "merchant": merchant,
+            "installment_total": total,
+            "installment_value": value,
+            "paid": last_number,
+            "remaining": remaining,
+            "remaining_amount": value * remaining if value is not None else None,
+            "schedule": [
+                {"installment": number, "month": add_months(origin_month, number - 1), "valor": value}
+                for number in range(last_number + 1, total + 1)
+            ],
+        }
+
+    def projection(self, purchase_key: str) -> Optional[Dict[str, Any]]:
+        """Parcelas restantes de uma compra (consulta pela chave primária)."""
+        with self._lock:
+            purchase = self._conn.execute(
+                "SELECT purchase_id, account, merchant, installment_total, installment_value, origin_month,"
+                " last_number FROM installment_purchases WHERE purchase_id = ?", (purchase_key,)
+            ).fetchone()
+        return self._projection(purchase) if purchase else None
+
+    def open_purchases(self, account: str) -> List[Dict[str, Any]]:
+        """Projeções das compras da conta que ainda têm parcelas a pagar."""
+        with self._lock:
+            purchases = self._conn.execute(
+                "SELECT purchase_id, account, merchant, installment_total, installment_value, origin_month,"
+                " last_number FROM installment_purchases WHERE account = ? AND last_number < installment_total",
+                (account,),
+            ).fetchall()
+        return [self._projection(purchase) for purchase in purchases]
+
+    def commitments(self, account: str) -> Dict[str, int]:
+        """Total comprometido por mês futuro (em centavos) com as parcelas restantes da conta."""
+        months: Dict[str, int] = {}
+        for purchase in self.open_purchases(account):
+            for payment in purchase["schedule"]:
+                if payment["valor"] is not None:
+                    months[payment["month"]] = months.get(payment["month"], 0) + payment["valor"]
+        return dict(sorted(months.items()))
+
+
+def get_installment_index() -> InstallmentIndex:
+    """Índice de parcelas em ``INSTALLMENT_INDEX_PATH`` (um por processo)."""
+    path = os.getenv("INSTALLMENT_INDEX_PATH", DEFAULT_INDEX_PATH)
+    return get_or_create(f"installment_index:{path}", lambda: InstallmentIndex(path))
@@ -0,0 +1,150 @@
+"""Registro de layouts de extrato com detecção barata pelo cabeçalho.
+
+Cada layout declara os nomes aceitos para cada coluna canônica (``data``,
+``valor``, ``descricao``) e o processador de linha correspondente. Ao
+encontrar uma linha de cabeçalho, o layout compila um ``ColumnMapping`` com
+os índices das colunas uma única vez por bloco; as linhas seguintes são
+extraídas por índice, sem consultar nomes de coluna.
+
+A detecção (``detect_layout``) abre o arquivo em modo read-only e lê apenas
+as primeiras linhas, então registrar um novo banco não exige carregar a
+planilha inteira.
+"""
+import unicodedata
+from dataclasses import dataclass, field
+from operator import itemgetter
+from typing import Any, Callable, Dict, FrozenSet, List, Optional, Sequence, Tuple
+
+from openpyxl import load_workbook
+
+CANONICAL_COLUMNS = ("data", "valor", "descricao")
+
+# Linhas lidas para detectar o layout
+SNIFF_ROWS = 10
+
+
+def normalize_header(value: Any) -> Optional[str]:
+    """Normaliza um nome de coluna: minúsculas, sem acentos e sem espaços extras."""
+    if value is None:
+        return None
+    text = unicodedata.normalize("NFKD", str(value).strip().lower())
+    return "".join(ch for ch in text if not unicodedata.combining(ch)) or None
+
+
+@dataclass(frozen=True)
+class ColumnMapping:
+    """Índices das colunas canônicas em um bloco, compilados a partir do cabeçalho."""
+    indexes: Tuple[int, ...]
+
+    def __post_init__(self):
+        object.__setattr__(self, "width", max(self.indexes) + 1)
+        object.__setattr__(self, "_getter", itemgetter(*self.indexes))
+
+    def extract(self, row: Sequence[Any]) -> Tuple[Any, ...]:
+        """Extrai os valores das colunas canônicas, na ordem de ``CANONICAL_COLUMNS``."""
+        if len(row) < self.width:
+            row = tuple(row) + (None,) * (self.width - len(row))
+        return self._getter(row)
+
+
+RowProcessor = Callable[[Tuple[Any, ...], str], Dict[str, Any]]
+
+
+@dataclass(frozen=True)
+class Layout:
+    """Layout de extrato: aliases de cabeçalho por coluna e processador de linha."""
+    name: str
+    aliases: Dict[str, Tuple[str, ...]]
+    row_processor: RowProcessor
+    default_mapping: Optional[ColumnMapping] = None
+    header_tokens: FrozenSet[str] = field(init=False)
+
+    def __post_init__(self):
+        aliases = {
+            column: tuple(normalize_header(alias) for alias in names)
+            for column, names in self.aliases.items()
+        }
+        object.__setattr__(self, "aliases", aliases)
+        object.__setattr__(self, "header_tokens", frozenset(alias for names in aliases.values() for alias in names))
+
+    def compile(self, header_row: Sequence[Any]) -> Optional[ColumnMapping]:
+        """Compila o mapeamento de colunas se o cabeçalho pertencer a este layout."""
+        positions = {}
+        for index, cell in enumerate(header_row):
+            name = normalize_header(cell)
+            if name is None:
+                continue
+            for column, names in self.aliases.items():
+                if column not in positions and name in names:
+                    positions[column] = index
+        if any(column not in positions for column in CANONICAL_COLUMNS):
+            return None
+        return ColumnMapping(tuple(positions[column] for column in CANONICAL_COLUMNS))
+
+
+_layouts: List[Layout] = []
+_header_tokens: FrozenSet[str] = frozenset()
+
+
+def register_layout(layout: Layout) -> Layout:
+    """Registra um layout; layouts registrados depois têm prioridade."""
+    global _header_tokens
+    _layouts.insert(0, layout)
+    _header_tokens = _header_tokens | layout.header_tokens
+    return layout
+
+
+def get_layouts() -> List[Layout]:
+    return list(_layouts)
+
+
+def get_layout(name: str) -> Layout:
+    for layout in _layouts:
+        if layout.name == name:
+            return layout
+    raise KeyError(f"Unknown layout: {name}")
+
+
+def looks_like_header(row: Sequence[Any]) -> bool:
+    """Teste barato: a primeira célula preenchida é um nome de coluna conhecido."""
+    for cell in row:
+        if cell is None:
+            continue
+        if not isinstance(cell, str):
+            return False
+        text = cell.strip().lower()
+        if text in _header_tokens:
+            return True
+        # Só normaliza acentos quando necessário (datas e valores são ASCII)
+        return not text.isascii() and normalize_header(text) in _header_tokens
+    return False
+
+
+def match_header(row: Sequence[Any], preferred: Optional[Layout] = None) -> Optional[Tuple[Layout, ColumnMapping]]:
+    """Devolve o layout e o mapeamento compilado para uma linha de cabeçalho."""
+    candidates = ([preferred] if preferred else []) + [layout for layout in _layouts if layout is not preferred]
+    for layout in candidates:
+        mapping = layout.compile(row)
+        if mapping is not None:
+            return layout, mapping
+    return None
+
+
+def sniff_layout(rows: Sequence[Sequence[Any]]) -> Optional[Tuple[Layout, ColumnMapping]]:
+    """Detecta o layout a partir das primeiras linhas de uma planilha."""
+    for row in rows:
+        if row and looks_like_header(row):
+            match = match_header(row)
+            if match:
+                return match
+    return None
+
+
+def detect_layout(file_path: str, sample_rows: int = SNIFF_ROWS) -> Optional[Tuple[Layout, ColumnMapping]]:
+    """Detecta o layout lendo apenas as primeiras linhas em modo read-only."""
+    wb = load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        rows = list(wb.active.iter_rows(max_row=sample_rows, values_only=True))
+    finally:
+        wb.close()
+    return sniff_layout(rows)
@@ -0,0 +1,188 @@
+"""Leitores em streaming para extratos em texto (CSV e OFX).
+
+Cada leitor devolve um iterador de linhas (tuplas de células), o mesmo
+formato de ``iter_rows(values_only=True)`` do openpyxl, então as linhas
+passam pelo mesmo ``_parse_rows`` do Excel: detecção de cabeçalho, blocos,
+``process_itau_row`` (normalização de data e valor) e hash. O arquivo é lido
+aos poucos: a leitura usa memória constante e só as linhas já convertidas
+são acumuladas, como no caminho do Excel.
+
+- CSV: delimitador detectado nas primeiras linhas (``;`` nos exports
+  brasileiros), linhas em branco separam blocos como na planilha.
+- OFX (1.x SGML ou 2.x XML): cada ``<STMTTRN>`` vira uma linha
+  ``(data, valor, descricao)`` no layout padrão do Itaú, sem cabeçalho. Em
+  extratos de cartão (``CREDITCARDMSGSRSV1``) compras vêm negativas; o sinal
+  é invertido para seguir a convenção das planilhas (compras positivas,
+  estornos negativos). Cada extrato dentro do arquivo vira um bloco.
+
+Leitores de outros formatos são registrados por extensão com
+``register_row_reader``.
+"""
+import codecs
+import csv
+import html
+import os
+import re
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+Row = Tuple[Any, ...]
+RowReader = Callable[[str], Iterator[Row]]
+
+# Bytes lidos para detectar encoding e delimitador
+SAMPLE_BYTES = 64 * 1024
+CHUNK_SIZE = 64 * 1024
+
+CSV_DELIMITERS = ";,\t|"
+
+
+class _BrazilianCsv(csv.excel):
+    delimiter = ";"
+
+
+_OFX_ELEMENT = re.compile(r"<(/?)([A-Za-z0-9_.]+)[^>]*>([^<]*)")
+
+
+def detect_encoding(file_path: str) -> str:
+    """UTF-8 quando as primeiras linhas decodificam como UTF-8, senão cp1252."""
+    with open(file_path, "rb") as f:
+        sample = f.read(SAMPLE_BYTES)
+    if sample.startswith(codecs.BOM_UTF8):
+        return "utf-8-sig"
+    try:
+        # Decoder incremental: um caractere cortado no fim da amostra não é erro
+        codecs.getincrementaldecoder("utf-8")().decode(sample, final=False)
+        return "utf-8"
+    except UnicodeDecodeError:
+        return "cp1252"
+
+
+def iter_csv_rows(file_path: str) -> Iterator[Row]:
+    """Lê um CSV linha a linha; células vazias viram ``None``."""
+    encoding = detect_encoding(file_path)
+    with open(file_path, encoding=encoding, errors="replace", newline="") as f:
+        sample = f.read(SAMPLE_BYTES)
+        f.seek(0)
+        try:
+            dialect = csv.Sniffer().sniff(sample, delimiters=CSV_DELIMITERS)
+        except csv.Error:
+            dialect = _BrazilianCsv
+        for row in csv.reader(f, dialect):
+            yield tuple(cell if cell.strip() else None for cell in row)
+
+
+def _ofx_date(value: str) -> Optional[str]:
+    """``YYYYMMDD[hhmmss[.xxx]][[-3:BRT]]`` -> ``YYYY-MM-DD``."""
+    digits = value[:8]
+    if len(digits) < 8 or not digits.isdigit():
+        return None
+    return f"{digits[:4]}-{digits[4:6]}-{digits[6:8]}"
+
+
+def _ofx_amount(value: str, sign: int) -> Optional[Decimal]:
+    """``TRNAMT`` em reais, exato (vira centavos no processador de linha)."""
+    try:
+        amount = Decimal(value.replace(",", "."))
+    except InvalidOperation:
+        return None
+    return sign * amount if amount.is_finite() else None
+
+
+def _ofx_elements(f, chunk_size: int = CHUNK_SIZE) -> Iterator[Tuple[bool, str, str]]:
+    """Percorre ``(fechamento, tag, texto)`` lendo o arquivo em pedaços."""
+    buffer = ""
+    while True:
+        chunk = f.read(chunk_size)
+        if not chunk:
+            break
+        buffer += chunk
+        # Só processa até o último "<": o elemento seguinte pode estar incompleto
+        cut = buffer.rfind("<")
+        if cut <= 0:
+            continue
+        for match in _OFX_ELEMENT.finditer(buffer, 0, cut):
+            yield match.group(1) == "/", match.group(2).upper(), match.group(3)
+        buffer = buffer[cut:]
+    for match in _OFX_ELEMENT.finditer(buffer):
+        yield match.group(1) == "/", match.group(2).upper(), match.group(3)
+
+
+def _ofx_row(transaction: Dict[str, str], sign: int) -> Row:
+    descricao = transaction.get("MEMO") or transaction.get("NAME")
+    if descricao and "&" in descricao:
+        descricao = html.unescape(descricao)
+    return (
+        _ofx_date(transaction.get("DTPOSTED", "")),
+        _ofx_amount(transaction.get("TRNAMT", ""), sign),
+        descricao,
+    )
+
+
+def iter_ofx_rows(file_path: str) -> Iterator[Row]:
+    """Lê as transações (``<STMTTRN>``) de um OFX como ``(data, valor, descricao)``."""
+    encoding = detect_encoding(file_path)
+    sign = 1
+    transaction: Optional[Dict[str, str]] = None
+    with open(file_path, encoding=encoding, errors="replace") as f:
+        for closing, tag, text in _ofx_elements(f):
+            if tag == "CREDITCARDMSGSRSV1":
+                sign = 1 if closing else -1
+            elif tag == "STMTTRN":
+                if transaction is not None:
+                    yield _ofx_row(transaction, sign)
+                transaction = None if closing else {}
+            elif tag == "BANKTRANLIST" and closing:
+                if transaction is not None:
+                    yield _ofx_row(transaction, sign)
+                    transaction = None
+                # Linha vazia separa os extratos em blocos
+                yield ()
+            elif transaction is not None and not closing:
+                transaction[tag] = text.strip()
+        if transaction is not None:
+            yield _ofx_row(transaction, sign)
+
+
+# Tipo de parser das planilhas (lidas pelo openpyxl, sem leitor de linhas)
+SPREADSHEET_PARSER = "excel"
+
+_row_readers: Dict[str, RowReader] = {}
+_parser_readers: Dict[str, RowReader] = {}
+
+
+def register_row_reader(extension: str, reader: RowReader, parser: Optional[str] = None) -> RowReader:
+    """Registra o leitor de linhas de uma extensão (ex.: ``".csv"``) e, opcionalmente, do tipo de parser."""
+    _row_readers[extension.lower()] = reader
+    if parser:
+        _parser_readers[parser] = reader
+    return reader
+
+
+def get_row_reader(file_path: str, parser: Optional[str] = None) -> Optional[RowReader]:
+    """Leitor registrado para o arquivo; None para planilhas.
+
+    ``parser`` é o tipo decidido pelo roteamento do trigger (``excel``, ``csv``,
+    ``ofx``) e tem precedência sobre a extensão.
+    """
+    if parser is not None:
+        if parser == SPREADSHEET_PARSER:
+            return None
+        if parser not in _parser_readers:
+            raise ValueError(f"Unknown parser: {parser}")
+        return _parser_readers[parser]
+    return _row_readers.get(os.path.splitext(file_path)[1].lower())
+
+
+def head_rows(file_path: str, count: int, parser: Optional[str] = None) -> List[Row]:
+    """Primeiras ``count`` linhas de um arquivo em texto (para detectar o layout)."""
+    rows = get_row_reader(file_path, parser)(file_path)
+    try:
+        return list(islice(rows, count))
+    finally:
+        rows.close()
+
+
+register_row_reader(".csv", iter_csv_rows, parser="csv")
+register_row_reader(".ofx", iter_ofx_rows, parser="ofx")
+register_row_reader(".qfx", iter_ofx_rows)
@@ -0,0 +1,297 @@
+"""Tamanho de lote e concorrência adaptativos para as escritas no BigQuery.
+
+Em vez de uma chamada ``insert_rows_json`` por mensagem, ``write_batches``
+divide as linhas em requisições de ``batch_rows`` linhas e mantém até
+``concurrency`` requisições em voo por escrita. Os dois valores são ajustados por um
+controlador AIMD (aumento aditivo, redução multiplicativa), como o controle
+de congestionamento do TCP:
+
+- requisição rápida (latência até ``target_latency``): o lote cresce
+  ``increase_rows`` linhas e, a cada rodada de ``concurrency`` requisições
+  rápidas, a concorrência cresce 1;
+- requisição lenta: o lote é multiplicado por ``decrease`` (a latência
+  cresce com o tamanho da requisição);
+- erro: lote e concorrência são multiplicados por ``decrease``;
+- quota (HTTP 429, ``quotaExceeded``/``rateLimitExceeded``): a concorrência
+  é multiplicada por ``decrease`` e nada cresce por ``quota_cooldown``
+  segundos.
+
+O lote também é limitado por ``max_request_bytes`` (o BigQuery recusa
+requisições acima de 10 MB), estimado pelo tamanho médio das linhas. As
+decisões ficam em ``metrics()`` e no log ``SLI: batch_controller``.
+
+A espera do rate limiter (``acquire``) acontece antes de cada envio e fora
+da medição de latência, para não ser confundida com lentidão do BigQuery.
+"""
+import json
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from utils.factories import discard_instance, get_or_create
+from utils.logging_config import setup_logging
+
+logger = setup_logging(__name__)
+
+OUTCOME_OK = "ok"
+OUTCOME_SLOW = "slow"
+OUTCOME_ERROR = "error"
+OUTCOME_QUOTA = "quota"
+
+QUOTA_REASONS = ("quotaexceeded", "ratelimitexceeded", "too many requests")
+
+# Linhas usadas para estimar o tamanho médio de uma linha
+SIZE_SAMPLE_ROWS = 50
+
+Rows = List[Dict[str, Any]]
+Sink = Callable[[Rows], Optional[List[Any]]]
+
+# Intervalo [início, fim) de linhas de uma escrita
+Span = Tuple[int, int]
+
+
+def classify_error(error: Any) -> str:
+    """``quota`` para erros de quota/limite de taxa, ``error`` para os demais."""
+    if getattr(error, "code", None) == 429:
+        return OUTCOME_QUOTA
+    if isinstance(error, list):
+        text = json.dumps(error, default=str)
+    else:
+        text = str(error)
+    text = text.lower()
+    return OUTCOME_QUOTA if any(reason in text for reason in QUOTA_REASONS) else OUTCOME_ERROR
+
+
+class AimdController:
+    """Ajusta linhas por requisição e requisições em voo pelo resultado de cada requisição."""
+
+    def __init__(self, initial_rows: int = 500, min_rows: int = 50, max_rows: int = 10000,
+                 increase_rows: int = 100, max_in_flight: int = 8, target_latency: float = 1.0,
+                 decrease: float = 0.5, quota_cooldown: float = 5.0,
+                 max_request_bytes: int = 9 * 1024 * 1024, clock: Callable[[], float] = time.monotonic):
+        self.min_rows = min_rows
+        self.max_rows = max_rows
+        self.increase_rows = increase_rows
+        self.max_in_flight = max_in_flight
+        self.target_latency = target_latency
+        self.decrease = decrease
+        self.quota_cooldown = quota_cooldown
+        self.max_request_bytes = max_request_bytes
+        self.clock = clock
+        self.batch_rows = max(min_rows, min(initial_rows, max_rows))
+        self.concurrency = 1
+        self._round_successes = 0
+        self._hold_until = 0.0
+        self._lock = threading.Lock()
+        self._metrics = {"requests": 0, "rows": 0, "increases": 0, "concurrency_increases": 0,
+                         "decreases_latency": 0, "decreases_error": 0, "decreases_quota": 0}
+        self._latency_ewma: Optional[float] = None
+
+    def batch_size(self, avg_row_bytes: float = 0) -> int:
+        """Linhas da próxima requisição, respeitando o limite de bytes."""
+        if avg_row_bytes > 0:
+            return max(1, min(self.batch_rows, int(self.max_request_bytes // avg_row_bytes)))
+        return self.batch_rows
+
+    def observe(self, rows: int, latency: float, outcome: str = OUTCOME_OK) -> str:
+        """Registra o resultado de uma requisição e ajusta lote e concorrência.
+
+        Returns:
+            O resultado considerado (``ok`` vira ``slow`` acima da latência alvo).
+        """
+        with self._lock:
+            self._metrics["requests"] += 1
+            self._latency_ewma = latency if self._latency_ewma is None else 0.8 * self._latency_ewma + 0.2 * latency
+            if outcome == OUTCOME_OK and latency > self.target_latency:
+                outcome = OUTCOME_SLOW
+
+            if outcome == OUTCOME_OK:
+                self._metrics["rows"] += rows
+                if self.clock() >= self._hold_until:
+                    # Só cresce se a requisição encheu o lote (lotes parciais não dizem nada)
+                    if rows >= self.batch_rows and self.batch_rows < self.max_rows:
+                        self.batch_rows = min(self.max_rows, self.batch_rows + self.increase_rows)
+                        self._metrics["increases"] += 1
+                    self._round_successes += 1
+                    if self._round_successes >= self.concurrency and self.concurrency < self.max_in_flight:
+                        self.concurrency += 1
+                        self._round_successes = 0
+                        self._metrics["concurrency_increases"] += 1
+            elif outcome == OUTCOME_SLOW:
+                self._metrics["rows"] += rows
+                self.batch_rows = max(self.min_rows, int(self.batch_rows * self.decrease))
+                self._round_successes = 0
+                self._metrics["decreases_latency"] += 1
+            elif outcome == OUTCOME_QUOTA:
+                self.concurrency = max(1, int(self.concurrency * self.decrease))
+                self._round_successes = 0
+                self._hold_until = self.clock() + self.quota_cooldown
+                self._metrics["decreases_quota"] += 1
+            else:
+                self.batch_rows = max(self.min_rows, int(self.batch_rows * self.decrease))
+                self.concurrency = max(1, int(self.concurrency * self.decrease))
+                self._round_successes = 0
+                self._metrics["decreases_error"] += 1
+            return outcome
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self._metrics, "batch_rows": self.batch_rows, "concurrency": self.concurrency,
+                    "latency_ewma": self._latency_ewma,
+                    "quota_hold": max(0.0, self._hold_until - self.clock())}
+
+
+class BatchWriteError(RuntimeError):
+    """Uma ou mais requisições falharam; ``errors`` traz os erros de cada uma.
+
+    ``failed`` traz o intervalo ``(início, fim)`` das linhas de cada requisição
+    que falhou, na ordem de ``errors``, e ``unsent`` o das linhas que não
+    chegaram a ser enviadas. As demais linhas foram gravadas: quem repete a
+    escrita deve reenviar só esses intervalos (``split``).
+    """
+
+    def __init__(self, errors: List[Any], rows_written: int, failed: Optional[List[Span]] = None,
+                 unsent: Optional[Span] = None, total_rows: Optional[int] = None):
+        self.errors = errors
+        self.rows_written = rows_written
+        self.failed = failed
+        self.unsent = unsent
+        self.total_rows = total_rows
+        super().__init__(f"{len(errors)} failed request(s): {errors[:3]}")
+
+    def split(self, rows: Rows) -> Optional[Tuple[Rows, List[Tuple[Rows, Any]], Rows]]:
+        """Separa ``rows`` (as linhas da escrita que falhou) pelo destino de cada uma.
+
+        Returns:
+            Linhas gravadas, linhas de cada requisição que falhou com o erro
+            dela e linhas não enviadas; ``None`` se ``rows`` não é o lote da
+            escrita ou os intervalos não foram registrados.
+        """
+        if self.failed is None or self.total_rows != len(rows):
+            return None
+        pending = sorted(self.failed + ([self.unsent] if self.unsent else []))
+        written: Rows = []
+        position = 0
+        for start, stop in pending:
+            written.extend(rows[position:start])
+            position = stop
+        written.extend(rows[position:])
+        failed = [(rows[start:stop], error) for (start, stop), error in zip(self.failed, self.errors)]
+        unsent = rows[self.unsent[0]:self.unsent[1]] if self.unsent else []
+        return written, failed, unsent
+
+
+def average_row_bytes(rows: List[Dict[str, Any]]) -> float:
+    sample = rows[:SIZE_SAMPLE_ROWS]
+    if not sample:
+        return 0.0
+    return len(json.dumps(sample, default=str)) / len(sample)
+
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_workers = 0
+_executor_lock = threading.Lock()
+
+
+def _get_executor(max_workers: int) -> ThreadPoolExecutor:
+    global _executor, _executor_workers
+    with _executor_lock:
+        if _executor is None or _executor_workers < max_workers:
+            if _executor is not None:
+                _executor.shutdown(wait=False)
+            _executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="bq-write")
+            _executor_workers = max_workers
+        return _executor
+
+
+def _timed_send(sink: Sink, chunk: List[Dict[str, Any]]):
+    start = time.monotonic()
+    try:
+        errors = sink(chunk)
+    except Exception as e:
+        return time.monotonic() - start, e
+    return time.monotonic() - start, errors or None
+
+
+def write_batches(rows: List[Dict[str, Any]], sink: Sink, controller: AimdController,
+                  acquire: Optional[Callable[[], float]] = None) -> Dict[str, Any]:
+    """Envia ``rows`` ao ``sink`` em requisições dimensionadas pelo controlador.
+
+    O ``sink`` recebe uma lista de linhas e devolve os erros de linha (lista
+    vazia em caso de sucesso) ou lança exceção. Depois da primeira falha
+    nenhuma requisição nova é enviada; as que estão em voo terminam e
+    ``BatchWriteError`` é lançado com os intervalos que falharam e os que não
+    foram enviados. ``acquire`` é chamado antes de cada requisição e devolve
+    os segundos esperados no rate limiter.
+
+    Returns:
+        Requisições feitas, linhas enviadas, espera no rate limiter e as
+        métricas do controlador.
+    """
+    avg_row_bytes = average_row_bytes(rows)
+    errors: List[Any] = []
+    failed: List[Span] = []
+    written = 0
+    requests = 0
+    position = 0
+    in_flight: Dict[Any, Span] = {}
+    acquire = acquire or (lambda: 0.0)
+
+    # Caso comum: tudo cabe em uma requisição, sem passar pelo pool
+    if len(rows) <= controller.batch_size(avg_row_bytes):
+        rate_limit_wait = acquire()
+        latency, error = _timed_send(sink, rows)
+        controller.observe(len(rows), latency, OUTCOME_OK if error is None else classify_error(error))
+        if error is not None:
+            raise BatchWriteError([error], 0, failed=[(0, len(rows))], total_rows=len(rows))
+        return {"requests": 1, "rows": len(rows), "rate_limit_wait": rate_limit_wait, **controller.metrics()}
+
+    rate_limit_wait = 0.0
+    executor = _get_executor(controller.max_in_flight)
+    while position < len(rows) or in_flight:
+        while position < len(rows) and not errors and len(in_flight) < controller.concurrency:
+            rate_limit_wait += acquire()
+            chunk = rows[position:position + controller.batch_size(avg_row_bytes)]
+            in_flight[executor.submit(_timed_send, sink, chunk)] = (position, position + len(chunk))
+            position += len(chunk)
+            requests += 1
+        if not in_flight:
+            break
+        done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+        for future in done:
+            start, stop = in_flight.pop(future)
+            latency, error = future.result()
+            controller.observe(stop - start, latency, OUTCOME_OK if error is None else classify_error(error))
+            if error is None:
+                written += stop - start
+            else:
+                errors.append(error)
+                failed.append((start, stop))
+
+    if errors:
+        unsent = (position, len(rows)) if position < len(rows) else None
+        raise BatchWriteError(errors, written, failed=failed, unsent=unsent, total_rows=len(rows))
+    return {"requests": requests, "rows": written, "rate_limit_wait": rate_limit_wait, **controller.metrics()}
+
+
+def create_batch_controller() -> AimdController:
+    """Controlador configurado por ``WRITER_BATCH_*`` e ``WRITER_MAX_IN_FLIGHT``."""
+    return AimdController(
+        initial_rows=int(os.getenv("WRITER_BATCH_INITIAL_ROWS", 500)),
+        min_rows=int(os.getenv("WRITER_BATCH_MIN_ROWS", 50)),
+        max_rows=int(os.getenv("WRITER_BATCH_MAX_ROWS", 10000)),
+        max_in_flight=int(os.getenv("WRITER_MAX_IN_FLIGHT", 8)),
+        target_latency=float(os.getenv("WRITER_BATCH_TARGET_LATENCY", 1.0)),
+    )
+
+
+def get_batch_controller() -> AimdController:
+    """Controlador compartilhado pelas escritas do processo."""
+    return get_or_create("batch_controller", create_batch_controller)
+
+
+def reset_batch_controller() -> None:
+    """Descarta o controlador compartilhado (ex.: após mudar a configuração)."""
+    discard_instance("batch_controller")
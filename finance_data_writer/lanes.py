@@ -0,0 +1,146 @@
+"""Filas por chave de ordenação com escalonamento justo entre contas.
+
+O leitor publica cada extrato com a conta como ``ordering_key``. Aqui cada
+chave ganha uma fila própria (lane): mensagens de uma mesma conta são
+processadas uma de cada vez, na ordem de chegada, e contas diferentes são
+processadas em paralelo por até ``workers`` threads.
+
+As chaves com mensagens pendentes ficam em um rodízio: cada worker pega a
+próxima chave, processa uma única mensagem dela e a devolve ao fim do
+rodízio se ainda houver pendências. Um backfill grande em uma conta ocupa no
+máximo um worker por vez e não atrasa as demais. Mensagens sem
+``ordering_key`` não têm ordem a respeitar e usam uma lane própria.
+"""
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Optional
+
+from utils.logging_config import setup_logging
+
+logger = setup_logging(__name__)
+
+
+def message_key(message) -> str:
+    """Chave de ordenação da mensagem (ou o id, quando ela não tem chave)."""
+    return getattr(message, "ordering_key", None) or f"message:{message.message_id}"
+
+
+class LaneScheduler:
+    """Distribui mensagens em filas por chave e as processa em rodízio."""
+
+    def __init__(self, handler: Callable[[Any], Any], workers: int = 4, name: str = "lane"):
+        self.handler = handler
+        self.workers = max(1, workers)
+        self.name = name
+        self._lanes: Dict[str, Deque[Any]] = {}
+        self._ready: Deque[str] = deque()
+        self._active = set()
+        self._cond = threading.Condition()
+        self._threads = []
+        self._stopped = False
+        self._metrics = {"submitted": 0, "processed": 0, "max_lanes": 0, "max_ready": 0}
+
+    def start(self) -> "LaneScheduler":
+        with self._cond:
+            if self._threads:
+                return self
+            self._stopped = False
+            for index in range(self.workers):
+                thread = threading.Thread(target=self._run, name=f"{self.name}-{index}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+        return self
+
+    def submit(self, message) -> None:
+        """Enfileira a mensagem na lane da sua chave (usado como callback do subscriber)."""
+        key = message_key(message)
+        with self._cond:
+            lane = self._lanes.get(key)
+            if lane is None:
+                lane = self._lanes[key] = deque()
+            lane.append((message, time.monotonic()))
+            self._metrics["submitted"] += 1
+            # Uma chave em processamento volta ao rodízio quando o worker termina
+            if len(lane) == 1 and key not in self._active:
+                self._ready.append(key)
+                self._cond.notify()
+            self._metrics["max_lanes"] = max(self._metrics["max_lanes"], len(self._lanes))
+            self._metrics["max_ready"] = max(self._metrics["max_ready"], len(self._ready))
+
+    def _next(self):
+        with self._cond:
+            while not self._ready:
+                if self._stopped:
+                    return None
+                self._cond.wait()
+            key = self._ready.popleft()
+            message, enqueued_at = self._lanes[key].popleft()
+            self._active.add(key)
+            return key, message, enqueued_at
+
+    def _done(self, key: str) -> None:
+        with self._cond:
+            self._active.discard(key)
+            self._metrics["processed"] += 1
+            if self._lanes[key]:
+                self._ready.append(key)
+                self._cond.notify()
+            else:
+                del self._lanes[key]
+            self._cond.notify_all()
+
+    def _run(self) -> None:
+        while True:
+            item = self._next()
+            if item is None:
+                return
+            key, message, enqueued_at = item
+            try:
+                logger.info("SLI: lane_wait_time",
+                            extra={"ordering_key": key,
+                                   "message_id": message.message_id,
+                                   "duration": time.monotonic() - enqueued_at})
+                self.handler(message)
+            except Exception as e:
+                logger.error(f"Error in lane handler: {str(e)}",
+                             extra={"ordering_key": key, "message_id": message.message_id})
+            finally:
+                self._done(key)
+
+    def pending(self) -> int:
+        """Mensagens enfileiradas ou em processamento."""
+        with self._cond:
+            return sum(len(lane) for lane in self._lanes.values()) + len(self._active)
+
+    def join(self, timeout: Optional[float] = None) -> bool:
+        """Espera todas as lanes esvaziarem; ``False`` se o tempo acabar antes."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self._lanes or self._active:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+            return True
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Encerra os workers depois que as mensagens já enfileiradas terminam."""
+        self.join(timeout)
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+            threads, self._threads = self._threads, []
+        for thread in threads:
+            thread.join(timeout)
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._cond:
+            return {**self._metrics, "lanes": len(self._lanes), "active": len(self._active),
+                    "workers": self.workers}
+
+
+def create_lane_scheduler(handler: Callable[[Any], Any]) -> LaneScheduler:
+    """Escalonador com ``WRITER_LANE_WORKERS`` workers."""
+    return LaneScheduler(handler, workers=int(os.getenv("WRITER_LANE_WORKERS", 4)), name="writer-lane")
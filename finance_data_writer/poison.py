@@ -0,0 +1,337 @@
+"""Isolamento de mensagens envenenadas no writer.
+
+Uma mensagem que sempre falha era devolvida (nack) e reentregue para sempre:
+a cada entrega o JSON era decodificado de novo e o BigQuery recebia o mesmo
+lote inválido, roubando capacidade do tráfego saudável (e, com ordering
+keys, travando a lane da conta).
+
+``PoisonGuard`` conta as entregas de cada mensagem (``delivery_attempt`` do
+Pub/Sub, presente quando a subscription tem dead-letter policy, ou a
+contagem local do processo) e decide o que fazer com uma falha:
+
+- mensagens que não são JSON vão direto para o dead-letter e são confirmadas;
+- erros dos próprios dados (lote rejeitado pelo schema, linhas ``invalid``
+  no BigQuery, HTTP 400, 413 ou 422, inclusive de uma só requisição do
+  lote) disparam a bisseção já na primeira entrega;
+- erros transitórios (quota, ``backendError``, 429/5xx, rede) só voltam
+  para o Pub/Sub: repetir resolve, e a dead-letter policy da subscription
+  cuida do que nunca se resolver;
+- os demais erros voltam para o Pub/Sub até ``bisect_after`` entregas e só
+  então o lote é bisseccionado.
+
+A bisseção parte só das requisições que falharam (as demais já foram
+gravadas), divide cada uma ao meio e escreve cada metade; metades que falham
+são divididas de novo até sobrar a linha culpada. As linhas boas
+ficam gravadas, as culpadas vão para o dead-letter (arquivo JSONL ou tópico)
+e a mensagem é confirmada. Se alguma linha isolada falhou por erro
+transitório, ou se nenhuma linha passou sem que o erro seja dos dados (por
+exemplo, configuração errada), a mensagem volta para o Pub/Sub.
+
+As taxas de mensagens e linhas envenenadas ficam em ``metrics()`` e nos logs
+``SLI: poison_rows`` e ``SLI: poison_rate``.
+"""
+import json
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from finance_data_writer.batching import OUTCOME_QUOTA, BatchWriteError, classify_error
+from utils.factories import discard_instance, get_or_create, get_pubsub_publisher, get_topic_path
+from utils.logging_config import setup_logging
+from utils.schema import SchemaValidationError
+
+logger = setup_logging(__name__)
+
+DEFAULT_DEAD_LETTER_PATH = "/tmp/writer_dead_letter.jsonl"
+
+FAILURE_DATA = "data"
+FAILURE_TRANSIENT = "transient"
+FAILURE_UNKNOWN = "unknown"
+
+# Motivos de erro de linha do insertAll: ``invalid`` é a linha culpada e
+# ``stopped`` as demais linhas da mesma requisição, recusadas junto com ela
+ROW_DATA_REASONS = frozenset({"invalid", "stopped"})
+
+DATA_STATUS_CODES = frozenset({400, 413, 422})
+TRANSIENT_STATUS_CODES = frozenset({408, 429})
+
+# (linha, erro que a isolou)
+PoisonedRow = Tuple[Dict[str, Any], BaseException]
+
+
+def _row_errors_are_data(row_errors: Any) -> bool:
+    if not isinstance(row_errors, list):
+        return False
+    reasons = {str(error.get("reason", "")).lower()
+               for entry in row_errors if isinstance(entry, dict)
+               for error in entry.get("errors", []) if isinstance(error, dict)}
+    return "invalid" in reasons and reasons <= ROW_DATA_REASONS
+
+
+def _classify_request_error(error: Any) -> str:
+    # Listas são erros de linha do insert_rows_json; exceções são da requisição
+    if isinstance(error, list):
+        return FAILURE_DATA if _row_errors_are_data(error) else FAILURE_TRANSIENT
+    return classify_failure(error)
+
+
+def classify_failure(error: Optional[BaseException]) -> str:
+    """``data`` (repetir não resolve), ``transient`` (repetir resolve) ou ``unknown``.
+
+    Códigos HTTP que dependem do conteúdo da requisição (400, 413, 422) são
+    dos dados; 408, 429 e 5xx são transitórios. Os demais 4xx (credencial,
+    permissão, tabela inexistente) falham com qualquer linha e ficam como
+    ``unknown``.
+    """
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        if isinstance(error, SchemaValidationError):
+            return FAILURE_DATA
+        if isinstance(error, BatchWriteError):
+            failures = {_classify_request_error(request_error) for request_error in error.errors}
+            if failures == {FAILURE_DATA}:
+                return FAILURE_DATA
+            return FAILURE_TRANSIENT if FAILURE_TRANSIENT in failures else FAILURE_UNKNOWN
+        code = getattr(error, "code", None)
+        if code in TRANSIENT_STATUS_CODES or (isinstance(code, int) and code >= 500) \
+                or classify_error(error) == OUTCOME_QUOTA:
+            return FAILURE_TRANSIENT
+        if code in DATA_STATUS_CODES:
+            return FAILURE_DATA
+        if isinstance(error, (ConnectionError, TimeoutError)):
+            return FAILURE_TRANSIENT
+        error = error.__cause__ or error.__context__
+    return FAILURE_UNKNOWN
+
+
+def _find_batch_error(error: Optional[BaseException]) -> Optional[BatchWriteError]:
+    seen = set()
+    while error is not None and id(error) not in seen:
+        if isinstance(error, BatchWriteError):
+            return error
+        seen.add(id(error))
+        error = error.__cause__ or error.__context__
+    return None
+
+
+def _split_failure(rows: List[Dict[str, Any]], error: BaseException):
+    """Linhas gravadas, pedaços que falharam (com o erro de cada um) e linhas não enviadas."""
+    batch_error = _find_batch_error(error)
+    parts = batch_error.split(rows) if batch_error is not None else None
+    if parts is None:
+        return [], [(rows, error)], []
+    written, failed, unsent = parts
+    return written, [(chunk, BatchWriteError([chunk_error], 0, failed=[(0, len(chunk))], total_rows=len(chunk)))
+                     for chunk, chunk_error in failed], unsent
+
+
+def bisect_rows(rows: List[Dict[str, Any]], write: Callable[[List[Dict[str, Any]]], Any],
+                error: BaseException) -> Tuple[List[Dict[str, Any]], List[PoisonedRow], int]:
+    """Isola as linhas que fazem ``write`` falhar, sabendo que a escrita de ``rows`` falhou com ``error``.
+
+    Quando o erro informa as requisições que falharam (``BatchWriteError``),
+    só elas são bisseccionadas: as demais linhas já foram gravadas e as que
+    não chegaram a ser enviadas são escritas antes.
+
+    Returns:
+        Linhas escritas, linhas isoladas com o erro de cada uma e o número de escritas feitas.
+    """
+    written, failing, unsent = _split_failure(rows, error)
+    written = list(written)
+    poisoned: List[PoisonedRow] = []
+    writes = 0
+    pending = [unsent] if unsent else []
+    while pending or failing:
+        if pending:
+            chunk = pending.pop()
+            writes += 1
+            try:
+                write(chunk)
+                written.extend(chunk)
+            except Exception as e:
+                chunk_written, chunk_failing, chunk_unsent = _split_failure(chunk, e)
+                written.extend(chunk_written)
+                failing.extend(chunk_failing)
+                if chunk_unsent:
+                    pending.append(chunk_unsent)
+            continue
+        chunk, chunk_error = failing.pop()
+        if len(chunk) == 1:
+            poisoned.append((chunk[0], chunk_error))
+            continue
+        middle = len(chunk) // 2
+        pending.extend((chunk[:middle], chunk[middle:]))
+    return written, poisoned, writes
+
+
+class DeliveryTracker:
+    """Entregas por mensagem: o maior entre o ``delivery_attempt`` do Pub/Sub e a contagem local."""
+
+    def __init__(self, max_entries: int = 10000):
+        self.max_entries = max_entries
+        self._attempts: "OrderedDict[Any, int]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def attempt(self, message) -> int:
+        reported = getattr(message, "delivery_attempt", None)
+        if not isinstance(reported, int) or isinstance(reported, bool):
+            reported = 0
+        key = message.message_id
+        with self._lock:
+            local = self._attempts.pop(key, 0) + 1
+            self._attempts[key] = local
+            while len(self._attempts) > self.max_entries:
+                self._attempts.popitem(last=False)
+        return max(reported, local)
+
+    def forget(self, message) -> None:
+        with self._lock:
+            self._attempts.pop(message.message_id, None)
+
+
+class FileDeadLetterSink:
+    """Dead-letter local: um registro JSON por linha."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def write(self, records: List[Dict[str, Any]]) -> None:
+        lines = "".join(json.dumps(record, default=str) + "\n" for record in records)
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(lines)
+            f.flush()
+            os.fsync(f.fileno())
+
+
+class TopicDeadLetterSink:
+    """Dead-letter em um tópico do Pub/Sub: um registro por mensagem."""
+
+    def __init__(self, publisher, topic_path: str):
+        self.publisher = publisher
+        self.topic_path = topic_path
+
+    def write(self, records: List[Dict[str, Any]]) -> None:
+        futures = [self.publisher.publish(self.topic_path, json.dumps(record, default=str).encode("utf-8"))
+                   for record in records]
+        for future in futures:
+            future.result()
+
+
+class PoisonGuard:
+    """Conta entregas, bissecciona lotes que falham e desvia as linhas culpadas."""
+
+    def __init__(self, sink, bisect_after: int = 3, tracker: Optional[DeliveryTracker] = None):
+        self.sink = sink
+        self.bisect_after = max(1, bisect_after)
+        self.tracker = tracker or DeliveryTracker()
+        self._lock = threading.Lock()
+        self._metrics = {"messages": 0, "rows": 0, "poison_messages": 0, "poison_rows": 0,
+                         "undecodable_messages": 0, "bisections": 0, "bisect_writes": 0}
+
+    def attempt(self, message) -> int:
+        """Registra uma entrega e devolve o número dela (1 na primeira)."""
+        return self.tracker.attempt(message)
+
+    def should_bisect(self, error: BaseException, attempt: int) -> bool:
+        failure = classify_failure(error)
+        return failure == FAILURE_DATA or (failure == FAILURE_UNKNOWN and attempt >= self.bisect_after)
+
+    def write(self, rows: List[Dict[str, Any]], write: Callable[[List[Dict[str, Any]]], Any],
+              attempt: int) -> Tuple[List[Dict[str, Any]], List[PoisonedRow]]:
+        """Escreve ``rows``; se falhar, isola as linhas culpadas quando a política permite.
+
+        Returns:
+            Linhas escritas e linhas isoladas (vazia quando tudo foi escrito).
+
+        Raises:
+            Exception: O erro original, quando a falha deve voltar para o Pub/Sub.
+        """
+        try:
+            write(rows)
+            return rows, []
+        except Exception as error:
+            if not rows or not self.should_bisect(error, attempt):
+                raise
+            written, poisoned, writes = bisect_rows(rows, write, error)
+            with self._lock:
+                self._metrics["bisections"] += 1
+                self._metrics["bisect_writes"] += writes
+            failures = {classify_failure(row_error) for _, row_error in poisoned}
+            if FAILURE_TRANSIENT in failures or (not written and FAILURE_DATA not in failures):
+                raise
+            return written, poisoned
+
+    def dead_letter_rows(self, message, poisoned: List[PoisonedRow], file_path: Optional[str],
+                         attempt: int) -> None:
+        now = datetime.now(timezone.utc).isoformat()
+        self.sink.write([
+            {"kind": "row", "message_id": message.message_id, "file_path": file_path,
+             "delivery_attempt": attempt, "error": str(error), "row": row, "dead_lettered_at": now}
+            for row, error in poisoned
+        ])
+
+    def dead_letter_message(self, message, error: BaseException, attempt: int) -> None:
+        """Desvia uma mensagem que não pode ser lida, com o conteúdo original."""
+        self.sink.write([{
+            "kind": "message", "message_id": message.message_id, "delivery_attempt": attempt,
+            "error": str(error), "data": bytes(message.data).decode("utf-8", errors="replace"),
+            "dead_lettered_at": datetime.now(timezone.utc).isoformat(),
+        }])
+        with self._lock:
+            self._metrics["messages"] += 1
+            self._metrics["poison_messages"] += 1
+            self._metrics["undecodable_messages"] += 1
+        logger.info("SLI: poison_rows", extra={"message_id": message.message_id, "rows_count": 0,
+                                               "poison_rows": 0, "delivery_attempt": attempt,
+                                               "undecodable": True})
+
+    def record(self, message, rows_count: int, poison_count: int, attempt: int) -> None:
+        """Contabiliza uma mensagem concluída (confirmada)."""
+        self.tracker.forget(message)
+        with self._lock:
+            self._metrics["messages"] += 1
+            self._metrics["rows"] += rows_count
+            if poison_count:
+                self._metrics["poison_messages"] += 1
+                self._metrics["poison_rows"] += poison_count
+        if poison_count:
+            logger.info("SLI: poison_rows", extra={"message_id": message.message_id, "rows_count": rows_count,
+                                                   "poison_rows": poison_count, "delivery_attempt": attempt})
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            metrics = dict(self._metrics)
+        metrics["poison_message_rate"] = metrics["poison_messages"] / metrics["messages"] if metrics["messages"] else 0.0
+        metrics["poison_row_rate"] = metrics["poison_rows"] / metrics["rows"] if metrics["rows"] else 0.0
+        return metrics
+
+
+def create_dead_letter_sink():
+    """Tópico em ``WRITER_DEAD_LETTER_TOPIC`` ou arquivo em ``WRITER_DEAD_LETTER_PATH``."""
+    topic_id = os.getenv("WRITER_DEAD_LETTER_TOPIC")
+    if topic_id:
+        publisher = get_pubsub_publisher()
+        return TopicDeadLetterSink(publisher, get_topic_path(publisher, topic_id=topic_id))
+    return FileDeadLetterSink(os.getenv("WRITER_DEAD_LETTER_PATH", DEFAULT_DEAD_LETTER_PATH))
+
+
+def create_poison_guard() -> PoisonGuard:
+    """Guarda configurado por ``WRITER_POISON_BISECT_AFTER`` e pelo dead-letter."""
+    return PoisonGuard(create_dead_letter_sink(), bisect_after=int(os.getenv("WRITER_POISON_BISECT_AFTER", 3)))
+
+
+def get_poison_guard() -> PoisonGuard:
+    """Guarda compartilhado pelas mensagens do processo."""
+    return get_or_create("poison_guard", create_poison_guard)
+
+
+def reset_poison_guard() -> None:
+    """Descarta o guarda compartilhado (ex.: após mudar a configuração)."""
+    discard_instance("poison_guard")
@@ -0,0 +1,355 @@
+"""Agregados mensais por conta e categoria mantidos pelo writer.
+
+Cada lote gravado no BigQuery também atualiza, em um SQLite local, a soma,
+a contagem e o mínimo/máximo de ``valor`` (em centavos, então as somas são
+exatas) por ``(account, mês, category)``.
+Consultas de resumo leem a tabela ``monthly_rollups`` (algumas centenas de
+linhas) em vez do histórico completo. O SQLite é de uma instância e só tem
+os totais completos com um único writer; com várias instâncias os totais
+compartilhados ficam na tabela ``monthly_rollups`` do BigQuery, recalculada
+por uma consulta agendada com ``RECOMPUTE_QUERY`` (``terraform/main.tf``).
+
+A atualização é idempotente: os ids das transações já agregadas
+(``instance_ids``: o ``id`` da linha mais o ordinal entre compras idênticas)
+ficam em ``rollup_rows``, então reentregas do Pub/Sub não contam a mesma
+linha duas vezes. Linhas substituídas por um reenvio corrigido (modo incremental) saem
+dos agregados com ``retract``. Com ``ledger_months`` o registro guarda só os
+meses abertos mais recentes: meses anteriores ficam fechados, com agregados
+congelados, e linhas que chegam para eles são ignoradas (sem os ids não há
+como deduplicar) até um ``rebuild_closed`` a partir do BigQuery.
+
+``check_consistency`` roda ``RECOMPUTE_QUERY`` no BigQuery, sobre a view sem
+as linhas substituídas, e lista as divergências; ``check_ledger`` compara os
+meses abertos com o registro local. Uso::
+
+    python -m finance_data_writer.rollups --account itau-card --month 2024-01
+    python -m finance_data_writer.rollups --check [--local]
+    python -m finance_data_writer.rollups --rebuild
+"""
+import argparse
+import json
+import os
+import sqlite3
+import threading
+from collections import Counter
+from datetime import date
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from utils.factories import get_bigquery_client, get_or_create
+from utils.ingestion_index import instance_ids, row_period
+from utils.money import is_cents
+
+# Lançamentos sem categoria ficam sob esta chave (NULL não funciona em chave primária)
+UNCATEGORIZED = ""
+
+# Recalcula os mesmos agregados a partir da tabela bruta no BigQuery. A consulta
+# agendada que mantém a tabela compartilhada monthly_rollups usa a mesma SQL
+# (terraform/sql/monthly_rollups.sql)
+RECOMPUTE_QUERY = """
+SELECT account, FORMAT_DATE('%Y-%m', date) AS month, IFNULL(category, '') AS category,
+       SUM(cents) AS total, COUNT(*) AS count, MIN(cents) AS min_valor, MAX(cents) AS max_valor
+FROM (
+  -- Linhas gravadas antes de value_cents só têm value (FLOAT, em reais)
+  SELECT *, IFNULL(value_cents, CAST(ROUND(value * 100) AS INT64)) AS cents FROM `{table}`
+)
+GROUP BY account, month, category
+"""
+
+# Meses abertos no registro de ids quando ROLLUPS_LEDGER_MONTHS não é definido
+DEFAULT_LEDGER_MONTHS = 3
+
+# PRAGMA user_version a partir do qual os valores estão em centavos
+CENTS_SCHEMA_VERSION = 1
+
+RollupKey = Tuple[str, str, str]
+Aggregate = Tuple[int, int, int, int]
+
+
+def rollup_key(row: Dict[str, Any]) -> RollupKey:
+    return (row.get("account") or "", row_period(row), row.get("category") or UNCATEGORIZED)
+
+
+def _merge(aggregate: Optional[Aggregate], valor: int) -> Aggregate:
+    if aggregate is None:
+        return (valor, 1, valor, valor)
+    total, count, min_valor, max_valor = aggregate
+    return (total + valor, count + 1, min(min_valor, valor), max(max_valor, valor))
+
+
+def open_months_since(ledger_months: int, today: Optional[date] = None) -> Optional[str]:
+    """Primeiro mês (``YYYY-MM``) mantido no registro de ids; None guarda todos."""
+    if ledger_months <= 0:
+        return None
+    today = today or date.today()
+    index = today.year * 12 + today.month - ledger_months
+    return f"{index // 12:04d}-{index % 12 + 1:02d}"
+
+
+def source_table(client) -> str:
+    """Tabela lida por ``RECOMPUTE_QUERY``: ``ROLLUPS_SOURCE_TABLE`` ou a view ``<BIGQUERY_TABLE>_current``."""
+    return os.getenv("ROLLUPS_SOURCE_TABLE") or (
+        f"{client.project}.{os.getenv('BIGQUERY_DATASET')}.{os.getenv('BIGQUERY_TABLE')}_current")
+
+
+def recompute_from_bigquery(client, table: Optional[str] = None) -> Dict[RollupKey, Aggregate]:
+    """Recalcula os agregados do zero com ``RECOMPUTE_QUERY`` no BigQuery."""
+    table = table or source_table(client)
+    result = client.query(RECOMPUTE_QUERY.format(table=table)).result()
+    return {
+        (row["account"] or "", row["month"] or "", row["category"]): (
+            int(row["total"]), row["count"], int(row["min_valor"]), int(row["max_valor"]))
+        for row in result
+    }
+
+
+def aggregate_rows(rows: Iterable[Dict[str, Any]]) -> Dict[RollupKey, Aggregate]:
+    """Calcula os agregados de um conjunto de linhas (ignora valores que não são centavos)."""
+    aggregates: Dict[RollupKey, Aggregate] = {}
+    for row in rows:
+        valor = row.get("valor")
+        if is_cents(valor):
+            key = rollup_key(row)
+            aggregates[key] = _merge(aggregates.get(key), valor)
+    return aggregates
+
+
+class RollupStore:
+    """Agregados mensais em SQLite, atualizados incrementalmente.
+
+    Args:
+        path: Arquivo SQLite.
+        ledger_months: Meses abertos mantidos no registro de ids (0 guarda todos).
+        clock: Devolve a data de hoje; usado para calcular os meses abertos.
+    """
+
+    def __init__(self, path: str, ledger_months: int = 0, clock=date.today):
+        self.path = path
+        self.ledger_months = ledger_months
+        self.clock = clock
+        self.rows_closed = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        existing = self._conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'rollup_rows'").fetchone()
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS rollup_rows (
+                id TEXT PRIMARY KEY, account TEXT NOT NULL, month TEXT NOT NULL,
+                category TEXT NOT NULL, valor INTEGER NOT NULL);
+            CREATE TABLE IF NOT EXISTS monthly_rollups (
+                account TEXT NOT NULL, month TEXT NOT NULL, category TEXT NOT NULL,
+                total INTEGER NOT NULL, count INTEGER NOT NULL, min_valor INTEGER NOT NULL,
+                max_valor INTEGER NOT NULL, PRIMARY KEY (account, month, category));
+            CREATE INDEX IF NOT EXISTS rollup_rows_month ON rollup_rows (month);
+        """)
+        if self._conn.execute("PRAGMA user_version").fetchone()[0] < CENTS_SCHEMA_VERSION:
+            if existing:
+                # Bancos anteriores aos centavos guardam reais em colunas REAL
+                self._conn.executescript("""
+                    UPDATE rollup_rows SET valor = ROUND(valor * 100);
+                    UPDATE monthly_rollups SET total = ROUND(total * 100),
+                        min_valor = ROUND(min_valor * 100), max_valor = ROUND(max_valor * 100);
+                """)
+            self._conn.execute(f"PRAGMA user_version = {CENTS_SCHEMA_VERSION}")
+        self._conn.commit()
+
+    def open_since(self) -> Optional[str]:
+        """Primeiro mês aberto (None quando o registro guarda todos os meses)."""
+        return open_months_since(self.ledger_months, self.clock())
+
+    def apply(self, rows: Iterable[Dict[str, Any]], ids: Optional[Iterable[str]] = None) -> int:
+        """Agrega as linhas ainda não vistas; devolve quantas foram agregadas.
+
+        O registro usa o id de cada transação (``instance_ids``): o ``id`` da
+        linha é o mesmo para compras idênticas no mesmo dia. O writer passa em
+        ``ids`` os calculados sobre a mensagem inteira; sem eles são calculados
+        sobre ``rows``.
+        """
+        rows = list(rows)
+        ids = instance_ids(rows) if ids is None else ids
+        deltas: Dict[RollupKey, Aggregate] = {}
+        applied = 0
+        since = self.open_since()
+        with self._lock, self._conn:
+            for row, row_id in zip(rows, ids):
+                valor = row.get("valor")
+                if not row_id or not is_cents(valor):
+                    continue
+                key = rollup_key(row)
+                if since and key[1] < since:
+                    self.rows_closed += 1
+                    continue
+                cursor = self._conn.execute(
+                    "INSERT OR IGNORE INTO rollup_rows (id, account, month, category, valor) VALUES (?, ?, ?, ?, ?)",
+                    (row_id, *key, valor),
+                )
+                if cursor.rowcount == 1:
+                    deltas[key] = _merge(deltas.get(key), valor)
+                    applied += 1
+            self._conn.executemany(
+                "INSERT INTO monthly_rollups (account, month, category, total, count, min_valor, max_valor)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)"
+                " ON CONFLICT(account, month, category) DO UPDATE SET"
+                " total = total + excluded.total, count = count + excluded.count,"
+                " min_valor = MIN(min_valor, excluded.min_valor), max_valor = MAX(max_valor, excluded.max_valor)",
+                [(*key, *aggregate) for key, aggregate in deltas.items()],
+            )
+            if since:
+                self._conn.execute("DELETE FROM rollup_rows WHERE month < ?", (since,))
+        return applied
+
+    def retract(self, ids: Iterable[str]) -> int:
+        """Remove dos agregados linhas substituídas por uma versão corrigida; devolve quantas.
+
+        ``ids`` são os ``id`` das linhas substituídas; um id repetido retira
+        outra transação idêntica (``<id>:<n>``), a partir da última. Os
+        agregados das chaves afetadas são recalculados a partir de ``rollup_rows``.
+        """
+        keys = set()
+        retracted = 0
+        with self._lock, self._conn:
+            for row_id, count in Counter(ids).items():
+                found = self._conn.execute(
+                    "SELECT id, account, month, category FROM rollup_rows WHERE id = ? OR id LIKE ?"
+                    " ORDER BY LENGTH(id) DESC, id DESC LIMIT ?", (row_id, f"{row_id}:%", count)).fetchall()
+                for instance_id, *key in found:
+                    self._conn.execute("DELETE FROM rollup_rows WHERE id = ?", (instance_id,))
+                    keys.add(tuple(key))
+                    retracted += 1
+            for key in keys:
+                total, count, min_valor, max_valor = self._conn.execute(
+                    "SELECT SUM(valor), COUNT(*), MIN(valor), MAX(valor) FROM rollup_rows"
+                    " WHERE account = ? AND month = ? AND category = ?", key).fetchone()
+                if count:
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO monthly_rollups"
+                        " (account, month, category, total, count, min_valor, max_valor) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        (*key, total, count, min_valor, max_valor))
+                else:
+                    self._conn.execute(
+                        "DELETE FROM monthly_rollups WHERE account = ? AND month = ? AND category = ?", key)
+        return retracted
+
+    def rollups(self) -> Dict[RollupKey, Aggregate]:
+        with self._lock:
+            return {
+                (account, month, category): (int(total), count, int(min_valor), int(max_valor))
+                for account, month, category, total, count, min_valor, max_valor in self._conn.execute(
+                    "SELECT account, month, category, total, count, min_valor, max_valor FROM monthly_rollups")
+            }
+
+    def summary(self, account: Optional[str] = None, month: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Resumo mensal por categoria, lido apenas da tabela de agregados."""
+        query = "SELECT account, month, category, total, count, min_valor, max_valor FROM monthly_rollups WHERE 1 = 1"
+        params: List[str] = []
+        if account:
+            query += " AND account = ?"
+            params.append(account)
+        if month:
+            query += " AND month = ?"
+            params.append(month)
+        query += " ORDER BY account, month, category"
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        return [
+            {"account": account, "month": month, "category": category or None, "total": int(total),
+             "count": count, "min": int(min_valor), "max": int(max_valor)}
+            for account, month, category, total, count, min_valor, max_valor in rows
+        ]
+
+    def recompute(self) -> Dict[RollupKey, Aggregate]:
+        """Recalcula os agregados dos meses abertos a partir das linhas registradas."""
+        with self._lock:
+            rows = self._conn.execute("SELECT account, month, category, valor FROM rollup_rows").fetchall()
+        aggregates: Dict[RollupKey, Aggregate] = {}
+        for account, month, category, valor in rows:
+            aggregates[(account, month, category)] = _merge(aggregates.get((account, month, category)), int(valor))
+        return aggregates
+
+    def rebuild_closed(self, expected: Dict[RollupKey, Aggregate]) -> int:
+        """Substitui os agregados dos meses fechados por um recálculo; devolve quantas chaves gravou."""
+        since = self.open_since()
+        if since is None:
+            return 0
+        closed = [(*key, *aggregate) for key, aggregate in expected.items() if key[1] < since]
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM monthly_rollups WHERE month < ?", (since,))
+            self._conn.executemany(
+                "INSERT INTO monthly_rollups (account, month, category, total, count, min_valor, max_valor)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)", closed)
+        return len(closed)
+
+    def check_consistency(self, expected: Optional[Dict[RollupKey, Aggregate]] = None,
+                          tolerance: int = 0, client=None) -> List[Dict[str, Any]]:
+        """Compara os agregados incrementais com um recálculo completo.
+
+        Args:
+            expected: Agregados de referência por ``(account, month, category)``,
+                por exemplo ``aggregate_rows`` sobre linhas exportadas; por padrão,
+                ``RECOMPUTE_QUERY`` no BigQuery.
+            tolerance: Diferença aceita nas somas, em centavos.
+            client: Cliente do BigQuery usado sem ``expected``; por padrão, o da factory.
+
+        Returns:
+            Divergências encontradas; lista vazia quando tudo confere.
+        """
+        if expected is None:
+            expected = recompute_from_bigquery(client or get_bigquery_client())
+        return self._compare(expected, self.rollups(), tolerance)
+
+    def check_ledger(self, tolerance: int = 0) -> List[Dict[str, Any]]:
+        """Compara os meses abertos com o recálculo a partir do registro local de ids."""
+        since = self.open_since()
+        actual = {key: aggregate for key, aggregate in self.rollups().items() if since is None or key[1] >= since}
+        return self._compare(self.recompute(), actual, tolerance)
+
+    @staticmethod
+    def _compare(expected: Dict[RollupKey, Aggregate], actual: Dict[RollupKey, Aggregate],
+                 tolerance: int) -> List[Dict[str, Any]]:
+        mismatches = []
+        for key in sorted(set(expected) | set(actual)):
+            want, got = expected.get(key), actual.get(key)
+            if want is None or got is None or want[1] != got[1] or any(
+                    abs(w - g) > tolerance for w, g in zip((want[0], want[2], want[3]), (got[0], got[2], got[3]))):
+                mismatches.append({"key": key, "expected": want, "actual": got})
+        return mismatches
+
+
+def get_rollup_store() -> Optional[RollupStore]:
+    """Store de agregados em ``ROLLUPS_DB_PATH`` (None quando não configurado)."""
+    path = os.getenv("ROLLUPS_DB_PATH")
+    if not path:
+        return None
+    return get_or_create(f"rollup_store:{path}", lambda: RollupStore(
+        path, int(os.getenv("ROLLUPS_LEDGER_MONTHS", DEFAULT_LEDGER_MONTHS))))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Agregados mensais por conta e categoria")
+    parser.add_argument("--db", default=os.getenv("ROLLUPS_DB_PATH"), help="Arquivo SQLite dos agregados")
+    parser.add_argument("--account")
+    parser.add_argument("--month", help="Mês no formato YYYY-MM")
+    parser.add_argument("--ledger-months", type=int, default=int(os.getenv("ROLLUPS_LEDGER_MONTHS", DEFAULT_LEDGER_MONTHS)),
+                        help="Meses abertos mantidos no registro de ids (0 guarda todos)")
+    parser.add_argument("--check", action="store_true", help="Compara com um recálculo completo no BigQuery")
+    parser.add_argument("--local", action="store_true", help="Com --check, recalcula a partir do registro local")
+    parser.add_argument("--rebuild", action="store_true", help="Recalcula os meses fechados a partir do BigQuery")
+    args = parser.parse_args(argv)
+    if not args.db:
+        parser.error("--db or ROLLUPS_DB_PATH is required")
+
+    store = RollupStore(args.db, args.ledger_months)
+    if args.check:
+        mismatches = store.check_ledger() if args.local else store.check_consistency()
+        print(json.dumps({"consistent": not mismatches, "mismatches": mismatches}, indent=2, default=list))
+        return 1 if mismatches else 0
+    if args.rebuild:
+        rebuilt = store.rebuild_closed(recompute_from_bigquery(get_bigquery_client()))
+        print(json.dumps({"rebuilt": rebuilt, "open_since": store.open_since()}, indent=2))
+        return 0
+    print(json.dumps(store.summary(args.account, args.month), indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
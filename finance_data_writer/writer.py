@@ -2,16 +2,38 @@ import os
 import json
 import logging
 import time
-from typing import Dict, Any, List, Optional
+from datetime import datetime
+from typing import Dict, Any, List, NamedTuple, Optional
 
 import functions_framework
 from flask import Request
-from google.cloud import bigquery
-from google.cloud import pubsub_v1
 
+from finance_data_writer.batching import BatchWriteError, get_batch_controller, write_batches
+from finance_data_writer.lanes import create_lane_scheduler
+from finance_data_writer.poison import get_poison_guard
+from finance_data_writer.rollups import get_rollup_store
+from utils.lazy_import import lazy_import
 from utils.logging_config import setup_logging, log_structured
-from utils.telemetry import create_span, get_current_trace_id
-from utils.factories import get_logger, get_telemetry, get_bigquery_client, get_pubsub_subscriber, get_subscription_path
+from utils.telemetry import create_span, extract_context, get_current_trace_id, record_span
+from utils.factories import (
+    get_bigquery_client,
+    get_ingestion_index,
+    get_logger,
+    get_pubsub_subscriber,
+    get_rate_limiter,
+    get_subscription_path,
+    get_table_schema,
+    get_telemetry,
+    get_write_spool,
+)
+from utils.ingestion_index import instance_ids, replaced_ids
+from utils.money import to_cents
+from utils.profiling import profile_invocation, message_wants_profile
+from utils.warmup import Warmup, is_warmup_request, warmup_on_start
+
+# Clientes do Google importados sob demanda (primeira requisição, não no cold start)
+bigquery = lazy_import("google.cloud.bigquery")
+pubsub_v1 = lazy_import("google.cloud.pubsub_v1")
 
 # Setup logger
 logger = get_logger(__name__)
@@ -45,8 +67,12 @@ def check_credentials(telemetry=None):
             span.set_attribute("error", error_msg)
             raise
 
-def write_to_bigquery(rows: List[Dict[str, Any]], telemetry=None):
-    """Escreve dados no BigQuery."""
+def write_to_bigquery(rows: List[Dict[str, Any]], telemetry=None, insert_ids: Optional[List[str]] = None):
+    """Escreve dados no BigQuery.
+
+    ``insert_ids`` (alinhados com ``rows``) vão como insertId de cada linha;
+    sem eles são calculados com ``instance_ids`` sobre as linhas recebidas.
+    """
     telemetry = telemetry or get_telemetry("writer")
     with create_span("write_to_bigquery", {"rows_count": len(rows)}) as span:
         try:
@@ -60,6 +86,15 @@ def write_to_bigquery(rows: List[Dict[str, Any]], telemetry=None):
                 logger.error(error_msg)
                 span.set_attribute("error", error_msg)
                 raise ValueError(error_msg)
+            # Validar e projetar o lote no schema da tabela antes de qualquer requisição
+            schema = get_table_schema()
+            unknown_fields = schema.unknown_fields(rows)
+            if unknown_fields:
+                logger.warning("Dropping fields not in table schema",
+                              extra={"fields": unknown_fields})
+            insert_ids = insert_ids if insert_ids is not None else instance_ids(rows)
+            rows = schema.project(rows)
+            insert_id_of = {id(row): insert_id for row, insert_id in zip(rows, insert_ids)}
             # Preparar dados para inserção
             table_ref = f"{client.project}.{dataset_id}.{table_id}"
             # Registrar início da escrita
@@ -68,19 +103,37 @@ def write_to_bigquery(rows: List[Dict[str, Any]], telemetry=None):
                              "table": table_ref})
             # Medir tempo de escrita
             start_time = time.monotonic()
-            # Inserir dados
-            errors = client.insert_rows_json(table_ref, rows)
+            # Inserir dados em requisições com tamanho e concorrência adaptativos,
+            # cada uma liberada pelo rate limiter da API e da tabela. O id da
+            # transação vai como insertId: se a mensagem voltar depois de uma falha
+            # parcial, o BigQuery descarta as linhas das requisições já gravadas
+            limiter = get_rate_limiter()
+            batch_error = None
+            try:
+                batches = write_batches(rows, lambda chunk: client.insert_rows_json(
+                                            table_ref, chunk, row_ids=[insert_id_of[id(row)] for row in chunk]),
+                                        get_batch_controller(),
+                                        acquire=lambda: limiter.acquire("bigquery.insert", table_ref))
+            except BatchWriteError as e:
+                batch_error = e
+                batches = get_batch_controller().metrics()
             # Calcular duração
             duration = time.monotonic() - start_time
             # Registrar métricas
             logger.info("SLI: bigquery_write_duration",
                        extra={"duration": duration,
                              "rows_count": len(rows)})
-            if errors:
-                error_msg = f"Errors writing to BigQuery: {errors}"
+            logger.info("SLI: batch_controller", extra=batches)
+            span.set_attribute("batch.requests", batches.get("requests", 0))
+            span.set_attribute("batch.rows", batches["batch_rows"])
+            span.set_attribute("batch.concurrency", batches["concurrency"])
+            span.set_attribute("rate_limit.wait_s", batches.get("rate_limit_wait", 0.0))
+            if batch_error is not None:
+                error_msg = f"Errors writing to BigQuery: {batch_error.errors}"
                 logger.error(error_msg)
                 span.set_attribute("error", error_msg)
-                raise RuntimeError(error_msg)
+                # A causa permite ao PoisonGuard distinguir linhas recusadas de falhas transitórias
+                raise RuntimeError(error_msg) from batch_error
             # Registrar sucesso
             logger.info("BigQuery write completed successfully",
                        extra={"rows_count": len(rows),
@@ -92,21 +145,178 @@ def write_to_bigquery(rows: List[Dict[str, Any]], telemetry=None):
             span.set_attribute("error", error_msg)
             raise
 
-def process_message(message: pubsub_v1.types.PubsubMessage, telemetry=None):
+def flatten_rows(rows: List[Any]) -> List[Dict[str, Any]]:
+    """Achata blocos de linhas (lista de listas) em uma lista de linhas."""
+    flat = []
+    for item in rows:
+        if isinstance(item, list):
+            flat.extend(item)
+        else:
+            flat.append(item)
+    return flat
+
+def normalize_amounts(rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Converte para centavos valores publicados antes dos centavos (float em reais).
+
+    O JSON preserva o tipo: centavos chegam como inteiros, então um ``valor``
+    float só pode vir de uma mensagem (ou spool) antiga.
+    """
+    for row in rows:
+        if isinstance(row.get("valor"), float):
+            row["valor"] = to_cents(row["valor"])
+    return rows
+
+def message_writer(rows: List[Dict[str, Any]]):
+    """Função de escrita que mantém os ids de transação da mensagem inteira.
+
+    A bisseção do PoisonGuard escreve subconjuntos das linhas; recalcular os
+    ordinais em cada parte daria o mesmo id a compras idênticas separadas.
+    Devolve ``(write, ids)``, com ``ids`` indexado pela identidade da linha.
+    """
+    ids = {id(row): instance_id for row, instance_id in zip(rows, instance_ids(rows))}
+    return (lambda chunk: write_to_bigquery(chunk, insert_ids=[ids[id(row)] for row in chunk])), ids
+
+def exclude_poisoned(index_entries: List[List[str]], poisoned) -> List[List[str]]:
+    """Remove as entradas do índice das linhas desviadas (elas não foram escritas)."""
+    poisoned_ids = {row.get("id") for row, _ in poisoned}
+    return [entry for entry in index_entries if entry[3] not in poisoned_ids]
+
+def record_ingested(index_entries: List[List[str]], file_path: Optional[str] = None):
+    """Registra no índice incremental as linhas escritas com sucesso."""
+    try:
+        recorded = get_ingestion_index().record(index_entries)
+        logger.info("SLI: ingestion_index_recorded",
+                   extra={"file_path": file_path, "rows_count": recorded})
+    except Exception as e:
+        # As linhas já estão no BigQuery: não devolver a mensagem por causa do índice
+        logger.error(f"Error updating ingestion index: {str(e)}",
+                    extra={"file_path": file_path})
+
+def update_rollups(rows: List[Dict[str, Any]], file_path: Optional[str] = None,
+                   replaced: Optional[List[str]] = None, ids: Optional[List[str]] = None):
+    """Atualiza os agregados mensais com as linhas escritas com sucesso.
+
+    ``replaced`` são os ids que essas linhas substituem (valor corrigido em um
+    reenvio incremental); eles saem dos agregados. ``ids`` são os ids de
+    transação das linhas, calculados sobre a mensagem inteira.
+    """
+    store = get_rollup_store()
+    if store is None:
+        return
+    try:
+        start_time = time.monotonic()
+        applied = store.apply(rows, ids)
+        retracted = store.retract(replaced) if replaced else 0
+        logger.info("SLI: rollups_updated",
+                   extra={"file_path": file_path,
+                         "rows_count": applied,
+                         "retracted_rows": retracted,
+                         "closed_month_rows": store.rows_closed,
+                         "duration": time.monotonic() - start_time})
+    except Exception as e:
+        # As linhas já estão no BigQuery: os agregados podem ser recalculados depois
+        logger.error(f"Error updating rollups: {str(e)}",
+                    extra={"file_path": file_path})
+
+class SpooledBatch(NamedTuple):
+    """Lote drenado do spool, contado pelo PoisonGuard como uma mensagem."""
+    message_id: str
+
+def write_spooled_records(records: List[Dict[str, Any]]):
+    """Escreve no BigQuery, em um único lote, os registros drenados do spool.
+
+    O lote passa pelo PoisonGuard como uma mensagem: linhas que nunca serão
+    aceitas vão para o dead-letter em vez de travar o spool, que repetiria o
+    mesmo lote a partir do checkpoint e seguraria todos os segmentos seguintes.
+    """
+    rows = normalize_amounts([row for record in records for row in record["rows"]])
+    guard = get_poison_guard()
+    # Depois de uma falha o spool reenvia o lote a partir do mesmo registro
+    batch = SpooledBatch(f"spool:{records[0].get('message_id')}" if records else "spool")
+    attempt = guard.attempt(batch)
+    write, ids = message_writer(rows)
+    written, poisoned = guard.write(rows, write, attempt)
+    if poisoned:
+        # Cada linha vai para o dead-letter com a mensagem e o arquivo de origem
+        origin = {id(row): index for index, record in enumerate(records) for row in record["rows"]}
+        by_record: Dict[int, List[Any]] = {}
+        for row, error in poisoned:
+            by_record.setdefault(origin[id(row)], []).append((row, error))
+        for index, record_poisoned in sorted(by_record.items()):
+            record = records[index]
+            guard.dead_letter_rows(SpooledBatch(record.get("message_id") or batch.message_id),
+                                   record_poisoned, record.get("file_path"), attempt)
+        logger.error("Poison rows from spool sent to dead letter",
+                    extra={"poison_rows": len(poisoned), "delivery_attempt": attempt})
+    index_entries = exclude_poisoned(
+        [entry for record in records for entry in record.get("index_entries") or []], poisoned)
+    update_rollups(written, replaced=replaced_ids(index_entries), ids=[ids[id(row)] for row in written])
+    if index_entries:
+        record_ingested(index_entries)
+    guard.record(batch, len(rows), len(poisoned), attempt)
+
+# Inicialização pesada feita antes da primeira mensagem (WARMUP_ON_START ou /_ah/warmup)
+WARMUP = Warmup("writer", [
+    ("telemetry", lambda: get_telemetry("writer")),
+    ("bigquery_client", lambda: get_bigquery_client()),
+    ("pubsub_subscriber", lambda: get_subscription_path(get_pubsub_subscriber())),
+    ("table_schema", lambda: get_table_schema()),
+    ("rollup_store", lambda: get_rollup_store()),
+    ("poison_guard", lambda: get_poison_guard()),
+    ("write_spool", lambda: get_write_spool(write_spooled_records)),
+])
+if warmup_on_start():
+    WARMUP.start()
+
+def record_queue_time(message, context=None) -> Optional[float]:
+    """Registra o tempo entre o publish e a entrega como um span ``pubsub_queue``."""
+    publish_time = getattr(message, "publish_time", None)
+    if not isinstance(publish_time, datetime):
+        return None
+    start_ns = int(publish_time.timestamp() * 1_000_000_000)
+    end_ns = time.time_ns()
+    record_span("pubsub_queue", start_ns, end_ns,
+                {"message_id": message.message_id,
+                 "delivery_attempt": getattr(message, "delivery_attempt", None) or 1},
+                context=context)
+    queue_time = max(0.0, (end_ns - start_ns) / 1_000_000_000)
+    logger.info("SLI: pubsub_queue_time",
+               extra={"message_id": message.message_id, "duration": queue_time})
+    return queue_time
+
+@WARMUP.entry_point
+@profile_invocation("process_message", message_wants_profile)
+def process_message(message: "pubsub_v1.types.PubsubMessage", telemetry=None):
     """Processa uma mensagem do Pub/Sub."""
     telemetry = telemetry or get_telemetry("writer")
+    # Continua o trace do leitor (traceparent W3C nos atributos da mensagem)
+    parent_context = extract_context(getattr(message, "attributes", None))
+    record_queue_time(message, parent_context)
+    guard = get_poison_guard()
+    attempt = guard.attempt(message)
     with create_span("process_message", {
         "message_id": message.message_id,
-        "publish_time": message.publish_time.isoformat()
-    }) as span:
+        "publish_time": message.publish_time.isoformat(),
+        "delivery_attempt": attempt,
+    }, context=parent_context) as span:
         try:
-            # Decodificar mensagem
-            data = json.loads(message.data.decode("utf-8"))
+            # Decodificar mensagem; o que não é um objeto JSON nunca vai funcionar
+            try:
+                data = json.loads(message.data.decode("utf-8"))
+                if not isinstance(data, dict):
+                    raise ValueError("Message is not a JSON object")
+            except ValueError as e:
+                guard.dead_letter_message(message, e, attempt)
+                logger.error(f"Undecodable message sent to dead letter: {str(e)}",
+                            extra={"message_id": message.message_id, "delivery_attempt": attempt})
+                span.set_attribute("poison.undecodable", True)
+                message.ack()
+                return True
             
-            # Extrair dados
-            rows = data.get("rows", [])
+            # Extrair dados (o leitor publica as linhas agrupadas em blocos)
+            rows = normalize_amounts(flatten_rows(data.get("rows", [])))
             file_path = data.get("file_path")
-            trace_id = data.get("trace_id")
+            trace_id = get_current_trace_id() or data.get("trace_id")
             
             # Registrar início do processamento
             logger.info("Processing message",
@@ -115,11 +325,39 @@ def process_message(message: pubsub_v1.types.PubsubMessage, telemetry=None):
                              "rows_count": len(rows),
                              "trace_id": trace_id})
             
+            # Com spool local: grava no WAL, confirma a mensagem e deixa o flusher escrever
+            spool = get_write_spool(write_spooled_records)
+            if spool is not None:
+                spool.append({"rows": rows,
+                              "file_path": file_path,
+                              "message_id": message.message_id,
+                              "index_entries": data.get("index_entries")})
+                logger.info("SLI: rows_spooled",
+                           extra={"message_id": message.message_id,
+                                 "rows_count": len(rows)})
+                message.ack()
+                return True
+            
             # Medir tempo de processamento
             start_time = time.monotonic()
             
-            # Escrever no BigQuery
-            write_to_bigquery(rows)
+            # Escrever no BigQuery; linhas que sempre falham são isoladas e desviadas
+            write, ids = message_writer(rows)
+            written, poisoned = guard.write(rows, write, attempt)
+            if poisoned:
+                guard.dead_letter_rows(message, poisoned, file_path, attempt)
+                logger.error("Poison rows sent to dead letter",
+                            extra={"message_id": message.message_id,
+                                  "file_path": file_path,
+                                  "poison_rows": len(poisoned),
+                                  "delivery_attempt": attempt})
+            span.set_attribute("poison.rows", len(poisoned))
+            index_entries = exclude_poisoned(data.get("index_entries") or [], poisoned)
+            update_rollups(written, file_path, replaced_ids(index_entries), [ids[id(row)] for row in written])
+            
+            # Atualizar o índice incremental somente após a escrita
+            if index_entries:
+                record_ingested(index_entries, file_path)
             
             # Calcular duração
             duration = time.monotonic() - start_time
@@ -135,6 +373,7 @@ def process_message(message: pubsub_v1.types.PubsubMessage, telemetry=None):
                              "rows_count": len(rows),
                              "duration": duration})
             
+            guard.record(message, len(rows), len(poisoned), attempt)
             message.ack()
             return True
             
@@ -148,6 +387,9 @@ def process_message(message: pubsub_v1.types.PubsubMessage, telemetry=None):
 @functions_framework.http
 def main(request: Request, telemetry=None):
     """HTTP Cloud Function para processar mensagens do Pub/Sub."""
+    # A latência de main não é medida: ela dura enquanto o streaming pull estiver ativo
+    if is_warmup_request(request):
+        return WARMUP.response()
     telemetry = telemetry or get_telemetry("writer")
     with create_span("main") as span:
         try:
@@ -177,10 +419,15 @@ def main(request: Request, telemetry=None):
                 else:
                     message.nack()
             
-            # Iniciar subscriber
+            # Uma lane por conta (ordering_key): ordem dentro da conta, paralelismo entre contas
+            lanes = create_lane_scheduler(callback).start()
+            
+            # Iniciar subscriber; o flow control limita as mensagens retidas nas lanes
             streaming_pull_future = subscriber.subscribe(
                 subscription_path,
-                callback=callback
+                callback=lanes.submit,
+                flow_control=pubsub_v1.types.FlowControl(
+                    max_messages=int(os.getenv("WRITER_MAX_OUTSTANDING_MESSAGES", 100))),
             )
             
             # Aguardar mensagens
@@ -189,6 +436,10 @@ def main(request: Request, telemetry=None):
             except Exception as e:
                 streaming_pull_future.cancel()
                 raise e
+            finally:
+                lanes.stop(timeout=30)
+                logger.info("SLI: writer_lanes", extra=lanes.metrics())
+                logger.info("SLI: poison_rate", extra=get_poison_guard().metrics())
             
             # Calcular duração
             duration = time.monotonic() - start_time
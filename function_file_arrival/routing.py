@@ -0,0 +1,153 @@
+"""Tabela de rotas do trigger: caminho do objeto → conta, tipo de parser e endpoint.
+
+As rotas são lidas uma vez por processo de ``TRIGGER_ROUTES_PATH`` (ou do
+``routes.json`` ao lado deste módulo) e compiladas em dois índices:
+
+- sufixo: a extensão do arquivo, em minúsculas, indexa o tipo de parser
+  (``excel``, ``csv``, ``ofx``); extensões fora da tabela são ignoradas;
+- prefixo: as rotas são agrupadas pelo primeiro segmento do prefixo, então
+  cada evento faz uma consulta em dicionário e compara só os prefixos
+  daquele segmento, do mais longo para o mais curto.
+
+``Router.match`` classifica um evento sem tocar em span, log ou rede.
+Placeholders de pasta (nomes terminados em ``/``), arquivos temporários
+(``~$planilha.xlsx``, ``.arquivo``) e extensões não suportadas são
+ignorados; caminhos fora de qualquer rota são recusados com a mesma
+mensagem de antes (``Invalid folder name in file path``).
+
+Cada rota tem uma conta e, opcionalmente, ``parsers`` (restringe as
+extensões aceitas), ``layout`` (layout registrado no leitor, para exportações
+sem cabeçalho; com ele o leitor não detecta o layout pelas primeiras
+linhas), ``endpoint``
+(URL fixa) ou ``endpoint_env`` (variável com a URL; padrão
+``TRANSACTIONS_FUNCTION_ITAU_CARD_<CONTA>``). A variável é lida a cada
+evento, como antes, para que a URL possa mudar sem recompilar.
+
+``Router.stats`` acumula os resultados por motivo; ``take_stats`` devolve o
+que foi contado desde a última chamada, para o trigger publicar como SLI.
+"""
+import json
+import os
+import threading
+from collections import Counter
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from utils.factories import discard_instance, get_or_create
+
+DEFAULT_ROUTES_PATH = os.path.join(os.path.dirname(__file__), "routes.json")
+
+IGNORED_PLACEHOLDER = "folder placeholder"
+IGNORED_TEMPORARY = "temporary file"
+IGNORED_EXTENSION = "unsupported extension"
+REJECTED_FOLDER = "Invalid folder name in file path"
+
+
+@dataclass(frozen=True)
+class Route:
+    """Destino dos objetos com um prefixo."""
+    prefix: str
+    account: str
+    parsers: Optional[Tuple[str, ...]] = None
+    layout: Optional[str] = None
+    endpoint: Optional[str] = None
+    endpoint_env: Optional[str] = None
+
+    @property
+    def env_var(self) -> str:
+        return self.endpoint_env or f"TRANSACTIONS_FUNCTION_ITAU_CARD_{self.account.upper()}"
+
+    def resolve_endpoint(self) -> Optional[str]:
+        """URL da função de leitura (lida do ambiente a cada chamada)."""
+        return self.endpoint or os.environ.get(self.env_var)
+
+
+@dataclass(frozen=True)
+class Match:
+    """Resultado do roteamento: ``route`` e ``parser`` ou o motivo da recusa."""
+    route: Optional[Route] = None
+    parser: Optional[str] = None
+    ignored: Optional[str] = None
+    rejected: Optional[str] = None
+
+
+class Router:
+    """Casa caminhos de objetos com as rotas compiladas."""
+
+    def __init__(self, routes: List[Route], parsers: Dict[str, str], ignore_name_prefixes: Tuple[str, ...] = ()):
+        self.parsers = {suffix.lower(): parser for suffix, parser in parsers.items()}
+        self.ignore_name_prefixes = tuple(ignore_name_prefixes)
+        self._by_segment: Dict[str, List[Route]] = {}
+        for route in routes:
+            segment = route.prefix.split("/", 1)[0]
+            self._by_segment.setdefault(segment, []).append(route)
+        for candidates in self._by_segment.values():
+            candidates.sort(key=lambda route: len(route.prefix), reverse=True)
+        self.stats: Counter = Counter()
+        self._reported: Counter = Counter()
+        self._stats_lock = threading.Lock()
+
+    def match(self, name: str) -> Match:
+        if not name or name.endswith("/"):
+            return self._count(Match(ignored=IGNORED_PLACEHOLDER))
+        base_name = name.rsplit("/", 1)[-1]
+        if base_name.startswith(self.ignore_name_prefixes):
+            return self._count(Match(ignored=IGNORED_TEMPORARY))
+        dot = base_name.rfind(".")
+        parser = self.parsers.get(base_name[dot:].lower()) if dot > 0 else None
+        if parser is None:
+            return self._count(Match(ignored=IGNORED_EXTENSION))
+
+        for route in self._by_segment.get(name.split("/", 1)[0], ()):
+            if name.startswith(route.prefix):
+                if route.parsers is not None and parser not in route.parsers:
+                    return self._count(Match(ignored=IGNORED_EXTENSION))
+                return self._count(Match(route=route, parser=parser))
+        return self._count(Match(rejected=REJECTED_FOLDER))
+
+    def _count(self, match: Match) -> Match:
+        with self._stats_lock:
+            self.stats[match.ignored or match.rejected or "routed"] += 1
+        return match
+
+    @property
+    def pending(self) -> int:
+        """Eventos contados desde o último ``take_stats``."""
+        with self._stats_lock:
+            return sum(self.stats.values()) - sum(self._reported.values())
+
+    def take_stats(self) -> Dict[str, int]:
+        """Contagens por motivo desde a última chamada."""
+        with self._stats_lock:
+            current = self.stats.copy()
+            delta = current - self._reported
+            self._reported = current
+        return dict(delta)
+
+
+def load_router(path: str) -> Router:
+    """Lê e compila a tabela de rotas de um arquivo JSON."""
+    with open(path, encoding="utf-8") as f:
+        config = json.load(f)
+    routes = []
+    for entry in config["routes"]:
+        prefix = entry["prefix"]
+        routes.append(Route(
+            prefix=prefix if prefix.endswith("/") else f"{prefix}/",
+            account=entry["account"],
+            parsers=tuple(entry["parsers"]) if entry.get("parsers") else None,
+            layout=entry.get("layout"),
+            endpoint=entry.get("endpoint"),
+            endpoint_env=entry.get("endpoint_env"),
+        ))
+    return Router(routes, config["parsers"], tuple(config.get("ignore_name_prefixes", ())))
+
+
+def get_router() -> Router:
+    """Rotas compiladas uma vez por processo a partir de ``TRIGGER_ROUTES_PATH``."""
+    return get_or_create("router", lambda: load_router(os.getenv("TRIGGER_ROUTES_PATH", DEFAULT_ROUTES_PATH)))
+
+
+def reset_router() -> None:
+    """Descarta as rotas compiladas (ex.: após trocar o arquivo de rotas)."""
+    discard_instance("router")
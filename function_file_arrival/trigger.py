@@ -1,4 +1,3 @@
-import os
 import json
 import logging
 import requests
@@ -6,9 +5,12 @@ import time
 from dotenv import load_dotenv
 import functions_framework
 
+from function_file_arrival.routing import get_router
 from utils.logging_config import setup_logging, log_structured
-from utils.telemetry import create_span, get_current_trace_id
-from utils.factories import get_logger, get_telemetry
+from utils.telemetry import create_span, get_current_trace_id, inject_context
+from utils.factories import get_logger, get_rate_limiter, get_telemetry, get_upload_manifest
+from utils.manifest import content_key
+from utils.warmup import Warmup, warmup_on_start
 
 # Load environment variables
 load_dotenv()
@@ -16,13 +18,27 @@ load_dotenv()
 # Setup logger
 logger = get_logger(__name__)
 
-# Mapeamento de pastas para contas
-FOLDER_TO_ACCOUNT = {
-    "azul-visa": "azul-visa",
-    "itau-card": "itau-card",
-}
+# Descartes baratos só aparecem no SLI junto com o próximo evento roteado
+# ou a cada ROUTE_STATS_EVERY eventos
+ROUTE_STATS_EVERY = 100
+
+def report_route_stats(router):
+    """Publica as contagens do roteamento desde o último relatório (``SLI: trigger_routes``)."""
+    stats = router.take_stats()
+    if stats:
+        log_structured(logger, logging.INFO, "SLI: trigger_routes", **stats)
+
+# Inicialização feita antes do primeiro evento quando WARMUP_ON_START está ativo
+WARMUP = Warmup("trigger", [
+    ("telemetry", lambda: get_telemetry("trigger")),
+    ("routes", lambda: get_router()),
+    ("upload_manifest", lambda: get_upload_manifest()),
+])
+if warmup_on_start():
+    WARMUP.start()
 
 @functions_framework.cloud_event
+@WARMUP.entry_point
 def storage_trigger_function(cloud_event, telemetry=None):
     """Cloud Function triggered by a change to a Cloud Storage bucket.
     
@@ -40,39 +56,67 @@ def storage_trigger_function(cloud_event, telemetry=None):
         log_structured(logger, logging.ERROR, f"Missing required fields in event: {missing}", **data)
         return f"Missing required fields in event: {missing}"
 
+    # Roteamento antes de qualquer span ou chamada de rede: placeholders de pasta,
+    # temporários e extensões não suportadas são descartados sem custo
+    router = get_router()
+    match = router.match(file_name)
+    if not match.ignored or router.pending >= ROUTE_STATS_EVERY:
+        report_route_stats(router)
+    if match.ignored:
+        return f"Ignored object: {match.ignored}"
+    if match.rejected:
+        folder_name = file_name.split("/")[0]
+        log_structured(logger, logging.ERROR, f"Invalid folder name: {folder_name}",
+                     folder_name=folder_name,
+                     file_name=file_name)
+        return match.rejected
+    route = match.route
+
+    key = None
+    manifest = None
+
     # Criar span para o processamento do arquivo
     with create_span("process_file", {
         "file_name": file_name,
         "bucket": bucket_name,
-        "event_type": "storage.trigger"
+        "event_type": "storage.trigger",
+        "account": route.account,
+        "parser": match.parser,
+        "layout": route.layout or "detect"
     }) as span:
         try:
-            # Extrair nome da pasta do arquivo
-            folder_name = file_name.split("/")[0]
-            
-            # Verificar se a pasta é válida
-            if folder_name not in FOLDER_TO_ACCOUNT:
-                error_msg = f"Invalid folder name: {folder_name}"
-                log_structured(logger, logging.ERROR, error_msg,
-                             folder_name=folder_name,
-                             file_name=file_name)
-                span.set_attribute("error", error_msg)
-                return "Invalid folder name in file path"
-            
-            account = FOLDER_TO_ACCOUNT[folder_name]
-            env_var = f"TRANSACTIONS_FUNCTION_ITAU_CARD_{account.upper()}"
-            function_url = os.environ.get(env_var)
+            account = route.account
+            env_var = route.env_var
+            function_url = route.resolve_endpoint()
             if not function_url:
                 log_structured(logger, logging.ERROR, f"Missing environment variable: {env_var}",
                                  file_name=file_name)
                 span.set_attribute("error", f"Missing environment variable: {env_var}")
                 return f"Missing environment variable: {env_var}"
             
+            # Descartar uploads repetidos (mesmo conteúdo ou evento duplicado)
+            key = content_key(data.get("md5Hash"), data.get("generation"), bucket_name, file_name)
+            if key:
+                manifest = get_upload_manifest()
+                if not manifest.claim(key, file_name=file_name, bucket=bucket_name):
+                    skips = manifest.record_skip("trigger")
+                    log_structured(logger, logging.INFO, "SLI: duplicate_upload_skipped",
+                                  stage="trigger",
+                                  file_name=file_name,
+                                  content_hash=key,
+                                  skips_total=skips)
+                    span.set_attribute("duplicate", True)
+                    return "File already processed"
+            
             # Preparar payload
             payload = {
                 "file_path": file_name,
                 "bucket": bucket_name,
                 "account": account,
+                "parser": match.parser,
+                "layout": route.layout,
+                "content_hash": key,
+                "generation": data.get("generation"),
                 "trace_id": get_current_trace_id()
             }
             
@@ -80,20 +124,25 @@ def storage_trigger_function(cloud_event, telemetry=None):
             log_structured(logger, logging.INFO, "Sending request to processing function",
                           function_url=function_url, payload=payload)
             
-            # Enviar requisição para a função HTTP
+            # Enviar requisição para a função HTTP (traceparent W3C nos headers)
+            rate_limit_wait = get_rate_limiter().acquire("reader.invoke", function_url)
             start_time = time.monotonic()
-            response = requests.post(function_url, json=payload)
+            response = requests.post(function_url, json=payload, headers=inject_context())
             duration = time.monotonic() - start_time
             
             # Registrar métricas de tempo
             log_structured(logger, logging.INFO, "SLI: request_duration",
                           duration=duration,
+                          rate_limit_wait=rate_limit_wait,
                           file_name=file_name,
                           account=account)
             
             # Verificar resposta
             response.raise_for_status()
             
+            if key:
+                manifest.mark_done(key, file_name=file_name, bucket=bucket_name)
+            
             # Registrar sucesso
             log_structured(logger, logging.INFO, "File processed successfully",
                           file_name=file_name,
@@ -103,6 +152,9 @@ def storage_trigger_function(cloud_event, telemetry=None):
             
             return "File processed successfully"
         except Exception as e:
+            # Libera o arquivo para que a nova tentativa seja processada
+            if key:
+                manifest.release(key)
             error_msg = f"Error processing file: {str(e)}"
             log_structured(logger, logging.ERROR, error_msg,
                          file_name=file_name,
@@ -12,6 +12,7 @@ setup(
         "pandas>=2.2.0",
         "openpyxl>=3.1.2",
         "xlrd>=2.0.1",
+        "pyarrow>=15.0.0",
         "python-json-logger>=2.0.7",
         "opentelemetry-api>=1.23.0",
         "opentelemetry-sdk>=1.23.0",
@@ -28,6 +29,7 @@ setup(
             "mypy>=1.8.0",
             "bandit>=1.7.7",
             "safety>=2.3.5",
+            "xlwt>=1.3.0",
         ],
     },
     python_requires=">=3.13",
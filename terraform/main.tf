@@ -51,15 +51,8 @@ resource "google_bigquery_table" "personal_finance_flow" {
   dataset_id = google_bigquery_dataset.personal_finance.dataset_id
   table_id   = "personal_finance_flow"
 
-  schema = <<EOF
-[
-  {"name":"id",          "type":"STRING", "mode":"NULLABLE"},
-  {"name":"date",        "type":"DATE",   "mode":"NULLABLE"},
-  {"name":"value",       "type":"FLOAT",  "mode":"NULLABLE"},
-  {"name":"description", "type":"STRING", "mode":"NULLABLE"},
-  {"name":"account",     "type":"STRING", "mode":"NULLABLE"}
-]
-EOF
+  # Mesmo arquivo usado pelo writer para validar os lotes (utils/schema.py)
+  schema = file("${path.module}/schemas/personal_finance_flow.json")
 
   time_partitioning {
     type  = "DAY"
@@ -67,6 +60,64 @@ EOF
   }
 }
 
+# Índice da ingestão incremental, compartilhado entre o leitor e o writer
+# (INGESTION_INDEX_BACKEND=bigquery). Só recebe inserts; vale a entrada mais recente de cada chave.
+resource "google_bigquery_table" "ingestion_index" {
+  dataset_id = google_bigquery_dataset.personal_finance.dataset_id
+  table_id   = "ingestion_index"
+
+  schema = jsonencode([
+    { name = "account", type = "STRING", mode = "REQUIRED" },
+    { name = "period", type = "STRING", mode = "REQUIRED" },
+    { name = "row_key", type = "STRING", mode = "REQUIRED" },
+    { name = "row_id", type = "STRING", mode = "REQUIRED" },
+    { name = "replaced_id", type = "STRING", mode = "NULLABLE" },
+    { name = "recorded_at", type = "TIMESTAMP", mode = "REQUIRED" },
+  ])
+
+  clustering = ["account", "period"]
+}
+
+# Lançamentos atuais: sem as linhas substituídas por reimportações com alterações
+resource "google_bigquery_table" "personal_finance_flow_current" {
+  dataset_id = google_bigquery_dataset.personal_finance.dataset_id
+  table_id   = "personal_finance_flow_current"
+
+  view {
+    use_legacy_sql = false
+    query          = <<-SQL
+      WITH latest AS (
+        SELECT row_id, replaced_id FROM `${var.project_id}.${google_bigquery_dataset.personal_finance.dataset_id}.${google_bigquery_table.ingestion_index.table_id}`
+        QUALIFY ROW_NUMBER() OVER (PARTITION BY account, period, row_key ORDER BY recorded_at DESC) = 1
+      )
+      SELECT * FROM `${var.project_id}.${google_bigquery_dataset.personal_finance.dataset_id}.${google_bigquery_table.personal_finance_flow.table_id}`
+      WHERE id NOT IN (
+        SELECT replaced_id FROM latest
+        WHERE replaced_id IS NOT NULL AND replaced_id NOT IN (SELECT row_id FROM latest)
+      )
+    SQL
+  }
+}
+
+# Agregados mensais compartilhados por todas as instâncias do writer, lidos pelos
+# dashboards. A consulta é a mesma RECOMPUTE_QUERY de finance_data_writer/rollups.py
+# (conferida nos testes) sobre a view sem as linhas substituídas; o SQLite do writer
+# (ROLLUPS_DB_PATH) só vê as mensagens da própria instância.
+resource "google_bigquery_data_transfer_config" "monthly_rollups" {
+  display_name           = "monthly_rollups"
+  data_source_id         = "scheduled_query"
+  location               = var.location
+  schedule               = "every 1 hours"
+  destination_dataset_id = google_bigquery_dataset.personal_finance.dataset_id
+
+  params = {
+    destination_table_name_template = "monthly_rollups"
+    write_disposition               = "WRITE_TRUNCATE"
+    query = replace(file("${path.module}/sql/monthly_rollups.sql"), "{table}",
+      "${var.project_id}.${google_bigquery_dataset.personal_finance.dataset_id}.${google_bigquery_table.personal_finance_flow_current.table_id}")
+  }
+}
+
 resource "google_pubsub_subscription" "finance_to_bq" {
   name  = "finance-to-bq"
   topic = google_pubsub_topic.personal_finance_flow.name
@@ -81,6 +132,53 @@ resource "google_pubsub_subscription" "finance_to_bq" {
   message_retention_duration = "604800s"  # 7 dias
 }
 
+# Subscription de pull do writer (PUBSUB_SUBSCRIPTION): o leitor publica com a
+# conta como ordering_key e o writer processa cada conta em ordem
+resource "google_pubsub_subscription" "finance_writer" {
+  name  = "finance-writer"
+  topic = google_pubsub_topic.personal_finance_flow.name
+
+  enable_message_ordering    = true
+  ack_deadline_seconds       = 60
+  message_retention_duration = "604800s"  # 7 dias
+
+  # Preenche delivery_attempt nas mensagens; o writer isola linhas inválidas
+  # antes disso e o Pub/Sub só desvia o que falhar em todas as entregas
+  dead_letter_policy {
+    dead_letter_topic     = google_pubsub_topic.finance_writer_dead_letter.id
+    max_delivery_attempts = 10
+  }
+}
+
+# Dead-letter do writer: mensagens que esgotaram as entregas e, com
+# WRITER_DEAD_LETTER_TOPIC, as linhas isoladas pela bisseção
+resource "google_pubsub_topic" "finance_writer_dead_letter" {
+  name = "personal_finance_flow_dead_letter"
+}
+
+resource "google_pubsub_subscription" "finance_writer_dead_letter" {
+  name                       = "finance-writer-dead-letter"
+  topic                      = google_pubsub_topic.finance_writer_dead_letter.name
+  message_retention_duration = "604800s"  # 7 dias
+}
+
+# O agente de serviço do Pub/Sub precisa publicar no dead-letter e confirmar na subscription
+data "google_project" "current" {
+  project_id = var.project_id
+}
+
+resource "google_pubsub_topic_iam_member" "dead_letter_publisher" {
+  topic  = google_pubsub_topic.finance_writer_dead_letter.name
+  role   = "roles/pubsub.publisher"
+  member = "serviceAccount:service-${data.google_project.current.number}@gcp-sa-pubsub.iam.gserviceaccount.com"
+}
+
+resource "google_pubsub_subscription_iam_member" "dead_letter_subscriber" {
+  subscription = google_pubsub_subscription.finance_writer.name
+  role         = "roles/pubsub.subscriber"
+  member       = "serviceAccount:service-${data.google_project.current.number}@gcp-sa-pubsub.iam.gserviceaccount.com"
+}
+
 #############################
 # 3) CLOUD FUNCTIONS
 #############################
@@ -148,7 +246,12 @@ resource "google_cloudfunctions_function" "function_itau_card_reader" {
 
   # Passar por env var o tópico a ser usado
   environment_variables = {
-    "PUBSUB_TOPIC" = google_pubsub_topic.personal_finance_flow.id
+    "PUBSUB_TOPIC"    = google_pubsub_topic.personal_finance_flow.id
+    # Clientes, parser e regras preparados ao iniciar a instância
+    "WARMUP_ON_START" = "true"
+    # Índice incremental compartilhado com o writer
+    "INGESTION_INDEX_BACKEND" = "bigquery"
+    "BIGQUERY_DATASET"        = google_bigquery_dataset.personal_finance.dataset_id
   }
 }
 
@@ -178,7 +281,29 @@ resource "google_pubsub_topic_iam_member" "publisher_itau_reader" {
   member = "serviceAccount:${google_cloudfunctions_function.function_itau_card_reader.service_account_email}"
 }
 
-# 4.3) Se quiser invocar a function_itau_card_reader publicamente sem autenticação
+# 4.3) O leitor consulta o índice incremental no BigQuery
+resource "google_bigquery_table_iam_member" "ingestion_index_reader" {
+  dataset_id = google_bigquery_dataset.personal_finance.dataset_id
+  table_id   = google_bigquery_table.ingestion_index.table_id
+  role       = "roles/bigquery.dataViewer"
+  member     = "serviceAccount:${google_cloudfunctions_function.function_itau_card_reader.service_account_email}"
+}
+
+# O writer (publicado pelo CI) registra as linhas gravadas no mesmo índice
+resource "google_bigquery_table_iam_member" "ingestion_index_writer" {
+  dataset_id = google_bigquery_dataset.personal_finance.dataset_id
+  table_id   = google_bigquery_table.ingestion_index.table_id
+  role       = "roles/bigquery.dataEditor"
+  member     = "serviceAccount:${coalesce(var.writer_service_account, "${var.project_id}@appspot.gserviceaccount.com")}"
+}
+
+resource "google_project_iam_member" "itau_reader_bigquery_jobs" {
+  project = var.project_id
+  role    = "roles/bigquery.jobUser"
+  member  = "serviceAccount:${google_cloudfunctions_function.function_itau_card_reader.service_account_email}"
+}
+
+# 4.4) Se quiser invocar a function_itau_card_reader publicamente sem autenticação
 resource "google_cloudfunctions_function_iam_member" "itau_reader_invoker" {
   project        = var.project_id
   region         = var.region
@@ -211,3 +336,8 @@ output "bq_table" {
   value       = google_bigquery_table.personal_finance_flow.id
   description = "Tabela BQ que recebe dados do Pub/Sub"
 }
+
+output "writer_subscription" {
+  value       = google_pubsub_subscription.finance_writer.name
+  description = "Subscription ordenada por conta consumida pelo writer"
+}
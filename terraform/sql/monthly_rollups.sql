@@ -0,0 +1,7 @@
+SELECT account, FORMAT_DATE('%Y-%m', date) AS month, IFNULL(category, '') AS category,
+       SUM(cents) AS total, COUNT(*) AS count, MIN(cents) AS min_valor, MAX(cents) AS max_valor
+FROM (
+  -- Linhas gravadas antes de value_cents só têm value (FLOAT, em reais)
+  SELECT *, IFNULL(value_cents, CAST(ROUND(value * 100) AS INT64)) AS cents FROM `{table}`
+)
+GROUP BY account, month, category
@@ -14,3 +14,9 @@ variable "location" {
   description = "Local (region) para o BigQuery. Pode ser 'US', 'EU', etc."
   default     = "US"
 }
+
+variable "writer_service_account" {
+  type        = string
+  description = "Service account da função process_transactions (publicada pelo CI). Vazio usa a conta padrão do App Engine."
+  default     = ""
+}
@@ -50,6 +50,26 @@ def mock_factories():
          patch('utils.factories.get_subscription_path', get_subscription_path):
         yield
 
+@pytest.fixture(autouse=True)
+def clear_shared_instances():
+    """Garante que clientes e telemetry compartilhados não vazem entre testes."""
+    from utils.factories import clear_instances
+    clear_instances()
+    yield
+    clear_instances()
+
+@pytest.fixture(autouse=True)
+def parse_cache_dir(tmp_path):
+    """Isola o cache de extratos lidos em um diretório temporário por teste."""
+    with patch.dict(os.environ, {'PARSE_CACHE_DIR': str(tmp_path / 'parse_cache')}):
+        yield
+
+@pytest.fixture(autouse=True)
+def installment_index_path(tmp_path):
+    """Isola o índice de compras parceladas em um arquivo temporário por teste."""
+    with patch.dict(os.environ, {'INSTALLMENT_INDEX_PATH': str(tmp_path / 'installments.sqlite3')}):
+        yield
+
 @pytest.fixture(autouse=True)
 def mock_environment_variables():
     """Set up test environment variables."""
@@ -58,6 +78,8 @@ def mock_environment_variables():
     os.environ['BIGQUERY_TABLE'] = 'test_table'
     os.environ['PUBSUB_TOPIC'] = 'test-topic'
     os.environ['PUBSUB_SUBSCRIPTION'] = 'test-subscription'
+    os.environ['UPLOAD_MANIFEST_BACKEND'] = 'memory'
+    os.environ['INGESTION_INDEX_BACKEND'] = 'memory'
     yield 
 
 def setup_telemetry_if_not_testing(service_name: str):
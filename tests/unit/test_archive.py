@@ -0,0 +1,141 @@
+import json
+import os
+import tempfile
+import unittest
+from datetime import datetime
+from decimal import Decimal
+from unittest.mock import MagicMock, patch
+
+
+from benchmarks.statement_generator import generate_rows, write_csv, write_xlsx
+from credit_card_readers.archive import StatementArchive, decode_cell, encode_cell
+from credit_card_readers.azul_visa_reader import parse_excel, read_statement
+from credit_card_readers.replay import replay
+
+
+def published_rows(publisher):
+    return [json.loads(call.args[1])['rows'] for call in publisher.publish.call_args_list]
+
+
+class TestStatementArchive(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.archive = StatementArchive(os.path.join(self.tmp.name, 'archive'))
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def read(self, rows):
+        path = write_xlsx(os.path.join(self.tmp.name, 'extrato.xlsx'), rows)
+        provenance = []
+        return path, read_statement(path, provenance=provenance), provenance
+
+    def test_partitions_by_account_and_month(self):
+        """Testa a partição por conta e mês e a proveniência de cada linha"""
+        path, blocks, provenance = self.read([
+            ('data', 'valor', 'descricao'),
+            ('10/01/2024', '10,00', 'LOJA A'),
+            ('15/02/2024', '20,00', 'LOJA B'),
+            (None, None, None),
+            ('data', 'valor', 'descricao'),
+            ('20/01/2024', '30,00', 'LOJA C'),
+        ])
+        result = self.archive.write(blocks, provenance, path, 'md5:abc')
+
+        self.assertEqual((result['rows'], result['partitions']), (3, 2))
+        january = list(self.archive.statements(month='2024-01'))
+        self.assertEqual(len(january), 1)
+        account, month, file_path, rows = january[0]
+        self.assertEqual((account, month, file_path), ('ITAU_CARD', '2024-01', path))
+        self.assertEqual([(row['block'], row['source_row']) for row in rows], [(0, 2), (1, 6)])
+        self.assertEqual([decode_cell(cell) for cell in rows[0]['raw_cells']], ['10/01/2024', '10,00', 'LOJA A'])
+        self.assertEqual(rows[0]['layout'], 'itau')
+        self.assertEqual(list(self.archive.statements(account='outra')), [])
+
+    def test_column_pruning(self):
+        """Testa que só as colunas pedidas são lidas"""
+        path, blocks, provenance = self.read(generate_rows(5, n_blocks=1))
+        self.archive.write(blocks, provenance, path)
+        _, _, _, rows = next(self.archive.statements(columns=('valor',)))
+        self.assertEqual(set(rows[0]), {'valor', 'file_path', 'block', 'position'})
+
+    def test_rewrite_replaces_statement(self):
+        """Testa que arquivar o mesmo extrato de novo não duplica as linhas"""
+        path, blocks, provenance = self.read(generate_rows(5, n_blocks=1))
+        self.archive.write(blocks, provenance, path, 'md5:abc')
+        self.archive.write(blocks, provenance, path, 'md5:abc')
+        self.assertEqual(sum(len(rows) for *_, rows in self.archive.statements()), 5)
+
+    def test_cells_keep_type(self):
+        """Testa que datas do openpyxl voltam como datas"""
+        moment = datetime(2024, 1, 10, 0, 0)
+        for value in (moment, moment.date(), 'R$ 1,00', 10.5, 3, None, Decimal('-12.34')):
+            self.assertEqual(decode_cell(encode_cell(value)), value)
+
+    def test_provenance_must_match_rows(self):
+        """Testa a recusa de proveniência incompleta"""
+        with self.assertRaises(ValueError):
+            self.archive.write([[{'id': '1'}]], [], 'x.xlsx')
+
+
+class TestReplay(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.archive_dir = os.path.join(self.tmp.name, 'archive')
+        patcher = patch.dict(os.environ, {'K_SERVICE': 'test', 'STATEMENT_ARCHIVE_DIR': self.archive_dir})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def parse(self, path):
+        request = MagicMock()
+        request.get_json.return_value = {'file_path': path}
+        publisher = MagicMock()
+        self.assertEqual(parse_excel(request, publisher=publisher, topic_path='t', telemetry=MagicMock()), ('OK', 200))
+        return publisher
+
+    def test_replay_matches_original_publish_without_openpyxl(self):
+        """Testa que o reprocessamento publica as mesmas linhas sem abrir o Excel"""
+        path = write_xlsx(os.path.join(self.tmp.name, 'extrato.xlsx'), generate_rows(30, n_blocks=3))
+        original = published_rows(self.parse(path))[0]
+
+        publisher = MagicMock()
+        with patch('credit_card_readers.azul_visa_reader.load_workbook', side_effect=AssertionError('openpyxl')):
+            stats = replay(StatementArchive(self.archive_dir), publisher, 't')
+
+        replayed = [row for rows in published_rows(publisher) for block in rows for row in block]
+        key = lambda row: row['id']
+        self.assertEqual(sorted(replayed, key=key), sorted((row for block in original for row in block), key=key))
+        self.assertEqual(stats['rows_read'], 30)
+        self.assertEqual(stats['rows_published'], 30)
+
+    def test_replay_renormalizes_raw_cells(self):
+        """Testa que a normalização atual é aplicada às células brutas arquivadas"""
+        path = write_csv(os.path.join(self.tmp.name, 'extrato.csv'), generate_rows(4, n_blocks=1))
+        self.parse(path)
+        archive = StatementArchive(self.archive_dir)
+
+        publisher = MagicMock()
+        with patch('credit_card_readers.azul_visa_reader.converter_valor_br', return_value=100):
+            replay(archive, publisher, 't')
+        rows = published_rows(publisher)
+        self.assertEqual({row['valor'] for message in rows for block in message for row in block}, {100})
+
+        publisher = MagicMock()
+        with patch('credit_card_readers.azul_visa_reader.converter_valor_br', return_value=100):
+            replay(archive, publisher, 't', as_archived=True)
+        rows = published_rows(publisher)
+        self.assertNotIn(100, {row['valor'] for message in rows for block in message for row in block})
+
+    def test_archive_errors_do_not_fail_upload(self):
+        """Testa que uma falha ao arquivar não impede a publicação"""
+        path = write_xlsx(os.path.join(self.tmp.name, 'extrato.xlsx'), generate_rows(3, n_blocks=1))
+        with patch('credit_card_readers.archive.StatementArchive.write', side_effect=OSError('disco cheio')):
+            publisher = self.parse(path)
+        publisher.publish.assert_called_once()
+
+
+if __name__ == '__main__':
+    unittest.main()
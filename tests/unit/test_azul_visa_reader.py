@@ -1,13 +1,30 @@
+import json
+import threading
 import unittest
-from unittest.mock import patch, MagicMock
+from unittest.mock import ANY, patch, MagicMock
 import os
+import tempfile
 import pandas as pd
+from openpyxl import Workbook
+from benchmarks.statement_generator import generate_rows, write_xls
+from credit_card_readers.installments import get_installment_index
+from benchmarks.fakes import FakeIngestionIndexClient
+from utils.factories import clear_instances, get_ingestion_index, get_parse_cache
+from utils.ingestion_index import create_ingestion_index, replaced_ids
 from credit_card_readers.azul_visa_reader import (
     converter_data_br,
     converter_valor_br,
     compute_row_hash,
-    parse_excel
+    convert_data,
+    convert_sheets,
+    parse_excel,
+    process_itau_row,
+    process_row,
+    ITAU_LAYOUT,
+    WARMUP,
 )
+from credit_card_readers import registry
+from credit_card_readers.registry import ColumnMapping, Layout, register_layout
 
 class TestAzulVisaReader(unittest.TestCase):
     def setUp(self):
@@ -34,6 +51,11 @@ class TestAzulVisaReader(unittest.TestCase):
         self.mock_workbook.active = self.mock_sheet
         self.mock_load_workbook.return_value = self.mock_workbook
 
+        # A detecção de layout lê as primeiras linhas do mesmo workbook
+        self.registry_load_workbook_patcher = patch('credit_card_readers.registry.load_workbook',
+                                                    return_value=self.mock_workbook)
+        self.registry_load_workbook_patcher.start()
+
         self.test_file = 'tests/resources/test_file.xlsx'
         self.valid_request = {
             'file_path': 'test-folder/test-file.xlsx'
@@ -42,6 +64,7 @@ class TestAzulVisaReader(unittest.TestCase):
     def tearDown(self):
         self.env_patcher.stop()
         self.load_workbook_patcher.stop()
+        self.registry_load_workbook_patcher.stop()
 
     def test_converter_data_br(self):
         """Testa conversão de data no formato brasileiro"""
@@ -51,9 +74,31 @@ class TestAzulVisaReader(unittest.TestCase):
 
     def test_converter_valor_br(self):
         """Testa conversão de valor no formato brasileiro"""
-        self.assertEqual(converter_valor_br('R$ 100,50'), 100.50)
-        self.assertEqual(converter_valor_br('R$ 1.234,56'), 1234.56)
+        self.assertEqual(converter_valor_br('R$ 100,50'), 10050)
+        self.assertEqual(converter_valor_br('R$ 1.234,56'), 123456)
+        self.assertEqual(converter_valor_br('R$ -0,07'), -7)
+        self.assertEqual(converter_valor_br(150), 15000)
+        self.assertEqual(converter_valor_br(1234.56), 123456)
         self.assertIsNone(converter_valor_br('invalid'))
+        self.assertIsNone(converter_valor_br(None))
+
+    def test_row_ids_match_baseline(self):
+        """Testa que os ids são os mesmos gerados antes dos centavos, para células numéricas e texto"""
+        # Ids calculados pelo leitor anterior (valor em float, hash de str do valor)
+        baseline = [
+            (150, '0dbec42e667e489a62d878cd6b42e802'),
+            (150.0, 'c3c03985c004a01466f8fbfade11fefc'),
+            (1234.56, 'c723d541f9a385ff4db9d2669ef6b28a'),
+            ('R$ 1.234,56', 'c723d541f9a385ff4db9d2669ef6b28a'),
+            ('R$ -0,07', '5f152a2acc8df793b305ffb5185388c2'),
+            ('R$ 1.234,567', '7939e2c71c8fd4ee41151f1dc58db00e'),
+            ('invalid', '885e5380f9f8bc46e734a51725d2ef99'),
+        ]
+        for cell, row_id in baseline:
+            with self.subTest(cell=cell):
+                self.assertEqual(process_itau_row(('01/01/2024', cell, 'LOJA'), 'itau-card')['id'], row_id)
+                row = process_row(('01/01/2024', cell, 'LOJA'), ['data', 'valor', 'descricao'], 'itau-card')
+                self.assertEqual(row['id'], row_id)
 
     def test_compute_row_hash(self):
         """Testa geração de hash para linha"""
@@ -90,6 +135,20 @@ class TestAzulVisaReader(unittest.TestCase):
         self.assertEqual(result[0], "OK")
         self.assertEqual(result[1], 200)
 
+    @patch('credit_card_readers.azul_visa_reader.get_pubsub_publisher')
+    def test_parse_excel_warmup_request(self, mock_get_pubsub_publisher):
+        """Testa que o caminho de warm-up prepara clientes, parser e regras sem ler extrato"""
+        with patch.object(WARMUP, '_done', threading.Event()), patch.object(WARMUP, '_results', {}):
+            body, status = parse_excel(MagicMock(path='/_ah/warmup'))
+
+        report = json.loads(body)
+        self.assertEqual(status, 200)
+        self.assertEqual(report['failed_steps'], [])
+        self.assertIn('parser', report['steps'])
+        self.assertIn('categorizer', report['steps'])
+        mock_get_pubsub_publisher.assert_called_once()
+        self.mock_load_workbook.assert_called_once()
+
     def test_parse_excel_invalid_request(self):
         """Testa erro quando request é inválido"""
         mock_request = MagicMock()
@@ -140,5 +199,255 @@ class TestAzulVisaReader(unittest.TestCase):
         else:
             self.assertEqual(result, "Running in local mode")
 
+    @patch('credit_card_readers.azul_visa_reader.convert_sheets')
+    def test_parse_excel_all_sheets(self, mock_convert_sheets):
+        """Testa que parse_excel lê todas as planilhas quando solicitado"""
+        mock_convert_sheets.return_value = [[{'id': '1'}]]
+        mock_request = MagicMock()
+        mock_request.get_json.return_value = {
+            'file_path': 'test-folder/test-file.xlsx',
+            'sheets': '*',
+            'sheet_accounts': {'adicional': 'itau-card-adicional'}
+        }
+
+        result = parse_excel(mock_request, publisher=MagicMock(), topic_path='topic', telemetry=MagicMock())
+        self.assertEqual(result, ("OK", 200))
+        mock_convert_sheets.assert_called_once_with(
+            'test-folder/test-file.xlsx', 'ITAU_CARD',
+            sheets=None, sheet_accounts={'adicional': 'itau-card-adicional'}, provenance=None,
+            layout=ITAU_LAYOUT, mapping=ANY)
+
+    @patch('credit_card_readers.azul_visa_reader.convert_data')
+    def test_parse_excel_skips_processed_content(self, mock_convert_data):
+        """Testa que conteúdo já publicado não é lido novamente"""
+        mock_convert_data.return_value = [[{'id': '1'}]]
+        mock_request = MagicMock()
+        mock_request.get_json.return_value = dict(self.valid_request, content_hash='md5:abc==')
+        publisher = MagicMock()
+
+        self.assertEqual(parse_excel(mock_request, publisher=publisher, topic_path='t', telemetry=MagicMock()), ("OK", 200))
+        self.assertEqual(parse_excel(mock_request, publisher=publisher, topic_path='t', telemetry=MagicMock()),
+                         ("Already processed", 200))
+        mock_convert_data.assert_called_once()
+        publisher.publish.assert_called_once()
+
+    @patch('credit_card_readers.azul_visa_reader.convert_data')
+    def test_parse_excel_retry_uses_parse_cache(self, mock_convert_data):
+        """Testa que a nova tentativa após falha no publish não lê o arquivo de novo"""
+        mock_convert_data.return_value = [[{'id': '1'}]]
+        mock_request = MagicMock()
+        mock_request.get_json.return_value = dict(self.valid_request, content_hash='md5:retry==')
+        publisher = MagicMock()
+        publisher.publish.side_effect = [Exception("Pub/Sub indisponível"), MagicMock()]
+
+        result = parse_excel(mock_request, publisher=publisher, topic_path='t', telemetry=MagicMock())
+        self.assertEqual(result[1], 500)
+        self.assertEqual(parse_excel(mock_request, publisher=publisher, topic_path='t', telemetry=MagicMock()), ("OK", 200))
+        mock_convert_data.assert_called_once()
+        self.assertEqual(json.loads(publisher.publish.call_args[0][1])['rows'],
+                         [[{'id': '1', 'category': None, 'installment_number': None,
+                            'installment_total': None, 'purchase_id': None}]])
+        self.assertEqual(get_parse_cache().size_bytes(), 0)
+
+    @patch('credit_card_readers.azul_visa_reader.convert_data')
+    def test_parse_excel_ordering_key(self, mock_convert_data):
+        """Testa que o extrato é publicado com a conta como ordering_key"""
+        mock_convert_data.return_value = [[{'id': '1'}]]
+        mock_request = MagicMock()
+        publisher = MagicMock()
+
+        mock_request.get_json.return_value = dict(self.valid_request, account='itau-card')
+        parse_excel(mock_request, publisher=publisher, topic_path='t', telemetry=MagicMock())
+        self.assertEqual(publisher.publish.call_args.kwargs['ordering_key'], 'itau-card')
+
+        # Sem conta na requisição, a pasta do arquivo identifica a conta
+        mock_request.get_json.return_value = {'file_path': 'outra-conta/extrato.xlsx'}
+        parse_excel(mock_request, publisher=publisher, topic_path='t', telemetry=MagicMock())
+        self.assertEqual(publisher.publish.call_args.kwargs['ordering_key'], 'outra-conta')
+
+        with patch.dict(os.environ, {'PUBSUB_MESSAGE_ORDERING': 'false'}):
+            mock_request.get_json.return_value = {'file_path': 'terceira/extrato.xlsx'}
+            parse_excel(mock_request, publisher=publisher, topic_path='t', telemetry=MagicMock())
+        self.assertNotIn('ordering_key', publisher.publish.call_args.kwargs)
+
+    @patch('credit_card_readers.azul_visa_reader.convert_data')
+    def test_parse_excel_resumes_ordering_key_after_failure(self, mock_convert_data):
+        """Testa que a ordering_key pausada pela falha é retomada para a nova tentativa"""
+        mock_convert_data.return_value = [[{'id': '1'}]]
+        mock_request = MagicMock()
+        mock_request.get_json.return_value = dict(self.valid_request, account='itau-card')
+        publisher = MagicMock()
+        publisher.publish.return_value.result.side_effect = Exception("Pub/Sub indisponível")
+
+        result = parse_excel(mock_request, publisher=publisher, topic_path='t', telemetry=MagicMock())
+        self.assertEqual(result[1], 500)
+        publisher.resume_publish.assert_called_once_with('t', 'itau-card')
+
+    @patch('credit_card_readers.azul_visa_reader.convert_data')
+    def test_parse_excel_incremental(self, mock_convert_data):
+        """Testa que o modo incremental publica apenas linhas novas"""
+        row = {'data': '2024-01-01', 'descricao': 'Teste', 'valor': 1.0, 'account': 'itau-card', 'id': '1'}
+        mock_convert_data.return_value = [[row]]
+        mock_request = MagicMock()
+        mock_request.get_json.return_value = dict(self.valid_request, incremental=True)
+        publisher = MagicMock()
+
+        self.assertEqual(parse_excel(mock_request, publisher=publisher, topic_path='t', telemetry=MagicMock()), ("OK", 200))
+        message = json.loads(publisher.publish.call_args[0][1])
+        self.assertEqual(message['rows'], [[row]])
+        self.assertEqual(len(message['index_entries']), 1)
+
+        # O writer registra as entradas; o reenvio não publica nada
+        get_ingestion_index().record(message['index_entries'])
+        self.assertEqual(parse_excel(mock_request, publisher=publisher, topic_path='t', telemetry=MagicMock()), ("OK", 200))
+        publisher.publish.assert_called_once()
+
+    @patch('credit_card_readers.azul_visa_reader.convert_data')
+    def test_parse_excel_incremental_shared_index(self, mock_convert_data):
+        """Testa o índice no BigQuery, registrado pelo writer em outra instância"""
+        client = FakeIngestionIndexClient()
+        row = {'data': '2024-01-01', 'descricao': 'Teste', 'valor': 1.0, 'account': 'itau-card', 'id': '1'}
+        mock_convert_data.return_value = [[row]]
+        mock_request = MagicMock()
+        mock_request.get_json.return_value = dict(self.valid_request, incremental=True)
+        publisher = MagicMock()
+        with patch.dict(os.environ, {'INGESTION_INDEX_BACKEND': 'bigquery'}), \
+                patch('utils.factories.get_bigquery_client', return_value=client):
+            clear_instances()
+            self.addCleanup(clear_instances)
+            writer_index = create_ingestion_index(lambda: client)
+
+            parse_excel(mock_request, publisher=publisher, topic_path='t', telemetry=MagicMock())
+            writer_index.record(json.loads(publisher.publish.call_args[0][1])['index_entries'])
+
+            # Valor corrigido no reenvio: publica a linha nova e o id que ela substitui
+            mock_convert_data.return_value = [[dict(row, valor=2.0, id='2')]]
+            parse_excel(mock_request, publisher=publisher, topic_path='t', telemetry=MagicMock())
+        message = json.loads(publisher.publish.call_args[0][1])
+        self.assertEqual([r['id'] for r in message['rows'][0]], ['2'])
+        self.assertEqual(replaced_ids(message['index_entries']), ['1'])
+        self.assertEqual(publisher.publish.call_count, 2)
+
+    @patch('credit_card_readers.azul_visa_reader.convert_data')
+    def test_parse_excel_adds_category(self, mock_convert_data):
+        """Testa que cada lançamento publicado recebe a categoria"""
+        mock_convert_data.return_value = [[{'id': '1', 'descricao': 'IFOOD *REST'}, {'id': '2', 'descricao': 'XYZ'}]]
+        mock_request = MagicMock()
+        mock_request.get_json.return_value = self.valid_request
+        publisher = MagicMock()
+
+        self.assertEqual(parse_excel(mock_request, publisher=publisher, topic_path='t', telemetry=MagicMock()), ("OK", 200))
+        rows = json.loads(publisher.publish.call_args[0][1])['rows'][0]
+        self.assertEqual([row['category'] for row in rows], ['alimentacao', None])
+
+    @patch('credit_card_readers.azul_visa_reader.convert_data')
+    def test_parse_excel_indexes_installments(self, mock_convert_data):
+        """Testa que parcelas publicadas alimentam o índice de compras parceladas"""
+        mock_convert_data.return_value = [[{'id': '1', 'data': '2024-03-10', 'valor': 50.0,
+                                            'descricao': 'LOJA X 03/10', 'account': 'itau-card'}]]
+        mock_request = MagicMock()
+        mock_request.get_json.return_value = self.valid_request
+        publisher = MagicMock()
+
+        self.assertEqual(parse_excel(mock_request, publisher=publisher, topic_path='t', telemetry=MagicMock()), ("OK", 200))
+        row = json.loads(publisher.publish.call_args[0][1])['rows'][0][0]
+        self.assertEqual((row['installment_number'], row['installment_total']), (3, 10))
+        projection = get_installment_index().projection(row['purchase_id'])
+        self.assertEqual(projection['remaining'], 7)
+        self.assertEqual(projection['schedule'][0]['month'], '2024-04')
+
+class TestConvertSheets(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.file_path = os.path.join(self.tmp.name, 'consolidado.xlsx')
+        wb = Workbook()
+        wb.remove(wb.active)
+        for index, (sheet_name, n_rows) in enumerate([('titular', 5), ('adicional', 3), ('virtual', 2)]):
+            ws = wb.create_sheet(sheet_name)
+            for row in generate_rows(n_rows, n_blocks=1, seed=index):
+                ws.append(list(row))
+        wb.save(self.file_path)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_convert_all_sheets_in_parallel(self):
+        """Testa leitura de todas as planilhas em paralelo com conta por planilha"""
+        blocks = convert_sheets(self.file_path, 'itau-card',
+                                sheet_accounts={'adicional': 'itau-card-adicional'},
+                                max_workers=2)
+        self.assertEqual([len(block) for block in blocks], [5, 3, 2])
+        self.assertEqual({row['account'] for row in blocks[1]}, {'itau-card-adicional'})
+        self.assertEqual({row['account'] for row in blocks[2]}, {'itau-card'})
+
+    def test_convert_sheets_passes_layout_to_workers(self):
+        """Testa que o layout e o mapeamento detectados chegam às planilhas lidas nos processos do pool"""
+        layout = register_layout(Layout(name='teste-valor-primeiro', row_processor=process_itau_row,
+                                        aliases={'data': ('dt_teste',), 'valor': ('vl_teste',),
+                                                 'descricao': ('ds_teste',)}))
+        self.addCleanup(registry._layouts.remove, layout)
+        path = os.path.join(self.tmp.name, 'sem_cabecalho.xlsx')
+        wb = Workbook()
+        wb.remove(wb.active)
+        for sheet_name in ('titular', 'adicional'):
+            wb.create_sheet(sheet_name).append(['R$ 10,00', '05/01/2024', f'COMPRA {sheet_name}'])
+        wb.save(path)
+
+        mapping = ColumnMapping((1, 0, 2))
+        with patch('credit_card_readers.azul_visa_reader.os.cpu_count', return_value=2):
+            blocks = convert_sheets(path, 'itau-card', layout=layout, mapping=mapping, max_workers=2)
+        self.assertEqual(blocks, convert_sheets(path, 'itau-card', layout=layout, mapping=mapping, max_workers=1))
+        self.assertEqual([(row['data'], row['valor'], row['descricao']) for block in blocks for row in block],
+                         [('2024-01-05', 1000, 'COMPRA titular'), ('2024-01-05', 1000, 'COMPRA adicional')])
+
+    def test_convert_selected_sheets(self):
+        """Testa leitura de um subconjunto de planilhas na ordem do arquivo"""
+        blocks = convert_sheets(self.file_path, 'itau-card', sheets=['virtual', 'titular'], max_workers=1)
+        self.assertEqual([len(block) for block in blocks], [5, 2])
+
+    def test_convert_missing_sheet(self):
+        """Testa erro quando a planilha solicitada não existe"""
+        with self.assertRaises(ValueError):
+            convert_sheets(self.file_path, 'itau-card', sheets=['inexistente'])
+
+    def test_hotpath_counters_from_workers(self):
+        """Testa que os contadores dos processos do pool chegam ao log de métricas"""
+        with patch('credit_card_readers.azul_visa_reader.logger') as mock_logger:
+            convert_sheets(self.file_path, 'itau-card', max_workers=2)
+
+        metrics = [call.kwargs['extra'] for call in mock_logger.info.call_args_list
+                   if call.args[0] == 'SLI: hotpath']
+        self.assertEqual(len(metrics), 1)
+        functions = metrics[0]['functions']
+        self.assertEqual(functions['process_itau_row']['calls'], 10)
+        self.assertEqual(functions['compute_row_hash']['calls'], 10)
+        self.assertEqual(functions['converter_valor_br']['failures'], 0)
+        self.assertGreaterEqual(functions['read_rows']['calls'], 10)
+
+    def test_hotpath_counts_conversion_fallbacks(self):
+        """Testa a contagem de conversões que caem no valor de fallback"""
+        path = os.path.join(self.tmp.name, 'invalido.xlsx')
+        wb = Workbook()
+        wb.active.append(['01/01/2024', 'R$ 10,00', 'ok'])
+        wb.active.append(['32/13/2024', 'abc', 'invalido'])
+        wb.save(path)
+
+        with patch('credit_card_readers.azul_visa_reader.logger') as mock_logger:
+            convert_data(path, 'itau-card')
+
+        metrics = [call.kwargs['extra'] for call in mock_logger.info.call_args_list
+                   if call.args[0] == 'SLI: hotpath']
+        functions = metrics[0]['functions']
+        self.assertEqual(functions['converter_data_br']['calls'], 2)
+        self.assertEqual(functions['converter_data_br']['failures'], 1)
+        self.assertEqual(functions['converter_valor_br']['failures'], 1)
+        self.assertEqual(functions['read_rows']['calls'], 2)
+
+    def test_xls_conversion_keeps_blocks(self):
+        """Testa que a conversão de .xls preserva blocos e linhas em branco"""
+        xls_path = write_xls(os.path.join(self.tmp.name, 'extrato.xls'), generate_rows(12, n_blocks=3))
+        blocks = convert_data(xls_path, 'itau-card')
+        self.assertEqual([len(block) for block in blocks], [4, 4, 4])
+
 if __name__ == '__main__':
     unittest.main() 
\ No newline at end of file
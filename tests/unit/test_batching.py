@@ -0,0 +1,191 @@
+import unittest
+
+from benchmarks.fakes import FakeBigQueryClient
+from finance_data_writer.batching import (
+    AimdController,
+    BatchWriteError,
+    OUTCOME_ERROR,
+    OUTCOME_QUOTA,
+    OUTCOME_SLOW,
+    classify_error,
+    write_batches,
+)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def latency_model(rows, in_flight):
+    """Latência simulada: custo fixo, custo por linha e contenção por requisição simultânea."""
+    return 0.05 + 0.0002 * rows * (1 + 0.1 * (in_flight - 1))
+
+
+class TestAimdController(unittest.TestCase):
+    def test_converges_below_target_latency(self):
+        """Testa que o lote oscila logo abaixo do tamanho que atinge a latência alvo"""
+        controller = AimdController(initial_rows=100, min_rows=50, max_rows=20000, increase_rows=100,
+                                    max_in_flight=4, target_latency=0.5)
+        sizes = []
+        for _ in range(500):
+            rows = controller.batch_size()
+            controller.observe(rows, latency_model(rows, controller.concurrency))
+            sizes.append(controller.batch_rows)
+
+        # Com 4 requisições em voo a latência alvo é atingida por volta de 1730 linhas
+        steady = sizes[-200:]
+        self.assertEqual(controller.concurrency, 4)
+        self.assertLessEqual(max(steady), 1800)
+        self.assertGreaterEqual(min(steady), 800)
+        metrics = controller.metrics()
+        self.assertGreater(metrics['decreases_latency'], 0)
+        self.assertGreater(metrics['increases'], 0)
+
+    def test_slow_request_halves_batch(self):
+        """Testa redução multiplicativa do lote em requisições lentas"""
+        controller = AimdController(initial_rows=1000, target_latency=1.0)
+        self.assertEqual(controller.observe(1000, 2.0), OUTCOME_SLOW)
+        self.assertEqual(controller.batch_rows, 500)
+        self.assertEqual(controller.concurrency, 1)
+
+    def test_error_halves_batch_and_concurrency(self):
+        """Testa redução de lote e concorrência em erros"""
+        controller = AimdController(initial_rows=1000, max_in_flight=8)
+        controller.concurrency = 6
+        controller.observe(1000, 0.1, OUTCOME_ERROR)
+        self.assertEqual((controller.batch_rows, controller.concurrency), (500, 3))
+        self.assertEqual(controller.metrics()['decreases_error'], 1)
+
+    def test_quota_reduces_concurrency_and_holds_growth(self):
+        """Testa que erros de quota reduzem a concorrência e seguram o crescimento"""
+        clock = FakeClock()
+        controller = AimdController(initial_rows=1000, max_in_flight=8, quota_cooldown=5.0, clock=clock)
+        controller.concurrency = 4
+        controller.observe(1000, 0.1, OUTCOME_QUOTA)
+        self.assertEqual((controller.batch_rows, controller.concurrency), (1000, 2))
+
+        for _ in range(5):
+            controller.observe(1000, 0.1)
+        self.assertEqual((controller.batch_rows, controller.concurrency), (1000, 2))
+        self.assertGreater(controller.metrics()['quota_hold'], 0)
+
+        clock.now = 6.0
+        controller.observe(1000, 0.1)
+        controller.observe(1100, 0.1)
+        self.assertEqual((controller.batch_rows, controller.concurrency), (1200, 3))
+
+    def test_partial_batches_do_not_grow(self):
+        """Testa que lotes menores que o atual não aumentam o tamanho do lote"""
+        controller = AimdController(initial_rows=500)
+        controller.observe(10, 0.01)
+        self.assertEqual(controller.batch_rows, 500)
+
+    def test_batch_size_respects_request_bytes(self):
+        """Testa o limite de bytes por requisição"""
+        controller = AimdController(initial_rows=5000, max_request_bytes=100_000)
+        self.assertEqual(controller.batch_size(avg_row_bytes=200), 500)
+        self.assertEqual(controller.batch_size(), 5000)
+
+    def test_classify_error(self):
+        """Testa a classificação de erros de quota"""
+        class TooManyRequests(Exception):
+            code = 429
+
+        self.assertEqual(classify_error(TooManyRequests()), OUTCOME_QUOTA)
+        self.assertEqual(classify_error([{'index': 0, 'errors': [{'reason': 'quotaExceeded'}]}]), OUTCOME_QUOTA)
+        self.assertEqual(classify_error(['Error']), OUTCOME_ERROR)
+        self.assertEqual(classify_error(RuntimeError('boom')), OUTCOME_ERROR)
+
+
+class TestWriteBatches(unittest.TestCase):
+    def setUp(self):
+        self.rows = [{'id': str(i), 'value': float(i)} for i in range(3000)]
+
+    def test_splits_rows_and_grows_concurrency(self):
+        """Testa que todas as linhas são enviadas em várias requisições simultâneas"""
+        client = FakeBigQueryClient(latency=0.002)
+        controller = AimdController(initial_rows=200, min_rows=50, increase_rows=0, max_in_flight=4)
+
+        result = write_batches(self.rows, lambda chunk: client.insert_rows_json('t', chunk), controller)
+
+        self.assertEqual(client.rows_inserted, 3000)
+        self.assertEqual(result['rows'], 3000)
+        self.assertEqual(result['requests'], 15)
+        self.assertGreater(client.max_in_flight_seen, 1)
+        self.assertLessEqual(client.max_in_flight_seen, 4)
+
+    def test_single_request_when_rows_fit(self):
+        """Testa que lotes pequenos usam uma única requisição"""
+        client = FakeBigQueryClient()
+        result = write_batches(self.rows[:10], lambda chunk: client.insert_rows_json('t', chunk),
+                               AimdController(initial_rows=500))
+        self.assertEqual((client.calls, result['requests']), (1, 1))
+
+    def test_quota_errors_fail_write_and_reduce_concurrency(self):
+        """Testa que erros de quota falham a escrita e reduzem a concorrência"""
+        client = FakeBigQueryClient(latency=0.01, quota_in_flight=1)
+        controller = AimdController(initial_rows=100, min_rows=50, max_in_flight=4)
+        controller.concurrency = 4
+
+        with self.assertRaises(BatchWriteError) as context:
+            write_batches(self.rows, lambda chunk: client.insert_rows_json('t', chunk), controller)
+
+        self.assertGreater(client.quota_errors, 0)
+        self.assertLess(controller.concurrency, 4)
+        self.assertGreater(controller.metrics()['decreases_quota'], 0)
+        # Depois da falha nenhuma requisição nova é enviada
+        self.assertLess(client.calls, len(self.rows) // 100)
+        self.assertEqual(context.exception.rows_written, client.rows_inserted)
+
+    def test_sink_exception_is_reported(self):
+        """Testa que exceções do sink viram BatchWriteError"""
+        def sink(chunk):
+            raise ConnectionError('reset')
+
+        with self.assertRaises(BatchWriteError) as context:
+            write_batches(self.rows[:10], sink, AimdController())
+        self.assertIsInstance(context.exception.errors[0], ConnectionError)
+
+    def test_failed_and_unsent_spans_are_reported(self):
+        """Testa que a falha parcial informa quais linhas falharam e quais não foram enviadas"""
+        def sink(chunk):
+            return [{'index': 0, 'errors': [{'reason': 'invalid'}]}] if any(r['id'] == '250' for r in chunk) else []
+
+        controller = AimdController(initial_rows=100, min_rows=50, increase_rows=0, max_in_flight=1)
+        with self.assertRaises(BatchWriteError) as context:
+            write_batches(self.rows, sink, controller)
+
+        error = context.exception
+        self.assertEqual((error.failed, error.unsent, error.rows_written), ([(200, 300)], (300, 3000), 200))
+        written, failed, unsent = error.split(self.rows)
+        self.assertEqual([row['id'] for row in written], [str(i) for i in range(200)])
+        self.assertEqual([(chunk[0]['id'], len(chunk)) for chunk, _ in failed], [('200', 100)])
+        self.assertEqual(len(unsent), 2700)
+        self.assertIsNone(error.split(self.rows[:10]))
+
+    def test_retry_with_row_ids_does_not_duplicate(self):
+        """Testa que reenviar um lote com row_ids não duplica as requisições já gravadas"""
+        client = FakeBigQueryClient()
+        failing = {'200'}
+
+        def sink(chunk):
+            if any(row['id'] in failing for row in chunk):
+                raise ConnectionError('reset')
+            return client.insert_rows_json('t', chunk, row_ids=[row['id'] for row in chunk])
+
+        controller = AimdController(initial_rows=100, min_rows=50, increase_rows=0, max_in_flight=1)
+        with self.assertRaises(BatchWriteError):
+            write_batches(self.rows, sink, controller)
+        failing.clear()
+        write_batches(self.rows, sink, controller)
+
+        self.assertEqual(client.rows_inserted, 3000)
+        self.assertEqual(client.rows_deduplicated, 200)
+
+
+if __name__ == '__main__':
+    unittest.main()
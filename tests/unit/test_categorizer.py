@@ -0,0 +1,85 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from benchmarks.statement_generator import generate_descriptions, generate_merchant_rules
+from credit_card_readers.categorizer import (
+    Categorizer,
+    get_categorizer,
+    reset_categorizer,
+    tokenize,
+)
+
+
+class TestCategorizer(unittest.TestCase):
+    def setUp(self):
+        self.categorizer = Categorizer([
+            ('UBER', 'transporte'),
+            ('UBER EATS', 'alimentacao'),
+            ('IFOOD', 'alimentacao'),
+            ('PAO DE ACUCAR', 'mercado'),
+            ('ACUCAR', 'outros'),
+            ('DE', 'outros'),
+        ])
+
+    def test_tokenize(self):
+        """Testa normalização de descrições em tokens"""
+        self.assertEqual(tokenize('Pão de Açúcar*123'), ('PAO', 'DE', 'ACUCAR', '123'))
+        self.assertEqual(tokenize(None), ())
+
+    def test_categorize(self):
+        """Testa categorização com pontuação e maiúsculas/minúsculas"""
+        self.assertEqual(self.categorizer.categorize('IFOOD *REST'), 'alimentacao')
+        self.assertEqual(self.categorizer.categorize('uber trip'), 'transporte')
+        self.assertIsNone(self.categorizer.categorize('LOJA QUALQUER'))
+        self.assertIsNone(self.categorizer.categorize(None))
+
+    def test_longest_match_wins(self):
+        """Testa que o padrão mais longo tem prioridade"""
+        self.assertEqual(self.categorizer.categorize('UBER *EATS PENDING'), 'alimentacao')
+        self.assertEqual(self.categorizer.categorize('PAO DE ACUCAR 1234'), 'mercado')
+
+    def test_matches_whole_tokens_only(self):
+        """Testa que padrões não casam no meio de palavras"""
+        self.assertIsNone(self.categorizer.categorize('UBERLANDIA'))
+
+    def test_categorize_blocks(self):
+        """Testa que a categoria é adicionada a cada linha"""
+        blocks = [[{'descricao': 'IFOOD'}], [{'descricao': 'XYZ'}]]
+        self.assertEqual(self.categorizer.categorize_blocks(blocks), 1)
+        self.assertEqual(blocks, [[{'descricao': 'IFOOD', 'category': 'alimentacao'}],
+                                  [{'descricao': 'XYZ', 'category': None}]])
+
+    def test_matches_naive_scan(self):
+        """Testa o autômato contra uma busca ingênua em regras sintéticas"""
+        rules = generate_merchant_rules(300, seed=7)
+        categorizer = Categorizer(rules, cache_size=0)
+        for text in generate_descriptions(500, rules, seed=7):
+            tokens = tokenize(text)
+            best = None
+            for order, (pattern, category) in enumerate(rules):
+                pattern_tokens = tokenize(pattern)
+                n = len(pattern_tokens)
+                if any(tokens[i:i + n] == pattern_tokens for i in range(len(tokens) - n + 1)):
+                    candidate = (n, -order, category)
+                    best = max(best, candidate) if best else candidate
+            self.assertEqual(categorizer.categorize(text), best[2] if best else None, text)
+
+    def test_rules_loaded_once_from_env(self):
+        """Testa carga das regras de CATEGORY_RULES_PATH uma vez por processo"""
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'rules.json')
+            with open(path, 'w') as f:
+                json.dump({'categorias': {'pets': ['PETZ', 'COBASI']}}, f)
+            reset_categorizer()
+            self.addCleanup(reset_categorizer)
+            with patch.dict(os.environ, {'CATEGORY_RULES_PATH': path}):
+                categorizer = get_categorizer()
+                self.assertIs(get_categorizer(), categorizer)
+                self.assertEqual(categorizer.categorize('PETZ LOJA 12'), 'pets')
+
+
+if __name__ == '__main__':
+    unittest.main()
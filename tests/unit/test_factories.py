@@ -0,0 +1,79 @@
+import unittest
+from unittest.mock import MagicMock, patch
+
+from finance_data_writer.poison import get_poison_guard, reset_poison_guard
+from function_file_arrival.routing import get_router
+from utils.factories import (
+    clear_instances,
+    discard_instance,
+    get_bigquery_client,
+    get_or_create,
+    get_pubsub_publisher,
+    get_telemetry,
+)
+
+
+class TestFactories(unittest.TestCase):
+    @patch('utils.factories.bigquery.Client')
+    def test_bigquery_client_is_created_once(self, mock_client):
+        """Testa que o cliente do BigQuery é reaproveitado entre chamadas"""
+        first = get_bigquery_client()
+        second = get_bigquery_client()
+        self.assertIs(first, second)
+        mock_client.assert_called_once()
+
+    @patch('utils.factories.setup_telemetry')
+    def test_telemetry_is_configured_once_per_service(self, mock_setup):
+        """Testa que o telemetry é configurado uma vez por serviço"""
+        get_telemetry('writer')
+        get_telemetry('writer')
+        get_telemetry('trigger')
+        self.assertEqual(mock_setup.call_count, 2)
+
+    @patch('utils.factories.pubsub_v1.PublisherClient')
+    def test_clear_instances(self, mock_publisher):
+        """Testa que clear_instances força a criação de um novo cliente"""
+        get_pubsub_publisher()
+        clear_instances()
+        get_pubsub_publisher()
+        self.assertEqual(mock_publisher.call_count, 2)
+
+    @patch('utils.factories.pubsub_v1.PublisherClient')
+    def test_publisher_enables_message_ordering(self, mock_publisher):
+        """Testa que o publisher é criado com ordenação por ordering_key"""
+        get_pubsub_publisher()
+        options = mock_publisher.call_args.kwargs['publisher_options']
+        self.assertTrue(options.enable_message_ordering)
+
+        clear_instances()
+        with patch.dict('os.environ', {'PUBSUB_MESSAGE_ORDERING': 'false'}):
+            get_pubsub_publisher()
+        self.assertEqual(mock_publisher.call_args.kwargs, {})
+
+    def test_none_is_cached(self):
+        """Testa que uma factory que devolve None (recurso desabilitado) roda uma vez só"""
+        create = MagicMock(return_value=None)
+        self.assertIsNone(get_or_create('disabled', create))
+        self.assertIsNone(get_or_create('disabled', create))
+        create.assert_called_once()
+        discard_instance('disabled')
+        get_or_create('disabled', create)
+        self.assertEqual(create.call_count, 2)
+
+    @patch('utils.factories.pubsub_v1.PublisherClient')
+    def test_module_singletons_share_reset(self, mock_publisher):
+        """Testa que os singletons dos módulos usam as mesmas instâncias e o mesmo reset"""
+        with patch.dict('os.environ', {'WRITER_DEAD_LETTER_TOPIC': 'dead-letter'}):
+            # O guarda cria o publisher dentro da própria criação
+            guard = get_poison_guard()
+        self.assertIs(get_poison_guard(), guard)
+        router = get_router()
+        reset_poison_guard()
+        self.assertIsNot(get_poison_guard(), guard)
+        self.assertIs(get_router(), router)
+        clear_instances()
+        self.assertIsNot(get_router(), router)
+
+
+if __name__ == '__main__':
+    unittest.main()
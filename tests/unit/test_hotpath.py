@@ -0,0 +1,69 @@
+import os
+import threading
+import unittest
+from unittest.mock import patch
+
+from utils.hotpath import collect, counted, counted_iter
+
+
+@counted(failure=lambda result, value: result is None)
+def parse(value):
+    if value == 'boom':
+        raise ValueError(value)
+    return int(value) if value.isdigit() else None
+
+
+class TestHotPath(unittest.TestCase):
+    def test_counts_only_inside_collect(self):
+        """Testa que chamadas fora de collect() não são contadas"""
+        parse('1')
+        with collect() as stats:
+            parse('1')
+            parse('x')
+            with self.assertRaises(ValueError):
+                parse('boom')
+
+        summary = stats.summary()['parse']
+        self.assertEqual((summary['calls'], summary['failures']), (3, 2))
+        self.assertGreaterEqual(summary['time_ms'], 0)
+
+    def test_nested_scopes_add_to_outer(self):
+        """Testa que escopos aninhados também somam no escopo externo"""
+        with collect() as outer:
+            parse('1')
+            with collect() as inner:
+                parse('2')
+        self.assertEqual(inner.summary()['parse']['calls'], 1)
+        self.assertEqual(outer.summary()['parse']['calls'], 2)
+
+    def test_counters_are_thread_local(self):
+        """Testa que outra thread não contamina o escopo atual"""
+        with collect() as stats:
+            thread = threading.Thread(target=lambda: [parse('1') for _ in range(5)])
+            thread.start()
+            thread.join()
+            parse('1')
+        self.assertEqual(stats.summary()['parse']['calls'], 1)
+
+    def test_counted_iter_and_merge(self):
+        """Testa a contagem de iteração e a soma de contadores de outro processo"""
+        with collect() as stats:
+            self.assertEqual(list(counted_iter('rows', range(4))), [0, 1, 2, 3])
+        stats.merge({'rows': [6, 2_000_000, 1]})
+
+        self.assertEqual(stats.summary()['rows']['calls'], 10)
+        self.assertEqual(stats.summary()['rows']['failures'], 1)
+        attributes = stats.span_attributes()
+        self.assertEqual(attributes['hotpath.rows.calls'], 10)
+        self.assertIn('hotpath.rows.time_ms', attributes)
+
+    def test_disabled_by_env(self):
+        """Testa HOTPATH_COUNTERS=false"""
+        with patch.dict(os.environ, {'HOTPATH_COUNTERS': 'false'}):
+            with collect() as stats:
+                parse('1')
+        self.assertEqual(stats.summary(), {})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,161 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from benchmarks.fakes import FakeIngestionIndexClient
+from utils.ingestion_index import (
+    BigQueryIngestionIndexBackend,
+    IngestionIndex,
+    InMemoryIngestionIndexBackend,
+    SQLiteIngestionIndexBackend,
+    assign_row_keys,
+    create_ingestion_index,
+    replaced_ids,
+    row_period,
+)
+
+
+def make_row(data, descricao, valor, row_id, account='itau-card'):
+    return {'data': data, 'descricao': descricao, 'valor': valor, 'account': account, 'id': row_id}
+
+
+class TestRowKeys(unittest.TestCase):
+    def test_row_period(self):
+        """Testa extração do período da data ISO"""
+        self.assertEqual(row_period({'data': '2024-03-15'}), '2024-03')
+        self.assertEqual(row_period({'data': None}), 'unknown')
+
+    def test_identical_rows_get_distinct_keys(self):
+        """Testa que compras idênticas no mesmo extrato têm chaves distintas"""
+        rows = [make_row('2024-01-01', 'CAFE', 5.0, 'a'), make_row('2024-01-01', 'CAFE', 5.0, 'a')]
+        keys = [key for _, key in assign_row_keys(rows)]
+        self.assertEqual(len(set(keys)), 2)
+
+    def test_key_ignores_amount(self):
+        """Testa que a chave natural não depende do valor"""
+        [(_, first)] = assign_row_keys([make_row('2024-01-01', 'LOJA', 10.0, 'a')])
+        [(_, second)] = assign_row_keys([make_row('2024-01-01', 'LOJA', 12.0, 'b')])
+        self.assertEqual(first, second)
+
+
+class IngestionIndexContract:
+    """Testes comuns aos backends do índice incremental."""
+
+    def make_backend(self):
+        raise NotImplementedError
+
+    def setUp(self):
+        self.index = IngestionIndex(self.make_backend())
+        self.blocks = [
+            [make_row('2024-01-01', 'LOJA A', 10.0, 'id-a'), make_row('2024-01-02', 'LOJA B', 20.0, 'id-b')],
+            [make_row('2024-02-01', 'LOJA C', 30.0, 'id-c')],
+        ]
+
+    def test_first_ingestion_keeps_everything(self):
+        """Testa que, sem histórico, todas as linhas são novas"""
+        blocks, stats, entries = self.index.diff_blocks(self.blocks)
+        self.assertEqual(blocks, self.blocks)
+        self.assertEqual(stats, {'total': 3, 'new': 3, 'changed': 0, 'unchanged': 0})
+        self.assertEqual(len(entries), 3)
+
+    def test_reupload_with_new_and_changed_rows(self):
+        """Testa que apenas linhas novas ou alteradas são mantidas"""
+        _, _, entries = self.index.diff_blocks(self.blocks)
+        self.assertEqual(self.index.record(entries), 3)
+
+        updated = [
+            [make_row('2024-01-01', 'LOJA A', 10.0, 'id-a'), make_row('2024-01-02', 'LOJA B', 25.0, 'id-b2')],
+            [make_row('2024-02-01', 'LOJA C', 30.0, 'id-c'), make_row('2024-02-03', 'LOJA D', 40.0, 'id-d')],
+        ]
+        blocks, stats, entries = self.index.diff_blocks(updated)
+        self.assertEqual([[row['id'] for row in block] for block in blocks], [['id-b2'], ['id-d']])
+        self.assertEqual(stats, {'total': 4, 'new': 1, 'changed': 1, 'unchanged': 2})
+        self.assertEqual([entry[3] for entry in entries], ['id-b2', 'id-d'])
+        self.assertEqual(replaced_ids(entries), ['id-b'])
+        self.index.record(entries)
+        blocks, _, _ = self.index.diff_blocks(updated)
+        self.assertEqual(blocks, [])
+
+    def test_record_accepts_entries_without_replaced_id(self):
+        """Testa entradas publicadas antes do id substituído (4 campos)"""
+        self.assertEqual(self.index.record([['itau-card', '2024-01', 'key', 'id-a']]), 1)
+        self.assertEqual(self.index.backend.load('itau-card', '2024-01'), {'key': 'id-a'})
+
+    def test_unchanged_statement_is_empty(self):
+        """Testa que reenviar o mesmo extrato não gera linhas"""
+        _, _, entries = self.index.diff_blocks(self.blocks)
+        self.index.record(entries)
+        blocks, stats, entries = self.index.diff_blocks(self.blocks)
+        self.assertEqual(blocks, [])
+        self.assertEqual(stats['unchanged'], 3)
+        self.assertEqual(entries, [])
+
+    def test_unrecorded_rows_are_sent_again(self):
+        """Testa que linhas não confirmadas pelo writer continuam pendentes"""
+        self.index.diff_blocks(self.blocks)
+        _, stats, _ = self.index.diff_blocks(self.blocks)
+        self.assertEqual(stats['new'], 3)
+
+
+class TestInMemoryIngestionIndex(IngestionIndexContract, unittest.TestCase):
+    def make_backend(self):
+        return InMemoryIngestionIndexBackend()
+
+
+class TestSQLiteIngestionIndex(IngestionIndexContract, unittest.TestCase):
+    def make_backend(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.path = os.path.join(self.tmp.name, 'index.sqlite3')
+        return SQLiteIngestionIndexBackend(self.path)
+
+    def test_index_persists_across_instances(self):
+        """Testa que o índice sobrevive a um novo processo"""
+        _, _, entries = self.index.diff_blocks(self.blocks)
+        self.index.record(entries)
+        reopened = IngestionIndex(SQLiteIngestionIndexBackend(self.path))
+        blocks, _, _ = reopened.diff_blocks(self.blocks)
+        self.assertEqual(blocks, [])
+
+
+class TestBigQueryIngestionIndex(IngestionIndexContract, unittest.TestCase):
+    def make_backend(self):
+        self.client = FakeIngestionIndexClient()
+        return BigQueryIngestionIndexBackend(lambda: self.client, 'p.personal_finance.ingestion_index')
+
+    def test_reader_sees_entries_recorded_by_writer(self):
+        """Testa que leitor e writer em instâncias diferentes compartilham o índice"""
+        reader = self.index
+        writer = IngestionIndex(BigQueryIngestionIndexBackend(self.client, 'p.personal_finance.ingestion_index'))
+        _, _, entries = reader.diff_blocks(self.blocks)
+        writer.record(entries)
+        # Reentrega da mesma mensagem não duplica as entradas
+        writer.record(entries)
+        self.assertEqual(len(self.client.rows), 3)
+        blocks, stats, _ = reader.diff_blocks(self.blocks)
+        self.assertEqual((blocks, stats['unchanged']), ([], 3))
+
+
+class TestCreateIngestionIndex(unittest.TestCase):
+    def test_sqlite_is_refused_on_cloud_functions(self):
+        """Testa que o backend sqlite, local a cada instância, falha no Cloud Functions"""
+        with patch.dict(os.environ, {'K_SERVICE': 'process_transactions'}):
+            os.environ.pop('INGESTION_INDEX_BACKEND', None)
+            with self.assertRaises(ValueError):
+                create_ingestion_index()
+            os.environ['INGESTION_INDEX_BACKEND'] = 'bigquery'
+            self.assertIsInstance(create_ingestion_index(FakeIngestionIndexClient).backend,
+                                  BigQueryIngestionIndexBackend)
+
+    def test_sqlite_is_allowed_locally(self):
+        """Testa que o sqlite continua disponível fora do Cloud Functions"""
+        with tempfile.TemporaryDirectory() as tmp, \
+                patch.dict(os.environ, {'INGESTION_INDEX_BACKEND': 'sqlite',
+                                        'INGESTION_INDEX_PATH': os.path.join(tmp, 'index.sqlite3')}):
+            os.environ.pop('K_SERVICE', None)
+            self.assertIsInstance(create_ingestion_index().backend, SQLiteIngestionIndexBackend)
+
+
+if __name__ == '__main__':
+    unittest.main()
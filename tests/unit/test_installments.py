@@ -0,0 +1,95 @@
+import os
+import tempfile
+import unittest
+
+from credit_card_readers.installments import (
+    InstallmentIndex,
+    add_months,
+    annotate_installments,
+    parse_installment,
+)
+
+
+def make_row(data, descricao, valor=10000, account='itau-card'):
+    return {'data': data, 'descricao': descricao, 'valor': valor, 'account': account}
+
+
+class TestParseInstallment(unittest.TestCase):
+    def test_markers(self):
+        """Testa os formatos de parcela usados pelo Itaú"""
+        self.assertEqual(parse_installment('LOJA X 03/10'), ('LOJA X', 3, 10))
+        self.assertEqual(parse_installment('LOJA X PARC 03/10'), ('LOJA X', 3, 10))
+        self.assertEqual(parse_installment('MAGALU*LOJA - PARCELA 2/5'), ('MAGALU*LOJA', 2, 5))
+
+    def test_non_installments(self):
+        """Testa que descrições sem parcela válida são ignoradas"""
+        for descricao in ('UBER TRIP', 'LOJA 12/10', 'LOJA 1/1', 'RESTAURANTE 2024/01', 'PARC 03/10', None):
+            self.assertIsNone(parse_installment(descricao), descricao)
+
+    def test_add_months(self):
+        """Testa aritmética de meses"""
+        self.assertEqual(add_months('2024-11', 3), '2025-02')
+        self.assertEqual(add_months('2024-01', -1), '2023-12')
+
+
+class TestInstallmentIndex(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.index = InstallmentIndex(os.path.join(self.tmp.name, 'installments.sqlite3'))
+
+    def test_installments_are_linked_across_statements(self):
+        """Testa que parcelas de extratos diferentes apontam para a mesma compra"""
+        march = [[make_row('2024-03-10', 'LOJA X 03/10')]]
+        april = [[make_row('2024-04-10', 'LOJA X 04/10')]]
+        self.assertEqual(annotate_installments(march), 1)
+        annotate_installments(april)
+        self.assertEqual(march[0][0]['purchase_id'], april[0][0]['purchase_id'])
+
+    def test_distinct_purchases(self):
+        """Testa que compras diferentes na mesma loja não se misturam"""
+        blocks = [[make_row('2024-03-10', 'LOJA X 01/10'), make_row('2024-03-10', 'LOJA X 03/10'),
+                   make_row('2024-03-10', 'LOJA X 01/10', valor=8000), make_row('2024-03-10', 'UBER')]]
+        self.assertEqual(annotate_installments(blocks), 3)
+        self.assertEqual(len({row['purchase_id'] for row in blocks[0][:3]}), 3)
+        self.assertIsNone(blocks[0][3]['purchase_id'])
+
+    def test_projection_of_remaining_payments(self):
+        """Testa a projeção das parcelas restantes a partir do índice"""
+        blocks = [[make_row('2024-03-10', 'LOJA X 03/10', 5000)]]
+        annotate_installments(blocks)
+        self.index.record(blocks[0])
+        later = [[make_row('2024-04-10', 'LOJA X 04/10', 5000)]]
+        annotate_installments(later)
+        self.index.record(later[0])
+        # Reprocessar um extrato antigo não faz a compra voltar atrás
+        self.index.record(blocks[0])
+
+        projection = self.index.projection(blocks[0][0]['purchase_id'])
+        self.assertEqual((projection['paid'], projection['remaining']), (4, 6))
+        self.assertEqual(projection['remaining_amount'], 30000)
+        self.assertEqual([p['month'] for p in projection['schedule']],
+                         ['2024-05', '2024-06', '2024-07', '2024-08', '2024-09', '2024-10'])
+        self.assertIsNone(self.index.projection('unknown'))
+
+    def test_legacy_float_amounts_are_stored_in_cents(self):
+        """Testa que blocos antigos do cache, com valor em reais, entram no índice em centavos"""
+        blocks = [[make_row('2024-03-10', 'LOJA X 03/10', 50.0)]]
+        annotate_installments(blocks)
+        self.index.record(blocks[0])
+        projection = self.index.projection(blocks[0][0]['purchase_id'])
+        self.assertEqual(projection['remaining_amount'], 35000)
+        self.assertEqual(projection['schedule'][0]['valor'], 5000)
+
+    def test_commitments_by_month(self):
+        """Testa o total comprometido por mês com compras em aberto"""
+        blocks = [[make_row('2024-03-10', 'LOJA X 09/10', 5000), make_row('2024-03-10', 'LOJA Y 01/02', 2000),
+                   make_row('2024-03-10', 'LOJA Z 02/02', 3000)]]
+        annotate_installments(blocks)
+        self.index.record(blocks[0])
+        self.assertEqual(self.index.commitments('itau-card'), {'2024-04': 7000})
+        self.assertEqual(len(self.index.open_purchases('itau-card')), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
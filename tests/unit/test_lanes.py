@@ -0,0 +1,101 @@
+import threading
+import time
+import unittest
+from unittest.mock import MagicMock
+
+from finance_data_writer.lanes import LaneScheduler, message_key
+
+
+def make_message(message_id, ordering_key=''):
+    message = MagicMock()
+    message.message_id = message_id
+    message.ordering_key = ordering_key
+    return message
+
+
+class TestLaneScheduler(unittest.TestCase):
+    def test_order_is_kept_within_key(self):
+        """Testa que mensagens da mesma conta são processadas uma por vez, em ordem"""
+        processed = {'a': [], 'b': []}
+        running = {'a': 0, 'b': 0}
+        overlaps = []
+        lock = threading.Lock()
+
+        def handler(message):
+            key = message.ordering_key
+            with lock:
+                running[key] += 1
+                overlaps.append(running[key])
+            time.sleep(0.001)
+            with lock:
+                processed[key].append(message.message_id)
+                running[key] -= 1
+
+        lanes = LaneScheduler(handler, workers=4).start()
+        for i in range(20):
+            lanes.submit(make_message(f'a{i}', 'a'))
+            lanes.submit(make_message(f'b{i}', 'b'))
+        self.assertTrue(lanes.join(5))
+        lanes.stop()
+
+        self.assertEqual(processed['a'], [f'a{i}' for i in range(20)])
+        self.assertEqual(processed['b'], [f'b{i}' for i in range(20)])
+        self.assertEqual(max(overlaps), 1)
+        self.assertEqual(lanes.metrics()['processed'], 40)
+
+    def test_backfill_does_not_starve_other_accounts(self):
+        """Testa que um backfill grande não atrasa as mensagens de outras contas"""
+        order = []
+        release = threading.Event()
+
+        def handler(message):
+            release.wait(5)
+            order.append(message.message_id)
+
+        lanes = LaneScheduler(handler, workers=1).start()
+        for i in range(50):
+            lanes.submit(make_message(f'backfill{i}', 'backfill'))
+        lanes.submit(make_message('small0', 'small'))
+        lanes.submit(make_message('small1', 'small'))
+        release.set()
+        self.assertTrue(lanes.join(5))
+        lanes.stop()
+
+        # Rodízio: a conta pequena termina entre as primeiras mensagens do backfill
+        self.assertLess(order.index('small1'), 5)
+        self.assertEqual(len(order), 52)
+
+    def test_accounts_run_in_parallel(self):
+        """Testa que contas diferentes ocupam workers diferentes ao mesmo tempo"""
+        barrier = threading.Barrier(3, timeout=5)
+        lanes = LaneScheduler(lambda message: barrier.wait(), workers=3).start()
+        for key in ('a', 'b', 'c'):
+            lanes.submit(make_message(key, key))
+        self.assertTrue(lanes.join(5))
+        lanes.stop()
+        self.assertFalse(barrier.broken)
+
+    def test_handler_errors_do_not_stop_lane(self):
+        """Testa que um erro no handler não trava a lane da conta"""
+        processed = []
+
+        def handler(message):
+            if message.message_id == '1':
+                raise RuntimeError('boom')
+            processed.append(message.message_id)
+
+        lanes = LaneScheduler(handler, workers=2).start()
+        for i in range(3):
+            lanes.submit(make_message(str(i), 'a'))
+        self.assertTrue(lanes.join(5))
+        lanes.stop()
+        self.assertEqual(processed, ['0', '2'])
+
+    def test_message_without_key_uses_own_lane(self):
+        """Testa que mensagens sem ordering_key não ficam na mesma fila"""
+        self.assertEqual(message_key(make_message('1', 'itau-card')), 'itau-card')
+        self.assertNotEqual(message_key(make_message('1')), message_key(make_message('2')))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,27 @@
+import sys
+import unittest
+
+from utils.lazy_import import lazy_import
+
+
+class TestLazyImport(unittest.TestCase):
+    def test_lazy_module_is_registered_and_resolves(self):
+        """Testa que o módulo é registrado e carregado no primeiro acesso"""
+        sys.modules.pop('wave', None)
+        module = lazy_import('wave')
+        self.assertIs(sys.modules['wave'], module)
+        self.assertTrue(callable(module.open))
+
+    def test_returns_already_imported_module(self):
+        """Testa que módulos já importados são devolvidos diretamente"""
+        import json
+        self.assertIs(lazy_import('json'), json)
+
+    def test_missing_module(self):
+        """Testa erro para módulo inexistente"""
+        with self.assertRaises(ModuleNotFoundError):
+            lazy_import('modulo_que_nao_existe')
+
+
+if __name__ == '__main__':
+    unittest.main()
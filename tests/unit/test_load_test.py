@@ -0,0 +1,77 @@
+import time
+import unittest
+
+from benchmarks.fakes import FakeBigQueryClient, FakePubSub
+from benchmarks.load_test import percentile, run_load_test
+
+
+class TestFakePubSub(unittest.TestCase):
+    def test_ack_removes_message(self):
+        """Testa que mensagens confirmadas saem da fila"""
+        broker = FakePubSub()
+        broker.publish('t', b'1')
+        message = broker.pull(timeout=0.1)
+        self.assertEqual(message.data, b'1')
+        message.ack()
+        self.assertEqual(broker.pending(), 0)
+        self.assertIsNone(broker.pull(timeout=0.01))
+
+    def test_nack_redelivers(self):
+        """Testa que nack devolve a mensagem para nova entrega"""
+        broker = FakePubSub()
+        broker.publish('t', b'1')
+        broker.pull(timeout=0.1).nack()
+        message = broker.pull(timeout=0.1)
+        self.assertEqual(message.delivery_attempt, 2)
+        self.assertEqual(broker.stats['redelivered'], 1)
+
+    def test_expired_lease_is_redelivered(self):
+        """Testa reentrega após o ack deadline e descarte do ack atrasado"""
+        broker = FakePubSub(ack_deadline=0.01)
+        broker.publish('t', b'1')
+        first = broker.pull(timeout=0.1)
+        time.sleep(0.02)
+        second = broker.pull(timeout=0.1)
+        first.ack()
+        self.assertEqual(broker.pending(), 1)
+        second.ack()
+        self.assertEqual(broker.pending(), 0)
+        self.assertEqual(broker.stats['expired'], 1)
+
+    def test_dead_letter_after_max_attempts(self):
+        """Testa que a mensagem vai para dead letter após as tentativas"""
+        broker = FakePubSub(max_delivery_attempts=2)
+        broker.publish('t', b'1')
+        broker.pull(timeout=0.1).nack()
+        broker.pull(timeout=0.1).nack()
+        self.assertEqual(broker.pending(), 0)
+        self.assertEqual(len(broker.dead_letters), 1)
+
+
+class TestLoadTest(unittest.TestCase):
+    def test_percentile(self):
+        """Testa percentil por posição"""
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertEqual(percentile([], 99), 0.0)
+
+    def test_fake_sink_error_rate(self):
+        """Testa que o BigQuery falso devolve erros na taxa configurada"""
+        sink = FakeBigQueryClient(error_rate=1.0)
+        self.assertTrue(sink.insert_rows_json('t', [{}]))
+        self.assertEqual(sink.rows_inserted, 0)
+
+    def test_end_to_end_run(self):
+        """Testa que todos os uploads chegam ao BigQuery mesmo com erros e reentregas"""
+        report = run_load_test(uploads=3, concurrency=2, writers=2, rows=20, blocks=2,
+                               sink_error_rate=0.3, max_delivery_attempts=None)
+        self.assertEqual(report['rows_written'], 60)
+        self.assertEqual(report['pubsub']['acked'], 3)
+        self.assertEqual(report['trigger_results'], {'File processed successfully': 3})
+        self.assertEqual(report['stages']['end_to_end']['count'], 3)
+        self.assertGreater(report['stages']['reader']['peak_traced_mib'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+import base64
+import hashlib
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from utils.manifest import (
+    InMemoryManifestBackend,
+    SQLiteManifestBackend,
+    UploadManifest,
+    content_key,
+    create_upload_manifest,
+    file_content_key,
+)
+
+
+class ManifestContract:
+    """Testes comuns aos backends do manifesto."""
+
+    def make_backend(self):
+        raise NotImplementedError
+
+    def setUp(self):
+        self.manifest = UploadManifest(self.make_backend(), claim_ttl=60)
+
+    def test_claim_and_done(self):
+        """Testa que um arquivo reivindicado ou concluído não é reprocessado"""
+        self.assertTrue(self.manifest.claim('md5:abc', file_name='a.xlsx'))
+        self.assertFalse(self.manifest.claim('md5:abc'))
+        self.assertFalse(self.manifest.is_done('md5:abc'))
+        self.manifest.mark_done('md5:abc')
+        self.assertTrue(self.manifest.is_done('md5:abc'))
+        self.assertFalse(self.manifest.claim('md5:abc'))
+
+    def test_release_allows_retry(self):
+        """Testa que liberar a reivindicação permite nova tentativa"""
+        self.manifest.claim('md5:abc')
+        self.manifest.release('md5:abc')
+        self.assertTrue(self.manifest.claim('md5:abc'))
+
+    def test_release_keeps_done_entries(self):
+        """Testa que release não remove arquivos concluídos"""
+        self.manifest.mark_done('md5:abc')
+        self.manifest.release('md5:abc')
+        self.assertTrue(self.manifest.is_done('md5:abc'))
+
+    def test_expired_claim_can_be_taken_over(self):
+        """Testa que reivindicações abandonadas expiram"""
+        self.manifest.claim('md5:abc')
+        self.manifest.claim_ttl = -1
+        self.assertTrue(self.manifest.claim('md5:abc'))
+
+    def test_skip_counts(self):
+        """Testa contagem de arquivos ignorados por etapa"""
+        self.assertEqual(self.manifest.record_skip('trigger'), 1)
+        self.assertEqual(self.manifest.record_skip('trigger'), 2)
+        self.manifest.record_skip('reader')
+        self.assertEqual(self.manifest.skip_counts(), {'trigger': 2, 'reader': 1})
+
+
+class TestInMemoryManifest(ManifestContract, unittest.TestCase):
+    def make_backend(self):
+        return InMemoryManifestBackend()
+
+
+class TestSQLiteManifest(ManifestContract, unittest.TestCase):
+    def make_backend(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        return SQLiteManifestBackend(os.path.join(self.tmp.name, 'manifest.sqlite3'))
+
+    def test_entries_survive_reopen(self):
+        """Testa que o manifesto persiste entre instâncias"""
+        self.manifest.mark_done('md5:abc', file_name='a.xlsx')
+        reopened = UploadManifest(SQLiteManifestBackend(self.manifest.backend.path))
+        self.assertTrue(reopened.is_done('md5:abc'))
+        self.assertEqual(reopened.backend.get('md5:abc')['file_name'], 'a.xlsx')
+
+
+class TestContentKey(unittest.TestCase):
+    def test_content_key_precedence(self):
+        """Testa que o md5 tem precedência sobre a geração"""
+        self.assertEqual(content_key('abc==', '1', 'b', 'n'), 'md5:abc==')
+        self.assertEqual(content_key(None, '1', 'b', 'n'), 'gen:b/n#1')
+        self.assertIsNone(content_key(None, None, 'b', 'n'))
+
+    def test_file_content_key_matches_gcs_md5(self):
+        """Testa que o hash local é igual ao md5Hash do GCS"""
+        with tempfile.NamedTemporaryFile(delete=False) as f:
+            f.write(b'conteudo do extrato')
+        self.addCleanup(os.unlink, f.name)
+        expected = base64.b64encode(hashlib.md5(b'conteudo do extrato').digest()).decode()
+        self.assertEqual(file_content_key(f.name), f'md5:{expected}')
+        self.assertIsNone(file_content_key('/caminho/inexistente.xlsx'))
+
+    @patch.dict(os.environ, {'UPLOAD_MANIFEST_BACKEND': 'invalid'})
+    def test_unknown_backend(self):
+        """Testa erro para backend desconhecido"""
+        with self.assertRaises(ValueError):
+            create_upload_manifest()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,52 @@
+import unittest
+from decimal import Decimal
+
+from utils.money import cents_text, cents_to_decimal, legacy_amount_text, parse_brl, to_cents
+
+
+class TestMoney(unittest.TestCase):
+    def test_parse_brl(self):
+        """Testa a leitura de valores no formato brasileiro direto para centavos"""
+        cases = {
+            'R$ 1.234,56': 123456,
+            'R$\xa0-1.234.567,8': -123456780,
+            '+10': 1000,
+            ',5': 50,
+            '1.000': 100000,
+            '0,005': 0,
+            '0,015': 2,
+            '0,0051': 1,
+        }
+        for text, cents in cases.items():
+            self.assertEqual(parse_brl(text), cents, text)
+        for text in ('', '-', 'R$', 'abc', '1,2,3', '1e3', '١٢'):
+            self.assertIsNone(parse_brl(text), text)
+
+    def test_to_cents(self):
+        """Testa a conversão de células numéricas em reais"""
+        self.assertEqual(to_cents(150), 15000)
+        self.assertEqual(to_cents(1234.56), 123456)
+        self.assertEqual(to_cents(Decimal('-12.345')), -1234)
+        self.assertIsNone(to_cents(float('nan')))
+        self.assertIsNone(to_cents(True))
+        self.assertIsNone(to_cents(None))
+
+    def test_cents_text_matches_float_text(self):
+        """Testa que o texto dos centavos é o mesmo do float em reais"""
+        for cents in (0, 7, -7, 10, 15000, 123456, -123456780, 99999999999):
+            self.assertEqual(cents_text(cents), str(cents / 100))
+        self.assertEqual(cents_text(None), 'None')
+        self.assertEqual(cents_to_decimal(-1050), Decimal('-10.50'))
+
+
+    def test_legacy_amount_text(self):
+        """Testa o texto do valor usado no hash antes dos centavos"""
+        cases = [(150, '150'), (150.0, '150.0'), (1234.56, '1234.56'), ('R$ 1.234,56', '1234.56'),
+                 ('R$ 1.234,567', '1234.567'), (' -0,07 ', '-0.07'), ('invalid', 'None'), (None, 'None'),
+                 (Decimal('-10.50'), '-10.5')]
+        for cell, text in cases:
+            self.assertEqual(legacy_amount_text(cell), text, cell)
+
+
+if __name__ == '__main__':
+    unittest.main()
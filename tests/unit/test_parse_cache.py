@@ -0,0 +1,66 @@
+import os
+import tempfile
+import time
+import unittest
+
+from utils.parse_cache import ParseCache, decode_blocks, encode_blocks, parse_cache_key
+
+
+def make_blocks(n_rows=3):
+    return [
+        [{'data': f'2024-01-{i + 1:02d}', 'valor': float(i), 'descricao': f'LOJA {i}', 'account': 'itau-card', 'id': str(i)}
+         for i in range(n_rows)],
+        [{'data': '2024-02-01', 'valor': 1.5, 'descricao': 'OUTRA', 'account': 'itau-card', 'id': 'x'}],
+    ]
+
+
+class TestParseCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.cache = ParseCache(self.tmp.name, max_bytes=1024 * 1024)
+
+    def test_encode_roundtrip(self):
+        """Testa que a serialização colunar preserva os blocos"""
+        blocks = make_blocks() + [[{'id': '1'}, {'id': '2', 'extra': True}], []]
+        self.assertEqual(decode_blocks(encode_blocks(blocks)), blocks)
+
+    def test_key_depends_on_content_and_options(self):
+        """Testa que a chave muda com o conteúdo e as opções de leitura"""
+        key = parse_cache_key('a.xlsx', 'md5:1')
+        self.assertNotEqual(key, parse_cache_key('a.xlsx', 'md5:2'))
+        self.assertNotEqual(key, parse_cache_key('a.xlsx', 'md5:1', sheets='*'))
+        self.assertIsNone(parse_cache_key('a.xlsx', None))
+
+    def test_hit_and_miss(self):
+        """Testa contagem de acertos e falhas do cache"""
+        self.assertIsNone(self.cache.get('k'))
+        self.cache.put('k', make_blocks())
+        self.assertEqual(self.cache.get('k'), make_blocks())
+        self.assertEqual(self.cache.stats(), {'hits': 1, 'misses': 1, 'evictions': 0})
+
+    def test_delete(self):
+        """Testa remoção de uma entrada"""
+        self.cache.put('k', make_blocks())
+        self.cache.delete('k')
+        self.cache.delete('k')
+        self.assertIsNone(self.cache.get('k'))
+
+    def test_eviction_by_size(self):
+        """Testa que as entradas menos usadas são removidas ao exceder o limite"""
+        size = self.cache.put('a', make_blocks(200))
+        self.cache.max_bytes = int(size * 2.5)
+        self.cache.put('b', make_blocks(200))
+        # 'a' passa a ser a mais recente
+        past = time.time() - 60
+        os.utime(os.path.join(self.tmp.name, 'b.json.z'), (past, past))
+        self.cache.get('a')
+        self.cache.put('c', make_blocks(200))
+        self.assertIsNotNone(self.cache.get('a'))
+        self.assertIsNone(self.cache.get('b'))
+        self.assertLessEqual(self.cache.size_bytes(), self.cache.max_bytes)
+        self.assertEqual(self.cache.stats()['evictions'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
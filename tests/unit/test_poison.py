@@ -0,0 +1,172 @@
+import json
+import os
+import tempfile
+import unittest
+from types import SimpleNamespace
+
+from google.api_core.exceptions import BadRequest, ServiceUnavailable
+
+from benchmarks.fakes import FakeBigQueryClient
+from finance_data_writer.batching import AimdController, BatchWriteError, write_batches
+from finance_data_writer.poison import (
+    FAILURE_DATA,
+    FAILURE_TRANSIENT,
+    FAILURE_UNKNOWN,
+    DeliveryTracker,
+    FileDeadLetterSink,
+    PoisonGuard,
+    bisect_rows,
+    classify_failure,
+)
+from utils.schema import SchemaValidationError
+
+
+def invalid_row_error():
+    return [{'index': 0, 'errors': [{'reason': 'invalid', 'message': 'no such field'}]}]
+
+
+class RecordingSink:
+    def __init__(self):
+        self.records = []
+
+    def write(self, records):
+        self.records.extend(records)
+
+
+class TestPoison(unittest.TestCase):
+    def setUp(self):
+        self.rows = [{'id': str(i)} for i in range(8)]
+        self.calls = []
+
+    def write_rejecting(self, *bad_ids, error=None):
+        def write(rows):
+            self.calls.append(len(rows))
+            if any(row['id'] in bad_ids for row in rows):
+                raise error or SchemaValidationError([{'row': 0, 'field': 'date', 'reason': 'not a DATE'}], 1)
+        return write
+
+    def test_bisect_isolates_offending_rows(self):
+        """Testa que a bisseção escreve as linhas boas e isola só as culpadas"""
+        write = self.write_rejecting('2', '5')
+        written, poisoned, writes = bisect_rows(self.rows, write, ValueError('lote'))
+        self.assertEqual(sorted(row['id'] for row in written), ['0', '1', '3', '4', '6', '7'])
+        self.assertEqual(sorted(row['id'] for row, _ in poisoned), ['2', '5'])
+        self.assertEqual(writes, len(self.calls))
+        self.assertLess(writes, len(self.rows) * 2)
+
+    def test_classify_failure(self):
+        """Testa a separação entre erros dos dados, transitórios e desconhecidos"""
+        self.assertEqual(classify_failure(SchemaValidationError([], 1)), FAILURE_DATA)
+        self.assertEqual(classify_failure(BatchWriteError([invalid_row_error()], 0)), FAILURE_DATA)
+        backend = [{'index': 0, 'errors': [{'reason': 'backendError'}]}]
+        self.assertEqual(classify_failure(BatchWriteError([backend], 0)), FAILURE_TRANSIENT)
+        self.assertEqual(classify_failure(BatchWriteError([ConnectionError('reset')], 0)), FAILURE_TRANSIENT)
+        try:
+            try:
+                raise BatchWriteError([invalid_row_error()], 0)
+            except BatchWriteError as e:
+                raise RuntimeError('Errors writing to BigQuery') from e
+        except RuntimeError as wrapped:
+            self.assertEqual(classify_failure(wrapped), FAILURE_DATA)
+        bad_request = ValueError('400 Bad Request')
+        bad_request.code = 400
+        self.assertEqual(classify_failure(bad_request), FAILURE_DATA)
+        self.assertEqual(classify_failure(ValueError('Missing BigQuery configuration')), FAILURE_UNKNOWN)
+        # Exceções de requisição dentro do lote são classificadas pelo código
+        self.assertEqual(classify_failure(BatchWriteError([BadRequest('invalid')], 0)), FAILURE_DATA)
+        self.assertEqual(classify_failure(BatchWriteError([ServiceUnavailable('down')], 0)), FAILURE_TRANSIENT)
+        self.assertEqual(classify_failure(BatchWriteError([BadRequest('x'), ServiceUnavailable('y')], 0)),
+                         FAILURE_TRANSIENT)
+
+    def test_delivery_tracker(self):
+        """Testa a contagem de entregas local e a informada pelo Pub/Sub"""
+        tracker = DeliveryTracker(max_entries=2)
+        message = SimpleNamespace(message_id='m1', delivery_attempt=None)
+        self.assertEqual([tracker.attempt(message) for _ in range(3)], [1, 2, 3])
+        self.assertEqual(tracker.attempt(SimpleNamespace(message_id='m2', delivery_attempt=7)), 7)
+        tracker.forget(message)
+        self.assertEqual(tracker.attempt(message), 1)
+        tracker.attempt(SimpleNamespace(message_id='m3'))
+        self.assertEqual(tracker.attempt(SimpleNamespace(message_id='m2')), 1)
+
+    def test_guard_policy(self):
+        """Testa quando o guarda devolve a mensagem e quando isola as linhas"""
+        guard = PoisonGuard(RecordingSink(), bisect_after=3)
+        write = self.write_rejecting('4')
+        written, poisoned = guard.write(self.rows, write, attempt=1)
+        self.assertEqual((len(written), [row['id'] for row, _ in poisoned]), (7, ['4']))
+
+        transient = self.write_rejecting('4', error=BatchWriteError([ConnectionError('reset')], 0))
+        with self.assertRaises(BatchWriteError):
+            guard.write(self.rows, transient, attempt=10)
+
+        unknown = self.write_rejecting('4', error=TypeError('not serializable'))
+        with self.assertRaises(TypeError):
+            guard.write(self.rows, unknown, attempt=2)
+        written, poisoned = guard.write(self.rows, unknown, attempt=3)
+        self.assertEqual([row['id'] for row, _ in poisoned], ['4'])
+
+        # Nada passa e o erro não é dos dados (ex.: configuração): volta para o Pub/Sub
+        broken = self.write_rejecting(*[row['id'] for row in self.rows], error=ValueError('Missing configuration'))
+        with self.assertRaises(ValueError):
+            guard.write(self.rows, broken, attempt=5)
+        self.assertEqual(guard.metrics()['bisections'], 3)
+
+    def batched_write(self, client, bad_id, error_for_chunk):
+        controller = AimdController(initial_rows=50, min_rows=50, increase_rows=0, max_in_flight=1)
+
+        def sink(chunk):
+            if any(row['id'] == bad_id for row in chunk):
+                return error_for_chunk(chunk)
+            return client.insert_rows_json('t', chunk)
+        return lambda rows: write_batches(rows, sink, controller)
+
+    def test_bisect_rewrites_only_failed_requests(self):
+        """Testa que a bisseção não reenvia as requisições do lote que já foram gravadas"""
+        client = FakeBigQueryClient()
+        rows = [{'id': str(i)} for i in range(200)]
+        write = self.batched_write(client, '70', lambda chunk: invalid_row_error())
+
+        written, poisoned = PoisonGuard(RecordingSink()).write(rows, write, attempt=1)
+
+        self.assertEqual((len(written), [row['id'] for row, _ in poisoned]), (199, ['70']))
+        self.assertEqual(client.rows_inserted, 199)
+        self.assertEqual(sorted(int(row['id']) for row in written), [i for i in range(200) if i != 70])
+
+    def test_bad_request_chunk_is_bisected(self):
+        """Testa que um BadRequest de uma requisição do lote dispara a bisseção na primeira entrega"""
+        client = FakeBigQueryClient()
+        rows = [{'id': str(i)} for i in range(120)]
+
+        def bad_request(chunk):
+            raise BadRequest('Invalid value for field')
+        write = self.batched_write(client, '5', bad_request)
+
+        written, poisoned = PoisonGuard(RecordingSink(), bisect_after=3).write(rows, write, attempt=1)
+
+        self.assertEqual([row['id'] for row, _ in poisoned], ['5'])
+        self.assertEqual(classify_failure(poisoned[0][1]), FAILURE_DATA)
+        self.assertEqual(client.rows_inserted, 119)
+
+    def test_metrics_and_file_sink(self):
+        """Testa as taxas de envenenamento e o dead-letter em JSONL"""
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'dead', 'letters.jsonl')
+            guard = PoisonGuard(FileDeadLetterSink(path))
+            message = SimpleNamespace(message_id='m1', data=b'{"rows": [')
+            guard.dead_letter_rows(message, [({'id': '4'}, ValueError('invalid'))], 'extrato.xlsx', 2)
+            guard.record(message, 8, 1, 2)
+            guard.dead_letter_message(message, ValueError('Expecting value'), 1)
+            guard.record(SimpleNamespace(message_id='m2'), 2, 0, 1)
+            with open(path) as f:
+                records = [json.loads(line) for line in f]
+        self.assertEqual([(r['kind'], r['message_id']) for r in records], [('row', 'm1'), ('message', 'm1')])
+        self.assertEqual(records[0]['row'], {'id': '4'})
+        self.assertEqual(records[1]['data'], '{"rows": [')
+        metrics = guard.metrics()
+        self.assertEqual((metrics['poison_messages'], metrics['messages']), (2, 3))
+        self.assertAlmostEqual(metrics['poison_row_rate'], 0.1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import MagicMock, patch
+
+from utils.profiling import (
+    InvocationProfiler,
+    get_profile_mode,
+    message_wants_profile,
+    profile_invocation,
+    request_wants_profile,
+)
+
+
+def _work():
+    return sum(len(str(i)) for i in range(2000))
+
+
+class TestProfiling(unittest.TestCase):
+    @patch.dict(os.environ, {}, clear=True)
+    def test_mode_defaults_to_off(self):
+        """Testa que o modo padrão é desligado"""
+        self.assertEqual(get_profile_mode(), 'off')
+        with patch.dict(os.environ, {'PROFILE_INVOCATIONS': 'invalid'}):
+            self.assertEqual(get_profile_mode(), 'off')
+
+    @patch.dict(os.environ, {}, clear=True)
+    def test_decorator_is_noop_when_off(self):
+        """Testa que a função não é embrulhada com o profiling desligado"""
+        self.assertIs(profile_invocation('work')(_work), _work)
+
+    def test_profiler_summary(self):
+        """Testa geração do resumo com funções, memória e alocações"""
+        with tempfile.TemporaryDirectory() as tmp:
+            with patch.dict(os.environ, {'PROFILE_OUTPUT_DIR': tmp}):
+                with InvocationProfiler('work', top=5) as profiler:
+                    _work()
+            summary = profiler.summary
+            self.assertEqual(summary['name'], 'work')
+            self.assertLessEqual(len(summary['top_functions']), 5)
+            self.assertTrue(any('_work' in f['function'] for f in summary['top_functions']))
+            self.assertGreaterEqual(summary['peak_memory_kb'], 0)
+            with open(summary['output_file']) as f:
+                self.assertEqual(json.load(f)['name'], 'work')
+
+    def test_header_mode_profiles_only_flagged_requests(self):
+        """Testa que no modo header apenas requisições marcadas são perfiladas"""
+        with patch.dict(os.environ, {'PROFILE_INVOCATIONS': 'header'}):
+            wrapped = profile_invocation('work', request_wants_profile)(lambda request: _work())
+
+        flagged = MagicMock(headers={'X-Profile-Invocation': '1'})
+        plain = MagicMock(headers={})
+        with patch('utils.profiling.InvocationProfiler') as mock_profiler:
+            wrapped(plain)
+            mock_profiler.assert_not_called()
+            wrapped(flagged)
+            mock_profiler.assert_called_once_with('work')
+
+    def test_message_wants_profile(self):
+        """Testa leitura do atributo profile da mensagem"""
+        self.assertTrue(message_wants_profile(MagicMock(attributes={'profile': 'true'})))
+        self.assertFalse(message_wants_profile(MagicMock(attributes={})))
+
+
+if __name__ == '__main__':
+    unittest.main()
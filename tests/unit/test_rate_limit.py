@@ -0,0 +1,100 @@
+import asyncio
+import os
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+from utils.rate_limit import RateLimiter, RateLimitTimeout, TokenBucket, create_rate_limiter, parse_rate_limits
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestTokenBucket(unittest.TestCase):
+    def test_burst_then_spaced_reservations(self):
+        """Testa o burst inicial e o espaçamento das reservas seguintes"""
+        clock = FakeClock()
+        bucket = TokenBucket(rate=10, burst=2, clock=clock)
+        waits = [bucket.reserve() for _ in range(5)]
+        for wait, expected in zip(waits, [0.0, 0.0, 0.1, 0.2, 0.3]):
+            self.assertAlmostEqual(wait, expected)
+
+        clock.now = 1.0
+        self.assertAlmostEqual(bucket.reserve(), 0.0)
+        stats = bucket.stats()
+        self.assertEqual((stats['acquired'], stats['waited']), (6, 3))
+        self.assertAlmostEqual(stats['max_wait_s'], 0.3)
+
+    def test_timeout_does_not_reserve(self):
+        """Testa que uma espera acima do timeout não consome tokens"""
+        clock = FakeClock()
+        bucket = TokenBucket(rate=1, burst=1, clock=clock)
+        self.assertTrue(bucket.try_acquire())
+        self.assertFalse(bucket.try_acquire())
+        with self.assertRaises(RateLimitTimeout):
+            bucket.reserve(timeout=0.5)
+        self.assertAlmostEqual(bucket.reserve(timeout=1.0), 1.0)
+
+    def test_threads_are_spaced(self):
+        """Testa que threads concorrentes respeitam a taxa"""
+        limiter = RateLimiter({('api', None): (200.0, 1.0)})
+        start = time.monotonic()
+        threads = [threading.Thread(target=limiter.acquire, args=('api',)) for _ in range(21)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertGreaterEqual(time.monotonic() - start, 0.09)
+
+
+class TestRateLimiter(unittest.TestCase):
+    def test_parse_rate_limits(self):
+        """Testa o formato de RATE_LIMITS"""
+        limits = parse_rate_limits('bigquery.insert=20/40, bigquery.insert:p.d.t=5,'
+                                   'reader.invoke:https://reader.example/fn=2')
+        self.assertEqual(limits, {('bigquery.insert', None): (20.0, 40.0),
+                                  ('bigquery.insert', 'p.d.t'): (5.0, None),
+                                  ('reader.invoke', 'https://reader.example/fn'): (2.0, None)})
+        with self.assertRaises(ValueError):
+            parse_rate_limits('bigquery.insert')
+
+    def test_api_and_resource_buckets(self):
+        """Testa que a chamada espera pelo bucket mais restritivo"""
+        clock = FakeClock()
+        sleeps = []
+        limiter = RateLimiter({('bq', None): (100.0, 1.0), ('bq', 'tabela'): (1.0, 1.0)},
+                              clock=clock, sleep=sleeps.append)
+        self.assertEqual(limiter.acquire('bq', 'tabela'), 0.0)
+        self.assertAlmostEqual(limiter.acquire('bq', 'tabela'), 1.0)
+        # Terceira chamada no bucket da API (o relógio não andou)
+        self.assertAlmostEqual(limiter.acquire('bq', 'outra'), 0.02)
+        self.assertEqual(limiter.acquire('pubsub.publish', 'topico'), 0.0)
+        self.assertEqual(len(sleeps), 2)
+
+    def test_acquire_async(self):
+        """Testa a espera assíncrona"""
+        limiter = RateLimiter({('api', None): (50.0, 1.0)})
+
+        async def run():
+            return await asyncio.gather(*(limiter.acquire_async('api') for _ in range(3)))
+
+        waits = asyncio.run(run())
+        self.assertEqual(waits[0], 0.0)
+        self.assertGreater(max(waits), 0.0)
+
+    def test_unconfigured_limiter(self):
+        """Testa que sem RATE_LIMITS nada é limitado"""
+        with patch.dict(os.environ, {'RATE_LIMITS': ''}):
+            limiter = create_rate_limiter()
+        self.assertEqual(limiter.stats(), {})
+        self.assertEqual(limiter.acquire('bigquery.insert', 'tabela'), 0.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
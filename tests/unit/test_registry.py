@@ -0,0 +1,102 @@
+import os
+import tempfile
+import unittest
+
+from openpyxl import Workbook
+
+from credit_card_readers.azul_visa_reader import ITAU_LAYOUT, _parse_rows, convert_data
+from credit_card_readers import registry
+from credit_card_readers.registry import (
+    ColumnMapping,
+    Layout,
+    detect_layout,
+    looks_like_header,
+    normalize_header,
+    register_layout,
+    sniff_layout,
+)
+
+
+class TestRegistry(unittest.TestCase):
+    def setUp(self):
+        self._layouts = list(registry._layouts)
+        self._tokens = registry._header_tokens
+
+    def tearDown(self):
+        registry._layouts[:] = self._layouts
+        registry._header_tokens = self._tokens
+
+    def test_normalize_header(self):
+        """Testa normalização de nomes de coluna"""
+        self.assertEqual(normalize_header('  Lançamento '), 'lancamento')
+        self.assertEqual(normalize_header('Descrição'), 'descricao')
+        self.assertIsNone(normalize_header(None))
+
+    def test_compile_reordered_header(self):
+        """Testa mapeamento compilado para cabeçalho em outra ordem"""
+        mapping = ITAU_LAYOUT.compile(['Data', 'Lançamento', None, 'Valor (R$)'])
+        self.assertEqual(mapping.indexes, (0, 3, 1))
+        self.assertEqual(mapping.extract(('01/01/24', 'LOJA', 'x', 'R$ 1,00')), ('01/01/24', 'R$ 1,00', 'LOJA'))
+        self.assertEqual(mapping.extract(('01/01/24',)), ('01/01/24', None, None))
+
+    def test_looks_like_header(self):
+        """Testa detecção barata de linha de cabeçalho"""
+        self.assertTrue(looks_like_header([None, 'Data', 'Valor']))
+        self.assertFalse(looks_like_header(['01/01/2024', 'R$ 1,00', 'LOJA']))
+        self.assertFalse(looks_like_header([None, None]))
+
+    def test_dispatch_to_registered_layout(self):
+        """Testa que um layout registrado recebe as linhas do seu bloco"""
+        def process(values, account):
+            data, valor, descricao = values
+            return {'data': data, 'valor': -valor, 'descricao': descricao, 'account': account}
+
+        register_layout(Layout(
+            name='banco_x',
+            aliases={'data': ('dt mov',), 'valor': ('debito',), 'descricao': ('historico',)},
+            row_processor=process,
+        ))
+        blocks = _parse_rows([
+            ('data', 'valor', 'descricao'),
+            ('01/01/2024', 'R$ 10,00', 'LOJA'),
+            (None, None, None),
+            ('Histórico', 'Dt Mov', 'Débito'),
+            ('PADARIA', '2024-01-02', 5.0),
+        ], 'conta')
+        self.assertEqual(blocks[0][0]['valor'], 1000)
+        self.assertEqual(blocks[1], [{'data': '2024-01-02', 'valor': -5.0, 'descricao': 'PADARIA', 'account': 'conta'}])
+        self.assertEqual(sniff_layout([('Dt Mov', 'Historico', 'Debito')])[0].name, 'banco_x')
+
+    def test_partial_header_closes_block(self):
+        """Testa que um cabeçalho só parcialmente reconhecido não vira lançamento"""
+        with self.assertLogs('credit_card_readers.azul_visa_reader', level='WARNING') as logs:
+            blocks = _parse_rows([
+                ('data', 'valor', 'descricao'),
+                ('01/01/2024', 'R$ 10,00', 'LOJA'),
+                ('data', 'histórico', 'valor'),
+                ('02/01/2024', 'R$ 5,00', 'PADARIA'),
+            ], 'conta', sheet='Janeiro')
+        self.assertEqual([[row['descricao'] for row in block] for block in blocks], [['LOJA'], ['PADARIA']])
+        self.assertIn('Unmatched header row', logs.output[0])
+
+    def test_detect_layout_and_convert(self):
+        """Testa detecção pelo arquivo e conversão com colunas reordenadas"""
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'extrato.xlsx')
+            wb = Workbook()
+            ws = wb.active
+            ws.append(['Data', 'Lançamento', 'Valor'])
+            ws.append(['01/01/2024', 'PADARIA', 'R$ 1.234,56'])
+            wb.save(path)
+
+            layout, mapping = detect_layout(path)
+            self.assertIs(layout, ITAU_LAYOUT)
+            self.assertEqual(mapping, ColumnMapping((0, 2, 1)))
+            blocks = convert_data(path, 'itau-card', layout, mapping)
+
+        self.assertEqual(blocks[0][0]['valor'], 123456)
+        self.assertEqual(blocks[0][0]['descricao'], 'PADARIA')
+
+
+if __name__ == '__main__':
+    unittest.main()
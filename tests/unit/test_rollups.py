@@ -0,0 +1,194 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+from datetime import date
+from unittest.mock import patch
+
+from benchmarks.fakes import FakeFuture
+from finance_data_writer.rollups import (
+    DEFAULT_LEDGER_MONTHS,
+    RECOMPUTE_QUERY,
+    RollupStore,
+    aggregate_rows,
+    get_rollup_store,
+    main,
+    open_months_since,
+)
+
+
+def make_row(row_id, data, valor, category='mercado', account='itau-card'):
+    return {'id': row_id, 'data': data, 'valor': valor, 'category': category, 'account': account}
+
+
+class FakeRecomputeClient:
+    """Responde ``RECOMPUTE_QUERY`` com os agregados das linhas da tabela no BigQuery."""
+
+    project = 'p'
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.queries = []
+
+    def query(self, sql):
+        self.queries.append(sql)
+        return FakeFuture([
+            {'account': account, 'month': month, 'category': category, 'total': total, 'count': count,
+             'min_valor': min_valor, 'max_valor': max_valor}
+            for (account, month, category), (total, count, min_valor, max_valor) in aggregate_rows(self.rows).items()
+        ])
+
+
+class TestRollupStore(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.path = os.path.join(self.tmp.name, 'rollups.sqlite3')
+        self.store = RollupStore(self.path)
+        self.rows = [
+            make_row('1', '2024-01-05', 1000),
+            make_row('2', '2024-01-20', 3000),
+            make_row('3', '2024-01-21', -500, category=None),
+            make_row('4', '2024-02-01', 750),
+        ]
+
+    def test_apply_and_summary(self):
+        """Testa soma, contagem, mínimo e máximo por conta, mês e categoria"""
+        self.assertEqual(self.store.apply(self.rows), 4)
+        summary = self.store.summary(month='2024-01')
+        self.assertEqual(summary, [
+            {'account': 'itau-card', 'month': '2024-01', 'category': None, 'total': -500, 'count': 1, 'min': -500, 'max': -500},
+            {'account': 'itau-card', 'month': '2024-01', 'category': 'mercado', 'total': 4000, 'count': 2, 'min': 1000, 'max': 3000},
+        ])
+
+    def test_apply_is_idempotent(self):
+        """Testa que reentregas não contam a mesma linha duas vezes"""
+        self.store.apply(self.rows[:2])
+        self.assertEqual(self.store.apply(self.rows), 2)
+        self.assertEqual(self.store.rollups()[('itau-card', '2024-01', 'mercado')], (4000, 2, 1000, 3000))
+
+    def test_identical_purchases_are_counted(self):
+        """Testa que compras idênticas no mesmo dia (mesmo id) entram todas nos agregados"""
+        row = make_row('dup', '2024-01-05', 1000)
+        self.assertEqual(self.store.apply([row, dict(row), dict(row)]), 3)
+        # Reentrega da mesma mensagem não conta de novo
+        self.assertEqual(self.store.apply([row, dict(row), dict(row)]), 0)
+        self.assertEqual(self.store.rollups()[('itau-card', '2024-01', 'mercado')], (3000, 3, 1000, 1000))
+        self.assertEqual(self.store.check_consistency(aggregate_rows([row] * 3)), [])
+
+        # Uma das compras idênticas corrigida: sai a última instância
+        self.assertEqual(self.store.retract(['dup']), 1)
+        self.assertEqual(self.store.rollups()[('itau-card', '2024-01', 'mercado')], (2000, 2, 1000, 1000))
+        self.assertEqual(self.store.retract(['dup', 'dup']), 2)
+        self.assertNotIn(('itau-card', '2024-01', 'mercado'), self.store.rollups())
+
+    def test_rows_without_numeric_value_are_skipped(self):
+        """Testa que linhas sem valor em centavos não entram nos agregados"""
+        self.assertEqual(self.store.apply([make_row('x', '2024-01-01', None), make_row('y', '2024-01-01', 1.0),
+                                           {'valor': 100}]), 0)
+
+    def test_sums_are_exact(self):
+        """Testa que somas de centavos não acumulam erro de ponto flutuante"""
+        rows = [make_row(str(i), '2024-03-01', 10) for i in range(10)]
+        self.store.apply(rows)
+        self.assertEqual(self.store.rollups()[('itau-card', '2024-03', 'mercado')], (100, 10, 10, 10))
+
+    def test_legacy_database_is_migrated_to_cents(self):
+        """Testa a conversão de bancos antigos, com valores em reais"""
+        path = os.path.join(self.tmp.name, 'legacy.sqlite3')
+        conn = sqlite3.connect(path)
+        conn.executescript("""
+            CREATE TABLE rollup_rows (id TEXT PRIMARY KEY, account TEXT NOT NULL, month TEXT NOT NULL,
+                category TEXT NOT NULL, valor REAL NOT NULL);
+            CREATE TABLE monthly_rollups (account TEXT NOT NULL, month TEXT NOT NULL, category TEXT NOT NULL,
+                total REAL NOT NULL, count INTEGER NOT NULL, min_valor REAL NOT NULL, max_valor REAL NOT NULL,
+                PRIMARY KEY (account, month, category));
+            INSERT INTO rollup_rows VALUES ('1', 'itau-card', '2024-01', 'mercado', 0.1);
+            INSERT INTO rollup_rows VALUES ('2', 'itau-card', '2024-01', 'mercado', 0.2);
+            INSERT INTO monthly_rollups VALUES ('itau-card', '2024-01', 'mercado', 0.30000000000000004, 2, 0.1, 0.2);
+        """)
+        conn.commit()
+        conn.close()
+        store = RollupStore(path)
+        self.assertEqual(store.rollups(), {('itau-card', '2024-01', 'mercado'): (30, 2, 10, 20)})
+        self.assertEqual(store.check_ledger(), [])
+        # Reabrir não converte de novo
+        self.assertEqual(RollupStore(path).rollups()[('itau-card', '2024-01', 'mercado')], (30, 2, 10, 20))
+
+    def test_retract_replaced_rows(self):
+        """Testa que linhas substituídas saem dos agregados e o mínimo e o máximo são recalculados"""
+        self.store.apply(self.rows)
+        self.assertEqual(self.store.retract(['2', '4', 'desconhecido']), 2)
+        rollups = self.store.rollups()
+        self.assertEqual(rollups[('itau-card', '2024-01', 'mercado')], (1000, 1, 1000, 1000))
+        self.assertNotIn(('itau-card', '2024-02', 'mercado'), rollups)
+        self.assertEqual(self.store.retract([]), 0)
+        self.assertEqual(self.store.check_ledger(), [])
+
+    def test_consistency_check(self):
+        """Testa o recálculo completo contra os agregados incrementais"""
+        for row in self.rows:
+            self.store.apply([row])
+        self.assertEqual(self.store.check_ledger(), [])
+        self.assertEqual(self.store.check_consistency(aggregate_rows(self.rows)), [])
+
+        expected = aggregate_rows(self.rows[:3])
+        mismatches = self.store.check_consistency(expected)
+        self.assertEqual([m['key'] for m in mismatches], [('itau-card', '2024-02', 'mercado')])
+
+    def test_consistency_check_against_bigquery(self):
+        """Testa o recálculo com RECOMPUTE_QUERY na view sem as linhas substituídas"""
+        self.store.apply(self.rows)
+        client = FakeRecomputeClient(self.rows)
+        with patch.dict(os.environ, {'BIGQUERY_DATASET': 'personal_finance', 'BIGQUERY_TABLE': 'personal_finance_flow'}):
+            self.assertEqual(self.store.check_consistency(client=client), [])
+            client.rows = self.rows[:3]
+            mismatches = self.store.check_consistency(client=client)
+        self.assertIn('`p.personal_finance.personal_finance_flow_current`', client.queries[0])
+        self.assertEqual([m['key'] for m in mismatches], [('itau-card', '2024-02', 'mercado')])
+
+    def test_ledger_keeps_only_open_months(self):
+        """Testa a retenção do registro de ids: meses fechados ficam congelados até o rebuild"""
+        self.assertEqual(open_months_since(2, date(2024, 2, 10)), '2024-01')
+        self.assertEqual(open_months_since(13, date(2024, 2, 10)), '2023-02')
+        self.assertIsNone(open_months_since(0))
+
+        store = RollupStore(os.path.join(self.tmp.name, 'ledger.sqlite3'), ledger_months=1,
+                            clock=lambda: date(2024, 1, 31))
+        self.assertEqual(store.apply(self.rows), 4)
+        store.clock = lambda: date(2024, 2, 1)
+        # Janeiro fechou: ids saem do registro e linhas atrasadas não são agregadas
+        self.assertEqual(store.apply([make_row('5', '2024-01-30', 100), make_row('6', '2024-02-02', 100)]), 1)
+        self.assertEqual(store.rows_closed, 1)
+        self.assertEqual(store.retract(['1']), 0)
+        self.assertEqual(store.check_ledger(), [])
+        self.assertEqual(store.rollups()[('itau-card', '2024-01', 'mercado')], (4000, 2, 1000, 3000))
+
+        expected = aggregate_rows(self.rows + [make_row('5', '2024-01-30', 100)])
+        self.assertEqual(store.rebuild_closed(expected), 2)
+        self.assertEqual(store.rollups()[('itau-card', '2024-01', 'mercado')], (4100, 3, 100, 3000))
+        self.assertEqual(store.rollups()[('itau-card', '2024-02', 'mercado')], (850, 2, 100, 750))
+
+    def test_ledger_is_bounded_by_default(self):
+        """Testa que o store do writer guarda, por padrão, só os meses abertos recentes"""
+        with patch.dict(os.environ, {'ROLLUPS_DB_PATH': os.path.join(self.tmp.name, 'default.sqlite3')}):
+            os.environ.pop('ROLLUPS_LEDGER_MONTHS', None)
+            self.assertEqual(get_rollup_store().ledger_months, DEFAULT_LEDGER_MONTHS)
+        self.assertGreater(DEFAULT_LEDGER_MONTHS, 0)
+
+    def test_shared_rollups_use_recompute_query(self):
+        """Testa que a consulta agendada da tabela compartilhada é a RECOMPUTE_QUERY"""
+        path = os.path.join(os.path.dirname(__file__), '..', '..', 'terraform', 'sql', 'monthly_rollups.sql')
+        with open(path) as f:
+            self.assertEqual(f.read().strip(), RECOMPUTE_QUERY.strip())
+
+    def test_cli_check(self):
+        """Testa a verificação de consistência pela linha de comando"""
+        self.store.apply(self.rows)
+        self.assertEqual(main(['--db', self.path, '--ledger-months', '0', '--check', '--local']), 0)
+        with patch('finance_data_writer.rollups.get_bigquery_client', return_value=FakeRecomputeClient(self.rows[:3])):
+            self.assertEqual(main(['--db', self.path, '--ledger-months', '0', '--check']), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from function_file_arrival.routing import (
+    IGNORED_EXTENSION,
+    IGNORED_PLACEHOLDER,
+    IGNORED_TEMPORARY,
+    REJECTED_FOLDER,
+    get_router,
+    load_router,
+    reset_router,
+)
+
+
+class TestRouter(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'routes.json')
+        with open(self.path, 'w') as f:
+            json.dump({
+                'parsers': {'.xlsx': 'excel', '.CSV': 'csv', '.ofx': 'ofx'},
+                'ignore_name_prefixes': ['~$', '.'],
+                'routes': [
+                    {'prefix': 'bancos', 'account': 'bancos'},
+                    {'prefix': 'bancos/itau/', 'account': 'itau-card', 'parsers': ['excel', 'csv'], 'layout': 'itau'},
+                    {'prefix': 'nubank/', 'account': 'nubank', 'endpoint': 'http://nubank'},
+                ],
+            }, f)
+        self.router = load_router(self.path)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_longest_prefix_wins(self):
+        """Testa que a rota de prefixo mais longo é escolhida"""
+        match = self.router.match('bancos/itau/2024/extrato.xlsx')
+        self.assertEqual((match.route.account, match.parser), ('itau-card', 'excel'))
+        self.assertEqual(self.router.match('bancos/outro/extrato.csv').route.account, 'bancos')
+        self.assertEqual(self.router.match('bancos/itau/extrato.csv').parser, 'csv')
+        self.assertEqual(match.route.layout, 'itau')
+        self.assertIsNone(self.router.match('nubank/a.xlsx').route.layout)
+
+    def test_ignored_and_rejected(self):
+        """Testa os descartes baratos e a recusa de pastas desconhecidas"""
+        self.assertEqual(self.router.match('bancos/').ignored, IGNORED_PLACEHOLDER)
+        self.assertEqual(self.router.match('bancos/~$extrato.xlsx').ignored, IGNORED_TEMPORARY)
+        self.assertEqual(self.router.match('bancos/.extrato.xlsx').ignored, IGNORED_TEMPORARY)
+        self.assertEqual(self.router.match('bancos/extrato.pdf').ignored, IGNORED_EXTENSION)
+        self.assertEqual(self.router.match('bancos/extrato').ignored, IGNORED_EXTENSION)
+        # A rota do Itaú aceita só Excel e CSV
+        self.assertEqual(self.router.match('bancos/itau/extrato.ofx').ignored, IGNORED_EXTENSION)
+        self.assertEqual(self.router.match('outro/extrato.xlsx').rejected, REJECTED_FOLDER)
+        self.assertEqual(self.router.stats['routed'], 0)
+        self.assertEqual(self.router.stats[IGNORED_EXTENSION], 3)
+
+    def test_take_stats_returns_counts_since_last_call(self):
+        """Testa as contagens por motivo entregues ao SLI do trigger"""
+        self.router.match('bancos/extrato.pdf')
+        self.router.match('bancos/itau/a.xlsx')
+        self.assertEqual(self.router.pending, 2)
+        self.assertEqual(self.router.take_stats(), {IGNORED_EXTENSION: 1, 'routed': 1})
+        self.assertEqual((self.router.pending, self.router.take_stats()), (0, {}))
+        self.router.match('outro/a.xlsx')
+        self.assertEqual(self.router.take_stats(), {REJECTED_FOLDER: 1})
+        self.assertEqual(self.router.stats['routed'], 1)
+
+    def test_endpoint_resolution(self):
+        """Testa a URL fixa e a variável de ambiente lida a cada chamada"""
+        self.assertEqual(self.router.match('nubank/a.xlsx').route.resolve_endpoint(), 'http://nubank')
+        route = self.router.match('bancos/itau/a.xlsx').route
+        self.assertEqual(route.env_var, 'TRANSACTIONS_FUNCTION_ITAU_CARD_ITAU-CARD')
+        with patch.dict(os.environ, {'TRANSACTIONS_FUNCTION_ITAU_CARD_ITAU-CARD': 'http://itau'}):
+            self.assertEqual(route.resolve_endpoint(), 'http://itau')
+        with patch.dict(os.environ, {}, clear=True):
+            self.assertIsNone(route.resolve_endpoint())
+
+    def test_router_is_loaded_once(self):
+        """Testa que a tabela é compilada uma vez por processo"""
+        reset_router()
+        try:
+            with patch.dict(os.environ, {'TRIGGER_ROUTES_PATH': self.path}):
+                router = get_router()
+                self.assertIs(get_router(), router)
+            self.assertEqual(router.match('nubank/a.xlsx').route.account, 'nubank')
+        finally:
+            reset_router()
+
+
+if __name__ == '__main__':
+    unittest.main()
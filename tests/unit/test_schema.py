@@ -0,0 +1,84 @@
+import json
+import os
+import tempfile
+import unittest
+from datetime import date
+from unittest.mock import patch
+
+from utils.schema import DEFAULT_SCHEMA_PATH, SchemaValidationError, TableSchema, create_table_schema
+
+
+class TestTableSchema(unittest.TestCase):
+    def setUp(self):
+        self.schema = TableSchema.from_file(DEFAULT_SCHEMA_PATH)
+
+    def test_projects_reader_fields(self):
+        """Testa o mapeamento dos campos do leitor para as colunas da tabela"""
+        rows = [{'id': 'a', 'data': '2024-01-05', 'valor': 1050, 'descricao': 'LOJA', 'account': 'itau-card',
+                 'category': None, 'installment_number': 2.0}]
+        self.assertEqual(self.schema.project(rows), [
+            {'id': 'a', 'date': '2024-01-05', 'value': 10.5, 'value_cents': 1050, 'description': 'LOJA',
+             'account': 'itau-card', 'installment_number': 2},
+        ])
+
+    def test_value_is_derived_exactly_from_cents(self):
+        """Testa que o valor em reais sai dos mesmos centavos, sem erro acumulado"""
+        projected = self.schema.project([{'valor': 30}, {'valor': -123456789}])
+        self.assertEqual([(row['value'], row['value_cents']) for row in projected],
+                         [(0.3, 30), (-1234567.89, -123456789)])
+
+    def test_accepts_table_column_names(self):
+        """Testa que linhas já no formato da tabela são aceitas"""
+        rows = [{'date': date(2024, 1, 5), 'value': '1.5'}]
+        self.assertEqual(self.schema.project(rows), [{'date': '2024-01-05', 'value': 1.5}])
+
+    def test_invalid_batch_fails_fast(self):
+        """Testa que valores inválidos rejeitam o lote inteiro com a lista de erros"""
+        rows = [{'data': '2024-01-05', 'valor': 100},
+                {'data': '05/01/2024', 'valor': 'R$ 1,00'},
+                {'data': '2024-02-30', 'valor': float('nan')}]
+        with self.assertRaises(SchemaValidationError) as context:
+            self.schema.project(rows)
+        self.assertEqual(context.exception.total, 6)
+        self.assertEqual({(e['row'], e['field']) for e in context.exception.errors},
+                         {(1, 'date'), (2, 'date'), (1, 'value'), (2, 'value'), (1, 'value_cents'), (2, 'value_cents')})
+
+    def test_unknown_fields(self):
+        """Testa que campos fora do schema são descartados, ou rejeitados no modo estrito"""
+        rows = [{'id': 'a', 'amount': 1}]
+        self.assertEqual(self.schema.unknown_fields(rows), ['amount'])
+        self.assertEqual(self.schema.project(rows), [{'id': 'a'}])
+        strict = TableSchema.from_file(DEFAULT_SCHEMA_PATH, strict=True)
+        with self.assertRaises(SchemaValidationError):
+            strict.project(rows)
+
+    def test_required_and_typed_columns(self):
+        """Testa colunas obrigatórias e tipos INTEGER/NUMERIC"""
+        schema = TableSchema([{'name': 'id', 'type': 'STRING', 'mode': 'REQUIRED'},
+                              {'name': 'cents', 'type': 'INT64'},
+                              {'name': 'amount', 'type': 'NUMERIC'}])
+        self.assertEqual(schema.project([{'id': 'a', 'cents': '-150', 'amount': 1.1}]),
+                         [{'id': 'a', 'cents': -150, 'amount': '1.1'}])
+        with self.assertRaises(SchemaValidationError) as context:
+            schema.project([{'cents': 1.5}])
+        self.assertEqual({e['reason'] for e in context.exception.errors}, {'required', 'not an INTEGER: 1.5'})
+
+    def test_unsupported_type(self):
+        """Testa erro ao compilar schema com tipo não suportado"""
+        with self.assertRaises(ValueError):
+            TableSchema([{'name': 'geo', 'type': 'GEOGRAPHY'}])
+
+    def test_schema_path_from_env(self):
+        """Testa leitura do schema de BIGQUERY_SCHEMA_PATH"""
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'schema.json')
+            with open(path, 'w') as f:
+                json.dump([{'name': 'id', 'type': 'STRING'}], f)
+            with patch.dict(os.environ, {'BIGQUERY_SCHEMA_PATH': path, 'BIGQUERY_SCHEMA_STRICT': 'true'}):
+                schema = create_table_schema()
+        self.assertEqual([column.name for column in schema.columns], ['id'])
+        self.assertTrue(schema.strict)
+
+
+if __name__ == '__main__':
+    unittest.main()
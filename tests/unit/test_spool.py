@@ -0,0 +1,127 @@
+import os
+import tempfile
+import time
+import unittest
+
+from utils.spool import WriteAheadSpool
+
+
+def make_record(n_rows, start=0):
+    return {'rows': [{'id': str(start + i)} for i in range(n_rows)], 'file_path': 'f.xlsx'}
+
+
+class FlakySink:
+    def __init__(self, fail_on_call=None):
+        self.batches = []
+        self.calls = 0
+        self.fail_on_call = fail_on_call
+
+    def __call__(self, records):
+        self.calls += 1
+        if self.calls == self.fail_on_call:
+            raise RuntimeError("BigQuery indisponível")
+        self.batches.append([row['id'] for record in records for row in record['rows']])
+
+
+class TestWriteAheadSpool(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.dir = self.tmp.name
+
+    def make_spool(self, sink, **kwargs):
+        spool = WriteAheadSpool(self.dir, sink, fsync=False, **kwargs)
+        self.addCleanup(spool.close)
+        return spool
+
+    def test_flush_in_large_batches(self):
+        """Testa que registros pequenos são agrupados em lotes grandes"""
+        sink = FlakySink()
+        spool = self.make_spool(sink, batch_rows=10)
+        for i in range(5):
+            spool.append(make_record(4, start=i * 4))
+        self.assertEqual(spool.flush(), 20)
+        self.assertEqual([len(batch) for batch in sink.batches], [12, 8])
+        self.assertEqual(spool.stats()['segments'], 0)
+
+    def test_segment_rotation(self):
+        """Testa que o segmento ativo é selado ao atingir o tamanho máximo"""
+        spool = self.make_spool(FlakySink(), segment_bytes=1)
+        spool.append(make_record(1))
+        spool.append(make_record(1))
+        self.assertEqual(spool.stats()['segments'], 2)
+
+    def test_failure_resumes_from_checkpoint(self):
+        """Testa que lotes já escritos não são reenviados após uma falha"""
+        sink = FlakySink(fail_on_call=2)
+        spool = self.make_spool(sink, batch_rows=4)
+        for i in range(3):
+            spool.append(make_record(4, start=i * 4))
+        with self.assertRaises(RuntimeError):
+            spool.flush()
+        self.assertEqual(spool.flush(), 8)
+        self.assertEqual(sink.batches, [['0', '1', '2', '3'], ['4', '5', '6', '7'], ['8', '9', '10', '11']])
+
+    def test_recovery_after_restart(self):
+        """Testa que registros pendentes são reprocessados em um novo processo"""
+        spool = self.make_spool(FlakySink())
+        spool.append(make_record(3))
+        spool.close()
+
+        sink = FlakySink()
+        recovered = self.make_spool(sink)
+        recovered.append(make_record(1, start=3))
+        self.assertEqual(recovered.flush(), 4)
+        self.assertEqual(sink.batches, [['0', '1', '2'], ['3']])
+
+    def test_torn_record_is_ignored(self):
+        """Testa que um registro truncado no fim do segmento é descartado"""
+        spool = self.make_spool(FlakySink())
+        spool.append(make_record(2))
+        spool.close()
+        [segment] = [name for name in os.listdir(self.dir) if name.endswith('.wal')]
+        with open(os.path.join(self.dir, segment), 'ab') as f:
+            f.write(b'\x00\x00\x01\x00garbage')
+
+        sink = FlakySink()
+        recovered = self.make_spool(sink)
+        self.assertEqual(recovered.flush(), 2)
+        self.assertEqual(recovered.stats()['corrupt_records'], 1)
+
+    def test_corrupt_record_is_quarantined(self):
+        """Testa que um registro corrompido no meio do segmento é isolado e os seguintes são entregues"""
+        spool = self.make_spool(FlakySink())
+        for i in range(3):
+            spool.append(make_record(2, start=i * 2))
+        spool.close()
+        [segment] = [name for name in os.listdir(self.dir) if name.endswith('.wal')]
+        path = os.path.join(self.dir, segment)
+        with open(path, 'rb') as f:
+            data = bytearray(f.read())
+        # Corrompe o payload do segundo registro
+        data[len(data) // 2] ^= 0xFF
+        with open(path, 'wb') as f:
+            f.write(data)
+
+        sink = FlakySink()
+        recovered = self.make_spool(sink)
+        self.assertEqual(recovered.flush(), 4)
+        self.assertEqual(sink.batches, [['0', '1', '4', '5']])
+        self.assertEqual(recovered.stats()['corrupt_records'], 1)
+        quarantined = os.listdir(os.path.join(self.dir, 'quarantine'))
+        self.assertEqual(len(quarantined), 1)
+        self.assertFalse(os.path.exists(path))
+
+    def test_background_flusher(self):
+        """Testa que o flusher em segundo plano drena o spool"""
+        sink = FlakySink()
+        spool = self.make_spool(sink, flush_interval=0.01).start()
+        spool.append(make_record(2))
+        deadline = time.monotonic() + 2
+        while not sink.batches and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(sink.batches, [['0', '1']])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,49 @@
+import os
+import tempfile
+import unittest
+
+from benchmarks.statement_generator import (
+    HEADER,
+    format_valor_br,
+    generate_rows,
+    generate_statement,
+)
+from credit_card_readers.azul_visa_reader import convert_data, converter_valor_br
+
+
+class TestStatementGenerator(unittest.TestCase):
+    def test_format_valor_br(self):
+        """Testa formatação de valores no padrão brasileiro"""
+        self.assertEqual(format_valor_br(1234.56), 'R$ 1.234,56')
+        self.assertEqual(format_valor_br(5.0), 'R$ 5,00')
+        self.assertEqual(format_valor_br(-1234567.8), 'R$ -1.234.567,80')
+        self.assertEqual(converter_valor_br(format_valor_br(-1234567.8)), -123456780)
+
+    def test_generate_rows_blocks(self):
+        """Testa geração determinística de blocos separados por linhas em branco"""
+        rows = generate_rows(10, n_blocks=3, seed=1)
+        self.assertEqual(rows, generate_rows(10, n_blocks=3, seed=1))
+        self.assertEqual(rows.count(HEADER), 3)
+        self.assertEqual(rows.count((None, None, None)), 2)
+        self.assertEqual(len(rows), 10 + 3 + 2)
+
+    def test_generated_xlsx_is_parsed_by_convert_data(self):
+        """Testa que o extrato gerado é lido por convert_data"""
+        with tempfile.TemporaryDirectory() as tmp:
+            path = generate_statement(os.path.join(tmp, 'statement.xlsx'), 50, n_blocks=4)
+            blocks = convert_data(path, 'itau-card')
+
+        self.assertEqual(len(blocks), 4)
+        self.assertEqual(sum(len(block) for block in blocks), 50)
+        for row in blocks[0]:
+            self.assertRegex(row['data'], r'^\d{4}-\d{2}-\d{2}$')
+            self.assertIsInstance(row['valor'], int)
+
+    def test_unsupported_format(self):
+        """Testa erro para formato não suportado"""
+        with self.assertRaises(ValueError):
+            generate_statement('statement.pdf', 10)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,112 @@
+import json
+import time
+import unittest
+from datetime import datetime, timedelta, UTC
+from unittest.mock import MagicMock, patch
+
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+
+from utils.telemetry import create_span, extract_context, get_current_trace_id, inject_context, record_span
+
+
+class TelemetryTestCase(unittest.TestCase):
+    """Usa um TracerProvider próprio com exportador em memória."""
+
+    def setUp(self):
+        self.exporter = InMemorySpanExporter()
+        provider = TracerProvider()
+        provider.add_span_processor(SimpleSpanProcessor(self.exporter))
+        patcher = patch('opentelemetry.trace.get_tracer', provider.get_tracer)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def spans(self):
+        return {span.name: span for span in self.exporter.get_finished_spans()}
+
+
+class TestTelemetry(TelemetryTestCase):
+    def test_create_span_is_current_and_ended_once(self):
+        """Testa que create_span mantém o span ativo no bloco e o encerra na saída"""
+        with create_span('parent', {'a': 1}) as parent:
+            self.assertTrue(parent.is_recording())
+            self.assertEqual(get_current_trace_id(), format(parent.get_span_context().trace_id, '032x'))
+            with create_span('child'):
+                pass
+
+        spans = self.spans()
+        self.assertEqual(len(self.exporter.get_finished_spans()), 2)
+        self.assertEqual(spans['child'].parent.span_id, spans['parent'].context.span_id)
+        self.assertEqual(spans['parent'].attributes['a'], 1)
+        self.assertIsNone(get_current_trace_id())
+
+    def test_inject_extract_roundtrip(self):
+        """Testa a propagação W3C por um carrier (headers ou atributos)"""
+        with create_span('trigger') as span:
+            carrier = inject_context()
+        self.assertRegex(carrier['traceparent'], r'^00-[0-9a-f]{32}-[0-9a-f]{16}-[0-9a-f]{2}$')
+
+        with create_span('reader', context=extract_context(carrier)):
+            pass
+
+        reader = self.spans()['reader']
+        self.assertEqual(reader.context.trace_id, span.get_span_context().trace_id)
+        self.assertEqual(reader.parent.span_id, span.get_span_context().span_id)
+
+    def test_extract_without_context(self):
+        """Testa carriers sem traceparent válido"""
+        self.assertIsNone(extract_context(None))
+        self.assertIsNone(extract_context({}))
+        self.assertIsNone(extract_context({'traceparent': 'invalido'}))
+        self.assertIsNone(extract_context(MagicMock()))
+        self.assertEqual(inject_context(), {})
+
+    def test_record_span_uses_given_times(self):
+        """Testa spans de intervalos já encerrados (tempo em fila)"""
+        start = time.time_ns() - 2_000_000_000
+        record_span('queue', start, start + 1_500_000_000)
+        span = self.spans()['queue']
+        self.assertEqual(span.end_time - span.start_time, 1_500_000_000)
+
+
+class TestTracePropagation(TelemetryTestCase):
+    def test_trigger_headers_and_reader_attributes(self):
+        """Testa uma única árvore do trigger ao writer, com o tempo de fila do Pub/Sub"""
+        from finance_data_writer.writer import process_message
+        from function_file_arrival.trigger import storage_trigger_function
+
+        response = MagicMock(status_code=200)
+        with patch('function_file_arrival.trigger.requests.post', return_value=response) as mock_post, \
+                patch.dict('os.environ', {'TRANSACTIONS_FUNCTION_ITAU_CARD_ITAU-CARD': 'http://reader'}):
+            event = MagicMock()
+            event.data = {'bucket': 'b', 'name': 'itau-card/extrato.xlsx'}
+            storage_trigger_function(event, telemetry=MagicMock())
+
+        headers = mock_post.call_args.kwargs['headers']
+        with create_span('parse_excel', context=extract_context(headers)):
+            with create_span('pubsub_publish'):
+                attributes = inject_context()
+
+        message = MagicMock()
+        message.message_id = 'msg-1'
+        message.attributes = attributes
+        message.publish_time = datetime.now(UTC) - timedelta(seconds=1)
+        message.delivery_attempt = 1
+        message.data = json.dumps({'rows': [], 'file_path': 'itau-card/extrato.xlsx'}).encode()
+        with patch('finance_data_writer.writer.write_to_bigquery'):
+            self.assertTrue(process_message(message, telemetry=MagicMock()))
+
+        spans = self.spans()
+        trigger_span = spans['process_file']
+        self.assertEqual({span.context.trace_id for span in spans.values()}, {trigger_span.context.trace_id})
+        self.assertEqual(spans['parse_excel'].parent.span_id, trigger_span.context.span_id)
+        publish = spans['pubsub_publish'].context.span_id
+        self.assertEqual(spans['pubsub_queue'].parent.span_id, publish)
+        self.assertEqual(spans['process_message'].parent.span_id, publish)
+        queue = spans['pubsub_queue']
+        self.assertGreaterEqual(queue.end_time - queue.start_time, 900_000_000)
+
+
+if __name__ == '__main__':
+    unittest.main()
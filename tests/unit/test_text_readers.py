@@ -0,0 +1,155 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from benchmarks.statement_generator import generate_statement
+from credit_card_readers.azul_visa_reader import convert_data, read_statement
+from credit_card_readers.text_readers import (
+    _ofx_elements,
+    detect_encoding,
+    get_row_reader,
+    iter_csv_rows,
+    iter_ofx_rows,
+)
+
+OFX_CARD = """OFXHEADER:100
+DATA:OFXSGML
+VERSION:102
+
+<OFX>
+<CREDITCARDMSGSRSV1>
+<CCSTMTTRNRS>
+<CCSTMTRS>
+<BANKTRANLIST>
+<STMTTRN>
+<TRNTYPE>DEBIT
+<DTPOSTED>20240105120000[-3:BRT]
+<TRNAMT>-100.50
+<MEMO>IFOOD *REST
+</STMTTRN>
+<STMTTRN>
+<TRNTYPE>CREDIT
+<DTPOSTED>20240107
+<TRNAMT>20,00
+<NAME>ESTORNO A &amp; B
+</STMTTRN>
+</BANKTRANLIST>
+</CCSTMTRS>
+</CCSTMTTRNRS>
+</CREDITCARDMSGSRSV1>
+</OFX>
+"""
+
+
+class TestTextReaders(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _write(self, name, content, encoding='utf-8'):
+        path = os.path.join(self.tmp.name, name)
+        with open(path, 'w', encoding=encoding, newline='') as f:
+            f.write(content)
+        return path
+
+    def test_registered_extensions(self):
+        """Testa o registro de leitores por extensão"""
+        self.assertIs(get_row_reader('extrato.CSV'), iter_csv_rows)
+        self.assertIs(get_row_reader('extrato.ofx'), iter_ofx_rows)
+        self.assertIsNone(get_row_reader('extrato.xlsx'))
+        # O tipo roteado pelo trigger tem precedência sobre a extensão
+        self.assertIs(get_row_reader('extrato.txt', 'csv'), iter_csv_rows)
+        self.assertIsNone(get_row_reader('extrato.csv', 'excel'))
+        with self.assertRaises(ValueError):
+            get_row_reader('extrato.csv', 'pdf')
+
+    def test_detect_encoding(self):
+        """Testa detecção de UTF-8 e fallback para cp1252"""
+        self.assertEqual(detect_encoding(self._write('a.csv', 'descrição', 'utf-8')), 'utf-8')
+        self.assertEqual(detect_encoding(self._write('b.csv', 'descrição', 'cp1252')), 'cp1252')
+
+    def test_csv_rows_and_delimiter(self):
+        """Testa leitura de CSV com ';' e com ',' entre aspas"""
+        semicolon = self._write('a.csv', 'data;valor;descricao\r\n01/01/2024;R$ 1.234,56;LOJA\r\n;;\r\n')
+        self.assertEqual(list(iter_csv_rows(semicolon)), [
+            ('data', 'valor', 'descricao'),
+            ('01/01/2024', 'R$ 1.234,56', 'LOJA'),
+            (None, None, None),
+        ])
+        comma = self._write('b.csv', 'data,valor,descricao\n01/01/2024,"R$ 1.234,56",LOJA\n'
+                                     '02/01/2024,"R$ 5,00",OUTRA\n')
+        self.assertEqual(list(iter_csv_rows(comma))[1], ('01/01/2024', 'R$ 1.234,56', 'LOJA'))
+
+    def test_csv_latin1_header_is_matched(self):
+        """Testa CSV em cp1252 com cabeçalho acentuado e colunas em outra ordem"""
+        path = self._write('a.csv', 'Data;Descrição;Valor\n01/01/2024;PADARIA;R$ 10,00\n', 'cp1252')
+        blocks = convert_data(path, 'itau-card')
+        self.assertEqual(blocks[0][0]['descricao'], 'PADARIA')
+        self.assertEqual(blocks[0][0]['valor'], 1000)
+        self.assertEqual(blocks[0][0]['data'], '2024-01-01')
+
+    def test_ofx_card_rows(self):
+        """Testa transações OFX de cartão com sinal invertido e entidades"""
+        rows = list(iter_ofx_rows(self._write('a.ofx', OFX_CARD)))
+        self.assertEqual(rows, [
+            ('2024-01-05', 100.5, 'IFOOD *REST'),
+            ('2024-01-07', -20.0, 'ESTORNO A & B'),
+            (),
+        ])
+
+    def test_ofx_bank_statement_keeps_sign(self):
+        """Testa que extratos bancários mantêm o sinal do OFX"""
+        content = OFX_CARD.replace('CREDITCARDMSGSRSV1', 'BANKMSGSRSV1')
+        rows = list(iter_ofx_rows(self._write('a.ofx', content)))
+        self.assertEqual(rows[0][1], -100.5)
+
+    def test_ofx_xml_in_small_chunks(self):
+        """Testa OFX 2.x (XML) lido em pedaços menores que um elemento"""
+        content = ('<?xml version="1.0"?><OFX><CREDITCARDMSGSRSV1><CCSTMTTRNRS><CCSTMTRS><BANKTRANLIST>'
+                   '<STMTTRN><DTPOSTED>20240110</DTPOSTED><TRNAMT>-7.25</TRNAMT><MEMO>UBER TRIP</MEMO></STMTTRN>'
+                   '</BANKTRANLIST></CCSTMTRS></CCSTMTTRNRS></CREDITCARDMSGSRSV1></OFX>')
+        path = self._write('a.ofx', content)
+        self.assertEqual(list(iter_ofx_rows(path)), [('2024-01-10', 7.25, 'UBER TRIP'), ()])
+        with open(path) as f:
+            elements = list(_ofx_elements(f, chunk_size=3))
+        with open(path) as f:
+            self.assertEqual(elements, list(_ofx_elements(f)))
+
+    def test_formats_produce_same_rows(self):
+        """Testa que xlsx, csv e ofx gerados do mesmo seed produzem as mesmas linhas"""
+        results = {}
+        for fmt in ('xlsx', 'csv', 'ofx'):
+            path = generate_statement(os.path.join(self.tmp.name, f'statement.{fmt}'), 60, n_blocks=3, seed=7)
+            results[fmt] = read_statement(path)
+
+        self.assertEqual([len(block) for block in results['csv']], [20, 20, 20])
+        self.assertEqual(results['csv'], results['xlsx'])
+        self.assertEqual([len(block) for block in results['ofx']], [20, 20, 20])
+        for ofx_row, xlsx_row in zip(results['ofx'][0], results['xlsx'][0]):
+            self.assertEqual(ofx_row['data'], xlsx_row['data'])
+            self.assertEqual(ofx_row['valor'], xlsx_row['valor'])
+            self.assertEqual(ofx_row['id'], xlsx_row['id'])
+
+    def test_read_statement_uses_routed_parser_and_layout(self):
+        """Testa que o parser e o layout da rota dispensam extensão e detecção"""
+        path = generate_statement(os.path.join(self.tmp.name, 'statement.csv'), 30, n_blocks=3, seed=7)
+        expected = read_statement(path)
+        renamed = os.path.join(self.tmp.name, 'statement.dat')
+        os.rename(path, renamed)
+        with patch('credit_card_readers.azul_visa_reader.sniff_layout') as mock_sniff, \
+                patch('credit_card_readers.azul_visa_reader.detect_layout') as mock_detect:
+            self.assertEqual(read_statement(renamed, parser='csv', layout_name='itau'), expected)
+        mock_sniff.assert_not_called()
+        mock_detect.assert_not_called()
+
+    def test_read_statement_ignores_sheets_for_csv(self):
+        """Testa que sheets é ignorado para formatos sem planilhas"""
+        path = generate_statement(os.path.join(self.tmp.name, 'statement.csv'), 10, n_blocks=1)
+        self.assertEqual(sum(len(block) for block in read_statement(path, sheets='*')), 10)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,7 @@
 import unittest
 from unittest.mock import MagicMock, patch
 import os
+from function_file_arrival.routing import get_router
 from function_file_arrival.trigger import storage_trigger_function
 
 class MockCloudEvent(dict):
@@ -52,6 +53,43 @@ class TestTrigger(unittest.TestCase):
         result = storage_trigger_function(MockCloudEvent(invalid_event), None)
         self.assertEqual(result, "Invalid folder name in file path")
 
+    @patch('function_file_arrival.trigger.create_span')
+    @patch('function_file_arrival.trigger.requests.post')
+    def test_non_statement_objects_are_ignored_early(self, mock_post, mock_span):
+        """Test that placeholders, temp files and other extensions skip tracing and network."""
+        os.environ['TRANSACTIONS_FUNCTION_ITAU_CARD_AZUL-VISA'] = 'http://test-function'
+        for name, reason in [('azul-visa/', 'folder placeholder'),
+                             ('azul-visa/~$test-file.xlsx', 'temporary file'),
+                             ('azul-visa/notes.txt', 'unsupported extension'),
+                             ('invalid/notes.pdf', 'unsupported extension')]:
+            event = dict(self.valid_event, name=name)
+            self.assertEqual(storage_trigger_function(MockCloudEvent(event), None), f"Ignored object: {reason}")
+        mock_span.assert_not_called()
+        mock_post.assert_not_called()
+
+    @patch('function_file_arrival.trigger.requests.post')
+    def test_parser_type_is_sent(self, mock_post):
+        """Test that the routed parser type is sent to the reader."""
+        mock_post.return_value = self.mock_response
+        os.environ['TRANSACTIONS_FUNCTION_ITAU_CARD_ITAU-CARD'] = 'http://test-function'
+        event = dict(self.valid_event, name='itau-card/extrato.CSV')
+        self.assertEqual(storage_trigger_function(MockCloudEvent(event), None), "File processed successfully")
+        payload = mock_post.call_args.kwargs['json']
+        self.assertEqual((payload['account'], payload['parser'], payload['layout']), ('itau-card', 'csv', None))
+
+    @patch('function_file_arrival.trigger.log_structured')
+    @patch('function_file_arrival.trigger.requests.post')
+    def test_route_stats_are_logged(self, mock_post, mock_log):
+        """Test that routing counts are reported as an SLI with the next routed event."""
+        mock_post.return_value = self.mock_response
+        os.environ['TRANSACTIONS_FUNCTION_ITAU_CARD_AZUL-VISA'] = 'http://test-function'
+        get_router().take_stats()
+        storage_trigger_function(MockCloudEvent(dict(self.valid_event, name='azul-visa/notes.txt')), None)
+        self.assertFalse([c for c in mock_log.call_args_list if c.args[2] == 'SLI: trigger_routes'])
+        storage_trigger_function(MockCloudEvent(self.valid_event), None)
+        reports = [c.kwargs for c in mock_log.call_args_list if c.args[2] == 'SLI: trigger_routes']
+        self.assertEqual(reports, [{'unsupported extension': 1, 'routed': 1}])
+
     @patch('function_file_arrival.trigger.requests.post')
     def test_http_error(self, mock_post):
         """Test handling HTTP error from processing function."""
@@ -61,5 +99,27 @@ class TestTrigger(unittest.TestCase):
         result = storage_trigger_function(MockCloudEvent(self.valid_event), None)
         self.assertEqual(result, "Error processing file: HTTP Error")
 
+    @patch('function_file_arrival.trigger.requests.post')
+    def test_duplicate_upload_is_skipped(self, mock_post):
+        """Test that a re-uploaded statement with the same content is not reprocessed."""
+        mock_post.return_value = self.mock_response
+        os.environ['TRANSACTIONS_FUNCTION_ITAU_CARD_AZUL-VISA'] = 'http://test-function'
+        event = dict(self.valid_event, md5Hash='abc==', generation='1')
+        renamed = dict(event, name='azul-visa/copy-of-test-file.xls', generation='2')
+        self.assertEqual(storage_trigger_function(MockCloudEvent(event), None), "File processed successfully")
+        self.assertEqual(storage_trigger_function(MockCloudEvent(renamed), None), "File already processed")
+        mock_post.assert_called_once()
+        self.assertEqual(mock_post.call_args.kwargs['json']['content_hash'], 'md5:abc==')
+
+    @patch('function_file_arrival.trigger.requests.post')
+    def test_failed_upload_can_be_retried(self, mock_post):
+        """Test that a failed request releases the file for the retry."""
+        mock_post.return_value = self.mock_response
+        self.mock_response.raise_for_status.side_effect = [Exception("HTTP Error"), None]
+        os.environ['TRANSACTIONS_FUNCTION_ITAU_CARD_AZUL-VISA'] = 'http://test-function'
+        event = dict(self.valid_event, md5Hash='abc==')
+        self.assertEqual(storage_trigger_function(MockCloudEvent(event), None), "Error processing file: HTTP Error")
+        self.assertEqual(storage_trigger_function(MockCloudEvent(event), None), "File processed successfully")
+
 if __name__ == '__main__':
     unittest.main() 
\ No newline at end of file
@@ -0,0 +1,95 @@
+import json
+import os
+import threading
+import unittest
+from unittest.mock import MagicMock, patch
+
+from utils.warmup import Warmup, is_warmup_request, warmup_on_start
+
+
+class TestWarmup(unittest.TestCase):
+    def test_steps_run_once(self):
+        """Testa que os passos rodam uma única vez por processo"""
+        calls = []
+        warmup = Warmup('svc', [('a', lambda: calls.append('a')), ('b', lambda: calls.append('b'))])
+        first = warmup.run()
+        warmup.run()
+
+        self.assertEqual(calls, ['a', 'b'])
+        self.assertTrue(first['done'])
+        self.assertEqual(set(first['steps']), {'a', 'b'})
+        self.assertTrue(all(step['ok'] for step in first['steps'].values()))
+
+    def test_failing_step_is_reported(self):
+        """Testa que um passo com erro não interrompe os demais"""
+        def fail():
+            raise RuntimeError('sem credenciais')
+
+        calls = []
+        warmup = Warmup('svc', [('client', fail), ('rules', lambda: calls.append('rules'))])
+        body, status = warmup.response()
+        report = json.loads(body)
+
+        self.assertEqual(status, 200)
+        self.assertEqual(calls, ['rules'])
+        self.assertEqual(report['failed_steps'], ['client'])
+        self.assertEqual(report['steps']['client']['error'], 'sem credenciais')
+
+    def test_background_start_and_concurrent_run(self):
+        """Testa que uma chamada concorrente espera o warm-up em andamento"""
+        release = threading.Event()
+        calls = []
+
+        def slow():
+            release.wait(5)
+            calls.append('slow')
+
+        warmup = Warmup('svc', [('slow', slow)]).start()
+        self.assertFalse(warmup.done)
+        release.set()
+        warmup.run()
+        self.assertTrue(warmup.wait(5))
+        self.assertEqual(calls, ['slow'])
+
+    def test_first_request_and_steady_state(self):
+        """Testa a separação entre a primeira requisição e o regime estável"""
+        warmup = Warmup('svc', [])
+        for _ in range(3):
+            with warmup.track_request():
+                pass
+
+        report = warmup.report()
+        self.assertIsNotNone(report['first_request_s'])
+        self.assertFalse(report['first_request_warmed_up'])
+        self.assertEqual(report['steady_requests'], 2)
+        self.assertIsNotNone(report['steady_request_s'])
+
+    def test_entry_point_answers_warmup_path(self):
+        """Testa que o entry point responde ao caminho de warm-up sem chamar a função"""
+        handler = MagicMock(return_value='ok')
+        warmup = Warmup('svc', [])
+        wrapped = warmup.entry_point(handler)
+
+        body, status = wrapped(MagicMock(path='/_ah/warmup'))
+        self.assertEqual(status, 200)
+        self.assertTrue(json.loads(body)['done'])
+        handler.assert_not_called()
+
+        self.assertEqual(wrapped(MagicMock(path='/')), 'ok')
+        self.assertIsNotNone(warmup.report()['first_request_s'])
+        self.assertTrue(warmup.report()['first_request_warmed_up'])
+
+    def test_warmup_request_and_env(self):
+        """Testa a detecção do caminho e da variável WARMUP_ON_START"""
+        self.assertTrue(is_warmup_request(MagicMock(path='/_ah/warmup/')))
+        self.assertFalse(is_warmup_request(MagicMock(path='/')))
+        self.assertFalse(is_warmup_request(MagicMock()))
+        with patch.dict(os.environ, {'WARMUP_PATH': '/warm', 'WARMUP_ON_START': 'true'}):
+            self.assertTrue(is_warmup_request(MagicMock(path='/warm')))
+            self.assertTrue(warmup_on_start())
+        with patch.dict(os.environ, {'WARMUP_ON_START': ''}):
+            self.assertFalse(warmup_on_start())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,7 +2,15 @@ import unittest
 from unittest.mock import patch, MagicMock
 import json
 import os
-from finance_data_writer.writer import write_to_bigquery, process_message, main, check_credentials
+import tempfile
+from finance_data_writer.writer import write_to_bigquery, process_message, main, check_credentials, write_spooled_records
+from finance_data_writer.batching import reset_batch_controller
+from finance_data_writer.poison import get_poison_guard, reset_poison_guard
+from finance_data_writer.rollups import get_rollup_store
+from benchmarks.fakes import FakeBigQueryClient
+from utils.factories import clear_instances, get_write_spool
+from utils.rate_limit import RateLimiter
+from utils.schema import SchemaValidationError
 
 class TestFinanceDataWriter(unittest.TestCase):
     def setUp(self):
@@ -75,6 +83,93 @@ class TestFinanceDataWriter(unittest.TestCase):
         with self.assertRaises(RuntimeError):
             write_to_bigquery(self.sample_transactions)
 
+    @patch.dict('os.environ', {'WRITER_BATCH_INITIAL_ROWS': '100', 'WRITER_BATCH_MIN_ROWS': '50'})
+    @patch('finance_data_writer.writer.bigquery.Client')
+    def test_write_to_bigquery_adaptive_batches(self, mock_bq_client):
+        """Testa que lotes grandes são divididos em várias requisições"""
+        mock_client = MagicMock()
+        mock_bq_client.return_value = mock_client
+        mock_client.insert_rows_json.return_value = []
+        rows = [{'id': str(i), 'data': '2024-01-01', 'valor': 1.0, 'descricao': 'X'} for i in range(450)]
+
+        reset_batch_controller()
+        try:
+            self.assertTrue(write_to_bigquery(rows))
+        finally:
+            reset_batch_controller()
+
+        sent = [row['id'] for call in mock_client.insert_rows_json.call_args_list for row in call.args[1]]
+        self.assertGreater(mock_client.insert_rows_json.call_count, 1)
+        self.assertEqual(sorted(sent, key=int), [str(i) for i in range(450)])
+        # O id da linha vai como insertId, para o BigQuery descartar reenvios
+        for call in mock_client.insert_rows_json.call_args_list:
+            self.assertEqual(call.kwargs['row_ids'], [row['id'] for row in call.args[1]])
+
+    @patch('finance_data_writer.writer.bigquery.Client')
+    def test_write_to_bigquery_keeps_identical_purchases(self, mock_bq_client):
+        """Testa que duas compras idênticas no mesmo lote recebem insertIds diferentes"""
+        client = FakeBigQueryClient()
+        mock_bq_client.return_value = client
+        row = {'id': 'abc', 'data': '2024-01-01', 'valor': 1250, 'descricao': 'CAFE', 'account': 'itau-card'}
+        self.assertTrue(write_to_bigquery([row, dict(row)]))
+        self.assertEqual((client.rows_inserted, client.rows_deduplicated, client.insert_id_collisions), (2, 0, 0))
+        # Reenvio da mesma mensagem: as duas são descartadas como duplicadas
+        write_to_bigquery([row, dict(row)])
+        self.assertEqual((client.rows_inserted, client.rows_deduplicated), (2, 2))
+
+    @patch('finance_data_writer.writer.write_to_bigquery')
+    def test_bisection_keeps_message_insert_ids(self, mock_write):
+        """Testa que a bisseção não recalcula os ordinais das compras idênticas"""
+        written_ids = []
+
+        def write(rows, insert_ids=None):
+            if any(row['data'] == 'invalid' for row in rows):
+                raise SchemaValidationError([{'row': 0, 'field': 'date', 'reason': 'not a DATE'}], 1)
+            written_ids.extend(insert_ids)
+        mock_write.side_effect = write
+        rows = [{'id': 'dup', 'data': '2024-01-01'}] * 2 + [{'id': 'bad', 'data': 'invalid'}] + \
+               [{'id': 'dup', 'data': '2024-01-01'}]
+        with tempfile.TemporaryDirectory() as tmp, \
+                patch.dict('os.environ', {'WRITER_DEAD_LETTER_PATH': os.path.join(tmp, 'dead.jsonl')}):
+            reset_poison_guard()
+            self.addCleanup(reset_poison_guard)
+            self.sample_message.data = json.dumps({'rows': [rows]}).encode('utf-8')
+            self.assertTrue(process_message(self.sample_message))
+        self.assertEqual(sorted(written_ids), ['dup', 'dup:1', 'dup:2'])
+
+    @patch.dict('os.environ', {'WRITER_BATCH_INITIAL_ROWS': '100', 'WRITER_BATCH_MIN_ROWS': '50'})
+    @patch('finance_data_writer.writer.bigquery.Client')
+    def test_write_to_bigquery_acquires_rate_limit(self, mock_bq_client):
+        """Testa que cada requisição passa pelo rate limiter da tabela"""
+        mock_client = MagicMock()
+        mock_client.project = 'p'
+        mock_bq_client.return_value = mock_client
+        mock_client.insert_rows_json.return_value = []
+        rows = [{'id': str(i), 'data': '2024-01-01', 'valor': 1.0, 'descricao': 'X'} for i in range(450)]
+        sleeps = []
+        limiter = RateLimiter({('bigquery.insert', 'p.test_dataset.test_table'): (1.0, 1.0)}, sleep=sleeps.append)
+
+        reset_batch_controller()
+        try:
+            with patch('finance_data_writer.writer.get_rate_limiter', return_value=limiter):
+                self.assertTrue(write_to_bigquery(rows))
+        finally:
+            reset_batch_controller()
+
+        requests = mock_client.insert_rows_json.call_count
+        self.assertEqual(limiter.stats()['bigquery.insert:p.test_dataset.test_table']['acquired'], requests)
+        # Uma requisição por segundo: todas menos a primeira esperam
+        self.assertEqual(len(sleeps), requests - 1)
+
+    @patch('finance_data_writer.writer.bigquery.Client')
+    def test_write_to_bigquery_invalid_batch(self, mock_bq_client):
+        """Testa que lotes fora do schema falham antes de chamar o BigQuery"""
+        mock_client = MagicMock()
+        mock_bq_client.return_value = mock_client
+        with self.assertRaises(ValueError):
+            write_to_bigquery([{'data': '01/01/2024', 'valor': 'R$ 1,00'}])
+        mock_client.insert_rows_json.assert_not_called()
+
     @patch.dict('os.environ', {}, clear=True)
     def test_write_to_bigquery_missing_env(self):
         """Testa erro quando variáveis de ambiente estão faltando"""
@@ -96,6 +191,145 @@ class TestFinanceDataWriter(unittest.TestCase):
         process_message(self.sample_message)
         self.sample_message.nack.assert_called_once()
 
+    @patch('finance_data_writer.writer.write_to_bigquery')
+    def test_process_message_flattens_blocks(self, mock_write):
+        """Testa que blocos de linhas são achatados antes da escrita"""
+        self.sample_message.data = json.dumps({'rows': [[{'id': '1'}, {'id': '2'}], [{'id': '3'}]]}).encode('utf-8')
+        process_message(self.sample_message)
+        mock_write.assert_called_once_with([{'id': '1'}, {'id': '2'}, {'id': '3'}], insert_ids=['1', '2', '3'])
+        self.sample_message.ack.assert_called_once()
+
+    @patch('finance_data_writer.writer.get_ingestion_index')
+    @patch('finance_data_writer.writer.write_to_bigquery')
+    def test_process_message_records_index_entries(self, mock_write, mock_get_index):
+        """Testa que o índice incremental é atualizado após a escrita"""
+        entries = [['itau-card', '2024-01', 'key', '1']]
+        self.sample_message.data = json.dumps({'rows': [[{'id': '1'}]], 'index_entries': entries}).encode('utf-8')
+        mock_get_index.return_value.record.side_effect = Exception("índice indisponível")
+        process_message(self.sample_message)
+        mock_get_index.return_value.record.assert_called_once_with(entries)
+        self.sample_message.ack.assert_called_once()
+        self.sample_message.nack.assert_not_called()
+
+    @patch('finance_data_writer.writer.write_to_bigquery')
+    def test_process_message_spools_rows(self, mock_write):
+        """Testa que, com spool, a mensagem é confirmada e a escrita fica para o flusher"""
+        with tempfile.TemporaryDirectory() as spool_dir, \
+                patch.dict('os.environ', {'WRITER_SPOOL_DIR': spool_dir, 'WRITER_SPOOL_FLUSH_INTERVAL': '3600'}):
+            self.sample_message.data = json.dumps({'rows': [[{'id': '1'}], [{'id': '2'}]]}).encode('utf-8')
+            self.sample_message.message_id = 'msg-1'
+            self.assertTrue(process_message(self.sample_message))
+            self.sample_message.ack.assert_called_once()
+            mock_write.assert_not_called()
+
+            get_write_spool(write_spooled_records).flush()
+            mock_write.assert_called_once_with([{'id': '1'}, {'id': '2'}], insert_ids=['1', '2'])
+            clear_instances()
+
+    @patch('finance_data_writer.writer.write_to_bigquery')
+    def test_process_message_updates_rollups(self, mock_write):
+        """Testa que os agregados mensais são atualizados após a escrita"""
+        with tempfile.TemporaryDirectory() as tmp, \
+                patch.dict('os.environ', {'ROLLUPS_DB_PATH': os.path.join(tmp, 'rollups.sqlite3'),
+                                          'ROLLUPS_LEDGER_MONTHS': '0'}):
+            row = {'id': '1', 'data': '2024-01-01', 'valor': 1250, 'account': 'itau-card', 'category': 'mercado'}
+            # Mensagem publicada antes dos centavos: valor float em reais
+            legacy = dict(row, id='2', valor=12.5)
+            self.sample_message.data = json.dumps({'rows': [[row, legacy]]}).encode('utf-8')
+            process_message(self.sample_message)
+            self.assertEqual(get_rollup_store().rollups(), {('itau-card', '2024-01', 'mercado'): (2500, 2, 1250, 1250)})
+
+    @patch('finance_data_writer.writer.get_ingestion_index')
+    @patch('finance_data_writer.writer.write_to_bigquery')
+    def test_process_message_retracts_replaced_rows(self, mock_write, mock_get_index):
+        """Testa que a linha substituída numa reimportação sai dos agregados mensais"""
+        with tempfile.TemporaryDirectory() as tmp, \
+                patch.dict('os.environ', {'ROLLUPS_DB_PATH': os.path.join(tmp, 'rollups.sqlite3'),
+                                          'ROLLUPS_LEDGER_MONTHS': '0'}):
+            row = {'id': 'old', 'data': '2024-01-01', 'valor': 1250, 'account': 'itau-card', 'category': 'mercado'}
+            self.sample_message.data = json.dumps({'rows': [[row]]}).encode('utf-8')
+            process_message(self.sample_message)
+
+            changed = dict(row, id='new', valor=990)
+            entries = [['itau-card', '2024-01', 'key', 'new', 'old']]
+            self.sample_message.data = json.dumps({'rows': [[changed]], 'index_entries': entries}).encode('utf-8')
+            process_message(self.sample_message)
+            self.assertEqual(get_rollup_store().rollups(), {('itau-card', '2024-01', 'mercado'): (990, 1, 990, 990)})
+        mock_get_index.return_value.record.assert_called_once_with(entries)
+
+    @patch('finance_data_writer.writer.get_ingestion_index')
+    @patch('finance_data_writer.writer.write_to_bigquery')
+    def test_process_message_isolates_poison_rows(self, mock_write, mock_get_index):
+        """Testa que linhas inválidas vão para o dead-letter e as boas são escritas e confirmadas"""
+        def write(rows, insert_ids=None):
+            if any(row['data'] == 'invalid' for row in rows):
+                raise SchemaValidationError([{'row': 0, 'field': 'date', 'reason': 'not a DATE'}], 1)
+        mock_write.side_effect = write
+        rows = [{'id': str(i), 'data': 'invalid' if i == 3 else '2024-01-01'} for i in range(6)]
+        entries = [['itau-card', '2024-01', f'key{i}', str(i)] for i in range(6)]
+        with tempfile.TemporaryDirectory() as tmp, \
+                patch.dict('os.environ', {'WRITER_DEAD_LETTER_PATH': os.path.join(tmp, 'dead.jsonl')}):
+            reset_poison_guard()
+            self.addCleanup(reset_poison_guard)
+            self.sample_message.message_id = 'msg-poison'
+            self.sample_message.data = json.dumps({'rows': [rows], 'file_path': 'extrato.xlsx',
+                                                   'index_entries': entries}).encode('utf-8')
+            self.assertTrue(process_message(self.sample_message))
+            with open(os.path.join(tmp, 'dead.jsonl')) as f:
+                dead = [json.loads(line) for line in f]
+        self.sample_message.ack.assert_called_once()
+        self.sample_message.nack.assert_not_called()
+        self.assertEqual([(record['row']['id'], record['file_path']) for record in dead], [('3', 'extrato.xlsx')])
+        recorded = mock_get_index.return_value.record.call_args[0][0]
+        self.assertEqual([entry[3] for entry in recorded], ['0', '1', '2', '4', '5'])
+        self.assertEqual(get_poison_guard().metrics()['poison_rows'], 1)
+
+    @patch('finance_data_writer.writer.write_to_bigquery')
+    def test_spool_flush_isolates_poison_rows(self, mock_write):
+        """Testa que uma linha inválida no spool vai para o dead-letter sem travar a drenagem"""
+        def write(rows, insert_ids=None):
+            if any(row['data'] == 'invalid' for row in rows):
+                raise SchemaValidationError([{'row': 0, 'field': 'date', 'reason': 'not a DATE'}], 1)
+        mock_write.side_effect = write
+        with tempfile.TemporaryDirectory() as tmp, \
+                patch.dict('os.environ', {'WRITER_SPOOL_DIR': os.path.join(tmp, 'spool'),
+                                          'WRITER_SPOOL_FLUSH_INTERVAL': '3600',
+                                          'WRITER_DEAD_LETTER_PATH': os.path.join(tmp, 'dead.jsonl')}):
+            reset_poison_guard()
+            self.addCleanup(reset_poison_guard)
+            for message_id, rows in (('msg-1', [{'id': '1', 'data': '2024-01-01'}]),
+                                     ('msg-2', [{'id': '2', 'data': 'invalid'}, {'id': '3', 'data': '2024-01-02'}])):
+                self.sample_message.message_id = message_id
+                self.sample_message.data = json.dumps({'rows': [rows], 'file_path': f'{message_id}.xlsx'}).encode('utf-8')
+                self.assertTrue(process_message(self.sample_message))
+
+            spool = get_write_spool(write_spooled_records)
+            self.assertEqual(spool.flush(), 3)
+            self.assertEqual(spool.stats()['segments'], 0)
+            with open(os.path.join(tmp, 'dead.jsonl')) as f:
+                dead = [json.loads(line) for line in f]
+            clear_instances()
+        self.assertEqual([(r['row']['id'], r['message_id'], r['file_path']) for r in dead], [('2', 'msg-2', 'msg-2.xlsx')])
+        written = sorted(row['id'] for call in mock_write.call_args_list[1:] for row in call.args[0]
+                         if row['data'] != 'invalid')
+        self.assertIn('3', written)
+
+    @patch('finance_data_writer.writer.write_to_bigquery')
+    def test_process_message_dead_letters_undecodable_message(self, mock_write):
+        """Testa que uma mensagem que não é JSON é desviada e confirmada, sem nova entrega"""
+        with tempfile.TemporaryDirectory() as tmp, \
+                patch.dict('os.environ', {'WRITER_DEAD_LETTER_PATH': os.path.join(tmp, 'dead.jsonl')}):
+            reset_poison_guard()
+            self.addCleanup(reset_poison_guard)
+            self.sample_message.message_id = 'msg-broken'
+            self.sample_message.data = b'{"rows": ['
+            self.assertTrue(process_message(self.sample_message))
+            with open(os.path.join(tmp, 'dead.jsonl')) as f:
+                dead = json.loads(f.readline())
+        self.sample_message.ack.assert_called_once()
+        mock_write.assert_not_called()
+        self.assertEqual((dead['kind'], dead['data']), ('message', '{"rows": ['))
+
     @patch('os.path.exists')
     @patch('finance_data_writer.writer.pubsub_v1.SubscriberClient')
     def test_main_success(self, mock_subscriber, mock_exists):
@@ -1,28 +1,108 @@
 import os
-from typing import Optional
-from google.cloud import pubsub_v1, bigquery
+import threading
+from typing import Any, Callable, Dict, Optional
+from utils.ingestion_index import create_ingestion_index
+from utils.lazy_import import lazy_import
 from utils.logging_config import setup_logging
+from utils.manifest import create_upload_manifest
+from utils.parse_cache import create_parse_cache
+from utils.rate_limit import create_rate_limiter
+from utils.schema import create_table_schema
+from utils.spool import WriteAheadSpool, create_write_spool
 from utils.telemetry import setup_telemetry
 
+# Clientes pesados: importados apenas quando o primeiro cliente é criado
+pubsub_v1 = lazy_import("google.cloud.pubsub_v1")
+bigquery = lazy_import("google.cloud.bigquery")
+
+# Instâncias compartilhadas por processo (reaproveitadas entre requisições)
+_instances: Dict[str, Any] = {}
+# Reentrante: uma factory pode usar outras (ex.: o dead-letter usa o publisher)
+_instances_lock = threading.RLock()
+# Distingue "ainda não criado" de uma factory que devolveu None (recurso desabilitado)
+_MISSING = object()
+
+def get_or_create(key: str, create: Callable[[], Any]) -> Any:
+    """Cria a instância na primeira chamada e a reaproveita nas seguintes (inclusive None)."""
+    instance = _instances.get(key, _MISSING)
+    if instance is _MISSING:
+        with _instances_lock:
+            instance = _instances.get(key, _MISSING)
+            if instance is _MISSING:
+                instance = create()
+                _instances[key] = instance
+    return instance
+
+def _close(instance: Any):
+    if isinstance(instance, WriteAheadSpool):
+        instance.close()
+
+def discard_instance(key: str):
+    """Descarta uma instância compartilhada; a próxima chamada cria outra."""
+    with _instances_lock:
+        _close(_instances.pop(key, None))
+
+def clear_instances():
+    """Descarta as instâncias compartilhadas (usado em testes)."""
+    with _instances_lock:
+        for instance in _instances.values():
+            _close(instance)
+        _instances.clear()
+
 def get_logger(name: str):
     """Factory para criar instância do logger."""
     return setup_logging(name)
 
 def get_telemetry(service_name: str):
-    """Factory para criar instância do telemetry."""
-    return setup_telemetry(service_name)
+    """Factory para configurar o telemetry uma única vez por serviço."""
+    return get_or_create(f"telemetry:{service_name}", lambda: setup_telemetry(service_name))
+
+def message_ordering_enabled() -> bool:
+    """Publicação com ordering_key por conta (PUBSUB_MESSAGE_ORDERING, ligado por padrão)."""
+    return os.getenv("PUBSUB_MESSAGE_ORDERING", "true").lower() not in ("0", "false", "no")
+
+def _create_pubsub_publisher():
+    if message_ordering_enabled():
+        return pubsub_v1.PublisherClient(
+            publisher_options=pubsub_v1.types.PublisherOptions(enable_message_ordering=True))
+    return pubsub_v1.PublisherClient()
 
 def get_pubsub_publisher():
     """Factory para criar cliente do PubSub Publisher."""
-    return pubsub_v1.PublisherClient()
+    return get_or_create("pubsub_publisher", _create_pubsub_publisher)
 
 def get_pubsub_subscriber():
     """Factory para criar cliente do PubSub Subscriber."""
-    return pubsub_v1.SubscriberClient()
+    return get_or_create("pubsub_subscriber", lambda: pubsub_v1.SubscriberClient())
 
 def get_bigquery_client():
     """Factory para criar cliente do BigQuery."""
-    return bigquery.Client()
+    return get_or_create("bigquery_client", lambda: bigquery.Client())
+
+def get_upload_manifest():
+    """Factory para o manifesto de uploads já processados."""
+    return get_or_create("upload_manifest", create_upload_manifest)
+
+def get_ingestion_index():
+    """Factory para o índice de linhas já ingeridas (modo incremental)."""
+    # O cliente do BigQuery só é criado no primeiro uso do índice
+    return get_or_create("ingestion_index", lambda: create_ingestion_index(get_bigquery_client))
+
+def get_parse_cache():
+    """Factory para o cache de extratos já lidos (None quando desabilitado)."""
+    return get_or_create("parse_cache", create_parse_cache)
+
+def get_write_spool(sink):
+    """Factory para o spool local do writer (None quando WRITER_SPOOL_DIR não está definido)."""
+    return get_or_create("write_spool", lambda: create_write_spool(sink))
+
+def get_rate_limiter():
+    """Factory para os token buckets das chamadas externas (RATE_LIMITS)."""
+    return get_or_create("rate_limiter", create_rate_limiter)
+
+def get_table_schema():
+    """Factory para o schema da tabela do BigQuery, compilado uma vez por processo."""
+    return get_or_create("table_schema", create_table_schema)
 
 def get_topic_path(publisher, project_id: Optional[str] = None, topic_id: Optional[str] = None):
     """Factory para criar path do tópico PubSub."""
@@ -34,4 +114,4 @@ def get_subscription_path(subscriber, project_id: Optional[str] = None, subscrip
     """Factory para criar path da subscription PubSub."""
     project_id = project_id or os.getenv("GOOGLE_CLOUD_PROJECT")
     subscription_id = subscription_id or os.getenv("PUBSUB_SUBSCRIPTION")
-    return subscriber.subscription_path(project_id, subscription_id) 
\ No newline at end of file
+    return subscriber.subscription_path(project_id, subscription_id)
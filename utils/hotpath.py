@@ -0,0 +1,141 @@
+"""Aggregated counters for per-row functions.
+
+A span per row would cost more than the work it measures, so per-row
+helpers are decorated with ``counted`` instead. Outside a ``collect()``
+scope the decorator only checks a thread-local and calls the function.
+Inside a scope it adds the call, its duration and whether it failed to a
+thread-local accumulator; the scope hands back the totals once, to be
+attached to the enclosing span and logged as a single metric.
+
+A failure is an exception or a result rejected by the function's
+``failure`` predicate, e.g. a converter falling back to ``None``.
+``HOTPATH_COUNTERS=false`` turns collection off entirely.
+"""
+import functools
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+# name -> [calls, nanoseconds, failures]
+Counters = Dict[str, List[int]]
+
+_local = threading.local()
+
+
+def counters_enabled() -> bool:
+    return os.getenv("HOTPATH_COUNTERS", "true").lower() not in ("0", "false", "no")
+
+
+def counted(name: Optional[str] = None, failure: Optional[Callable[..., bool]] = None):
+    """Decorate a per-row function so that ``collect()`` scopes count its calls.
+
+    Args:
+        name: Counter name; defaults to the function name.
+        failure: Called as ``failure(result, *args, **kwargs)``; a true value
+            counts the call as failed.
+
+    Returns:
+        The decorator.
+    """
+
+    def decorator(fn):
+        counter_name = name or fn.__name__
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            counters = getattr(_local, "counters", None)
+            if counters is None:
+                return fn(*args, **kwargs)
+            start = time.perf_counter_ns()
+            failed = True
+            try:
+                result = fn(*args, **kwargs)
+                failed = failure is not None and failure(result, *args, **kwargs)
+                return result
+            finally:
+                entry = counters.get(counter_name)
+                if entry is None:
+                    entry = counters[counter_name] = [0, 0, 0]
+                entry[0] += 1
+                entry[1] += time.perf_counter_ns() - start
+                if failed:
+                    entry[2] += 1
+
+        return wrapper
+
+    return decorator
+
+
+def counted_iter(name: str, iterable: Iterable[Any]) -> Iterator[Any]:
+    """Count each ``next()`` of an iterator (e.g. rows produced by a reader)."""
+    counters = getattr(_local, "counters", None)
+    if counters is None:
+        return iter(iterable)
+    return _counted_iter(name, iter(iterable), counters)
+
+
+def _counted_iter(name: str, iterator: Iterator[Any], counters: Counters) -> Iterator[Any]:
+    entry = counters.setdefault(name, [0, 0, 0])
+    while True:
+        start = time.perf_counter_ns()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            entry[1] += time.perf_counter_ns() - start
+            return
+        entry[0] += 1
+        entry[1] += time.perf_counter_ns() - start
+        yield item
+
+
+class HotPathStats:
+    """Totals gathered by one ``collect()`` scope."""
+
+    def __init__(self):
+        self.counters: Counters = {}
+
+    def merge(self, counters: Counters) -> None:
+        """Add counters gathered elsewhere (e.g. in a worker process)."""
+        for name, (calls, nanoseconds, failures) in counters.items():
+            entry = self.counters.setdefault(name, [0, 0, 0])
+            entry[0] += calls
+            entry[1] += nanoseconds
+            entry[2] += failures
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        return {
+            name: {"calls": calls, "time_ms": round(nanoseconds / 1e6, 3), "failures": failures}
+            for name, (calls, nanoseconds, failures) in sorted(self.counters.items())
+        }
+
+    def span_attributes(self, prefix: str = "hotpath") -> Dict[str, float]:
+        attributes = {}
+        for name, stats in self.summary().items():
+            for key, value in stats.items():
+                attributes[f"{prefix}.{name}.{key}"] = value
+        return attributes
+
+
+@contextmanager
+def collect() -> Iterator[HotPathStats]:
+    """Gather counters of the current thread for the duration of the block.
+
+    Nested scopes report their own totals and also add them to the outer
+    scope. When ``HOTPATH_COUNTERS`` is off the scope stays empty.
+    """
+    stats = HotPathStats()
+    if not counters_enabled():
+        yield stats
+        return
+    outer = getattr(_local, "counters", None)
+    _local.counters = stats.counters
+    try:
+        yield stats
+    finally:
+        _local.counters = outer
+        if outer is not None:
+            outer_stats = HotPathStats()
+            outer_stats.counters = outer
+            outer_stats.merge(stats.counters)
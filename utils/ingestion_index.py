@@ -0,0 +1,289 @@
+import hashlib
+import os
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from utils.lazy_import import lazy_import
+
+bigquery = lazy_import("google.cloud.bigquery")
+
+DEFAULT_INDEX_PATH = "/tmp/ingestion_index.sqlite3"
+DEFAULT_INDEX_TABLE = "ingestion_index"
+UNKNOWN_PERIOD = "unknown"
+
+Rows = List[Dict[str, Any]]
+Blocks = List[Rows]
+# (account, period, row_key, row_id, replaced_id): replaced_id is the id the
+# row had before its content changed, None for new rows
+IndexEntry = Tuple[str, str, str, str, Optional[str]]
+
+# Latest entry of each key in an append-only index table
+BIGQUERY_LOAD_QUERY = """
+SELECT row_key, row_id FROM `{table}`
+WHERE account = @account AND period = @period
+QUALIFY ROW_NUMBER() OVER (PARTITION BY row_key ORDER BY recorded_at DESC) = 1
+"""
+
+
+def row_period(row: Dict[str, Any]) -> str:
+    """Return the ``YYYY-MM`` period of a parsed row (``unknown`` if the date is not ISO)."""
+    data = row.get("data")
+    if isinstance(data, str) and len(data) >= 7 and data[4] == "-":
+        return data[:7]
+    return UNKNOWN_PERIOD
+
+
+def assign_row_keys(rows: Iterable[Dict[str, Any]]) -> List[Tuple[Dict[str, Any], str]]:
+    """Pair each row with its natural key.
+
+    The natural key identifies a transaction independently of its amount:
+    date, description and account, plus an ordinal that tells apart identical
+    purchases in the same statement. When the amount of a known transaction
+    changes, its key stays the same while its ``id`` (content hash) changes.
+
+    Args:
+        rows: Parsed rows, in statement order.
+
+    Returns:
+        ``(row, key)`` pairs in the same order.
+    """
+    seen: Dict[str, int] = defaultdict(int)
+    keyed = []
+    for row in rows:
+        base = f"{row.get('data')}|{row.get('descricao')}|{row.get('account')}"
+        ordinal = seen[base]
+        seen[base] += 1
+        key = hashlib.md5(f"{base}|{ordinal}".encode()).hexdigest()  # nosec B324 - not used for security
+        keyed.append((row, key))
+    return keyed
+
+
+def instance_ids(rows: Iterable[Dict[str, Any]]) -> List[str]:
+    """Return an id per transaction: the row ``id`` qualified by its ordinal.
+
+    The row ``id`` is a content hash, so identical purchases on the same day
+    share it. The first occurrence keeps the plain id (ids recorded earlier
+    stay valid) and the following ones get ``<id>:<n>``. Compute it once over
+    a whole message so the ids do not change when the rows are split.
+
+    Args:
+        rows: Rows of one message, in publish order.
+
+    Returns:
+        The instance ids, in the same order.
+    """
+    seen: Dict[Any, int] = defaultdict(int)
+    ids = []
+    for row in rows:
+        row_id = row.get("id")
+        ordinal = seen[row_id]
+        seen[row_id] += 1
+        ids.append(row_id if not ordinal else f"{row_id}:{ordinal}")
+    return ids
+
+
+class IngestionIndexBackend(ABC):
+    """Storage of ingested row ids per account and period."""
+
+    @abstractmethod
+    def load(self, account: str, period: str) -> Dict[str, str]:
+        """Return ``{row_key: row_id}`` for one account and period."""
+
+    @abstractmethod
+    def upsert(self, entries: List[IndexEntry]) -> None:
+        """Store ``(account, period, row_key, row_id, replaced_id)`` entries."""
+
+
+class InMemoryIngestionIndexBackend(IngestionIndexBackend):
+    def __init__(self):
+        self._entries: Dict[Tuple[str, str], Dict[str, str]] = defaultdict(dict)
+        self._lock = threading.Lock()
+
+    def load(self, account, period):
+        with self._lock:
+            return dict(self._entries.get((account, period), {}))
+
+    def upsert(self, entries):
+        with self._lock:
+            for account, period, row_key, row_id, _ in entries:
+                self._entries[(account, period)][row_key] = row_id
+
+
+class SQLiteIngestionIndexBackend(IngestionIndexBackend):
+    def __init__(self, path: str = DEFAULT_INDEX_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS ingested_rows ("
+            " account TEXT NOT NULL, period TEXT NOT NULL, row_key TEXT NOT NULL, row_id TEXT NOT NULL,"
+            " PRIMARY KEY (account, period, row_key))"
+        )
+        self._conn.commit()
+
+    def load(self, account, period):
+        with self._lock:
+            return dict(self._conn.execute(
+                "SELECT row_key, row_id FROM ingested_rows WHERE account = ? AND period = ?",
+                (account, period),
+            ).fetchall())
+
+    def upsert(self, entries):
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO ingested_rows (account, period, row_key, row_id) VALUES (?, ?, ?, ?)",
+                [entry[:4] for entry in entries],
+            )
+            self._conn.commit()
+
+
+class BigQueryIngestionIndexBackend(IngestionIndexBackend):
+    """Index kept in a BigQuery table, shared by every reader and writer instance.
+
+    The local backends live in each Cloud Function instance's ``/tmp``, so
+    the reader never sees what the writer recorded. This one is append-only
+    (streaming inserts, no DML, so rows in the streaming buffer are never
+    updated): ``upsert`` adds entries stamped with ``recorded_at`` and
+    ``load`` keeps the latest entry of each key. ``replaced_id`` is stored
+    too, so the ``<table>_current`` view can hide rows superseded by a
+    corrected re-upload.
+
+    Args:
+        client: BigQuery client, or a callable returning one on first use.
+        table: Fully qualified index table; defaults to
+            ``<project>.<BIGQUERY_DATASET>.ingestion_index``.
+    """
+
+    def __init__(self, client: Any, table: Optional[str] = None):
+        self._client = client
+        self._table = table
+
+    @property
+    def client(self):
+        if callable(self._client):
+            self._client = self._client()
+        return self._client
+
+    @property
+    def table(self) -> str:
+        if self._table is None:
+            self._table = f"{self.client.project}.{os.getenv('BIGQUERY_DATASET')}.{DEFAULT_INDEX_TABLE}"
+        return self._table
+
+    def load(self, account, period):
+        job_config = bigquery.QueryJobConfig(query_parameters=[
+            bigquery.ScalarQueryParameter("account", "STRING", account),
+            bigquery.ScalarQueryParameter("period", "STRING", period),
+        ])
+        result = self.client.query(BIGQUERY_LOAD_QUERY.format(table=self.table), job_config=job_config).result()
+        return {row["row_key"]: row["row_id"] for row in result}
+
+    def upsert(self, entries):
+        recorded_at = datetime.now(timezone.utc).isoformat()
+        rows = [{"account": account, "period": period, "row_key": row_key, "row_id": row_id,
+                 "replaced_id": replaced_id, "recorded_at": recorded_at}
+                for account, period, row_key, row_id, replaced_id in entries]
+        # insertId per entry: a redelivered message does not duplicate entries
+        errors = self.client.insert_rows_json(
+            self.table, rows, row_ids=["|".join(map(str, entry[:4])) for entry in entries])
+        if errors:
+            raise RuntimeError(f"Errors writing ingestion index: {errors}")
+
+
+INGESTION_INDEX_BACKENDS = {
+    "sqlite": lambda client: SQLiteIngestionIndexBackend(os.getenv("INGESTION_INDEX_PATH", DEFAULT_INDEX_PATH)),
+    "memory": lambda client: InMemoryIngestionIndexBackend(),
+    "bigquery": lambda client: BigQueryIngestionIndexBackend(client, os.getenv("INGESTION_INDEX_TABLE") or None),
+}
+
+
+class IngestionIndex:
+    """Index of already-ingested rows used by the incremental mode.
+
+    The reader calls ``diff_blocks`` to keep only new or changed rows before
+    publishing, and the writer calls ``record`` once those rows were written.
+    Reader and writer run in different instances, so in deployment both
+    must use the shared ``bigquery`` backend. Each ``(account, period)``
+    partition is loaded with a single lookup.
+    """
+
+    def __init__(self, backend: IngestionIndexBackend):
+        self.backend = backend
+
+    def diff_blocks(self, blocks: Blocks) -> Tuple[Blocks, Dict[str, int], List[IndexEntry]]:
+        """Drop rows that were already ingested with the same content.
+
+        Row keys depend on the position of a row among identical rows of the
+        whole statement, so they are computed here and handed to the writer
+        as index entries instead of being recomputed from the published subset.
+
+        Args:
+            blocks: Blocks returned by ``convert_data``.
+
+        Returns:
+            The filtered blocks (empty blocks removed), counters ``total``,
+            ``new``, ``changed`` and ``unchanged``, and the index entries of
+            the rows that were kept, to be passed to ``record`` after the write.
+            Entries of changed rows carry the id they replace.
+        """
+        stats = {"total": 0, "new": 0, "changed": 0, "unchanged": 0}
+        partitions: Dict[Tuple[str, str], Dict[str, str]] = {}
+        keep = set()
+        entries: List[IndexEntry] = []
+        for row, key in assign_row_keys(row for block in blocks for row in block):
+            partition = (row.get("account"), row_period(row))
+            if partition not in partitions:
+                partitions[partition] = self.backend.load(*partition)
+            known_id = partitions[partition].get(key)
+            stats["total"] += 1
+            if known_id is None:
+                stats["new"] += 1
+            elif known_id != row.get("id"):
+                stats["changed"] += 1
+            else:
+                stats["unchanged"] += 1
+                continue
+            keep.add(id(row))
+            entries.append((partition[0], partition[1], key, row.get("id"), known_id))
+
+        filtered = [[row for row in block if id(row) in keep] for block in blocks]
+        return [block for block in filtered if block], stats, entries
+
+    def record(self, entries: Iterable[Sequence[Optional[str]]]) -> int:
+        """Register the entries of rows that were successfully written; returns how many."""
+        # Messages published before replaced ids were tracked carry 4 fields
+        entries = [(*entry[:4], entry[4] if len(entry) > 4 else None) for entry in entries]
+        if entries:
+            self.backend.upsert(entries)
+        return len(entries)
+
+
+def replaced_ids(entries: Iterable[Sequence[Optional[str]]]) -> List[str]:
+    """Ids of rows superseded by the rows of ``entries`` (changed amounts)."""
+    return [entry[4] for entry in entries if len(entry) > 4 and entry[4] and entry[4] != entry[3]]
+
+
+def create_ingestion_index(client: Optional[Callable[[], Any]] = None) -> IngestionIndex:
+    """Build the index from ``INGESTION_INDEX_BACKEND`` (``sqlite``, ``memory`` or ``bigquery``).
+
+    Args:
+        client: BigQuery client factory for the ``bigquery`` backend, called on first use.
+
+    Raises:
+        ValueError: If the backend is unknown, or is ``sqlite`` on Cloud Functions
+            (``K_SERVICE`` set), where each instance would keep its own file.
+    """
+    backend_name = os.getenv("INGESTION_INDEX_BACKEND", "sqlite")
+    if backend_name not in INGESTION_INDEX_BACKENDS:
+        raise ValueError(f"Unknown ingestion index backend: {backend_name}")
+    if backend_name == "sqlite" and os.getenv("K_SERVICE"):
+        raise ValueError(
+            "INGESTION_INDEX_BACKEND=sqlite is local to each instance; "
+            "set INGESTION_INDEX_BACKEND=bigquery on Cloud Functions"
+        )
+    return IngestionIndex(INGESTION_INDEX_BACKENDS[backend_name](client))
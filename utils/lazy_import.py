@@ -0,0 +1,37 @@
+import importlib.util
+import sys
+from types import ModuleType
+
+
+def lazy_import(name: str) -> ModuleType:
+    """Return a module whose import is deferred until first attribute access.
+
+    Heavy dependencies (pandas, the Google Cloud clients, the Cloud Trace
+    exporter) are bound at module level with this helper so that importing a
+    function entry point does not pay for them. The module is registered in
+    ``sys.modules``, so later regular imports and ``unittest.mock.patch``
+    targets resolve to the same object.
+
+    Args:
+        name: Fully qualified module name, e.g. ``"google.cloud.bigquery"``.
+
+    Returns:
+        The (possibly not yet executed) module.
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ModuleNotFoundError(f"No module named '{name}'", name=name)
+
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+
+    parent_name, _, child_name = name.rpartition(".")
+    if parent_name:
+        setattr(sys.modules[parent_name], child_name, module)
+    return module
@@ -0,0 +1,268 @@
+import base64
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Callable, Dict, Optional
+
+STATUS_PROCESSING = "processing"
+STATUS_DONE = "done"
+
+DEFAULT_MANIFEST_PATH = "/tmp/upload_manifest.sqlite3"
+DEFAULT_CLAIM_TTL = 600.0
+
+
+def content_key(md5_hash: Optional[str] = None, generation: Optional[str] = None,
+                bucket: Optional[str] = None, name: Optional[str] = None) -> Optional[str]:
+    """Build the manifest key for an uploaded object.
+
+    The GCS ``md5Hash`` identifies the content regardless of the object name,
+    so it is preferred. Without it, the object generation identifies one
+    specific upload, which still collapses duplicate finalize events.
+
+    Args:
+        md5_hash: Base64 MD5 of the object content, as reported by GCS.
+        generation: Object generation.
+        bucket: Bucket name (used with ``generation``).
+        name: Object name (used with ``generation``).
+
+    Returns:
+        The key, or None when the event carries nothing to key on.
+    """
+    if md5_hash:
+        return f"md5:{md5_hash}"
+    if generation and bucket and name:
+        return f"gen:{bucket}/{name}#{generation}"
+    return None
+
+
+def file_content_key(path: str, chunk_size: int = 1024 * 1024) -> Optional[str]:
+    """Compute the content key of a local file, compatible with GCS ``md5Hash``.
+
+    Args:
+        path: Local file path.
+        chunk_size: Read size; the file is hashed in streaming fashion.
+
+    Returns:
+        The key, or None if the file cannot be read.
+    """
+    digest = hashlib.md5()  # nosec B324 - content addressing, same digest as GCS md5Hash
+    try:
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(chunk_size), b""):
+                digest.update(chunk)
+    except OSError:
+        return None
+    return content_key(md5_hash=base64.b64encode(digest.digest()).decode("ascii"))
+
+
+class ManifestBackend(ABC):
+    """Storage for manifest entries and skip counters.
+
+    Every operation is keyed, so implementations are expected to be O(1).
+    """
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return the entry for ``key`` (with ``status`` and ``updated_at``) or None."""
+
+    @abstractmethod
+    def insert_if_absent(self, key: str, status: str, info: Dict[str, Any]) -> bool:
+        """Atomically create the entry; return False if it already exists."""
+
+    @abstractmethod
+    def replace_if(self, key: str, expected_updated_at: float, status: str, info: Dict[str, Any]) -> bool:
+        """Overwrite the entry only if it was not modified since ``expected_updated_at``."""
+
+    @abstractmethod
+    def put(self, key: str, status: str, info: Dict[str, Any]) -> None:
+        """Create or overwrite the entry."""
+
+    @abstractmethod
+    def delete(self, key: str, status: Optional[str] = None) -> None:
+        """Delete the entry (only if it has ``status``, when given)."""
+
+    @abstractmethod
+    def increment_skip(self, stage: str) -> int:
+        """Increment and return the skip counter of ``stage``."""
+
+    @abstractmethod
+    def skip_counts(self) -> Dict[str, int]:
+        """Return all skip counters."""
+
+
+class InMemoryManifestBackend(ManifestBackend):
+    """Process-local backend, mostly for tests and local runs."""
+
+    def __init__(self):
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        self._skips: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        return dict(entry) if entry else None
+
+    def insert_if_absent(self, key, status, info):
+        with self._lock:
+            if key in self._entries:
+                return False
+            self._entries[key] = {"status": status, "updated_at": time.time(), **info}
+            return True
+
+    def replace_if(self, key, expected_updated_at, status, info):
+        with self._lock:
+            entry = self._entries.get(key)
+            if not entry or entry["updated_at"] != expected_updated_at:
+                return False
+            self._entries[key] = {"status": status, "updated_at": time.time(), **info}
+            return True
+
+    def put(self, key, status, info):
+        with self._lock:
+            self._entries[key] = {"status": status, "updated_at": time.time(), **info}
+
+    def delete(self, key, status=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and (status is None or entry["status"] == status):
+                del self._entries[key]
+
+    def increment_skip(self, stage):
+        with self._lock:
+            self._skips[stage] = self._skips.get(stage, 0) + 1
+            return self._skips[stage]
+
+    def skip_counts(self):
+        return dict(self._skips)
+
+
+class SQLiteManifestBackend(ManifestBackend):
+    """Backend stored in a local SQLite file (primary key lookups)."""
+
+    def __init__(self, path: str = DEFAULT_MANIFEST_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS manifest ("
+            " key TEXT PRIMARY KEY, status TEXT NOT NULL, updated_at REAL NOT NULL, info TEXT)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS skips (stage TEXT PRIMARY KEY, count INTEGER NOT NULL)"
+        )
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT status, updated_at, info FROM manifest WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {"status": row[0], "updated_at": row[1], **json.loads(row[2] or "{}")}
+
+    def insert_if_absent(self, key, status, info):
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT OR IGNORE INTO manifest (key, status, updated_at, info) VALUES (?, ?, ?, ?)",
+                (key, status, time.time(), json.dumps(info)),
+            )
+        return cursor.rowcount == 1
+
+    def replace_if(self, key, expected_updated_at, status, info):
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE manifest SET status = ?, updated_at = ?, info = ? WHERE key = ? AND updated_at = ?",
+                (status, time.time(), json.dumps(info), key, expected_updated_at),
+            )
+        return cursor.rowcount == 1
+
+    def put(self, key, status, info):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO manifest (key, status, updated_at, info) VALUES (?, ?, ?, ?)",
+                (key, status, time.time(), json.dumps(info)),
+            )
+
+    def delete(self, key, status=None):
+        with self._lock:
+            if status is None:
+                self._conn.execute("DELETE FROM manifest WHERE key = ?", (key,))
+            else:
+                self._conn.execute("DELETE FROM manifest WHERE key = ? AND status = ?", (key, status))
+
+    def increment_skip(self, stage):
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO skips (stage, count) VALUES (?, 1)"
+                " ON CONFLICT(stage) DO UPDATE SET count = count + 1",
+                (stage,),
+            )
+            return self._conn.execute("SELECT count FROM skips WHERE stage = ?", (stage,)).fetchone()[0]
+
+    def skip_counts(self):
+        with self._lock:
+            return dict(self._conn.execute("SELECT stage, count FROM skips").fetchall())
+
+
+MANIFEST_BACKENDS: Dict[str, Callable[[], ManifestBackend]] = {
+    "sqlite": lambda: SQLiteManifestBackend(os.getenv("UPLOAD_MANIFEST_PATH", DEFAULT_MANIFEST_PATH)),
+    "memory": InMemoryManifestBackend,
+}
+
+
+class UploadManifest:
+    """File-level manifest used to skip statements that were already ingested.
+
+    The trigger ``claim``s a key before calling the reader, so duplicate
+    finalize events for the same content are dropped while the first one is
+    in flight. The reader skips keys that are ``done`` and marks them done
+    after publishing. Claims older than ``claim_ttl`` seconds are considered
+    abandoned and can be taken over.
+    """
+
+    def __init__(self, backend: ManifestBackend, claim_ttl: float = DEFAULT_CLAIM_TTL):
+        self.backend = backend
+        self.claim_ttl = claim_ttl
+
+    def is_done(self, key: str) -> bool:
+        entry = self.backend.get(key)
+        return bool(entry) and entry["status"] == STATUS_DONE
+
+    def claim(self, key: str, **info) -> bool:
+        """Try to take ownership of ``key``; False means it is known (done or in flight)."""
+        if self.backend.insert_if_absent(key, STATUS_PROCESSING, info):
+            return True
+        entry = self.backend.get(key)
+        if entry is None:
+            return self.backend.insert_if_absent(key, STATUS_PROCESSING, info)
+        if entry["status"] == STATUS_PROCESSING and time.time() - entry["updated_at"] > self.claim_ttl:
+            return self.backend.replace_if(key, entry["updated_at"], STATUS_PROCESSING, info)
+        return False
+
+    def release(self, key: str) -> None:
+        """Drop an unfinished claim so that a retry can process the file."""
+        self.backend.delete(key, status=STATUS_PROCESSING)
+
+    def mark_done(self, key: str, **info) -> None:
+        self.backend.put(key, STATUS_DONE, info)
+
+    def record_skip(self, stage: str) -> int:
+        """Count a skipped duplicate at ``stage`` and return the stage total."""
+        return self.backend.increment_skip(stage)
+
+    def skip_counts(self) -> Dict[str, int]:
+        return self.backend.skip_counts()
+
+
+def create_upload_manifest() -> UploadManifest:
+    """Build the manifest from ``UPLOAD_MANIFEST_BACKEND`` (``sqlite`` or ``memory``)."""
+    backend_name = os.getenv("UPLOAD_MANIFEST_BACKEND", "sqlite")
+    if backend_name not in MANIFEST_BACKENDS:
+        raise ValueError(f"Unknown upload manifest backend: {backend_name}")
+    claim_ttl = float(os.getenv("UPLOAD_MANIFEST_CLAIM_TTL", DEFAULT_CLAIM_TTL))
+    return UploadManifest(MANIFEST_BACKENDS[backend_name](), claim_ttl=claim_ttl)
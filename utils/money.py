@@ -0,0 +1,111 @@
+"""Monetary amounts as integer cents.
+
+Statements carry amounts as Brazilian-formatted text (``R$ -1.234,56``) or as
+numeric spreadsheet cells. Both are converted once, at parse time, to an
+``int`` number of cents, which is what every later stage carries: JSON
+messages, the spool, the Parquet archive, rollups and installment
+projections. Sums and comparisons are exact and cheap, and JSON keeps the
+type (an amount that decodes as ``float`` predates this representation and
+is in reais).
+
+``parse_brl`` only does string slicing and ``int()`` on ASCII digits, so it
+can be mapped over a whole column without creating floats or ``Decimal``
+objects. Row ids are hashed from ``legacy_amount_text`` of the original cell,
+the exact text the reader hashed before amounts were carried as cents, so
+re-ingesting a statement produces the ids already stored.
+"""
+from decimal import ROUND_HALF_EVEN, Decimal
+from typing import Any, Optional
+
+
+def _round_half_even(cents: int, rest: str) -> int:
+    """Round ``cents`` by the digits that follow the second decimal place."""
+    if not rest or rest[0] < "5":
+        return cents
+    if rest[0] > "5" or rest[1:].strip("0") or cents % 2:
+        return cents + 1
+    return cents
+
+
+def parse_brl(text: str) -> Optional[int]:
+    """Parse a Brazilian amount (``R$ 1.234,56``, ``-10,5``, ``1.000``) into cents.
+
+    ``.`` is the thousands separator and ``,`` the decimal separator; digits
+    beyond the second decimal place are rounded half to even.
+
+    Returns:
+        The amount in cents, or ``None`` when the text is not an amount.
+    """
+    text = text.replace("R$", "").replace("\xa0", "").replace(" ", "")
+    negative = text.startswith("-")
+    if negative or text.startswith("+"):
+        text = text[1:]
+    whole, _, fraction = text.partition(",")
+    whole = whole.replace(".", "")
+    if not (whole or fraction) or not (whole + fraction).isascii() or not (whole + fraction).isdigit():
+        return None
+    cents = int(whole or "0") * 100 + int(fraction[:2].ljust(2, "0"))
+    cents = _round_half_even(cents, fraction[2:])
+    return -cents if negative else cents
+
+
+def to_cents(value: Any) -> Optional[int]:
+    """Convert a parsed cell (text, number or ``Decimal`` in reais) into cents.
+
+    Returns:
+        The amount in cents, or ``None`` for empty or unparseable values.
+    """
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, str):
+        return parse_brl(value)
+    if isinstance(value, int):
+        return value * 100
+    if isinstance(value, float):
+        return round(value * 100) if value == value and abs(value) != float("inf") else None
+    if isinstance(value, Decimal):
+        return int((value * 100).to_integral_value(ROUND_HALF_EVEN)) if value.is_finite() else None
+    return None
+
+
+def is_cents(value: Any) -> bool:
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def cents_to_decimal(cents: int) -> Decimal:
+    """Exact amount in reais."""
+    return Decimal(cents).scaleb(-2)
+
+
+def legacy_amount_text(cell: Any) -> str:
+    """Text the reader hashed for an amount cell before amounts were cents.
+
+    Text cells went through ``float`` after dropping ``R$``, ``.`` and
+    swapping ``,`` for ``.`` (``"R$ 1.234,56"`` -> ``"1234.56"``, no
+    rounding, ``"None"`` when that fails); OFX amounts, now ``Decimal``,
+    were parsed as ``float``; any other cell was hashed as is (``150`` ->
+    ``"150"``, ``150.0`` -> ``"150.0"``).
+    """
+    if isinstance(cell, str):
+        try:
+            return str(float(cell.replace("R$", "").strip().replace(".", "").replace(",", ".")))
+        except ValueError:
+            return "None"
+    if isinstance(cell, Decimal):
+        return str(float(cell))
+    return str(cell)
+
+
+def cents_text(value: Any) -> str:
+    """Text of an amount in cents, rendered like ``str(float)`` of the amount in reais.
+
+    ``123456`` -> ``"1234.56"``, ``15000`` -> ``"150.0"``. Other values fall
+    back to ``str``.
+    """
+    if not is_cents(value):
+        return str(value)
+    whole, fraction = divmod(abs(value), 100)
+    text = f"{whole}.{fraction:02d}".rstrip("0")
+    if text.endswith("."):
+        text += "0"
+    return f"-{text}" if value < 0 else text
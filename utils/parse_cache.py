@@ -0,0 +1,159 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import zlib
+from typing import Any, Dict, List, Optional
+
+DEFAULT_CACHE_DIR = "/tmp/parse_cache"
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+CACHE_SUFFIX = ".json.z"
+
+Blocks = List[List[Dict[str, Any]]]
+
+
+def parse_cache_key(file_path: str, content_hash: Optional[str], generation: Optional[str] = None,
+                    **options: Any) -> Optional[str]:
+    """Build the cache key of a parse result.
+
+    Args:
+        file_path: Path of the parsed file.
+        content_hash: Content key of the file (see ``utils.manifest``).
+        generation: Object generation, when known.
+        **options: Parse options that change the result (sheets, layout...).
+
+    Returns:
+        A hex key, or None when the content cannot be identified (no caching).
+    """
+    if not content_hash and not generation:
+        return None
+    material = json.dumps([file_path, content_hash, generation, options], sort_keys=True, default=str)
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+def encode_blocks(blocks: Blocks) -> bytes:
+    """Serialize blocks column by column and compress them.
+
+    Rows of a block share the same fields, so each block is stored as its
+    field names plus one value list per field. Blocks whose rows have
+    different fields are kept row by row.
+    """
+    encoded = []
+    for block in blocks:
+        columns = list(block[0]) if block else []
+        if all(list(row) == columns for row in block):
+            encoded.append({"columns": columns,
+                            "values": [[row[column] for row in block] for column in columns]})
+        else:
+            encoded.append({"rows": block})
+    return zlib.compress(json.dumps(encoded, separators=(",", ":")).encode("utf-8"))
+
+
+def decode_blocks(payload: bytes) -> Blocks:
+    """Inverse of ``encode_blocks``."""
+    blocks = []
+    for block in json.loads(zlib.decompress(payload)):
+        if "rows" in block:
+            blocks.append(block["rows"])
+        else:
+            blocks.append([dict(zip(block["columns"], values)) for values in zip(*block["values"])])
+    return blocks
+
+
+class ParseCache:
+    """Bounded on-disk cache of parsed statements.
+
+    Entries are written atomically and evicted least-recently-used first once
+    the directory exceeds ``max_bytes``. Hit and miss counters are kept per
+    process and exposed through ``stats``.
+    """
+
+    def __init__(self, directory: str = DEFAULT_CACHE_DIR, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key + CACHE_SUFFIX)
+
+    def get(self, key: str) -> Optional[Blocks]:
+        """Return the cached blocks for ``key`` or None."""
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                blocks = decode_blocks(f.read())
+            os.utime(path)
+        except (OSError, ValueError, zlib.error):
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return blocks
+
+    def put(self, key: str, blocks: Blocks) -> int:
+        """Store the blocks for ``key`` and return the entry size in bytes."""
+        payload = encode_blocks(blocks)
+        if len(payload) > self.max_bytes:
+            return 0
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(payload)
+            os.replace(tmp_path, self._path(key))
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self._evict()
+        return len(payload)
+
+    def delete(self, key: str) -> None:
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def _entries(self) -> List[os.DirEntry]:
+        with os.scandir(self.directory) as it:
+            return [entry for entry in it if entry.name.endswith(CACHE_SUFFIX)]
+
+    def size_bytes(self) -> int:
+        return sum(entry.stat().st_size for entry in self._entries())
+
+    def _evict(self) -> None:
+        with self._lock:
+            entries = []
+            for entry in self._entries():
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    continue
+                total -= size
+                self.evictions += 1
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
+
+def create_parse_cache() -> Optional[ParseCache]:
+    """Build the cache from ``PARSE_CACHE_DIR`` and ``PARSE_CACHE_MAX_BYTES`` (0 disables it)."""
+    max_bytes = int(os.getenv("PARSE_CACHE_MAX_BYTES", DEFAULT_MAX_BYTES))
+    if max_bytes <= 0:
+        return None
+    return ParseCache(os.getenv("PARSE_CACHE_DIR", DEFAULT_CACHE_DIR), max_bytes)
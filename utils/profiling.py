@@ -0,0 +1,182 @@
+import cProfile
+import functools
+import io
+import json
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+from datetime import datetime, UTC
+from typing import Any, Callable, Dict, List, Optional
+
+from utils.logging_config import setup_logging
+
+# Modes accepted in PROFILE_INVOCATIONS
+PROFILE_MODE_OFF = "off"
+PROFILE_MODE_ALWAYS = "always"
+PROFILE_MODE_HEADER = "header"
+
+PROFILE_HEADER = "X-Profile-Invocation"
+PROFILE_ATTRIBUTE = "profile"
+
+logger = setup_logging(__name__)
+
+# cProfile cannot reliably run overlapping profiles in the same process
+_profile_lock = threading.Lock()
+
+
+def get_profile_mode() -> str:
+    """Return the profiling mode configured in ``PROFILE_INVOCATIONS``.
+
+    Returns:
+        One of ``off`` (default), ``always`` or ``header``. Unknown values
+        are treated as ``off``.
+    """
+    mode = os.getenv("PROFILE_INVOCATIONS", PROFILE_MODE_OFF).strip().lower()
+    if mode in (PROFILE_MODE_ALWAYS, PROFILE_MODE_HEADER):
+        return mode
+    return PROFILE_MODE_OFF
+
+
+def _is_truthy(value: Any) -> bool:
+    return str(value).strip().lower() in ("1", "true", "yes", "on")
+
+
+def request_wants_profile(request, *args, **kwargs) -> bool:
+    """Check the ``X-Profile-Invocation`` header of an HTTP request."""
+    headers = getattr(request, "headers", None) or {}
+    return _is_truthy(headers.get(PROFILE_HEADER, ""))
+
+
+def message_wants_profile(message, *args, **kwargs) -> bool:
+    """Check the ``profile`` attribute of a Pub/Sub message."""
+    attributes = getattr(message, "attributes", None) or {}
+    return _is_truthy(attributes.get(PROFILE_ATTRIBUTE, ""))
+
+
+class InvocationProfiler:
+    """Context manager that profiles a block with cProfile and tracemalloc.
+
+    On exit, a compact summary (top functions by cumulative time, peak traced
+    memory and top allocations by line) is logged and, when
+    ``PROFILE_OUTPUT_DIR`` is set, written to a JSON file in that directory.
+    """
+
+    def __init__(self, name: str, top: Optional[int] = None):
+        self.name = name
+        self.top = top or int(os.getenv("PROFILE_TOP_N", "15"))
+        self.summary: Optional[Dict[str, Any]] = None
+        self._profile: Optional[cProfile.Profile] = None
+        self._started_tracemalloc = False
+        self._start = 0.0
+
+    def __enter__(self):
+        if not _profile_lock.acquire(blocking=False):
+            # Another invocation is already being profiled
+            return self
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracemalloc = True
+        tracemalloc.reset_peak()
+        self._profile = cProfile.Profile()
+        self._start = time.perf_counter()
+        self._profile.enable()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._profile is None:
+            return False
+        try:
+            self._profile.disable()
+            duration = time.perf_counter() - self._start
+            _, peak = tracemalloc.get_traced_memory()
+            snapshot = tracemalloc.take_snapshot()
+            if self._started_tracemalloc:
+                tracemalloc.stop()
+            self.summary = {
+                "name": self.name,
+                "duration": duration,
+                "peak_memory_kb": round(peak / 1024, 1),
+                "top_functions": self._top_functions(),
+                "top_allocations": self._top_allocations(snapshot),
+            }
+            self._emit()
+        finally:
+            self._profile = None
+            _profile_lock.release()
+        return False
+
+    def _top_functions(self) -> List[Dict[str, Any]]:
+        stats = pstats.Stats(self._profile, stream=io.StringIO())
+        stats.sort_stats(pstats.SortKey.CUMULATIVE)
+        functions = []
+        for func in stats.fcn_list[:self.top]:
+            _, ncalls, tottime, cumtime, _ = stats.stats[func]
+            filename, line, function_name = func
+            functions.append({
+                "function": f"{filename}:{line}({function_name})",
+                "ncalls": ncalls,
+                "tottime": round(tottime, 6),
+                "cumtime": round(cumtime, 6),
+            })
+        return functions
+
+    def _top_allocations(self, snapshot) -> List[Dict[str, Any]]:
+        snapshot = snapshot.filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__),
+        ))
+        allocations = []
+        for stat in snapshot.statistics("lineno")[:self.top]:
+            frame = stat.traceback[0]
+            allocations.append({
+                "location": f"{frame.filename}:{frame.lineno}",
+                "size_kb": round(stat.size / 1024, 1),
+                "count": stat.count,
+            })
+        return allocations
+
+    def _emit(self) -> None:
+        logger.info("Invocation profile", extra={"profile": self.summary})
+        output_dir = os.getenv("PROFILE_OUTPUT_DIR")
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+            timestamp = datetime.now(UTC).strftime("%Y%m%dT%H%M%S%f")
+            path = os.path.join(output_dir, f"{self.name}-{timestamp}-{os.getpid()}.json")
+            with open(path, "w") as f:
+                json.dump(self.summary, f, indent=2)
+            self.summary["output_file"] = path
+
+
+def profile_invocation(name: str, wants_profile: Optional[Callable[..., bool]] = None):
+    """Decorate a function so that its invocations can be profiled.
+
+    The mode is read once, when the function is decorated. With profiling
+    off (the default) the original function is returned untouched, so there
+    is no overhead at all.
+
+    Args:
+        name: Name used in the summary and in the output file.
+        wants_profile: Called with the invocation arguments in ``header`` mode
+            to decide whether this particular invocation is profiled.
+
+    Returns:
+        The decorator.
+    """
+    mode = get_profile_mode()
+
+    def decorator(fn):
+        if mode == PROFILE_MODE_OFF:
+            return fn
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if mode == PROFILE_MODE_HEADER and not (wants_profile and wants_profile(*args, **kwargs)):
+                return fn(*args, **kwargs)
+            with InvocationProfiler(name):
+                return fn(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
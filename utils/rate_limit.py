@@ -0,0 +1,168 @@
+"""Process-wide token buckets for outbound calls.
+
+During bursts every reader and writer thread calls Pub/Sub and BigQuery at
+once, trips quota errors and retries in lockstep. Outbound calls instead
+acquire a token from a bucket per API (``bigquery.insert``,
+``pubsub.publish``, ``reader.invoke``) and, optionally, from a bucket per
+resource of that API (a table, a topic, a function URL). Callers wait for
+their turn up front instead of failing and retrying together.
+
+Acquiring reserves the token immediately and returns how long the caller
+has to wait for it, so concurrent callers are spaced ``1 / rate`` apart in
+arrival order rather than all waking up when a token frees up.
+
+Buckets are configured by ``RATE_LIMITS``, a comma-separated list of
+``api[:resource]=rate[/burst]`` entries (tokens per second, burst defaults
+to one second worth of tokens)::
+
+    RATE_LIMITS=bigquery.insert=20/40,bigquery.insert:proj.ds.table=5,pubsub.publish=100
+
+APIs or resources without an entry are not limited. Waits are logged as
+``SLI: rate_limit_wait``.
+"""
+import asyncio
+import os
+import threading
+import time
+from typing import Callable, Dict, Optional, Tuple
+
+from utils.logging_config import setup_logging
+
+logger = setup_logging(__name__)
+
+
+class RateLimitTimeout(TimeoutError):
+    """The token would not be available within the caller's timeout."""
+
+
+class TokenBucket:
+    """Thread-safe token bucket with reservations.
+
+    Args:
+        rate: Tokens added per second.
+        burst: Bucket capacity; defaults to ``max(1, rate)``.
+        clock: Monotonic clock, injectable for tests.
+    """
+
+    def __init__(self, rate: float, burst: Optional[float] = None,
+                 clock: Callable[[], float] = time.monotonic):
+        if rate <= 0:
+            raise ValueError(f"Rate must be positive, got {rate}")
+        self.rate = rate
+        self.burst = burst if burst is not None else max(1.0, rate)
+        self.clock = clock
+        self._tokens = self.burst
+        self._updated = clock()
+        self._lock = threading.Lock()
+        self._stats = {"acquired": 0, "waited": 0, "wait_s": 0.0, "max_wait_s": 0.0}
+
+    def reserve(self, tokens: float = 1, timeout: Optional[float] = None) -> float:
+        """Take ``tokens`` now and return how long to wait before using them.
+
+        Args:
+            tokens: Tokens to take.
+            timeout: Maximum acceptable wait; larger waits reserve nothing.
+
+        Returns:
+            Seconds to wait (0 when tokens were available).
+
+        Raises:
+            RateLimitTimeout: If the wait would exceed ``timeout``.
+        """
+        with self._lock:
+            now = self.clock()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            wait = max(0.0, (tokens - self._tokens) / self.rate)
+            if timeout is not None and wait > timeout:
+                raise RateLimitTimeout(f"Rate limit wait of {wait:.3f}s exceeds timeout of {timeout:.3f}s")
+            # The balance may go negative: later callers queue behind this reservation
+            self._tokens -= tokens
+            self._stats["acquired"] += 1
+            if wait > 0:
+                self._stats["waited"] += 1
+                self._stats["wait_s"] += wait
+                self._stats["max_wait_s"] = max(self._stats["max_wait_s"], wait)
+            return wait
+
+    def try_acquire(self, tokens: float = 1) -> bool:
+        """Take ``tokens`` only if they are available right now."""
+        try:
+            self.reserve(tokens, timeout=0)
+            return True
+        except RateLimitTimeout:
+            return False
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            return {**self._stats, "rate": self.rate, "burst": self.burst}
+
+
+def parse_rate_limits(spec: str) -> Dict[Tuple[str, Optional[str]], Tuple[float, Optional[float]]]:
+    """Parse a ``RATE_LIMITS`` value into ``{(api, resource): (rate, burst)}``."""
+    limits = {}
+    for entry in filter(None, (part.strip() for part in spec.split(","))):
+        key, sep, value = entry.rpartition("=")
+        if not sep or not key:
+            raise ValueError(f"Invalid rate limit entry: {entry!r}")
+        api, _, resource = key.partition(":")
+        rate, _, burst = value.partition("/")
+        limits[(api.strip(), resource.strip() or None)] = (float(rate), float(burst) if burst else None)
+    return limits
+
+
+class RateLimiter:
+    """Buckets per API and per resource, shared by the whole process."""
+
+    def __init__(self, limits: Optional[Dict[Tuple[str, Optional[str]], Tuple[float, Optional[float]]]] = None,
+                 clock: Callable[[], float] = time.monotonic, sleep: Callable[[float], None] = time.sleep):
+        self.clock = clock
+        self.sleep = sleep
+        self._buckets = {key: TokenBucket(rate, burst, clock) for key, (rate, burst) in (limits or {}).items()}
+
+    def buckets(self, api: str, resource: Optional[str] = None):
+        """Buckets that apply to a call: the API bucket and the resource bucket, if configured."""
+        return [bucket for bucket in (self._buckets.get((api, None)),
+                                      self._buckets.get((api, resource)) if resource else None)
+                if bucket is not None]
+
+    def reserve(self, api: str, resource: Optional[str] = None, tokens: float = 1,
+                timeout: Optional[float] = None) -> float:
+        """Reserve tokens in every applicable bucket; returns the longest wait."""
+        waits = [bucket.reserve(tokens, timeout) for bucket in self.buckets(api, resource)]
+        wait = max(waits, default=0.0)
+        if wait > 0:
+            logger.info("SLI: rate_limit_wait", extra={"api": api, "resource": resource, "duration": wait})
+        return wait
+
+    def acquire(self, api: str, resource: Optional[str] = None, tokens: float = 1,
+                timeout: Optional[float] = None) -> float:
+        """Block until the call may proceed.
+
+        Returns:
+            Seconds spent waiting.
+
+        Raises:
+            RateLimitTimeout: If the wait would exceed ``timeout``.
+        """
+        wait = self.reserve(api, resource, tokens, timeout)
+        if wait > 0:
+            self.sleep(wait)
+        return wait
+
+    async def acquire_async(self, api: str, resource: Optional[str] = None, tokens: float = 1,
+                            timeout: Optional[float] = None) -> float:
+        """Like ``acquire``, but waits with ``asyncio.sleep``."""
+        wait = self.reserve(api, resource, tokens, timeout)
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        return {f"{api}:{resource}" if resource else api: bucket.stats()
+                for (api, resource), bucket in self._buckets.items()}
+
+
+def create_rate_limiter() -> RateLimiter:
+    """Build the limiter from ``RATE_LIMITS`` (empty: nothing is limited)."""
+    return RateLimiter(parse_rate_limits(os.getenv("RATE_LIMITS", "")))
@@ -0,0 +1,258 @@
+"""Table schema compiled once and applied to whole batches before a write.
+
+The BigQuery table is defined in ``terraform/schemas/*.json`` (the same file
+Terraform reads), while the reader emits Portuguese field names. A
+``TableSchema`` maps each column to its source field, picks a coercer per
+column type and projects a batch column by column: every value of a column
+is coerced in one pass, required columns are checked in one pass, and the
+whole batch is rejected with a ``SchemaValidationError`` before any request
+is sent.
+
+Amounts are emitted as integer cents (``valor``) and stored exactly in
+``value_cents``; ``value`` keeps the amount in reais for existing queries and
+is derived from the same cents.
+"""
+import json
+import math
+import os
+import re
+from dataclasses import dataclass
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from utils.money import cents_to_decimal, is_cents
+
+DEFAULT_SCHEMA_PATH = str(Path(__file__).resolve().parent.parent / "terraform" / "schemas" / "personal_finance_flow.json")
+
+# Reader field -> table column
+DEFAULT_FIELD_ALIASES = {
+    "data": "date",
+    "valor": "value_cents",
+    "descricao": "description",
+}
+
+# Column -> emitted field holding the same amount in cents
+DEFAULT_CENTS_ALIASES = {
+    "value": "valor",
+}
+
+MAX_REPORTED_ERRORS = 20
+
+_ISO_DATE = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+
+
+class SchemaValidationError(ValueError):
+    """Raised when a batch does not fit the table schema; ``errors`` lists the first problems."""
+
+    def __init__(self, errors: List[Dict[str, Any]], total: int):
+        self.errors = errors
+        self.total = total
+        super().__init__(f"{total} invalid value(s) for table schema: {errors[:3]}")
+
+
+class _Invalid:
+    __slots__ = ("reason",)
+
+    def __init__(self, reason: str):
+        self.reason = reason
+
+
+def _coerce_string(value):
+    return value if value is None or isinstance(value, str) else str(value)
+
+
+def _coerce_float(value):
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        return _Invalid("boolean is not a FLOAT")
+    try:
+        result = float(value)
+    except (TypeError, ValueError):
+        return _Invalid(f"not a FLOAT: {value!r}")
+    return result if math.isfinite(result) else _Invalid(f"not a finite FLOAT: {value!r}")
+
+
+def _coerce_integer(value):
+    if value is None or (isinstance(value, int) and not isinstance(value, bool)):
+        return value
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, str) and value.strip().lstrip("-").isdigit():
+        return int(value)
+    return _Invalid(f"not an INTEGER: {value!r}")
+
+
+def _coerce_numeric(value):
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        return _Invalid("boolean is not NUMERIC")
+    try:
+        number = Decimal(str(value))
+    except InvalidOperation:
+        return _Invalid(f"not NUMERIC: {value!r}")
+    # BigQuery aceita NUMERIC como string no insert JSON, sem perder precisão
+    return str(number) if number.is_finite() else _Invalid(f"not a finite NUMERIC: {value!r}")
+
+
+def _coerce_date(value):
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return value.date().isoformat()
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, str) and _ISO_DATE.match(value):
+        try:
+            date.fromisoformat(value)
+            return value
+        except ValueError:
+            pass
+    return _Invalid(f"not a DATE (YYYY-MM-DD): {value!r}")
+
+
+def _coerce_timestamp(value):
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, str):
+        try:
+            datetime.fromisoformat(value)
+            return value
+        except ValueError:
+            pass
+    return _Invalid(f"not a TIMESTAMP: {value!r}")
+
+
+def _coerce_boolean(value):
+    if value is None or isinstance(value, bool):
+        return value
+    return _Invalid(f"not a BOOLEAN: {value!r}")
+
+
+COERCERS: Dict[str, Callable[[Any], Any]] = {
+    "STRING": _coerce_string,
+    "FLOAT": _coerce_float,
+    "FLOAT64": _coerce_float,
+    "INTEGER": _coerce_integer,
+    "INT64": _coerce_integer,
+    "NUMERIC": _coerce_numeric,
+    "BIGNUMERIC": _coerce_numeric,
+    "DATE": _coerce_date,
+    "TIMESTAMP": _coerce_timestamp,
+    "BOOLEAN": _coerce_boolean,
+    "BOOL": _coerce_boolean,
+}
+
+
+@dataclass(frozen=True)
+class Column:
+    name: str
+    type: str
+    required: bool
+    sources: Tuple[str, ...]
+    coerce: Callable[[Any], Any]
+    cents_sources: Tuple[str, ...] = ()
+
+    def extract(self, row: Dict[str, Any]) -> Any:
+        for source in self.sources:
+            if source in row:
+                return row[source]
+        for source in self.cents_sources:
+            if source in row:
+                value = row[source]
+                return cents_to_decimal(value) if is_cents(value) else value
+        return None
+
+
+class TableSchema:
+    """Compiled projection from emitted rows to table rows.
+
+    Args:
+        fields: BigQuery schema fields (``name``, ``type``, ``mode``).
+        aliases: Emitted field name -> column name.
+        cents_aliases: Column name -> emitted field with the amount in cents
+            (the column receives the amount in units).
+        strict: Reject batches that carry fields the table does not have
+            (by default they are dropped and reported by ``unknown_fields``).
+    """
+
+    def __init__(self, fields: Sequence[Dict[str, Any]], aliases: Optional[Dict[str, str]] = None,
+                 strict: bool = False, cents_aliases: Optional[Dict[str, str]] = None):
+        aliases = DEFAULT_FIELD_ALIASES if aliases is None else aliases
+        cents_aliases = DEFAULT_CENTS_ALIASES if cents_aliases is None else cents_aliases
+        sources_by_column: Dict[str, List[str]] = {}
+        for source, column in aliases.items():
+            sources_by_column.setdefault(column, []).append(source)
+        self.columns: List[Column] = []
+        for field in fields:
+            field_type = field["type"].upper()
+            if field_type not in COERCERS:
+                raise ValueError(f"Unsupported column type {field_type} for {field['name']}")
+            self.columns.append(Column(
+                name=field["name"],
+                type=field_type,
+                required=field.get("mode", "NULLABLE").upper() == "REQUIRED",
+                sources=(field["name"], *sources_by_column.get(field["name"], ())),
+                coerce=COERCERS[field_type],
+                cents_sources=(cents_aliases[field["name"]],) if field["name"] in cents_aliases else (),
+            ))
+        self.strict = strict
+        self.known_fields = frozenset(source for column in self.columns
+                                      for source in column.sources + column.cents_sources)
+
+    @classmethod
+    def from_file(cls, path: str, **kwargs) -> "TableSchema":
+        with open(path, encoding="utf-8") as f:
+            return cls(json.load(f), **kwargs)
+
+    def unknown_fields(self, rows: Iterable[Dict[str, Any]]) -> List[str]:
+        seen = set()
+        for row in rows:
+            seen.update(row.keys())
+        return sorted(seen - self.known_fields)
+
+    def project(self, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Validate and project a batch; raises ``SchemaValidationError`` on any bad value.
+
+        Null values are omitted from the projected rows.
+        """
+        errors: List[Dict[str, Any]] = []
+        total_errors = 0
+        if self.strict:
+            unknown = self.unknown_fields(rows)
+            if unknown:
+                raise SchemaValidationError([{"field": name, "reason": "not in table schema"} for name in unknown],
+                                            len(unknown))
+
+        columns = []
+        for column in self.columns:
+            values = list(map(column.coerce, map(column.extract, rows)))
+            invalid = [index for index, value in enumerate(values) if isinstance(value, _Invalid)]
+            if column.required:
+                invalid += [index for index, value in enumerate(values) if value is None]
+            if invalid:
+                total_errors += len(invalid)
+                for index in invalid[:MAX_REPORTED_ERRORS - len(errors)]:
+                    value = values[index]
+                    errors.append({"row": index, "field": column.name,
+                                   "reason": value.reason if isinstance(value, _Invalid) else "required"})
+            columns.append(values)
+        if total_errors:
+            raise SchemaValidationError(errors, total_errors)
+
+        names = [column.name for column in self.columns]
+        return [{name: value for name, value in zip(names, values) if value is not None}
+                for values in zip(*columns)]
+
+
+def create_table_schema() -> TableSchema:
+    """Compile the schema from ``BIGQUERY_SCHEMA_PATH`` (strict with ``BIGQUERY_SCHEMA_STRICT``)."""
+    return TableSchema.from_file(
+        os.getenv("BIGQUERY_SCHEMA_PATH", DEFAULT_SCHEMA_PATH),
+        strict=os.getenv("BIGQUERY_SCHEMA_STRICT", "").lower() in ("1", "true", "yes"),
+    )
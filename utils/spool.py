@@ -0,0 +1,305 @@
+"""Local write-ahead spool.
+
+Records are appended to segment files (``segment-<seq>.wal``), each record
+framed as ``length | crc32 | json payload``. Appends only ever go to the
+newest segment; once a segment is sealed (size limit or flush interval), a
+background flusher reads it back, hands records to a sink in large batches
+and deletes it. A checkpoint file next to the segment stores the offset of
+the last batch accepted by the sink, so a crash in the middle of a segment
+does not resend the batches that were already written.
+
+On start, every segment left on disk is treated as sealed and replayed.
+A corrupted record does not end the replay: its bytes are copied to
+``quarantine/`` and reading resumes at the next offset where a whole record
+(length, CRC and JSON) checks out, so the valid records after it are still
+delivered before the segment is deleted.
+"""
+import json
+import os
+import struct
+import threading
+import time
+import zlib
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from utils.logging_config import setup_logging
+
+logger = setup_logging(__name__)
+
+HEADER = struct.Struct(">II")
+SEGMENT_PREFIX = "segment-"
+SEGMENT_SUFFIX = ".wal"
+CHECKPOINT_SUFFIX = ".ckpt"
+QUARANTINE_DIR = "quarantine"
+
+DEFAULT_SEGMENT_BYTES = 8 * 1024 * 1024
+DEFAULT_BATCH_ROWS = 5000
+DEFAULT_FLUSH_INTERVAL = 1.0
+DEFAULT_MAX_BACKOFF = 60.0
+
+Record = Dict[str, Any]
+Sink = Callable[[List[Record]], None]
+
+
+def encode_record(record: Record) -> bytes:
+    payload = json.dumps(record, separators=(",", ":")).encode("utf-8")
+    return HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+
+
+def record_weight(record: Record) -> int:
+    """Batch weight of a record: its number of rows (at least 1)."""
+    return max(1, len(record.get("rows") or ()))
+
+
+class WriteAheadSpool:
+    """Segmented append-only log drained into a sink by a background flusher.
+
+    Args:
+        directory: Where segments are stored.
+        sink: Called with a list of records; must raise if they were not written.
+        segment_bytes: Size after which the active segment is sealed.
+        batch_rows: Target number of rows per sink call.
+        flush_interval: Seconds between flushes; also the maximum age of the
+            active segment before it is sealed.
+        fsync: Whether ``append`` fsyncs before returning.
+    """
+
+    def __init__(self, directory: str, sink: Sink, segment_bytes: int = DEFAULT_SEGMENT_BYTES,
+                 batch_rows: int = DEFAULT_BATCH_ROWS, flush_interval: float = DEFAULT_FLUSH_INTERVAL,
+                 fsync: bool = True, max_backoff: float = DEFAULT_MAX_BACKOFF):
+        self.directory = directory
+        self.sink = sink
+        self.segment_bytes = segment_bytes
+        self.batch_rows = batch_rows
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self.max_backoff = max_backoff
+        self._append_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._wakeup = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._active = None
+        self._active_path: Optional[str] = None
+        self._active_size = 0
+        self._stats = {"appended_records": 0, "flushed_records": 0, "flushed_rows": 0,
+                       "flushed_batches": 0, "flush_failures": 0, "corrupt_records": 0,
+                       "quarantined_bytes": 0}
+        os.makedirs(directory, exist_ok=True)
+        existing = self._segments()
+        self._next_seq = self._seq(existing[-1]) + 1 if existing else 1
+
+    # Segments
+
+    def _segments(self) -> List[str]:
+        names = [name for name in os.listdir(self.directory)
+                 if name.startswith(SEGMENT_PREFIX) and name.endswith(SEGMENT_SUFFIX)]
+        return [os.path.join(self.directory, name) for name in sorted(names, key=self._seq)]
+
+    @staticmethod
+    def _seq(path: str) -> int:
+        name = os.path.basename(path)
+        return int(name[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)])
+
+    def _open_segment(self) -> None:
+        self._active_path = os.path.join(self.directory, f"{SEGMENT_PREFIX}{self._next_seq:012d}{SEGMENT_SUFFIX}")
+        self._next_seq += 1
+        self._active = open(self._active_path, "ab")
+        self._active_size = 0
+
+    def _seal(self) -> None:
+        """Close the active segment so that the flusher can drain it."""
+        if self._active is not None:
+            self._active.close()
+            self._active = None
+            self._active_path = None
+            self._active_size = 0
+
+    def append(self, record: Record) -> None:
+        """Durably append one record (fsynced unless ``fsync`` is False)."""
+        data = encode_record(record)
+        with self._append_lock:
+            if self._active is None:
+                self._open_segment()
+            self._active.write(data)
+            self._active.flush()
+            if self.fsync:
+                os.fsync(self._active.fileno())
+            self._active_size += len(data)
+            self._stats["appended_records"] += 1
+            if self._active_size >= self.segment_bytes:
+                self._seal()
+                self._wakeup.set()
+
+    # Replay
+
+    @staticmethod
+    def _parse_at(data: bytes, position: int) -> Optional[Tuple[Record, int]]:
+        """Decode the record framed at ``position``; None if it is torn or corrupted."""
+        if len(data) - position < HEADER.size:
+            return None
+        length, crc = HEADER.unpack_from(data, position)
+        end = position + HEADER.size + length
+        if end > len(data):
+            return None
+        payload = data[position + HEADER.size:end]
+        if zlib.crc32(payload) != crc:
+            return None
+        try:
+            record = json.loads(payload)
+        except ValueError:
+            return None
+        return (record, end) if isinstance(record, dict) else None
+
+    def _quarantine(self, path: str, offset: int, data: bytes) -> None:
+        directory = os.path.join(self.directory, QUARANTINE_DIR)
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, f"{os.path.basename(path)}.{offset}.corrupt"), "wb") as f:
+            f.write(data)
+        self._stats["corrupt_records"] += 1
+        self._stats["quarantined_bytes"] += len(data)
+        logger.error("Corrupted spool record quarantined",
+                     extra={"segment": path, "offset": offset, "bytes": len(data)})
+
+    def _read_records(self, path: str, offset: int) -> Iterator[Tuple[Record, int]]:
+        """Yield ``(record, end_offset)`` from ``offset``, quarantining corrupted bytes."""
+        with open(path, "rb") as f:
+            f.seek(offset)
+            data = f.read()
+        position = 0
+        while position < len(data):
+            parsed = self._parse_at(data, position)
+            if parsed is None:
+                resume = position + 1
+                while resume < len(data) and self._parse_at(data, resume) is None:
+                    resume += 1
+                self._quarantine(path, offset + position, data[position:resume])
+                position = resume
+                continue
+            record, position = parsed
+            yield record, offset + position
+
+    @staticmethod
+    def _read_checkpoint(path: str) -> int:
+        try:
+            with open(path + CHECKPOINT_SUFFIX) as f:
+                return int(f.read().strip() or 0)
+        except (OSError, ValueError):
+            return 0
+
+    @staticmethod
+    def _write_checkpoint(path: str, offset: int) -> None:
+        tmp_path = path + CHECKPOINT_SUFFIX + ".tmp"
+        with open(tmp_path, "w") as f:
+            f.write(str(offset))
+        os.replace(tmp_path, path + CHECKPOINT_SUFFIX)
+
+    def _send(self, batch: List[Record]) -> None:
+        self.sink(batch)
+        self._stats["flushed_batches"] += 1
+        self._stats["flushed_records"] += len(batch)
+        self._stats["flushed_rows"] += sum(len(record.get("rows") or ()) for record in batch)
+
+    def _drain_segment(self, path: str) -> None:
+        batch: List[Record] = []
+        weight = 0
+        offset = self._read_checkpoint(path)
+        for record, end in self._read_records(path, offset):
+            batch.append(record)
+            weight += record_weight(record)
+            if weight >= self.batch_rows:
+                self._send(batch)
+                self._write_checkpoint(path, end)
+                batch, weight = [], 0
+        if batch:
+            self._send(batch)
+        os.remove(path)
+        if os.path.exists(path + CHECKPOINT_SUFFIX):
+            os.remove(path + CHECKPOINT_SUFFIX)
+
+    def flush(self) -> int:
+        """Seal the active segment and drain every sealed segment; returns rows flushed.
+
+        Raises whatever the sink raises; the segment being drained stays on
+        disk and is resumed from its checkpoint on the next flush. The sink
+        is expected to divert rows that can never be written (the writer
+        sends them to its dead-letter sink), otherwise one bad batch blocks
+        every segment behind it.
+        """
+        with self._flush_lock:
+            flushed_before = self._stats["flushed_rows"]
+            with self._append_lock:
+                self._seal()
+                # Segments opened by later appends are left for the next flush
+                sealed = self._segments()
+            for path in sealed:
+                self._drain_segment(path)
+            return self._stats["flushed_rows"] - flushed_before
+
+    # Background flusher
+
+    def start(self) -> "WriteAheadSpool":
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="spool-flusher", daemon=True)
+            self._thread.start()
+        return self
+
+    def _run(self) -> None:
+        failures = 0
+        while not self._stop.is_set():
+            delay = min(self.max_backoff, self.flush_interval * 2 ** failures) if failures else self.flush_interval
+            self._wakeup.wait(delay)
+            self._wakeup.clear()
+            if self._stop.is_set():
+                return
+            start = time.monotonic()
+            try:
+                rows = self.flush()
+            except Exception as e:
+                failures += 1
+                self._stats["flush_failures"] += 1
+                logger.error(f"Spool flush failed: {str(e)}",
+                             extra={"failures": failures, "backlog_bytes": self.backlog_bytes()})
+                continue
+            failures = 0
+            if rows:
+                logger.info("SLI: spool_flush",
+                            extra={"rows_count": rows, "duration": time.monotonic() - start,
+                                   "backlog_bytes": self.backlog_bytes()})
+
+    def close(self) -> None:
+        """Stop the flusher and close the active segment; pending records stay on disk."""
+        self._stop.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        with self._append_lock:
+            self._seal()
+
+    def backlog_bytes(self) -> int:
+        total = 0
+        for path in self._segments():
+            try:
+                total += os.path.getsize(path) - self._read_checkpoint(path)
+            except OSError:
+                continue
+        return total
+
+    def stats(self) -> Dict[str, int]:
+        return {**self._stats, "segments": len(self._segments()), "backlog_bytes": self.backlog_bytes()}
+
+
+def create_write_spool(sink: Sink) -> Optional[WriteAheadSpool]:
+    """Build and start the spool from ``WRITER_SPOOL_*``; None when ``WRITER_SPOOL_DIR`` is unset."""
+    directory = os.getenv("WRITER_SPOOL_DIR")
+    if not directory:
+        return None
+    return WriteAheadSpool(
+        directory,
+        sink,
+        segment_bytes=int(os.getenv("WRITER_SPOOL_SEGMENT_BYTES", DEFAULT_SEGMENT_BYTES)),
+        batch_rows=int(os.getenv("WRITER_SPOOL_BATCH_ROWS", DEFAULT_BATCH_ROWS)),
+        flush_interval=float(os.getenv("WRITER_SPOOL_FLUSH_INTERVAL", DEFAULT_FLUSH_INTERVAL)),
+        fsync=os.getenv("WRITER_SPOOL_FSYNC", "true").lower() not in ("0", "false", "no"),
+    ).start()
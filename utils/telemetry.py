@@ -1,18 +1,34 @@
 import os
-from typing import Optional
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional
 
 from opentelemetry import trace
-from opentelemetry.exporter.cloud_trace import CloudTraceSpanExporter
-from opentelemetry.sdk.resources import Resource
-from opentelemetry.sdk.trace import TracerProvider
-from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+from opentelemetry.context import Context
+from opentelemetry.trace.propagation.tracecontext import TraceContextTextMapPropagator
 
-def setup_telemetry(service_name: str) -> None:
+TRACEPARENT_HEADER = "traceparent"
+
+# W3C Trace Context, independent of OTEL_PROPAGATORS
+_PROPAGATOR = TraceContextTextMapPropagator()
+
+def setup_telemetry(service_name: str):
     """Configure OpenTelemetry for the service.
     
+    The SDK and the Cloud Trace exporter are imported here rather than at
+    module level so that importing a function entry point stays cheap.
+    
     Args:
         service_name: Name of the service for resource attributes
+        
+    Returns:
+        The configured tracer provider
     """
+    from opentelemetry.exporter.cloud_trace import CloudTraceSpanExporter
+    from opentelemetry.sdk.resources import Resource
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+    
     # Create a resource with service information
     resource = Resource.create({
         "service.name": service_name,
@@ -30,6 +46,7 @@ def setup_telemetry(service_name: str) -> None:
     )
     span_processor = SimpleSpanProcessor(cloud_trace_exporter)
     tracer_provider.add_span_processor(span_processor)
+    return tracer_provider
 
 def get_current_trace_id() -> Optional[str]:
     """Get the current trace ID if available.
@@ -37,21 +54,78 @@ def get_current_trace_id() -> Optional[str]:
     Returns:
         The current trace ID as a string, or None if no active trace
     """
-    current_span = trace.get_current_span()
-    if current_span.is_recording():
-        return current_span.get_span_context().trace_id.hex()
+    span_context = trace.get_current_span().get_span_context()
+    if span_context.is_valid:
+        return format(span_context.trace_id, "032x")
     return None
 
-def create_span(name: str, attributes: dict = None) -> trace.Span:
-    """Create a new span with the given name and attributes.
+@contextmanager
+def create_span(name: str, attributes: dict = None, context: Optional[Context] = None,
+                start_time: Optional[int] = None) -> Iterator[trace.Span]:
+    """Create a span, make it current for the ``with`` block and end it on exit.
     
     Args:
         name: Name of the span
         attributes: Optional dictionary of attributes to add to the span
+        context: Optional parent context, e.g. from ``extract_context``;
+            defaults to the current context
+        start_time: Optional start timestamp in nanoseconds since the epoch
         
-    Returns:
+    Yields:
         The created span
     """
     tracer = trace.get_tracer(__name__)
-    with tracer.start_as_current_span(name, attributes=attributes) as span:
-        return span 
\ No newline at end of file
+    with tracer.start_as_current_span(name, context=context, attributes=attributes,
+                                      start_time=start_time) as span:
+        yield span
+
+def record_span(name: str, start_time: int, end_time: Optional[int] = None, attributes: dict = None,
+                context: Optional[Context] = None) -> trace.Span:
+    """Record an already finished interval as a span (e.g. time spent queued).
+    
+    Args:
+        name: Name of the span
+        start_time: Start timestamp in nanoseconds since the epoch
+        end_time: End timestamp in nanoseconds since the epoch; defaults to now
+        attributes: Optional dictionary of attributes to add to the span
+        context: Optional parent context; defaults to the current context
+        
+    Returns:
+        The ended span
+    """
+    tracer = trace.get_tracer(__name__)
+    span = tracer.start_span(name, context=context, attributes=attributes, start_time=start_time)
+    span.end(end_time=end_time if end_time is not None else time.time_ns())
+    return span
+
+def inject_context(carrier: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+    """Write the current W3C trace context (``traceparent``/``tracestate``) into a carrier.
+    
+    Args:
+        carrier: HTTP headers or Pub/Sub attributes to extend; a new dict by default
+        
+    Returns:
+        The carrier (unchanged when there is no active trace)
+    """
+    carrier = {} if carrier is None else carrier
+    _PROPAGATOR.inject(carrier)
+    return carrier
+
+def extract_context(carrier: Any) -> Optional[Context]:
+    """Read a W3C trace context from HTTP headers or Pub/Sub attributes.
+    
+    Args:
+        carrier: Mapping with a ``traceparent`` entry (case-insensitive for HTTP headers)
+        
+    Returns:
+        A context to pass as ``context=`` to ``create_span``, or None when the
+        carrier has no valid ``traceparent`` (the span then starts a new trace
+        or joins the current one)
+    """
+    # Flask headers and Pub/Sub attribute maps are not ``Mapping``s, but both have ``get``
+    if not hasattr(carrier, "get") or not isinstance(carrier.get(TRACEPARENT_HEADER), str):
+        return None
+    context = _PROPAGATOR.extract(carrier)
+    if not trace.get_current_span(context).get_span_context().is_valid:
+        return None
+    return context
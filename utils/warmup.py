@@ -0,0 +1,154 @@
+"""Instance warm-up: pay for heavy initialization before the first request.
+
+Each entry point declares its warm-up steps (telemetry, clients, parser
+imports, compiled rules and schema) in a ``Warmup``. The steps run once per
+process, either in a background thread at import time (``WARMUP_ON_START``)
+or when the platform calls the warm-up path (``WARMUP_PATH``, by default
+``/_ah/warmup``) — whichever comes first; a concurrent caller waits for the
+run in progress instead of repeating it. A failing step is logged and
+reported, never raised: the request that needs it will retry the work.
+
+``Warmup.track_request`` also records request latency, so the first request
+of the instance can be compared with the steady state in the warm-up report
+and in the ``SLI: first_request_latency`` log.
+"""
+import functools
+import json
+import os
+import statistics
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from utils.logging_config import setup_logging
+
+logger = setup_logging(__name__)
+
+DEFAULT_WARMUP_PATH = "/_ah/warmup"
+
+# Requests kept for the steady-state latency
+STEADY_WINDOW = 100
+
+Step = Tuple[str, Callable[[], Any]]
+
+
+def warmup_on_start() -> bool:
+    return os.getenv("WARMUP_ON_START", "").lower() in ("1", "true", "yes")
+
+
+def is_warmup_request(request) -> bool:
+    """Whether an HTTP request targets the warm-up path."""
+    path = getattr(request, "path", None)
+    return isinstance(path, str) and path.rstrip("/") == os.getenv("WARMUP_PATH", DEFAULT_WARMUP_PATH).rstrip("/")
+
+
+class Warmup:
+    """Warm-up steps of one entry point plus its request latency.
+
+    Args:
+        service: Name used in logs and in the report.
+        steps: ``(name, callable)`` pairs run in order.
+    """
+
+    def __init__(self, service: str, steps: List[Step]):
+        self.service = service
+        self.steps = steps
+        self._lock = threading.Lock()
+        self._latency_lock = threading.Lock()
+        self._done = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._results: Dict[str, Dict[str, Any]] = {}
+        self._duration: Optional[float] = None
+        self._first_request: Optional[float] = None
+        self._first_request_warm: Optional[bool] = None
+        self._steady: deque = deque(maxlen=STEADY_WINDOW)
+
+    @property
+    def done(self) -> bool:
+        return self._done.is_set()
+
+    def run(self) -> Dict[str, Any]:
+        """Run every step once (later calls return the same report)."""
+        with self._lock:
+            if not self._done.is_set():
+                start = time.monotonic()
+                for name, step in self.steps:
+                    step_start = time.monotonic()
+                    try:
+                        step()
+                        self._results[name] = {"ok": True, "duration": time.monotonic() - step_start}
+                    except Exception as e:
+                        self._results[name] = {"ok": False, "duration": time.monotonic() - step_start,
+                                               "error": str(e)}
+                        logger.error(f"Warm-up step failed: {str(e)}",
+                                     extra={"service": self.service, "step": name})
+                self._duration = time.monotonic() - start
+                self._done.set()
+                logger.info("SLI: warmup",
+                            extra={"service": self.service, "duration": self._duration,
+                                   "steps": {name: result["duration"] for name, result in self._results.items()}})
+        return self.report()
+
+    def start(self) -> "Warmup":
+        """Run the steps in a background thread."""
+        with self._lock:
+            if self._thread is None and not self._done.is_set():
+                self._thread = threading.Thread(target=self.run, name=f"warmup-{self.service}", daemon=True)
+                self._thread.start()
+        return self
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        return self._done.wait(timeout)
+
+    @contextmanager
+    def track_request(self) -> Iterator[None]:
+        """Measure one request; the first of the process is logged separately."""
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            duration = time.monotonic() - start
+            with self._latency_lock:
+                first = self._first_request is None
+                if first:
+                    self._first_request = duration
+                    self._first_request_warm = self._done.is_set()
+                else:
+                    self._steady.append(duration)
+            if first:
+                logger.info("SLI: first_request_latency",
+                            extra={"service": self.service, "duration": duration,
+                                   "warmed_up": self._first_request_warm})
+
+    def entry_point(self, fn: Callable) -> Callable:
+        """Decorate an entry point: answer warm-up requests and track the others."""
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if args and is_warmup_request(args[0]):
+                return self.response()
+            with self.track_request():
+                return fn(*args, **kwargs)
+
+        return wrapper
+
+    def report(self) -> Dict[str, Any]:
+        steady = list(self._steady)
+        return {
+            "service": self.service,
+            "done": self.done,
+            "duration": self._duration,
+            "steps": dict(self._results),
+            "first_request_s": self._first_request,
+            "first_request_warmed_up": self._first_request_warm,
+            "steady_request_s": statistics.median(steady) if steady else None,
+            "steady_requests": len(steady),
+        }
+
+    def response(self) -> Tuple[str, int]:
+        """Run the warm-up (if needed) and answer the warm-up request."""
+        report = self.run()
+        failed = [name for name, result in report["steps"].items() if not result["ok"]]
+        return json.dumps({**report, "failed_steps": failed}), 200